@@ -0,0 +1,270 @@
+"""
+ベンチマーク用の偽 Gemini サーバー。
+
+Gemini API の REST エンドポイント (`POST /v1beta/models/{model}:generateContent` と
+ストリーミング版の `:streamGenerateContent`) を模倣し、シナリオに書かれた応答を順番に返す。`GEMINI_API_ENDPOINT` をこのサーバーの URL にすると、
+SDK を含む本番と同じコードパスのまま、API キーもネットワークも使わずにエージェントを動かせる。
+
+単体で起動して `main.py chat` を手動で試すこともできる:
+
+    python benchmarks/fake_gemini.py benchmarks/scenarios/single_delegate.json --port 8089
+    GEMINI_API_KEY=fake GEMINI_API_ENDPOINT=http://127.0.0.1:8089 python src/main.py
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+import argparse
+import json
+import re
+import threading
+import time
+
+# チャット用のシステムプロンプト (`Agent._build_system_prompt`) からエージェント名を取り出す
+AGENT_NAME_PATTERN = re.compile(r"あなたは (\S+) という名前")
+# エージェント名を含まない要求（Manager のタスク分解・計画など、ツール無しの生成）の振り分け先
+GENERATE_ROUTE = "generate"
+EXHAUSTED_TEXT = "(fake-gemini: script exhausted)"
+# ストリーミング時のテキストの断片1つあたりの文字数
+STREAM_CHUNK_CHARS = 16
+
+
+class FakeGeminiServer:
+    """
+    シナリオの応答スクリプトを返す HTTP サーバー（バックグラウンドスレッドで動作する）。
+
+    スクリプトは振り分け先（エージェント名または "generate"）ごとの応答のリストで、先頭から順に消費する。
+    応答に `match` がある場合は、直近の送信内容にその文字列を含む要求にだけ使う
+    （並列に動く同名エージェントの応答が入れ替わらないようにするため）。
+    """
+
+    def __init__(self, scripts: Dict[str, List[Dict[str, Any]]], latency: float = 0.0, chunk_latency: float = 0.0,
+                 host: str = "127.0.0.1", port: int = 0):
+        """
+        Args:
+            scripts (dict): 振り分け先ごとの応答のリスト。
+            latency (float): 各応答を返す前の擬似レイテンシ（秒）。応答ごとの `latency` で上書きできる。
+            chunk_latency (float): ストリーミング時の断片ごとの擬似レイテンシ（秒）。
+            host (str): 待ち受けるアドレス。
+            port (int): 待ち受けるポート。0 の場合は空いているポートを使う。
+        """
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self._scripts = {route: list(entries) for route, entries in scripts.items()}
+        self._lock = threading.Lock()
+        self._requests: Dict[str, int] = {}
+        self._unscripted = 0
+        self._errors = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeGeminiServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-gemini", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "FakeGeminiServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        振り分け先ごとの要求数、スクリプト外の要求数、返したエラー数、消費されなかった応答数を返す。
+        """
+        with self._lock:
+            return {
+                "requests": dict(self._requests),
+                "unscripted": self._unscripted,
+                "errors": self._errors,
+                "unused": {route: len(entries) for route, entries in self._scripts.items() if entries},
+            }
+
+    def next_entry(self, route: str, last_content: str) -> Optional[Dict[str, Any]]:
+        """
+        振り分け先の次の応答を取り出す。該当する応答が無い場合は None。
+        """
+        with self._lock:
+            self._requests[route] = self._requests.get(route, 0) + 1
+            entries = self._scripts.get(route, [])
+            for index, entry in enumerate(entries):
+                if entry.get("match", "") in last_content:
+                    if "error" in entry:
+                        self._errors += 1
+                    return entries.pop(index)
+            self._unscripted += 1
+            return None
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # chunked 転送と接続の再利用のため HTTP/1.1 で応答する。
+            # 小さな断片を順に書き出すため、Nagle アルゴリズムによる送信の遅延は無効にする
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                raw = self.rfile.read(length)
+                request = json.loads(raw or b"{}")
+                route = route_of(request)
+                entry = server.next_entry(route, last_content_of(request))
+                time.sleep((entry or {}).get("latency", server.latency))
+
+                status, body = build_reply(entry, prompt_bytes=len(raw))
+                if status == 200 and ":streamGenerateContent" in self.path:
+                    self._write_stream(split_reply(body))
+                    return
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _write_stream(self, chunks: List[Dict[str, Any]]):
+                # REST のストリーミング応答は JSON 配列で、要素（断片）が届いた順に読み出される。
+                # 本物の API と同様に chunked 転送で送り、接続は次の要求に再利用させる
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for index, chunk in enumerate(chunks):
+                    if index:
+                        time.sleep(server.chunk_latency)
+                    prefix = "[" if index == 0 else ","
+                    self._write_chunk((prefix + json.dumps(chunk, ensure_ascii=False)).encode("utf-8"))
+                self._write_chunk(b"]")
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def route_of(request: Dict[str, Any]) -> str:
+    """
+    要求のシステムプロンプトからエージェント名を取り出す（見つからない場合は "generate"）。
+    """
+    parts = (request.get("systemInstruction") or {}).get("parts") or []
+    system = "".join(part.get("text", "") for part in parts)
+    match = AGENT_NAME_PATTERN.search(system)
+    return match.group(1) if match else GENERATE_ROUTE
+
+
+def last_content_of(request: Dict[str, Any]) -> str:
+    """
+    直近の送信内容（テキストまたはツール実行結果）を `match` の照合用に文字列化する。
+    """
+    contents = request.get("contents") or []
+    if not contents:
+        return ""
+    return json.dumps(contents[-1].get("parts", []), ensure_ascii=False)
+
+
+def build_reply(entry: Optional[Dict[str, Any]], prompt_bytes: int = 0):
+    """
+    スクリプトの応答を Gemini API のレスポンス (HTTP ステータスと JSON) に変換する。
+
+    応答の形式:
+        {"text": "..."}
+        {"function_call": {"name": "...", "args": {...}}}
+        {"function_calls": [{"name": "...", "args": {...}}, ...]}
+        {"error": 429, "message": "... Please retry in 0.5s."}
+
+    `text` と `function_call(s)` を併記すると、説明文付きの関数呼び出しになる。
+    """
+    entry = entry or {"text": EXHAUSTED_TEXT}
+    if "error" in entry:
+        code = int(entry["error"])
+        return code, {"error": {
+            "code": code,
+            "message": entry.get("message", "Resource has been exhausted (e.g. check quota)."),
+            "status": entry.get("status", "RESOURCE_EXHAUSTED"),
+        }}
+
+    calls = entry.get("function_calls") or ([entry["function_call"]] if "function_call" in entry else [])
+    parts = [{"text": entry["text"]}] if "text" in entry or not calls else []
+    parts += [{"functionCall": {"name": call["name"], "args": call.get("args", {})}} for call in calls]
+
+    # トークン数は実際のトークナイザーを使わず、おおよそ 4 バイト = 1 トークンとして見積もる
+    prompt_tokens = prompt_bytes // 4
+    candidate_tokens = len(json.dumps(parts, ensure_ascii=False).encode("utf-8")) // 4
+    return 200, {
+        "candidates": [{"content": {"role": "model", "parts": parts}, "finishReason": "STOP", "index": 0}],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": candidate_tokens,
+            "totalTokenCount": prompt_tokens + candidate_tokens,
+        },
+    }
+
+
+def split_reply(body: Dict[str, Any], chunk_chars: int = STREAM_CHUNK_CHARS) -> List[Dict[str, Any]]:
+    """
+    レスポンスをストリーミングの断片のリストに分ける。
+    テキストは `chunk_chars` 文字ごと、関数呼び出しは1つずつ1断片とし、使用量は最後の断片に載せる。
+    """
+    candidate = body["candidates"][0]
+    pieces: List[Dict[str, Any]] = []
+    for part in candidate["content"]["parts"]:
+        if "text" in part:
+            text = part["text"]
+            pieces.extend({"text": text[i:i + chunk_chars]} for i in range(0, max(len(text), 1), chunk_chars))
+        else:
+            pieces.append(part)
+
+    chunks = [{"candidates": [{"content": {"role": "model", "parts": [piece]}, "index": 0}]} for piece in pieces]
+    chunks[-1]["candidates"][0]["finishReason"] = candidate.get("finishReason", "STOP")
+    chunks[-1]["usageMetadata"] = body["usageMetadata"]
+    return chunks
+
+
+def load_scenario(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    """
+    シナリオの応答スクリプトを返す偽 Gemini サーバーを起動する（Ctrl+C で終了）。
+    """
+    parser = argparse.ArgumentParser(description="ベンチマーク用の偽 Gemini サーバー")
+    parser.add_argument("scenario", help="応答スクリプトを含むシナリオ (JSON)")
+    parser.add_argument("--port", type=int, default=8089, help="待ち受けるポート")
+    args = parser.parse_args()
+
+    data = load_scenario(args.scenario)
+    server = FakeGeminiServer(data["scripts"], latency=data.get("latency_seconds", 0.0),
+                              chunk_latency=data.get("chunk_latency_seconds", 0.0), port=args.port).start()
+    print(f"Fake Gemini server listening on {server.url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        print(json.dumps(server.stats(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+Manager / Architect / Coder パイプラインのエンドツーエンド・ベンチマーク。
+
+シナリオ (`benchmarks/scenarios/*.json`) ごとに偽 Gemini サーバーを起動し、
+`main.py chat` と同じ構成のチームを別プロセスで動かして、リクエストごとに以下を計測する。
+
+- 対話ターン数 (サブエージェントを含む `send_message` の回数) とツール反復回数
+- API 呼び出しの時間、待機時間 (レートリミット・エラー後のクールダウン)、ツール実行の時間
+- サンドボックスのサブプロセス実行時間、ピーク RSS
+- ストリーミング表示で最初のテキストが届くまでの時間（ユーザーが待たされる時間）
+
+結果は JSON で保存し、`compare` で2つの結果を比較してリグレッションを検出する。
+
+    python benchmarks/run.py run
+    python benchmarks/run.py compare benchmarks/results/before.json benchmarks/results/after.json
+"""
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import argparse
+import tempfile
+import time
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCHMARKS_DIR.parent
+SRC_DIR = REPO_ROOT / "src"
+SCENARIOS_DIR = BENCHMARKS_DIR / "scenarios"
+RESULTS_DIR = BENCHMARKS_DIR / "results"
+RESULT_FORMAT_VERSION = 1
+
+# `compare` で比較する集計値（小さいほど良い）
+COMPARED_METRICS = [
+    "wall_seconds", "turns", "tool_iterations", "api_calls", "api_seconds",
+    "sleep_seconds", "tool_seconds", "sandbox_seconds", "first_output_seconds", "peak_rss_kb",
+]
+
+sys.path.insert(0, str(BENCHMARKS_DIR))
+from fake_gemini import FakeGeminiServer, load_scenario  # noqa: E402
+
+
+def run(scenarios: List[Path], repeat: int = 3, output: Optional[Path] = None, log_dir: Optional[Path] = None):
+    """
+    シナリオを実行し、計測結果を JSON に保存する。
+
+    Args:
+        scenarios (list): 実行するシナリオ。空の場合は scenarios/ 以下の全て。
+        repeat (int): シナリオごとの繰り返し回数。
+        output (Path, optional): 結果の保存先。省略時は results/<日時>.json。
+        log_dir (Path, optional): 各セッションのエージェントの出力を保存するディレクトリ。
+    """
+    paths = scenarios or sorted(SCENARIOS_DIR.glob("*.json"))
+    results = []
+    for path in paths:
+        scenario = load_scenario(str(path))
+        runs = [_run_session(path, scenario, log_dir, index) for index in range(repeat)]
+        results.append({
+            "name": scenario.get("name", path.stem),
+            "description": scenario.get("description", ""),
+            "repeat": repeat,
+            "summary": _summarize(runs),
+            "runs": runs,
+        })
+        summary = results[-1]["summary"]
+        print(
+            f"{results[-1]['name']}: wall {summary['wall_seconds']:.2f}s, first output {summary['first_output_seconds']:.2f}s, "
+            f"api {summary['api_seconds']:.2f}s, "
+            f"sleep {summary['sleep_seconds']:.2f}s, tools {summary['tool_seconds']:.2f}s, "
+            f"sandbox {summary['sandbox_seconds']:.2f}s, turns {summary['turns']:.0f}, "
+            f"peak RSS {summary['peak_rss_kb'] / 1024:.1f} MiB"
+        )
+
+    report = {
+        "format_version": RESULT_FORMAT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scenarios": results,
+    }
+    if output is None:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        output = RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Results written to {output}")
+
+
+def compare(baseline: Path, candidate: Path, threshold: float = 0.10) -> int:
+    """
+    2つの結果ファイルをシナリオごとに比較する。
+
+    Args:
+        threshold (float): リグレッションとみなす増加率（wall_seconds と peak_rss_kb に適用）。
+
+    Returns:
+        int: リグレッションがあれば 1、なければ 0（終了コードとして使う）。
+    """
+    base = {s["name"]: s["summary"] for s in json.loads(baseline.read_text(encoding="utf-8"))["scenarios"]}
+    cand = {s["name"]: s["summary"] for s in json.loads(candidate.read_text(encoding="utf-8"))["scenarios"]}
+
+    regressed = False
+    for name in sorted(base.keys() & cand.keys()):
+        print(f"== {name}")
+        for metric in COMPARED_METRICS:
+            before, after = base[name].get(metric, 0), cand[name].get(metric, 0)
+            change = (after - before) / before if before else 0.0
+            flag = ""
+            if metric in ("wall_seconds", "peak_rss_kb") and change > threshold:
+                flag = "  <-- regression"
+                regressed = True
+            print(f"  {metric:<16} {before:>12.3f} -> {after:>12.3f} ({change:+.1%}){flag}")
+    for name in sorted(base.keys() ^ cand.keys()):
+        print(f"== {name}: only in {'baseline' if name in base else 'candidate'}")
+    return 1 if regressed else 0
+
+
+def session(scenario_path: Path, result_file: Path):
+    """
+    （内部用）1セッションを実行する子プロセス。`run` から呼ばれ、偽サーバーの URL は環境変数で受け取る。
+    """
+    sys.path.insert(0, str(SRC_DIR))
+    from main import build_team, handle_input, streaming_enabled
+    from agent.metrics import get_metrics, diff_snapshots
+    from agent.streaming import EVENT_TEXT
+    from agent.token_ledger import get_token_ledger
+
+    scenario = load_scenario(str(scenario_path))
+    metrics = get_metrics()
+    started_at = time.perf_counter()
+    manager = build_team()
+    startup_seconds = time.perf_counter() - started_at
+
+    requests = []
+    ledger = get_token_ledger()
+    first_output: List[float] = []
+
+    def on_event(event):
+        # いずれかのエージェントの最初のテキスト断片が届いた時点を、ユーザーが出力を目にする時刻とみなす
+        if event.kind == EVENT_TEXT and not first_output:
+            first_output.append(time.perf_counter())
+
+    with ledger.session(scenario.get("name", scenario_path.stem)):
+        for user_input in scenario["inputs"]:
+            before = metrics.snapshot()
+            first_output.clear()
+            request_started_at = time.perf_counter()
+            response = handle_input(manager, user_input, on_event=on_event if streaming_enabled() else None)
+            wall = time.perf_counter() - request_started_at
+            record = _request_record(user_input, response, wall, diff_snapshots(before, metrics.snapshot()))
+            # ストリーミングしない場合は、応答全体が返った時点で初めて出力が表示される
+            record["first_output_seconds"] = (first_output[0] - request_started_at) if first_output else wall
+            requests.append(record)
+
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    result = {
+        "startup_seconds": startup_seconds,
+        "requests": requests,
+        # Linux の ru_maxrss は KiB 単位
+        "peak_rss_kb": own.ru_maxrss,
+        # 子プロセスの ru_maxrss は fork 直後の親の RSS を含んでしまうため、CPU 時間のみ記録する
+        "sandbox_cpu_seconds": children.ru_utime + children.ru_stime,
+        "metrics": metrics.snapshot(),
+        "token_usage": ledger.snapshot(),
+    }
+    result_file.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def _run_session(path: Path, scenario: Dict[str, Any], log_dir: Optional[Path], index: int) -> Dict[str, Any]:
+    """
+    偽サーバーを起動し、子プロセスで1セッションを実行して結果を返す。
+    子プロセスにすることで、ピーク RSS やプロセス共有のレートリミッターなどをセッションごとに独立させる。
+    """
+    with FakeGeminiServer(scenario["scripts"], latency=scenario.get("latency_seconds", 0.0),
+                          chunk_latency=scenario.get("chunk_latency_seconds", 0.0)) as server, \
+            tempfile.TemporaryDirectory(prefix="agent-bench-") as workdir:
+        env = {
+            **os.environ,
+            "GEMINI_API_KEY": "fake",
+            "GEMINI_API_ENDPOINT": server.url,
+            "AGENT_LLM_BACKEND": "gemini",
+            **{key: str(value) for key, value in scenario.get("env", {}).items()},
+        }
+        env.pop("AGENT_RESPONSE_CACHE", None)
+        result_file = Path(workdir) / "result.json"
+        if log_dir is not None:
+            log_dir.mkdir(parents=True, exist_ok=True)
+            output = open(log_dir / f"{path.stem}-{index + 1}.log", "w", encoding="utf-8")
+        else:
+            output = subprocess.DEVNULL
+        started_at = time.perf_counter()
+        try:
+            # Coder の sandbox/ などは作業ディレクトリに作られるため、一時ディレクトリで実行する
+            subprocess.run(
+                [sys.executable, str(Path(__file__).resolve()), "session", str(path.resolve()), str(result_file)],
+                cwd=workdir, env=env, stdout=output, stderr=subprocess.STDOUT, check=True,
+            )
+        finally:
+            if output is not subprocess.DEVNULL:
+                output.close()
+        result = json.loads(result_file.read_text(encoding="utf-8"))
+        result["wall_seconds"] = time.perf_counter() - started_at
+        result["server"] = server.stats()
+    return result
+
+
+def _request_record(user_input: str, response: str, wall: float, diff: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    1リクエスト分のメトリクス差分を、レポート用の項目に変換する。
+    tool_seconds にはサブエージェントへの委任（その中の API 呼び出し）も含まれる。
+    """
+    counters, timers = diff["counters"], diff["timers"]
+
+    def seconds(name: str) -> float:
+        return timers.get(name, {}).get("total_seconds", 0.0)
+
+    return {
+        "input": user_input,
+        "response_chars": len(response),
+        "wall_seconds": wall,
+        "turns": counters.get("agent.turns", 0),
+        "tool_iterations": counters.get("agent.tool_iterations", 0),
+        "api_calls": counters.get("api.calls", 0),
+        "api_retries": counters.get("api.retries", 0),
+        "tokens": counters.get("api.tokens", 0),
+        "api_seconds": seconds("api.request"),
+        "sleep_seconds": seconds("api.rate_limit_wait") + seconds("session.cooldown"),
+        "tool_seconds": seconds("agent.tools"),
+        # sandbox のコマンドはサブプロセスまたは常駐ワーカー (AGENT_SANDBOX_WORKER=1) で実行される
+        "sandbox_seconds": seconds("sandbox.subprocess") + seconds("sandbox.worker"),
+        "sandbox_runs": sum(timers.get(name, {}).get("count", 0) for name in ("sandbox.subprocess", "sandbox.worker")),
+        "sandbox_command_cpu_seconds": seconds("sandbox.cpu_user") + seconds("sandbox.cpu_system"),
+    }
+
+
+def _summarize(runs: List[Dict[str, Any]]) -> Dict[str, float]:
+    """
+    繰り返し実行の結果を、セッション全体の合計値の中央値にまとめる。
+    """
+    def total(run: Dict[str, Any], key: str) -> float:
+        return sum(request[key] for request in run["requests"])
+
+    summary = {"wall_seconds": statistics.median(run["wall_seconds"] for run in runs)}
+    for key in ["turns", "tool_iterations", "api_calls", "api_retries", "tokens",
+                "api_seconds", "sleep_seconds", "tool_seconds", "sandbox_seconds"]:
+        summary[key] = statistics.median(total(run, key) for run in runs)
+    summary["first_output_seconds"] = statistics.median(run["requests"][0]["first_output_seconds"] for run in runs)
+    summary["peak_rss_kb"] = statistics.median(run["peak_rss_kb"] for run in runs)
+    summary["unscripted_requests"] = max(run["server"]["unscripted"] for run in runs)
+    return summary
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="エージェントチームのエンドツーエンド・ベンチマーク")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="シナリオを実行し、計測結果を JSON に保存する")
+    run_parser.add_argument("scenarios", nargs="*", type=Path, help="実行するシナリオ。省略時は scenarios/ 以下の全て")
+    run_parser.add_argument("--repeat", type=int, default=3, help="シナリオごとの繰り返し回数")
+    run_parser.add_argument("--output", type=Path, help="結果の保存先。省略時は results/<日時>.json")
+    run_parser.add_argument("--log-dir", type=Path, help="各セッションのエージェントの出力を保存するディレクトリ")
+
+    compare_parser = commands.add_parser("compare", help="2つの結果を比較し、リグレッションがあれば終了コード 1 を返す")
+    compare_parser.add_argument("baseline", type=Path)
+    compare_parser.add_argument("candidate", type=Path)
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="リグレッションとみなす増加率")
+
+    # `run` が起動する子プロセス用（内部コマンド）
+    session_parser = commands.add_parser("session")
+    session_parser.add_argument("scenario_path", type=Path)
+    session_parser.add_argument("result_file", type=Path)
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        run(args.scenarios, args.repeat, args.output, args.log_dir)
+    elif args.command == "compare":
+        return compare(args.baseline, args.candidate, args.threshold)
+    else:
+        session(args.scenario_path, args.result_file)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,5 +2,55 @@ from .agent import Agent
 from .manager import Manager
 from .architect import Architect
 from .coder import Coder
+from .agent_pool import AgentPool
+from .code_index import CodeIndex, get_code_index
+from .conversation_memory import ConversationMemory
+from .task_graph import TaskGraph, TaskNode
+from .task_scheduler import TaskScheduler
+from .llm_backend import LLMBackend, create_backend, get_backend
+from .file_editor import FileEditor, EditError
+from .recording_backend import RecordingBackend
+from .replay_backend import ReplayBackend
+from .metrics import Metrics, get_metrics
+from .model_router import ModelRouter, RouteRequest, RouteDecision, get_model_router
+from .project_index import ProjectIndex, get_project_index
+from .rate_limiter import RateLimiter, get_rate_limiter
+from .response_cache import ResponseCache, get_response_cache
+from .response_snapshot import ResponseSnapshot
+from .retry_engine import RetryEngine, CircuitOpenError, get_retry_engine
+from .sandbox_process import OutputCapture, SandboxLimits, SandboxResult
+from .sandbox_worker import SandboxWorker
+from .streaming import StreamEvent, StreamAssembler, stream_events
+from .token_ledger import TokenLedger, TokenBudgetExceeded, get_token_ledger
+from .tracing import Span, Tracer, get_tracer
+from .trace_exporters import SpanExporter, InMemorySpanExporter, JsonlSpanExporter, OtlpJsonSpanExporter
+from .tool_executor import ToolExecutor, ThreadPoolToolExecutor, AsyncioToolExecutor, parallel_safe
+from .tool_output_store import ToolOutputStore, get_tool_output_store
+from .tool_registry import ToolRegistry, ToolSpec, tool
+from .workspace_manager import WorkspaceManager, get_workspace_manager
 
-__all__ = ["Agent", "Manager", "Architect", "Coder"]
+__all__ = [
+    "Agent", "Manager", "Architect", "Coder",
+    "AgentPool", "TaskGraph", "TaskNode", "TaskScheduler", "ConversationMemory",
+    "LLMBackend", "GeminiBackend", "RecordingBackend", "ReplayBackend", "create_backend", "get_backend",
+    "Metrics", "get_metrics", "RateLimiter", "get_rate_limiter", "RetryEngine", "CircuitOpenError", "get_retry_engine",
+    "ModelRouter", "RouteRequest", "RouteDecision", "get_model_router",
+    "ProjectIndex", "get_project_index", "CodeIndex", "get_code_index", "FileEditor", "EditError",
+    "ResponseCache", "get_response_cache", "ResponseSnapshot",
+    "SandboxWorker", "SandboxResult", "SandboxLimits", "OutputCapture",
+    "StreamEvent", "StreamAssembler", "stream_events",
+    "TokenLedger", "TokenBudgetExceeded", "get_token_ledger",
+    "Span", "Tracer", "get_tracer",
+    "SpanExporter", "InMemorySpanExporter", "JsonlSpanExporter", "OtlpJsonSpanExporter",
+    "ToolExecutor", "ThreadPoolToolExecutor", "AsyncioToolExecutor", "parallel_safe",
+    "ToolOutputStore", "get_tool_output_store", "ToolRegistry", "ToolSpec", "tool",
+    "WorkspaceManager", "get_workspace_manager",
+]
+
+
+def __getattr__(name):
+    # google-generativeai の読み込みには1秒近くかかるため、Gemini バックエンドは使われるまでインポートしない
+    if name == "GeminiBackend":
+        from .gemini_backend import GeminiBackend
+        return GeminiBackend
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
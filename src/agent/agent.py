@@ -1,20 +1,64 @@
-from abc import ABC, abstractmethod
-from typing import List, Optional, Any, Dict
+from abc import ABC
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Any, Dict, Coroutine, Tuple, TypeVar
+import asyncio
+import contextvars
+import hashlib
+import inspect
+import json
 import os
-import time
-import google.generativeai as genai
 from rich.console import Console
 
+try:
+    from .conversation_memory import ConversationMemory, estimate_tokens, extractive_summary, format_turns
+    from .llm_backend import LLMBackend, get_backend
+    from .metrics import get_metrics
+    from .model_router import ModelRouter, RouteRequest, CALL_SUMMARY, CALL_TOOL_FOLLOWUP, CALL_TURN, get_model_router
+    from .rate_limiter import RateLimiter, get_rate_limiter
+    from .response_cache import ResponseCache, get_response_cache
+    from .response_snapshot import ResponseSnapshot, to_plain
+    from .retry_engine import CircuitOpenError, RetryEngine, ERROR_RATE_LIMIT, get_retry_engine
+    from .streaming import (StreamAssembler, StreamCallback, current_stream_callback, emit, stream_events, stream_turn,
+                            EVENT_TOOL_CALL, EVENT_TOOL_RESULT, TOOL_RESULT_PREVIEW_CHARS)
+    from .token_ledger import TokenLedger, BUDGET_OK, BUDGET_SOFT, get_token_ledger
+    from .tool_executor import ToolExecutor, create_tool_executor
+    from .tool_registry import ToolRegistry, ToolSpec, spec_of, tool
+    from .tool_output_store import ToolOutputStore, get_tool_output_store
+    from .tracing import Span, get_tracer
+except ImportError:
+    from agent.conversation_memory import ConversationMemory, estimate_tokens, extractive_summary, format_turns
+    from agent.llm_backend import LLMBackend, get_backend
+    from agent.metrics import get_metrics
+    from agent.model_router import ModelRouter, RouteRequest, CALL_SUMMARY, CALL_TOOL_FOLLOWUP, CALL_TURN, get_model_router
+    from agent.rate_limiter import RateLimiter, get_rate_limiter
+    from agent.response_cache import ResponseCache, get_response_cache
+    from agent.response_snapshot import ResponseSnapshot, to_plain
+    from agent.retry_engine import CircuitOpenError, RetryEngine, ERROR_RATE_LIMIT, get_retry_engine
+    from agent.streaming import (StreamAssembler, StreamCallback, current_stream_callback, emit, stream_events, stream_turn,
+                                 EVENT_TOOL_CALL, EVENT_TOOL_RESULT, TOOL_RESULT_PREVIEW_CHARS)
+    from agent.token_ledger import TokenLedger, BUDGET_OK, BUDGET_SOFT, get_token_ledger
+    from agent.tool_executor import ToolExecutor, create_tool_executor
+    from agent.tool_registry import ToolRegistry, ToolSpec, spec_of, tool
+    from agent.tool_output_store import ToolOutputStore, get_tool_output_store
+    from agent.tracing import Span, get_tracer
+
 # リッチな出力を提供するためのコンソールインスタンス
 console = Console()
 
+T = TypeVar("T")
+
 class Agent(ABC):
     """
     全てのAIエージェントの基底クラス。
-    Gemini APIとの通信、履歴管理、基本的な思考プロセスを担当する。
+    LLM (バックエンド経由の Gemini API) との通信、履歴管理、基本的な思考プロセスを担当する。
     """
 
-    def __init__(self, name: str, role: str, instructions: str, model_name: Optional[str] = None, tools: Optional[List[Any]] = None):
+    def __init__(self, name: str, role: str, instructions: str, model_name: Optional[str] = None, tools: Optional[List[Any]] = None,
+                 rate_limiter: Optional[RateLimiter] = None, tool_executor: Optional[ToolExecutor] = None,
+                 response_cache: Optional[ResponseCache] = None, backend: Optional[LLMBackend] = None,
+                 token_ledger: Optional[TokenLedger] = None, memory: Optional[ConversationMemory] = None,
+                 tool_output_store: Optional[ToolOutputStore] = None, retry_engine: Optional[RetryEngine] = None,
+                 model_router: Optional[ModelRouter] = None):
         """
         エージェントを初期化する。
 
@@ -23,35 +67,55 @@ class Agent(ABC):
             role (str): エージェントの役割（例: "Project Manager"）。
             instructions (str): システムプロンプトとしての詳細な指示。
             model_name (str, optional): 使用するGeminiモデルの名前。
-            tools (list, optional): エージェントが使用可能なツールのリスト。
+            tools (list, optional): エージェントが使用可能なツールのリスト。省略時はクラスで `tool` を付けて宣言したメソッド。
+            rate_limiter (RateLimiter, optional): API呼び出しの流量制御。省略時はプロセス共有のものを使用。
+            tool_executor (ToolExecutor, optional): 1ターン内のツール呼び出しの実行器。省略時は `AGENT_TOOL_EXECUTOR` に従う。
+            response_cache (ResponseCache, optional): LLM 応答の永続キャッシュ。省略時は `AGENT_RESPONSE_CACHE` が設定されている場合のみ有効。
+            backend (LLMBackend, optional): LLM との通信を担うバックエンド。省略時は `AGENT_LLM_BACKEND` に従う（デフォルトは Gemini）。
+            token_ledger (TokenLedger, optional): トークン使用量の集計と予算管理。省略時はプロセス共有のものを使用。
+            memory (ConversationMemory, optional): 会話履歴をトークン予算内に収める会話メモリ。省略時は `AGENT_MEMORY_*` に従う。
+            tool_output_store (ToolOutputStore, optional): 大きなツール出力の切り詰めと退避先。省略時はプロセス共有のものを使用。
+            retry_engine (RetryEngine, optional): API 呼び出しのリトライとモデルごとのサーキットブレーカー。省略時はプロセス共有のものを使用。
+            model_router (ModelRouter, optional): 呼び出しごとのモデルの選択。省略時は `AGENT_MODEL_*` に従うプロセス共有のもの。
         """
         self.name = name
         self.role = role
         self.instructions = instructions
-        self.tools = tools
+        # ツールの宣言はクラスごとに1度だけ集める
+        self.tool_registry = ToolRegistry.for_class(type(self))
+        if tools is None:
+            tools = [t for t in self.tool_registry.bind(self) if t.__name__ != "read_tool_output"] or None
+        # ツールを持つエージェントには、切り詰められた出力の続きを読むツールを加える
+        self.tools = [*tools, self.read_tool_output] if tools is not None else None
+        # ツール名から実行する関数への表（呼び出しのたびに分岐を辿らない）
+        self._tool_table = {getattr(t, "__name__", str(t)): t for t in self.tools or []}
+        self._tool_schema_digest: Optional[Tuple[List[Any], str]] = None
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.tool_executor = tool_executor or create_tool_executor()
+        self.response_cache = response_cache or get_response_cache()
+        self.token_ledger = token_ledger or get_token_ledger()
+        self.tool_output_store = tool_output_store or get_tool_output_store()
+        self.retry_engine = retry_engine or get_retry_engine()
+        self.model_router = model_router or get_model_router()
+        self.metrics = get_metrics()
+        self.tracer = get_tracer()
         
         # モデル名の決定: 引数 > 環境変数 > デフォルト
         self.model_name = model_name or os.getenv("GEMINI_MODEL_NAME") or "gemini-1.5-flash"
-        self.history: List[Dict[str, Any]] = []
-        
-        # APIキーの確認
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            error_msg = "GEMINI_API_KEY environment variable is not set."
-            console.print(f"[bold red]Error:[/bold red] {error_msg}")
-            raise ValueError(error_msg)
-        else:
-            genai.configure(api_key=api_key)
-
-        # モデルの初期化
-        self.model = genai.GenerativeModel(
-            model_name=self.model_name,
-            system_instruction=self._build_system_prompt(),
-            tools=self.tools
-        )
+        # ルーターが「エージェントのモデル」として扱うモデル（model_name は呼び出しごとに切り替わる）
+        self.default_model = self.model_name
+        # 次の呼び出しを上位モデルで行う理由（検証の失敗をツールなどが報告する）
+        self._escalation: Optional[str] = None
+        # サーキットブレーカーにより代わりのモデルへ切り替えている間の、元のモデル
+        self._failed_over_from: Optional[str] = None
+        # 会話履歴はチャットセッションが保持し、API 呼び出しの前に会話メモリが予算内に整える
+        self.memory = memory or ConversationMemory.from_env(
+            llm_summarizer=self._summarize_with_llm, output_store=self.tool_output_store)
         
-        # チャットセッションの開始（手動で関数呼び出しを制御するため False に設定）
-        self.chat_session = self.model.start_chat(history=[], enable_automatic_function_calling=False)
+        # モデルの初期化とチャットセッションの開始（関数呼び出しは手動で制御する）
+        self.backend = backend or get_backend()
+        self.chat_session = self.backend.start_chat(self.model_name, self._build_system_prompt(), self.tools)
+        self.model = getattr(self.chat_session, "model", None)
 
     def _build_system_prompt(self) -> str:
         """
@@ -67,38 +131,88 @@ class Agent(ABC):
         回答は常に日本語で行ってください。
         """
 
-    def send_message(self, message: str, max_iterations: int = 10) -> str:
+    def send_message(self, message: str, max_iterations: int = 10, on_event: Optional[StreamCallback] = None,
+                     raise_errors: bool = False) -> str:
         """
         ユーザーまたは他のエージェントからのメッセージを受け取り、応答を生成する。
+        非同期コア (`send_message_async`) の同期ラッパーで、API・ツールはブロッキングで呼び出す。
         
         Args:
             message (str): 入力メッセージ。
             max_iterations (int): ツール実行の最大反復回数。無限ループ防止用。
+            on_event (callable, optional): 応答をストリーミングで受け取るコールバック。
+                委任先のサブエージェントのテキストやツール呼び出しも `StreamEvent` として届く。
+            raise_errors (bool): True の場合、API の呼び出しやツールのループの失敗をエラーメッセージとして返さず、
+                例外として送出する（`TaskScheduler` がタスクの失敗を判定するため）。
 
         Returns:
             str: エージェントからの最終的な応答。
         """
-        # 連続リクエストによる429を防ぐための最小インターバル（秒）
-        request_interval = 2.0  # 安全のため少し延ばす
+        return run_sync(self._run_conversation(message, max_iterations, blocking=True, on_event=on_event,
+                                               raise_errors=raise_errors))
+
+    async def send_message_async(self, message: str, max_iterations: int = 10,
+                                 on_event: Optional[StreamCallback] = None, raise_errors: bool = False) -> str:
+        """
+        `send_message` の非同期版。API 呼び出しとツール実行の待ち時間中にイベントループを解放するため、
+        1つのイベントループで多数のエージェントチームを同時に動かせる。
 
+        Args:
+            message (str): 入力メッセージ。
+            max_iterations (int): ツール実行の最大反復回数。無限ループ防止用。
+            on_event (callable, optional): 応答をストリーミングで受け取るコールバック。
+            raise_errors (bool): True の場合、失敗をエラーメッセージとして返さずに例外として送出する。
+
+        Returns:
+            str: エージェントからの最終的な応答。
+        """
+        return await self._run_conversation(message, max_iterations, blocking=False, on_event=on_event,
+                                            raise_errors=raise_errors)
+
+    async def _run_conversation(self, message: str, max_iterations: int, blocking: bool,
+                                on_event: Optional[StreamCallback] = None, raise_errors: bool = False) -> str:
+        """
+        ReAct ループ本体。同期版・非同期版の両方から使われる。
+
+        Args:
+            blocking (bool): True の場合は同期 SDK 呼び出しと同期ツール実行を使う（`send_message` 用）。
+            on_event (callable, optional): ストリーミングのコールバック。省略時は呼び出し元から引き継いだもの（委任時）を使う。
+        """
+        if on_event is not None:
+            with stream_events(on_event):
+                return await self._run_conversation(message, max_iterations, blocking, raise_errors=raise_errors)
+
+        self.metrics.incr("agent.turns")
+        with self.tracer.span("agent.send_message", **{"agent.name": self.name, "llm.model": self.model_name}) as span, \
+                stream_turn(self.name):
+            return await self._converse(message, max_iterations, blocking, span, raise_errors)
+
+    async def _converse(self, message: str, max_iterations: int, blocking: bool, span: Span,
+                        raise_errors: bool = False) -> str:
+        """
+        `_run_conversation` の本体。反復回数とエラーをターンのスパンに記録する。
+        """
         # 最初のメッセージを送信
         try:
-            response = self._call_api(message)
+            response = await self._call_api_async(message, blocking=blocking)
         except Exception as e:
+            span.record_error(e)
+            if raise_errors:
+                raise
             return f"APIエラーが発生しました: {str(e)}"
 
         # 関数呼び出しのループ処理
         iteration_count = 0
+        iteration_cap: Optional[int] = None
         while True:
             # 無限ループ防止チェック
             if iteration_count >= max_iterations:
                 msg = f"\n[System Warning] Tool execution limit reached ({max_iterations} iterations). Loop forced to stop."
                 console.print(f"[bold red]{msg}[/bold red]")
-                return response.text + msg
+                span.set_attribute("agent.iteration_limit_reached", True)
+                return _response_text(response) + msg
 
-            # APIクォータを保護するためのインターバル
-            time.sleep(request_interval)
-            
+            # APIクォータの保護は _call_api_async 内のレートリミッターが担当する
             try:
                 # ツール実行依頼が含まれているか確認
                 function_calls = [part.function_call for part in response.parts if part.function_call]
@@ -107,63 +221,538 @@ class Agent(ABC):
                     # 思考が完了し、最終的なテキスト応答が得られた
                     return response.text
 
+                # トークン予算のソフトリミットを超えた後は、残りのツール反復を制限する
+                if iteration_cap is None and self.token_ledger.check() != BUDGET_OK:
+                    iteration_cap = iteration_count + self.token_ledger.soft_extra_iterations
+                if iteration_cap is not None and iteration_count >= iteration_cap:
+                    msg = "\n[System Warning] Token budget soft limit reached. Remaining tool calls were skipped."
+                    console.print(f"[bold yellow]{self.name}: {msg.strip()}[/bold yellow]")
+                    span.set_attribute("budget.iterations_skipped", True)
+                    return _response_text(response) + msg
+
                 # カウントアップ
                 iteration_count += 1
+                self.metrics.incr("agent.tool_iterations")
+                span.set_attribute("agent.tool_iterations", iteration_count)
                 console.print(f"[dim]{self.name} tool iteration: {iteration_count}/{max_iterations}[/dim]")
 
-                # ツール実行結果のリストを作成
+                # ツールを実行し（並列安全なものは同時に）、元の順序で結果のリストを作成
+                calls = [(fc.name, dict(fc.args)) for fc in function_calls]
+                for name, args in calls:
+                    emit(EVENT_TOOL_CALL, self.name, f"{name}({json.dumps(args, ensure_ascii=False, default=str)})")
+                with self.metrics.timer("agent.tools"):
+                    if blocking:
+                        results = self.tool_executor.run(self, calls)
+                    else:
+                        results = await self.tool_executor.run_async(self, calls)
                 tool_results = []
-                for fc in function_calls:
-                    result = self.execute_tool(fc.name, dict(fc.args))
-                    # TODO: 結果が長すぎる場合は切り詰めるなどの処理も検討可能
+                for (name, _), result in zip(calls, results):
+                    # 長すぎる結果は先頭と末尾だけを返し、全文は read_tool_output で読めるよう退避する
+                    if isinstance(result, str):
+                        limited = self.tool_output_store.limit(result)
+                        if limited is not result:
+                            self.metrics.incr("tool.truncated_results")
+                            span.add("tool.truncated_bytes", len(result.encode("utf-8")) - len(limited.encode("utf-8")))
+                        result = limited
+                    emit(EVENT_TOOL_RESULT, self.name, f"{name}: {str(result)[:TOOL_RESULT_PREVIEW_CHARS]}")
                     tool_results.append({
                         "function_response": {
-                            "name": fc.name,
+                            "name": name,
                             "response": {"result": result}
                         }
                     })
                 
                 # 実行結果をモデルに返送
                 console.print(f"[dim]{self.name} is processing tool results...[/dim]")
-                response = self._call_api(tool_results)
+                response = await self._call_api_async(tool_results, blocking=blocking, call_type=CALL_TOOL_FOLLOWUP,
+                                                      routine=self.model_router.is_routine(results))
                 
             except Exception as e:
+                span.record_error(e)
+                if raise_errors:
+                    raise
                 return f"処理中にエラーが発生しました: {str(e)}"
 
-    def _call_api(self, content: Any, max_retries: int = 3) -> Any:
+    def _call_api(self, content: Any, max_retries: Optional[int] = None) -> Any:
+        """
+        Gemini APIを呼び出し、一時的なエラー時はリトライを行います（`_call_api_async` の同期ラッパー）。
+        """
+        return run_sync(self._call_api_async(content, max_retries, blocking=True))
+
+    async def _call_api_async(self, content: Any, max_retries: Optional[int] = None, blocking: bool = False,
+                              call_type: str = CALL_TURN, routine: bool = False) -> Any:
         """
-        Gemini APIを呼び出し、429エラー時はリトライを行います。
+        Gemini APIを呼び出し、一時的なエラー時はリトライを行います。
+        呼び出し前にレートリミッターで予算を確保し、予算が枯渇している場合のみ待機します。
+
+        Args:
+            content: 送信する内容（テキストまたはツール実行結果）。
+            max_retries (int, optional): 最大試行回数。省略時はリトライエンジンの設定（`AGENT_RETRY_MAX_ATTEMPTS`）。
+            blocking (bool): True の場合は同期 SDK (`send_message`) を使う。
+            call_type (str): 呼び出しの種類（モデルの選択に使う。`CALL_TURN` / `CALL_TOOL_FOLLOWUP`）。
+            routine (bool): ツールの結果が定型的か（安価なモデルで処理してよいか）。
+        """
+        turn_span = self.tracer.current_span()
+        with self.tracer.span("llm.call", **{"agent.name": self.name, "llm.model": self.model_name}) as span:
+            # キャッシュキーはモデル名を含むため、キャッシュの参照より前にモデルを決める
+            self._apply_route(call_type, content, routine, span)
+            response = await self._call_api_with_retries(content, max_retries, blocking, span)
+            usage = usage_attributes(response)
+            span.attributes.update(usage)
+            if turn_span is not None:
+                turn_span.add("llm.calls")
+                turn_span.add("llm.total_tokens", usage["llm.total_tokens"])
+                turn_span.add("llm.retries", span.attributes.get("llm.retries", 0))
+            return response
+
+    async def _call_api_with_retries(self, content: Any, max_retries: int, blocking: bool, span: Span) -> Any:
+        """
+        `_call_api_async` の本体。キャッシュの参照と、試行ごとのスパンを伴うリトライを行う。
+        失敗の分類・待機時間・サーキットブレーカーは、プロセスで共有するリトライエンジンに従う。
         """
-        initial_delay = 5
+        engine = self.retry_engine
+        max_retries = max_retries or engine.max_attempts
+
+        # 古いターンの要約と大きなツール出力の置き換えを、キャッシュキーの計算より前に行う
+        if blocking or self.memory.summarizer != self._summarize_with_llm:
+            self._compact_history(span)
+        else:
+            # LLM による要約は同期の呼び出し（リトライの待機を含む）のため、イベントループを止めないようワーカースレッドで行う
+            await asyncio.to_thread(contextvars.copy_context().run, self._compact_history, span)
+
+        # キャッシュにヒットした場合は API を呼ばず、チャット履歴だけを進める
+        cache_key = self._cache_key(content) if self.response_cache else None
+        if cache_key:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                console.print(f"[dim]{self.name} response served from cache.[/dim]")
+                self.metrics.incr("api.cache_hits")
+                span.set_attribute("llm.cache_hit", True)
+                snapshot = ResponseSnapshot.from_dict(cached)
+                self._append_history(content, snapshot)
+                return snapshot
+
+        # トークン予算を確認する。ハードリミット超過なら呼び出さず、ソフトリミット超過なら安価なモデルへ切り替える
+        budget_state = self.token_ledger.enforce(self.name)
+        span.set_attribute("budget.state", budget_state)
+        if budget_state == BUDGET_SOFT:
+            self._switch_to_fallback_model()
+            span.set_attribute("llm.model", self.model_name)
         
+        delay = 0.0
         for attempt in range(max_retries):
+            # 失敗が続いて冷却中のモデルは呼ばない（代わりのモデルがあれば切り替え、無ければ即座に失敗する）
+            self._select_available_model(span)
             try:
-                if attempt == 0:
-                    console.print(f"[bold blue]{self.name}[/bold blue] is thinking...")
-                else:
-                    console.print(f"[yellow]Retrying {self.name} (attempt {attempt + 1}/{max_retries})...[/yellow]")
-                
-                return self.chat_session.send_message(content)
+                with self.tracer.span("llm.attempt", **{"llm.attempt": attempt + 1}) as attempt_span:
+                    # 予算が枯渇している場合（429による一時停止中を含む）はここで待機する
+                    with self.metrics.timer("api.rate_limit_wait"):
+                        waited = await self.rate_limiter.acquire_async(self.model_name)
+                    if waited:
+                        attempt_span.set_attribute("rate_limit.wait_seconds", waited)
+
+                    if attempt == 0:
+                        console.print(f"[bold blue]{self.name}[/bold blue] is thinking...")
+                    else:
+                        console.print(f"[yellow]Retrying {self.name} (attempt {attempt + 1}/{max_retries})...[/yellow]")
+                        self.metrics.incr("api.retries")
+                    
+                    self.metrics.incr("api.calls")
+                    with self.metrics.timer("api.request"):
+                        if current_stream_callback() is not None:
+                            response = await self._send_streaming(content, blocking, attempt_span)
+                        elif blocking:
+                            response = self.chat_session.send_message(content)
+                        else:
+                            response = await self.chat_session.send_message_async(content)
+                    attempt_span.attributes.update(usage_attributes(response))
+                engine.record_success(self.model_name)
+                tokens = _total_token_count(response)
+                self.metrics.incr("api.tokens", tokens)
+                self.rate_limiter.record_usage(self.model_name, tokens)
+                self._record_tokens(self.model_name, response)
+                if cache_key:
+                    self.response_cache.put(cache_key, ResponseSnapshot.from_response(response).to_dict())
+                return response
                 
             except Exception as e:
-                error_str = str(e)
-                if "429" in error_str and ("quota" in error_str.lower() or "limit" in error_str.lower()):
-                    if "limit: 0" in error_str:
-                        raise e # モデル利用不可は即時失敗
-                    
-                    if attempt < max_retries - 1:
-                        wait_time = initial_delay * (2 ** attempt)
-                        console.print(f"[yellow]Quota exceeded. Waiting {wait_time}s before retry...[/yellow]")
-                        time.sleep(wait_time)
-                        continue
-                raise e
-        
-        raise Exception(f"{self.name} failed after {max_retries} attempts.")
+                info = engine.classify(e)
+                span.set_attribute("llm.error_kind", info.kind)
+                engine.record_failure(self.model_name, info)
+                if not info.retryable or attempt >= max_retries - 1:
+                    raise
+                delay = engine.backoff(delay, info)
+                span.add("llm.retries")
+                if info.kind == ERROR_RATE_LIMIT:
+                    console.print(f"[yellow]Quota exceeded. Waiting {delay:.1f}s before retry...[/yellow]")
+                    # 同じモデルを使う他のエージェントも含めて待機させる（待機は次の試行のレートリミッターで行う）
+                    self.rate_limiter.penalize(self.model_name, delay)
+                else:
+                    console.print(f"[yellow]{self.name}: {info.kind} error ({e}). Retrying in {delay:.1f}s...[/yellow]")
+                    with self.metrics.timer("api.backoff_wait"):
+                        await asyncio.sleep(delay)
+
+    def _select_available_model(self, span: Span):
+        """
+        サーキットブレーカーに従って、この試行で使うモデルを決める。
+
+        代わりのモデルへ切り替えている間に元のモデルが回復していれば戻す。現在のモデルが冷却中なら、
+        `AGENT_FAILOVER_MODEL` が使える場合は会話履歴を引き継いだまま切り替え、使えない場合は `CircuitOpenError` を送出する。
+        """
+        engine = self.retry_engine
+        if self._failed_over_from and engine.allow(self._failed_over_from):
+            console.print(f"[green]{self.name} switches back to {self._failed_over_from}.[/green]")
+            self._switch_model(self._failed_over_from)
+            self._failed_over_from = None
+            return
+        if engine.allow(self.model_name):
+            return
+        failover = engine.failover_model
+        if failover and failover != self.model_name and engine.allow(failover):
+            console.print(f"[yellow]{self.model_name} is cooling down. {self.name} fails over to {failover}.[/yellow]")
+            self.metrics.incr("api.failovers")
+            self._failed_over_from = self._failed_over_from or self.model_name
+            self._switch_model(failover)
+            span.set_attribute("llm.failover", failover)
+            span.set_attribute("llm.model", failover)
+            return
+        self.metrics.incr("api.circuit_rejections")
+        raise CircuitOpenError(self.model_name, engine.retry_in(self.model_name))
+
+    async def _send_streaming(self, content: Any, blocking: bool, span: Span) -> ResponseSnapshot:
+        """
+        ストリーミングで送信し、届いたテキストをイベントとして送りながら1つのレスポンスに組み立てる。
+        """
+        history = list(self.chat_session.history)
+        assembler = StreamAssembler(self.name)
+        try:
+            if blocking:
+                for chunk in self.chat_session.send_message(content, stream=True):
+                    assembler.add(chunk)
+            else:
+                stream = await self.chat_session.send_message_async(content, stream=True)
+                async for chunk in stream:
+                    assembler.add(chunk)
+        except Exception:
+            # 途中で失敗したストリームは履歴に残さない（リトライでは同じ内容を送り直す）
+            self.chat_session.history = history
+            raise
+        if assembler.time_to_first_chunk is not None:
+            self.metrics.add_time("api.first_chunk", assembler.time_to_first_chunk)
+            span.set_attribute("llm.time_to_first_chunk", assembler.time_to_first_chunk)
+        return assembler.response()
+
+    def _record_tokens(self, model_name: str, response: Any):
+        """
+        レスポンスのトークン使用量をトークン台帳に記録する。
+        """
+        usage = usage_attributes(response)
+        self.token_ledger.record(
+            self.name, model_name,
+            prompt_tokens=usage["llm.prompt_tokens"],
+            candidates_tokens=usage["llm.candidates_tokens"],
+            total_tokens=usage["llm.total_tokens"],
+        )
+
+    def _compact_history(self, span: Span):
+        """
+        会話メモリで履歴を整え、圧縮した場合はメトリクスとスパンに記録する。
+        """
+        before = self.memory.stats()["compactions"]
+        if not self.memory.apply(self.chat_session):
+            return
+        if self.memory.stats()["compactions"] > before:
+            console.print(f"[dim]{self.name} compacted older conversation turns into a summary.[/dim]")
+            self.metrics.incr("memory.compactions")
+            span.set_attribute("memory.compacted", True)
+
+    def _summarize_with_llm(self, previous: str, turns: List[List[Dict[str, Any]]]) -> str:
+        """
+        古いターンを LLM で要約する（`AGENT_MEMORY_SUMMARIZER=llm` の場合に使用）。
+        失敗した場合は抽出的な要約に切り替える。
+        """
+        prompt = f"""
+        以下の「これまでの要約」と「会話」を統合し、今後の会話に必要な事実・決定事項・未解決の課題を
+        簡潔な箇条書きの日本語で要約してください。
+
+        これまでの要約:
+        {previous or "(なし)"}
+
+        会話:
+        {format_turns(turns)}
+        """
+        try:
+            model_name = self._route_single(CALL_SUMMARY, prompt)
+            response = self._generate_single(model_name, "あなたは会話の要約担当です。", prompt, span_name="llm.summarize")
+            return _response_text(response) or extractive_summary(previous, turns)
+        except Exception as e:
+            console.print(f"[yellow]{self.name}: summarization failed ({e}). Falling back to extractive summary.[/yellow]")
+            return extractive_summary(previous, turns)
+
+    def _switch_to_fallback_model(self):
+        """
+        トークン予算のソフトリミット超過時に、会話履歴を引き継いだまま安価なモデルへ切り替える。
+        """
+        fallback = self.token_ledger.fallback_model
+        if not fallback or fallback == self.model_name:
+            return
+        console.print(f"[yellow]Token budget soft limit reached. {self.name} switches model: {self.model_name} -> {fallback}[/yellow]")
+        # 予算による切り替えを優先し、ブレーカーによる切り替えからは戻さない
+        self._failed_over_from = None
+        self._switch_model(fallback)
+
+    def request_escalation(self, reason: str):
+        """
+        次の API 呼び出しを上位モデル (`AGENT_MODEL_STRONG`) で行うよう求める。
+        ツールが検証の失敗（コマンドの異常終了など）を検出したときに呼ぶ。
+        """
+        self._escalation = reason
+
+    def _apply_route(self, call_type: str, content: Any, routine: bool, span: Span):
+        """
+        ルーターが選んだモデルに、会話履歴を引き継いだまま切り替える。
+        """
+        if not self.model_router.enabled:
+            return
+        escalation, self._escalation = self._escalation, None
+        prompt_tokens = estimate_tokens(list(self.chat_session.history)) + estimate_tokens(content)
+        decision = self.model_router.route(
+            RouteRequest(self.name, call_type, prompt_tokens, self.token_ledger.check(), escalation, routine),
+            self.default_model)
+        span.set_attribute("llm.route_tier", decision.tier)
+        span.set_attribute("llm.route_reason", decision.reason)
+        self.metrics.incr(f"router.{decision.tier}")
+        if decision.model != self.model_name:
+            # ブレーカーによる切り替えは、ルーターが選んだモデルについて改めて判断する
+            self._failed_over_from = None
+            self._switch_model(decision.model)
+            span.set_attribute("llm.model", decision.model)
+
+    def _route_single(self, call_type: str, prompt: str, escalation: Optional[str] = None) -> str:
+        """
+        チャットセッションを使わない単発の生成（要約・タスクの分解）に使うモデルを選ぶ。
+        """
+        if not self.model_router.enabled:
+            return self.model_name
+        decision = self.model_router.route(
+            RouteRequest(self.name, call_type, estimate_tokens(prompt), self.token_ledger.check(), escalation),
+            self.default_model)
+        self.metrics.incr(f"router.{decision.tier}")
+        return decision.model
+
+    def _generate_single(self, model_name: str, system_instruction: str, prompt: str,
+                         response_schema: Optional[Dict[str, Any]] = None, span_name: str = "llm.generate") -> Any:
+        """
+        チャットセッションを使わない単発の生成を行う（要約・タスクの分解）。
+        チャットの呼び出しと同じく、試行ごとにレートリミッターの予算を確保し、使用量をバケットとトークン台帳に記録する。
+        """
+        def generate() -> Any:
+            with self.metrics.timer("api.rate_limit_wait"):
+                self.rate_limiter.acquire(model_name)
+            return self.backend.generate_content(model_name, system_instruction, prompt, response_schema)
+
+        self.metrics.incr("api.calls")
+        with self.tracer.span(span_name, **{"agent.name": self.name, "llm.model": model_name}) as span, \
+                self.metrics.timer("api.request"):
+            response = self.retry_engine.call(model_name, generate, on_rate_limit=self.rate_limiter.penalize)
+            span.attributes.update(usage_attributes(response))
+        self._record_single_usage(model_name, response)
+        return response
+
+    async def _generate_single_async(self, model_name: str, system_instruction: str, prompt: str,
+                                     response_schema: Optional[Dict[str, Any]] = None,
+                                     span_name: str = "llm.generate") -> Any:
+        """
+        `_generate_single` の非同期版。予算の待機とリトライの待機の間もイベントループをブロックしない。
+        """
+        async def generate() -> Any:
+            with self.metrics.timer("api.rate_limit_wait"):
+                await self.rate_limiter.acquire_async(model_name)
+            return await self.backend.generate_content_async(model_name, system_instruction, prompt, response_schema)
+
+        self.metrics.incr("api.calls")
+        with self.tracer.span(span_name, **{"agent.name": self.name, "llm.model": model_name}) as span, \
+                self.metrics.timer("api.request"):
+            response = await self.retry_engine.call_async(model_name, generate, on_rate_limit=self.rate_limiter.penalize)
+            span.attributes.update(usage_attributes(response))
+        self._record_single_usage(model_name, response)
+        return response
+
+    def _record_single_usage(self, model_name: str, response: Any):
+        tokens = _total_token_count(response)
+        self.metrics.incr("api.tokens", tokens)
+        self.rate_limiter.record_usage(model_name, tokens)
+        self._record_tokens(model_name, response)
+
+    def _switch_model(self, model_name: str):
+        """
+        会話履歴を引き継いだまま、チャットセッションを別のモデルで作り直す。
+        """
+        history = list(self.chat_session.history)
+        self.model_name = model_name
+        self.chat_session = self.backend.start_chat(model_name, self._build_system_prompt(), self.tools)
+        self.chat_session.history = history
+        self.model = getattr(self.chat_session, "model", None)
+
+    def _cache_key(self, content: Any) -> str:
+        """
+        モデル名・システムプロンプト・会話履歴・ツールスキーマ・送信内容からキャッシュキーを作る。
+        """
+        history = [_fingerprint(c) for c in self.chat_session.history]
+        return ResponseCache.make_key(
+            self.model_name,
+            _sha256(self._build_system_prompt()),
+            _sha256(history),
+            self._tool_digest(),
+            to_plain(content),
+        )
+
+    def _append_history(self, content: Any, snapshot: ResponseSnapshot):
+        """
+        API を呼ばずに得た応答を、通常の送受信と同じ形でチャット履歴に追加する。
+        """
+        user_parts = [{"text": content}] if isinstance(content, str) else to_plain(content)
+        self.chat_session.history = [
+            *self.chat_session.history,
+            {"role": "user", "parts": user_parts},
+            snapshot.to_content(),
+        ]
+
+    def _tool_digest(self) -> str:
+        """
+        ツールスキーマのハッシュ。ツールの一覧が変わらない間は計算し直さない。
+        """
+        if self._tool_schema_digest is None or self._tool_schema_digest[0] is not self.tools:
+            self._tool_schema_digest = (self.tools, _sha256(_tool_schema(self.tools)))
+        return self._tool_schema_digest[1]
+
+    @tool(parallel_safe=True, idempotent=True)
+    def read_tool_output(self, output_id: str, offset: int = 0, length: int = 4000) -> str:
+        """
+        切り詰められたツール出力の続きを読み出します。切り詰められた結果に示された ID を指定してください。
+
+        Args:
+            output_id (str): 切り詰められた出力の ID（例: 'out-1a2b3c4d5e6f'）。
+            offset (int): 読み出し開始位置（バイト）。
+            length (int): 読み出す長さ（バイト）。
+
+        Returns:
+            str: 指定範囲の出力。
+        """
+        return self.tool_output_store.read(output_id, int(offset), int(length))
+
+    def tool_spec(self, tool_name: str) -> Optional[ToolSpec]:
+        """
+        ツールのメタデータ（並列安全・冪等性・コストの分類）を返す。このエージェントのツールでなければ None。
+        """
+        spec = self.tool_registry.get(tool_name)
+        if spec is not None:
+            return spec
+        tool_func = self._tool_table.get(tool_name)
+        return spec_of(tool_func) if tool_func is not None else None
+
+    def is_tool_parallel_safe(self, tool_name: str) -> bool:
+        """
+        ツールが同じターン内の他のツールと並列実行しても安全かどうかを返す。
+        `tool(parallel_safe=True)`（または `parallel_safe` デコレーター）でマークされたツールのみ True となる。
+        """
+        spec = self.tool_spec(tool_name)
+        return spec is not None and spec.parallel_safe
 
-    @abstractmethod
     def execute_tool(self, tool_name: str, args: Dict[str, Any]) -> Any:
         """
-        サブクラスで実装されるべきツール実行メソッド。
-        Function Callingの仕組みと連携することを想定。
+        ツールを名前で引いて実行する。
         """
-        pass
+        tool_func = self._tool_table.get(tool_name)
+        if tool_func is None:
+            return f"Tool {tool_name} not found."
+        if getattr(tool_func, "__self__", None) is self:
+            # インスタンスで差し替えたメソッド（テストのモックなど）も使えるよう、名前で引き直す
+            tool_func = getattr(self, tool_name)
+        return tool_func(**args)
+
+    async def execute_tool_async(self, tool_name: str, args: Dict[str, Any]) -> Any:
+        """
+        `execute_tool` の非同期版。ツールにネイティブな非同期版（`<ツール名>_async` メソッド）があればそれを待ち、
+        無ければワーカースレッドで `execute_tool` を実行する。
+        """
+        spec = self.tool_registry.get(tool_name)
+        if spec is not None and spec.async_name is not None and tool_name in self._tool_table:
+            return await getattr(self, spec.async_name)(**args)
+        return await asyncio.to_thread(self.execute_tool, tool_name, args)
+
+
+def run_sync(coro: Coroutine[Any, Any, T]) -> T:
+    """
+    コルーチンを同期的に実行して結果を返す。
+    イベントループが動作中のスレッドから呼ばれた場合は、別スレッドの新しいループで実行する。
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        # 現在のスパンなどのコンテキストを引き継いで実行する
+        return pool.submit(contextvars.copy_context().run, asyncio.run, coro).result()
+
+
+def _sha256(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+def _fingerprint(content: Any) -> Any:
+    """
+    チャット履歴の要素 (protos.Content または辞書) を比較可能なプレーンな値に変換する。
+    """
+    to_dict = getattr(type(content), "to_dict", None)
+    if to_dict is not None:
+        return to_dict(content)
+    return to_plain(content)
+
+
+def _tool_schema(tools: Optional[List[Any]]) -> List[Any]:
+    """
+    ツールの名前・シグネチャ・説明（SDK がスキーマ生成に使う情報）を列挙する。
+    """
+    schema = []
+    for tool in tools or []:
+        try:
+            signature = str(inspect.signature(tool))
+        except (TypeError, ValueError):
+            signature = ""
+        schema.append([getattr(tool, "__name__", str(tool)), signature, inspect.getdoc(tool) or ""])
+    return schema
+
+
+def _total_token_count(response: Any) -> int:
+    """
+    レスポンスの usage_metadata から合計トークン数を取り出す（取得できない場合は 0）。
+    """
+    usage = getattr(response, "usage_metadata", None)
+    count = getattr(usage, "total_token_count", 0)
+    return count if isinstance(count, int) else 0
+
+
+def _response_text(response: Any) -> str:
+    """
+    レスポンスのテキストを返す。関数呼び出しのみのレスポンス (SDK では `text` が例外になる) の場合は空文字。
+    """
+    try:
+        return response.text or ""
+    except (ValueError, AttributeError):
+        return ""
+
+
+def usage_attributes(response: Any) -> Dict[str, int]:
+    """
+    レスポンスの usage_metadata をスパンの属性（トークン数）に変換する。
+    """
+    usage = getattr(response, "usage_metadata", None)
+    attributes = {}
+    for key, attr in (("llm.prompt_tokens", "prompt_token_count"),
+                      ("llm.candidates_tokens", "candidates_token_count"),
+                      ("llm.total_tokens", "total_token_count")):
+        count = getattr(usage, attr, 0)
+        attributes[key] = count if isinstance(count, int) else 0
+    return attributes
+
@@ -0,0 +1,203 @@
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Any, Callable, Deque, List, Optional
+import asyncio
+import threading
+
+# 待機者に「インスタンスの代わりに生成の枠を譲る」ことを表す値（他の呼び出し元の生成が失敗した場合）
+_CREATE = object()
+
+
+class _Waiter:
+    """
+    インスタンスの返却を待っている呼び出し元（スレッドまたはコルーチン）。
+    """
+
+    def __init__(self, pool: "AgentPool", loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.pool = pool
+        self.loop = loop
+        self.future: Optional[asyncio.Future] = loop.create_future() if loop else None
+        self.event = threading.Event()
+        self.agent: Any = None
+
+    def hand_over(self, agent: Any) -> bool:
+        """
+        返却されたインスタンスを待機者に渡す。待機者が既に諦めていた場合は False を返す。
+        """
+        if self.future is not None:
+            if self.future.done():
+                return False
+            self.loop.call_soon_threadsafe(self._resolve, agent)
+            return True
+        self.agent = agent
+        self.event.set()
+        return True
+
+    def _resolve(self, agent: Any):
+        if self.future.done():
+            # 引き渡しの直前にキャンセルされた場合は、インスタンスをプールへ戻す
+            self.pool.release(agent)
+            return
+        self.future.set_result(agent)
+
+
+class AgentPool:
+    """
+    同じ役割のサブエージェントのインスタンスをプールし、並列タスクに貸し出す。
+
+    1つの `chat_session` が並列タスク間で共有されないよう、貸し出し中のインスタンスは
+    返却されるまで他のタスクに渡さない。上限に達している場合は返却を待つ（先着順）。
+    primary を渡さない場合は、最初に借りられた時点で factory から生成する（一度も使われないエージェントは作らない）。
+    """
+
+    def __init__(self, name: str, primary: Any = None, factory: Optional[Callable[[], Any]] = None, max_size: int = 1):
+        """
+        Args:
+            name (str): プールするエージェントの名前（例: "Coder"）。
+            primary (Agent, optional): 最初から存在するインスタンス。None の場合は最初の貸し出し時に factory で生成する。
+            factory (callable, optional): インスタンスを生成する関数。None の場合は primary のみを使う。
+            max_size (int): インスタンス数の上限。
+
+        Raises:
+            ValueError: primary と factory のどちらも指定されていない場合。
+        """
+        if primary is None and factory is None:
+            raise ValueError(f"AgentPool '{name}' needs either a primary instance or a factory.")
+        self.name = name
+        self.factory = factory
+        self.max_size = max(1, max_size) if factory else 1
+        self._lock = threading.Lock()
+        self._idle: Deque[Any] = deque([primary] if primary is not None else [])
+        self._instances: List[Any] = [primary] if primary is not None else []
+        self._creating = 0
+        self._waiters: Deque[_Waiter] = deque()
+
+    @property
+    def size(self) -> int:
+        """
+        生成済みのインスタンス数。
+        """
+        with self._lock:
+            return len(self._instances)
+
+    @property
+    def primary(self) -> Any:
+        """
+        最初に生成された（または渡された）インスタンス。まだ生成されていない場合は None。
+        """
+        with self._lock:
+            return self._instances[0] if self._instances else None
+
+    def acquire(self) -> Any:
+        """
+        インスタンスを1つ借りる。空きが無く上限にも達している場合は返却されるまでブロックする。
+        """
+        agent, waiter, create = self._try_acquire()
+        if create:
+            return self._create()
+        if waiter is not None:
+            waiter.event.wait()
+            if waiter.agent is _CREATE:
+                return self._create()
+            return waiter.agent
+        return agent
+
+    async def acquire_async(self) -> Any:
+        """
+        `acquire` の非同期版。返却待ちの間もイベントループをブロックしない。
+        """
+        agent, waiter, create = self._try_acquire(asyncio.get_running_loop())
+        if create:
+            return await asyncio.to_thread(self._create)
+        if waiter is not None:
+            try:
+                agent = await waiter.future
+            except asyncio.CancelledError:
+                with self._lock:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                if waiter.future.done() and not waiter.future.cancelled():
+                    # 引き渡し済みのインスタンスは使わずに返却する
+                    self.release(waiter.future.result())
+                raise
+            if agent is _CREATE:
+                return await asyncio.to_thread(self._create)
+        return agent
+
+    def release(self, agent: Any):
+        """
+        借りたインスタンスを返却する。待機者がいれば直接引き渡す。
+        """
+        if agent is _CREATE:
+            self._abandon_creation()
+            return
+        with self._lock:
+            while self._waiters:
+                if self._waiters.popleft().hand_over(agent):
+                    return
+            self._idle.append(agent)
+
+    @contextmanager
+    def lease(self):
+        """
+        `with pool.lease() as agent:` の形で借りて、ブロックを抜けると返却する。
+        """
+        agent = self.acquire()
+        try:
+            yield agent
+        finally:
+            self.release(agent)
+
+    @asynccontextmanager
+    async def lease_async(self):
+        """
+        `lease` の非同期版。
+        """
+        agent = await self.acquire_async()
+        try:
+            yield agent
+        finally:
+            self.release(agent)
+
+    def _try_acquire(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        空きインスタンス・新規生成・待機登録のいずれかを決める。
+
+        Returns:
+            tuple: (空きインスタンス, 待機者, 新規生成するか)
+        """
+        with self._lock:
+            if self._idle:
+                return self._idle.popleft(), None, False
+            if len(self._instances) + self._creating < self.max_size:
+                self._creating += 1
+                return None, None, True
+            waiter = _Waiter(self, loop)
+            self._waiters.append(waiter)
+            return None, waiter, False
+
+    def _create(self) -> Any:
+        """
+        factory で新しいインスタンスを生成する（ロック外で実行）。
+        """
+        try:
+            agent = self.factory()
+        except Exception:
+            self._abandon_creation()
+            raise
+        with self._lock:
+            self._creating -= 1
+            self._instances.append(agent)
+        return agent
+
+    def _abandon_creation(self):
+        """
+        生成の枠を手放す。待機者がいれば、その待機者に生成を任せる（生成の失敗で待機者が取り残されないように）。
+        """
+        with self._lock:
+            self._creating -= 1
+            while self._waiters:
+                self._creating += 1
+                if self._waiters.popleft().hand_over(_CREATE):
+                    return
+                self._creating -= 1
@@ -1,11 +1,21 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import os
 from pathlib import Path
 from rich.console import Console
 try:
     from .agent import Agent
+    from .tool_registry import tool
+    from .project_index import get_project_index
+    from .code_index import get_code_index
+    from .file_editor import EditError, FileEditor
+    from .llm_backend import LLMBackend
 except ImportError:
     from agent.agent import Agent
+    from agent.tool_registry import tool
+    from agent.project_index import get_project_index
+    from agent.code_index import get_code_index
+    from agent.file_editor import EditError, FileEditor
+    from agent.llm_backend import LLMBackend
 
 console = Console()
 
@@ -14,7 +24,12 @@ class Architect(Agent):
     システムの設計（ディレクトリ構造、技術選定、仕様定義）を担当するエージェント。
     """
     
-    def __init__(self, name: str = "Architect"):
+    def __init__(self, name: str = "Architect", backend: Optional[LLMBackend] = None):
+        """
+        Args:
+            name (str): エージェント名。
+            backend (LLMBackend, optional): LLM バックエンド。省略時は `get_backend()`。
+        """
         # プロジェクトルートからの相対パスで設計書の保存場所を特定
         # 主に docs/architecture/ 配下を使用することを想定
         self.project_root = Path(".").resolve()
@@ -25,7 +40,9 @@ class Architect(Agent):
         1. ユーザーの要望を実現するための最適な技術スタックを選定する。
         2. プロジェクトのディレクトリ構造を定義する。
         3. 実装の詳細な仕様書（Markdown形式）を作成し `write_design_doc` ツールで保存する。
+           既存の設計書の修正は、`edit_file` または `apply_patch` で変更箇所だけを送る。
         4. 既存のファイル構成を `list_project_files` ツールで確認し、整合性の取れた設計を行う。
+        5. 既存のコードの中身は `search_code` で該当箇所を探し、`read_file` で必要な行だけを読む。
         
         回答は常に論理的かつ構造的である必要があります。
         """
@@ -34,10 +51,10 @@ class Architect(Agent):
         必要に応じてディレクトリツリーをMarkdownのコードブロックで表現してください。
         設計書を作成したら、必ずファイルに保存して成果物として残してください。
         """
-        super().__init__(name, role, instructions)
-        # ツールを登録
-        self.tools = [self.write_design_doc, self.list_project_files]
+        # ツールは `tool` で宣言したメソッドから、基底クラスの初期化時に登録される
+        super().__init__(name, role, instructions, backend=backend)
 
+    @tool(parallel_safe=True, idempotent=True)
     def write_design_doc(self, file_path: str, content: str) -> str:
         """
         設計書（Markdown等）を指定されたパスに保存します。
@@ -72,13 +89,67 @@ class Architect(Agent):
             console.print(f"[bold red]{error_msg}[/bold red]")
             return error_msg
 
-    def list_project_files(self, directory: str = ".", max_depth: int = 2) -> str:
+    # 同じファイルへの複数の編集が失われないよう、並列安全にしない（呼び出し順に単独で実行する）
+    @tool()
+    def edit_file(self, file_path: str, old_text: str, new_text: str, replace_all: bool = False) -> str:
+        """
+        プロジェクト内の既存のファイルの一部を置き換えます。ファイル全体を書き直さずに、変更箇所だけを送れます。
+        old_text はファイル内の1箇所と完全に一致する必要があります（空白・インデントを含む）。
+        
+        Args:
+            file_path (str): プロジェクトルートからの相対パス（例: 'docs/architecture/system_design.md'）。
+            old_text (str): 置き換える元の文字列（一意に決まるよう、前後の行を含めてください）。
+            new_text (str): 置き換え後の文字列。
+            replace_all (bool): old_text に一致する全ての箇所を置き換える場合は True。
+            
+        Returns:
+            str: 編集結果のメッセージ。
+        """
+        try:
+            result = FileEditor(str(self.project_root)).edit(file_path, old_text, new_text, replace_all)
+            console.print(f"[bold green]Architect edited:[/bold green] {file_path}")
+            return result
+        except EditError as e:
+            return f"Error: {str(e)}"
+        except Exception as e:
+            return f"Error editing file: {str(e)}"
+
+    @tool()
+    def apply_patch(self, patch: str) -> str:
+        """
+        プロジェクト内のファイルに unified diff 形式のパッチを適用します（複数ファイル、ファイルの追加・削除も可）。
+        パスは `--- a/<path>` / `+++ b/<path>` で指定し、各ハンクは `@@ -start,count +start,count @@` で始めます。
+        文脈の行が一致しない場合はどのファイルも変更せず、食い違った箇所を返します。
+        
+        Args:
+            patch (str): unified diff のテキスト。
+            
+        Returns:
+            str: 変更したファイルの一覧、または競合の内容。
+        """
+        try:
+            result = FileEditor(str(self.project_root)).apply_patch(patch)
+            console.print("[bold green]Architect applied patch[/bold green]")
+            return result
+        except EditError as e:
+            return f"Error: {str(e)}"
+        except Exception as e:
+            return f"Error applying patch: {str(e)}"
+
+    @tool(parallel_safe=True, idempotent=True)
+    def list_project_files(self, directory: str = ".", max_depth: int = 2, pattern: str = "",
+                           min_size: int = 0, max_size: int = 0) -> str:
         """
         指定されたディレクトリ以下のファイル構造を確認します。
+        `.git` や `node_modules`、.gitignore で無視されるファイルは含みません。
+        pattern やサイズを指定した場合は、条件に合うファイルを（深さの制限なく）サイズ付きで一覧にします。
         
         Args:
             directory (str): 確認したいディレクトリ（デフォルトはルート）。
             max_depth (int): 探索する深さ。
+            pattern (str): ファイル名または相対パスのグロブ（例: '*.py', 'src/**/test_*.py'）。
+            min_size (int): このバイト数以上のファイルのみ。
+            max_size (int): このバイト数以下のファイルのみ（0 で制限しない）。
             
         Returns:
             str: ディレクトリツリーのテキスト表現。
@@ -90,37 +161,49 @@ class Architect(Agent):
             if not str(root_path).startswith(str(self.project_root)):
                 return f"Error: Security violation. Cannot access outside project root."
             
-            if not root_path.exists():
+            if not root_path.is_dir():
                 return f"Error: Directory '{directory}' does not exist."
 
-            tree_str = f"Directory structure of '{directory}':\n"
-            
-            for root, dirs, files in os.walk(root_path):
-                # 深さ制限の計算
-                depth = str(Path(root).relative_to(root_path)).count(os.sep)
-                if depth >= max_depth:
-                    continue
-                
-                # インデント
-                indent = "  " * depth
-                subindent = "  " * (depth + 1)
-                
-                relative_root = Path(root).relative_to(root_path)
-                if str(relative_root) != ".":
-                    tree_str += f"{indent}- {relative_root.name}/\n"
-                
-                for f in files:
-                    if not f.startswith("."): # ドットファイルを除外
-                        tree_str += f"{subindent}- {f}\n"
-                        
-            return tree_str
+            # 走査結果はプロセス内で共有し、変更されたディレクトリだけを走査し直す
+            index = get_project_index(str(self.project_root))
+            if pattern or min_size or max_size:
+                return index.find(directory, pattern, min_size, max_size)
+            return index.tree(directory, max_depth)
             
         except Exception as e:
             return f"Error listing files: {str(e)}"
 
-    def execute_tool(self, tool_name: str, args: Dict[str, Any]) -> Any:
-        if tool_name == "write_design_doc":
-            return self.write_design_doc(**args)
-        elif tool_name == "list_project_files":
-            return self.list_project_files(**args)
-        return f"Tool {tool_name} not found."
+    @tool(parallel_safe=True, idempotent=True)
+    def search_code(self, query: str, max_results: int = 10) -> str:
+        """
+        プロジェクトのファイルの中身を検索し、一致した行を前後の行と合わせて、関連の高い順に返します。
+        
+        Args:
+            query (str): 検索する語（空白区切り。大文字小文字を区別しない。全ての語を含むファイルを優先）。
+            max_results (int): 返すスニペットの最大数。
+            
+        Returns:
+            str: ファイルパスと行番号付きのスニペット。
+        """
+        try:
+            return get_code_index(str(self.project_root)).search(query, max_results)
+        except Exception as e:
+            return f"Error searching code: {str(e)}"
+
+    @tool(parallel_safe=True, idempotent=True)
+    def read_file(self, file_path: str, start_line: int = 1, end_line: int = 0) -> str:
+        """
+        プロジェクトのファイルの指定した行範囲を、行番号付きで読みます。
+        
+        Args:
+            file_path (str): プロジェクトルートからの相対パス。
+            start_line (int): 読み始める行（1 始まり）。
+            end_line (int): 読み終える行（この行を含む。0 でファイルの最後まで）。
+            
+        Returns:
+            str: 行番号付きのファイルの内容。
+        """
+        try:
+            return get_code_index(str(self.project_root)).read(file_path, start_line, end_line)
+        except Exception as e:
+            return f"Error reading file: {str(e)}"
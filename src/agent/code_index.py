@@ -0,0 +1,265 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+import threading
+
+try:
+    from .project_index import ProjectIndex, get_project_index
+except ImportError:
+    from agent.project_index import ProjectIndex, get_project_index
+
+# 索引に入れないファイル（これより大きいもの、先頭に NUL を含むバイナリ）
+MAX_FILE_BYTES = 1024 * 1024
+_BINARY_SNIFF_BYTES = 8192
+# 検索結果の各スニペットで、一致した行の前後に含める行数
+CONTEXT_LINES = 2
+# read_file で1回に返す最大の行数
+MAX_READ_LINES = 400
+# 1行の表示の最大文字数（minify されたファイルなど）
+_MAX_LINE_CHARS = 300
+
+
+@dataclass
+class _IndexedFile:
+    mtime_ns: int
+    size: int
+    trigrams: FrozenSet[str]
+
+
+@dataclass
+class _Snippet:
+    path: str
+    start: int
+    end: int
+    score: int
+
+
+class CodeIndex:
+    """
+    プロジェクトのテキストファイルのトライグラム転置インデックス。
+
+    ファイルの一覧は `ProjectIndex`（.gitignore などで無視するものを除く）から得て、
+    mtime とサイズが変わったファイルだけを索引し直す。検索では、クエリの各語のトライグラムを全て含むファイルに
+    候補を絞ってから中身を読み、一致した行を前後の行と合わせたスニペットを、一致の多い順に返す。
+    """
+
+    def __init__(self, root: str, project_index: Optional[ProjectIndex] = None,
+                 max_file_bytes: int = MAX_FILE_BYTES):
+        """
+        Args:
+            root (str): 索引するディレクトリ。
+            project_index (ProjectIndex, optional): ファイルの一覧に使うインデックス。省略時はルートごとの共有のもの。
+            max_file_bytes (int): 索引するファイルの最大バイト数。
+        """
+        self.root = Path(root).resolve()
+        self.project_index = project_index or get_project_index(str(self.root))
+        self.max_file_bytes = max_file_bytes
+        self.indexed_files = 0
+        self._files: Dict[str, _IndexedFile] = {}
+        self._postings: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self) -> int:
+        """
+        変更・追加されたファイルを索引し直し、削除されたファイルを取り除く。索引し直したファイル数を返す。
+        """
+        with self._lock:
+            seen = set()
+            updated = 0
+            for path in self.project_index.files():
+                seen.add(path)
+                try:
+                    stat = (self.root / path).stat()
+                except OSError:
+                    continue
+                current = self._files.get(path)
+                if current is not None and (current.mtime_ns, current.size) == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                self._remove(path)
+                trigrams = self._read_trigrams(path, stat.st_size)
+                if trigrams is None:
+                    continue
+                self._files[path] = _IndexedFile(stat.st_mtime_ns, stat.st_size, trigrams)
+                for trigram in trigrams:
+                    self._postings.setdefault(trigram, set()).add(path)
+                updated += 1
+            for path in [path for path in self._files if path not in seen]:
+                self._remove(path)
+            self.indexed_files += updated
+            return updated
+
+    def search(self, query: str, max_results: int = 10, context_lines: int = CONTEXT_LINES) -> str:
+        """
+        クエリの語（空白区切り、大文字小文字を区別しない）を含む行を探し、スニペットを順位付けして返す。
+        全ての語を含むファイルを優先し、無い場合はいずれかの語を含むファイルから探す。
+        """
+        terms = sorted({term.lower() for term in query.split()})
+        if not terms:
+            return "Error: Empty query."
+        self.refresh()
+        candidates = self._candidates(terms, require_all=True) or self._candidates(terms, require_all=False)
+
+        snippets: List[_Snippet] = []
+        contents: Dict[str, List[str]] = {}
+        for path in sorted(candidates):
+            lines = self._read_lines(path)
+            if lines is None:
+                continue
+            file_snippets = _snippets(path, lines, terms, context_lines)
+            if file_snippets:
+                contents[path] = lines
+                snippets.extend(file_snippets)
+        if not snippets:
+            return f"No matches for '{query}'."
+
+        snippets.sort(key=lambda s: (-s.score, s.path, s.start))
+        shown = snippets[:max(1, max_results)]
+        out = [f"Found {len(snippets)} snippets in {len(contents)} files for '{query}' (showing {len(shown)}):"]
+        for snippet in shown:
+            out.append("")
+            out.append(f"{snippet.path}:{snippet.start}-{snippet.end}")
+            out.extend(_numbered(contents[snippet.path], snippet.start, snippet.end))
+        return "\n".join(out) + "\n"
+
+    def read(self, path: str, start_line: int = 1, end_line: int = 0, max_lines: int = MAX_READ_LINES) -> str:
+        """
+        ファイルの start_line 行目から end_line 行目まで（1 始まり、両端を含む。0 以下で最後まで）を行番号付きで返す。
+        """
+        target = (self.root / path).resolve()
+        if target != self.root and self.root not in target.parents:
+            return "Error: Security violation. Cannot read outside the root directory."
+        if not target.is_file():
+            return f"Error: File '{path}' does not exist."
+        lines = self._read_lines(target.relative_to(self.root).as_posix())
+        if lines is None:
+            return f"Error: File '{path}' is binary or too large to read."
+        total = len(lines)
+        start = max(1, start_line)
+        end = total if end_line <= 0 else min(end_line, total)
+        if start > total:
+            return f"Error: start_line {start_line} is beyond the end of '{path}' ({total} lines)."
+        note = ""
+        if end - start + 1 > max_lines:
+            end = start + max_lines - 1
+            note = f"\n... (truncated at {max_lines} lines; continue with start_line={end + 1})"
+        header = f"{path} (lines {start}-{end} of {total}):"
+        return "\n".join([header, *_numbered(lines, start, end)]) + note + "\n"
+
+    def _candidates(self, terms: List[str], require_all: bool) -> Set[str]:
+        with self._lock:
+            result: Optional[Set[str]] = None
+            for term in terms:
+                files = self._term_candidates(term)
+                if require_all:
+                    result = files if result is None else result & files
+                else:
+                    result = files if result is None else result | files
+            return result or set()
+
+    def _term_candidates(self, term: str) -> Set[str]:
+        grams = _trigrams(term)
+        if not grams:
+            # 3文字未満の語はトライグラムで絞れないため、全ファイルが候補
+            return set(self._files)
+        files: Optional[Set[str]] = None
+        # 出現するファイルが少ないトライグラムから積を取る
+        for gram in sorted(grams, key=lambda g: len(self._postings.get(g, ()))):
+            posting = self._postings.get(gram)
+            if not posting:
+                return set()
+            files = set(posting) if files is None else files & posting
+            if not files:
+                break
+        return files or set()
+
+    def _remove(self, path: str):
+        entry = self._files.pop(path, None)
+        if entry is None:
+            return
+        for trigram in entry.trigrams:
+            posting = self._postings.get(trigram)
+            if posting is not None:
+                posting.discard(path)
+                if not posting:
+                    del self._postings[trigram]
+
+    def _read_trigrams(self, path: str, size: int) -> Optional[FrozenSet[str]]:
+        if size > self.max_file_bytes:
+            return None
+        text = self._read_text(path)
+        return _trigrams(text.lower()) if text is not None else None
+
+    def _read_lines(self, path: str) -> Optional[List[str]]:
+        text = self._read_text(path)
+        return text.splitlines() if text is not None else None
+
+    def _read_text(self, path: str) -> Optional[str]:
+        try:
+            with open(self.root / path, "rb") as f:
+                data = f.read(self.max_file_bytes + 1)
+        except OSError:
+            return None
+        if len(data) > self.max_file_bytes or b"\0" in data[:_BINARY_SNIFF_BYTES]:
+            return None
+        return data.decode("utf-8", errors="replace")
+
+
+def _trigrams(text: str) -> FrozenSet[str]:
+    return frozenset(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def _snippets(path: str, lines: List[str], terms: List[str], context_lines: int) -> List[_Snippet]:
+    """
+    一致した行を前後の行と合わせた範囲にまとめ、範囲に含まれる語の種類と一致した行数で点数を付ける。
+    """
+    hits: List[Tuple[int, Set[str]]] = []
+    for number, line in enumerate(lines, 1):
+        lower = line.lower()
+        matched = {term for term in terms if term in lower}
+        if matched:
+            hits.append((number, matched))
+    snippets: List[_Snippet] = []
+    current: Optional[Tuple[int, int, Set[str], int]] = None
+    for number, matched in hits:
+        start, end = max(1, number - context_lines), min(len(lines), number + context_lines)
+        if current is not None and start <= current[1] + 1:
+            current = (current[0], end, current[2] | matched, current[3] + 1)
+            continue
+        if current is not None:
+            snippets.append(_score(path, terms, *current))
+        current = (start, end, set(matched), 1)
+    if current is not None:
+        snippets.append(_score(path, terms, *current))
+    return snippets
+
+
+def _score(path: str, terms: List[str], start: int, end: int, matched: Set[str], hit_lines: int) -> _Snippet:
+    # 語の種類を最優先し、ファイルのパスに語を含む場合と一致した行数を加点する
+    in_path = sum(1 for term in terms if term in path.lower())
+    return _Snippet(path, start, end, len(matched) * 100 + in_path * 10 + min(hit_lines, 9))
+
+
+def _numbered(lines: List[str], start: int, end: int) -> List[str]:
+    width = len(str(end))
+    out = []
+    for number in range(start, end + 1):
+        line = lines[number - 1]
+        if len(line) > _MAX_LINE_CHARS:
+            line = line[:_MAX_LINE_CHARS] + " ..."
+        out.append(f"{number:>{width}}| {line}")
+    return out
+
+
+_shared_indexes: Dict[Path, CodeIndex] = {}
+_shared_lock = threading.Lock()
+
+
+def get_code_index(root: str = ".") -> CodeIndex:
+    """
+    ルートごとにプロセス全体で共有されるインデックスを返す（同じディレクトリを見るエージェントで索引を共有する）。
+    """
+    path = Path(root).resolve()
+    with _shared_lock:
+        if path not in _shared_indexes:
+            _shared_indexes[path] = CodeIndex(str(path))
+        return _shared_indexes[path]
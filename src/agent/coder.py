@@ -1,15 +1,34 @@
 import os
-import subprocess
+import asyncio
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List, Optional
 from rich.console import Console
 
 # 相対インポートを使用（srcパッケージ内での実行を想定）
 try:
     from .agent import Agent
+    from .code_index import get_code_index
+    from .file_editor import EditError, FileEditor
+    from .llm_backend import LLMBackend
+    from .sandbox_process import SandboxLimits, SandboxResult, run_command
+    from .sandbox_worker import SandboxWorker
+    from .streaming import EVENT_TOOL_OUTPUT, current_stream_callback, emit
+    from .token_ledger import DEFAULT_SESSION
+    from .tool_registry import COST_SUBPROCESS, tool
+    from .workspace_manager import WorkspaceManager, get_workspace_manager, workspace_env
 except ImportError:
     # テスト時などのために絶対インポートへのフォールバック
     from agent.agent import Agent
+    from agent.code_index import get_code_index
+    from agent.file_editor import EditError, FileEditor
+    from agent.llm_backend import LLMBackend
+    from agent.sandbox_process import SandboxLimits, SandboxResult, run_command
+    from agent.sandbox_worker import SandboxWorker
+    from agent.streaming import EVENT_TOOL_OUTPUT, current_stream_callback, emit
+    from agent.token_ledger import DEFAULT_SESSION
+    from agent.tool_registry import COST_SUBPROCESS, tool
+    from agent.workspace_manager import WorkspaceManager, get_workspace_manager, workspace_env
 
 console = Console()
 
@@ -18,16 +37,27 @@ class Coder(Agent):
     設計書や指示に基づき、具体的なソースコードを実装するエージェント。
     """
     
-    def __init__(self, name: str = "Coder"):
+    def __init__(self, name: str = "Coder", workspace: Optional[str] = None,
+                 workspaces: Optional[WorkspaceManager] = None, backend: Optional[LLMBackend] = None):
+        """
+        Args:
+            name (str): エージェント名。
+            workspace (str, optional): このエージェント専用の sandbox ディレクトリ。
+            workspaces (WorkspaceManager, optional): セッションごとのワークスペースを払い出すマネージャー。
+                省略時は `AGENT_WORKSPACE_ROOT` が設定されていればプロセス共有のものを使い、どちらも無い場合は ./sandbox を使う。
+            backend (LLMBackend, optional): LLM バックエンド。省略時は `get_backend()`。
+        """
         role = """
         あなたは熟練のソフトウェアエンジニア（Coder）です。
         以下の責任を持ちます：
         1. Manager または Architect から提供された設計書・指示に基づき、高品質なコードを記述する。
         2. プログラミング言語のベストプラクティスに従い、読みやすく保守性の高いコードを書く。
         3. 実装したコードを `write_to_sandbox` ツールを使ってファイルとして保存する。
+           既存のファイルの修正は、`edit_file` または `apply_patch` で変更箇所だけを送る（ファイル全体を書き直さない）。
         4. 保存したコードを `execute_in_sandbox` ツールを使って実行し、期待通りに動作するか検証する。
         5. エラーが発生した場合は、出力を確認して修正を行う。
         6. 実装中に不明な点や仕様の確認が必要な場合は、`ask_question` ツールを使って Manager や Architect に質問を行う。
+        7. sandbox 内の既存のコードは `search_code` で該当箇所を探し、`read_file` で必要な行だけを読む（`cat` や `grep` を実行しない）。
         """
         instructions = """
         実装を行う際は、まず指示された要件を正しく理解しているか確認し、その後実装に入ってください。
@@ -36,12 +66,60 @@ class Coder(Agent):
         分からないことや相談したいことがあれば、躊躇せずに `ask_question` を使用して質問してください。
         質問した後は、その回答を待つために一度思考をまとめ、Managerに現在の状況を報告してください。
         """
-        super().__init__(name, role, instructions, tools=[self.write_to_sandbox, self.execute_in_sandbox, self.ask_question])
-        # プロジェクトルートからの相対パスでsandboxの場所を特定
-        self.sandbox_dir = Path("sandbox")
-        if not self.sandbox_dir.exists():
-            self.sandbox_dir.mkdir(parents=True, exist_ok=True)
+        # ツールは `tool` で宣言したメソッドから、基底クラスの初期化時に登録される
+        super().__init__(name, role, instructions, backend=backend)
+        self.workspaces = workspaces or get_workspace_manager()
+        if workspace is not None or self.workspaces is None:
+            # プロジェクトルートからの相対パスでsandboxの場所を特定
+            self.sandbox_dir = Path(workspace or "sandbox")
+            if not self.sandbox_dir.exists():
+                self.sandbox_dir.mkdir(parents=True, exist_ok=True)
+        else:
+            # セッションごとのワークスペースを、最初に使う時に作成する
+            self._sandbox_dir = None
+            self.workspaces.root.mkdir(parents=True, exist_ok=True)
+        # 常駐ワーカー（`AGENT_SANDBOX_WORKER=1` の場合のみ。最初のコマンド実行時に起動する）
+        self.sandbox_worker = SandboxWorker.from_env(self._sandbox_dir or self.workspaces.root)
+        # コマンドのタイムアウト（秒）と、ツール引数で延ばせる上限。出力はストリームごとに上限バイト数まで保持する
+        self.sandbox_timeout = float(os.getenv("AGENT_SANDBOX_TIMEOUT", "30"))
+        self.sandbox_max_timeout = float(os.getenv("AGENT_SANDBOX_MAX_TIMEOUT", "300"))
+        self.sandbox_output_bytes = int(os.getenv("AGENT_SANDBOX_MAX_OUTPUT_BYTES", "200000"))
+        # コマンドに課す CPU 時間・メモリ・プロセス数・ファイル数の上限
+        self.sandbox_limits = SandboxLimits.from_env()
+
+    @property
+    def sandbox_dir(self) -> Path:
+        """
+        ファイルの保存先とコマンドの実行場所。ワークスペースマネージャーを使う場合は、現在のセッションのワークスペース。
+        """
+        if self._sandbox_dir is not None:
+            return self._sandbox_dir
+        return self.workspaces.path(self.workspace_key())
+
+    @sandbox_dir.setter
+    def sandbox_dir(self, path: Any):
+        self._sandbox_dir = Path(path)
+
+    def workspace_key(self) -> str:
+        """
+        ワークスペースのキー。同じセッション（`TokenLedger.session`）の Coder は同じワークスペースを共有する。
+        セッションを指定していない場合は、プロセスごとに分ける。
+        """
+        session = self.token_ledger.current_session()
+        return f"process-{os.getpid()}" if session == DEFAULT_SESSION else f"session-{session}"
 
+    @contextmanager
+    def _workspace(self) -> Iterator[Path]:
+        """
+        ブロック内で sandbox ディレクトリを使用中にする（使用中のワークスペースは古いものの削除の対象にならない）。
+        """
+        if self._sandbox_dir is not None:
+            yield self._sandbox_dir
+            return
+        with self.workspaces.lease(self.workspace_key()) as path:
+            yield path
+
+    @tool(parallel_safe=True, idempotent=True)
     def write_to_sandbox(self, file_path: str, content: str) -> str:
         """
         生成したコードやファイルを、安全な sandbox ディレクトリ内に保存します。
@@ -54,20 +132,26 @@ class Coder(Agent):
             str: 保存結果のメッセージ。
         """
         try:
-            # 安全のためパスを正規化し、境界外へのアクセスを防止
-            target_path = (self.sandbox_dir / file_path).resolve()
-            
-            # sandbox_dir の外に出ようとしていないかチェック
-            if not str(target_path).startswith(str(self.sandbox_dir.resolve())):
-                return f"Error: Security violation. Cannot write outside sandbox directory."
+            with self._workspace() as sandbox_dir:
+                # 安全のためパスを正規化し、境界外へのアクセスを防止
+                target_path = (sandbox_dir / file_path).resolve()
 
-            # 親ディレクトリが存在しない場合は作成
-            target_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            # ファイルの書き込み
-            with open(target_path, "w", encoding="utf-8") as f:
-                f.write(content)
+                # sandbox_dir の外に出ようとしていないかチェック
+                if not str(target_path).startswith(str(sandbox_dir.resolve())):
+                    return f"Error: Security violation. Cannot write outside sandbox directory."
+
+                # 親ディレクトリが存在しない場合は作成
+                target_path.parent.mkdir(parents=True, exist_ok=True)
+
+                # テンプレートからハードリンクで作られたファイルは、リンクを切ってから書く（テンプレートを書き換えない）
+                if target_path.is_file() and target_path.stat().st_nlink > 1:
+                    target_path.unlink()
+
+                # ファイルの書き込み
+                with open(target_path, "w", encoding="utf-8") as f:
+                    f.write(content)
                 
+
             console.print(f"[bold green]Coder saved file:[/bold green] {file_path}")
             return f"Successfully saved {file_path} to sandbox."
             
@@ -76,42 +160,211 @@ class Coder(Agent):
             console.print(f"[bold red]{error_msg}[/bold red]")
             return error_msg
 
-    def execute_in_sandbox(self, command: str) -> str:
+    # 同じファイルへの複数の編集が失われないよう、並列安全にしない（呼び出し順に単独で実行する）
+    @tool()
+    def edit_file(self, file_path: str, old_text: str, new_text: str, replace_all: bool = False) -> str:
+        """
+        sandbox 内の既存のファイルの一部を置き換えます。ファイル全体を書き直さずに、変更箇所だけを送れます。
+        old_text はファイル内の1箇所と完全に一致する必要があります（空白・インデントを含む）。
+        
+        Args:
+            file_path (str): sandbox 内の相対パス（例: 'app.py'）。
+            old_text (str): 置き換える元の文字列（一意に決まるよう、前後の行を含めてください）。
+            new_text (str): 置き換え後の文字列。
+            replace_all (bool): old_text に一致する全ての箇所を置き換える場合は True。
+            
+        Returns:
+            str: 編集結果のメッセージ。
+        """
+        try:
+            with self._workspace() as sandbox_dir:
+                result = FileEditor(str(sandbox_dir)).edit(file_path, old_text, new_text, replace_all)
+            console.print(f"[bold green]Coder edited file:[/bold green] {file_path}")
+            return result
+        except EditError as e:
+            return f"Error: {str(e)}"
+        except Exception as e:
+            return f"Error editing file: {str(e)}"
+
+    @tool()
+    def apply_patch(self, patch: str) -> str:
+        """
+        sandbox 内のファイルに unified diff 形式のパッチを適用します（複数ファイル、ファイルの追加・削除も可）。
+        パスは `--- a/<path>` / `+++ b/<path>` で指定し、各ハンクは `@@ -start,count +start,count @@` で始めます。
+        文脈の行が一致しない場合はどのファイルも変更せず、食い違った箇所を返します。
+        
+        Args:
+            patch (str): unified diff のテキスト。
+            
+        Returns:
+            str: 変更したファイルの一覧、または競合の内容。
+        """
+        try:
+            with self._workspace() as sandbox_dir:
+                result = FileEditor(str(sandbox_dir)).apply_patch(patch)
+            console.print("[bold green]Coder applied patch[/bold green]")
+            return result
+        except EditError as e:
+            return f"Error: {str(e)}"
+        except Exception as e:
+            return f"Error applying patch: {str(e)}"
+
+    # 非同期版 `execute_in_sandbox_async` は、非同期のエージェントから自動的に使われる
+    @tool(cost=COST_SUBPROCESS)
+    def execute_in_sandbox(self, command: str, timeout: int = 0) -> str:
         """
         sandbox ディレクトリ内でシェルコマンドを実行し、その結果を返します。
         
         Args:
             command (str): 実行するコマンド（例: 'python app.py'）。
+            timeout (int): タイムアウトの秒数。0 の場合はデフォルト（通常 30 秒）。時間のかかるテストやインストールの場合のみ延ばしてください。
             
         Returns:
-            str: 標準出力と標準エラーの内容。
+            str: 標準出力と標準エラーの内容。タイムアウトした場合も、それまでの出力を含みます。
         """
         try:
             console.print(f"[bold cyan]Coder executing in sandbox:[/bold cyan] {command}")
+            return self._run_in_sandbox(command, timeout)
+        except Exception as e:
+            return f"Error executing command: {str(e)}"
+
+    async def execute_in_sandbox_async(self, command: str, timeout: int = 0) -> str:
+        """
+        `execute_in_sandbox` の非同期版。コマンドの完了を別スレッドで待ち、イベントループをブロックしない。
+        """
+        return await asyncio.to_thread(self.execute_in_sandbox, command, timeout)
+
+    def _run_in_sandbox(self, command: str, timeout: int) -> str:
+        """
+        サブプロセス（または常駐ワーカー）でコマンドを実行し、結果を整形する。
+        出力は上限付きで取り込み、ストリーミング中は届いた順にイベントとしても送る。
+        """
+        limit = self._sandbox_timeout(timeout)
+        runner = "worker" if self.sandbox_worker is not None else "subprocess"
+        on_output = self._report_output if current_stream_callback() is not None else None
+        with self.tracer.span("sandbox.exec", **{"agent.name": self.name, "sandbox.command": command,
+                                                 "sandbox.runner": runner, "sandbox.timeout": limit}) as span, \
+                self._workspace() as sandbox_dir, \
+                self.metrics.timer(f"sandbox.{runner}"):
+            span.set_attribute("sandbox.workspace", sandbox_dir.name)
+            # ワークスペースに仮想環境があれば、その中でコマンドを動かす
+            env = workspace_env(sandbox_dir)
+            if self.sandbox_worker is not None:
+                starts = self.sandbox_worker.starts
+                result = self.sandbox_worker.run(command, cwd=sandbox_dir, timeout=limit,
+                                                 max_output_bytes=self.sandbox_output_bytes, on_output=on_output,
+                                                 limits=self.sandbox_limits, env=env)
+                if self.sandbox_worker.starts != starts:
+                    self.metrics.incr("sandbox.worker_starts")
+            else:
+                result = run_command(command, cwd=str(sandbox_dir), timeout=limit,
+                                     max_output_bytes=self.sandbox_output_bytes, on_output=on_output,
+                                     limits=self.sandbox_limits, env=env)
+            span.set_attribute("sandbox.exit_code", result.exit_code)
+            if result.exit_code != 0 or result.timed_out:
+                # 失敗の原因の調査と修正は上位モデルに任せる（`AGENT_MODEL_STRONG` が設定されている場合）
+                self.request_escalation("sandbox command timed out" if result.timed_out
+                                        else f"sandbox exit code {result.exit_code}")
+            span.set_attribute("sandbox.stdout_bytes", result.stdout_bytes)
+            span.set_attribute("sandbox.stderr_bytes", result.stderr_bytes)
+            self._record_usage(span, result)
+            if result.truncated:
+                self.metrics.incr("sandbox.truncated_outputs")
+            if result.timed_out:
+                span.record_error("timeout")
+                return (f"Error: Command timed out after {limit:g} seconds.\n"
+                        + self._format_output(result.stdout, result.stderr))
+            if self._cpu_limit_exceeded(result):
+                span.record_error("cpu_limit")
+        return self._format_result(result)
+
+    def _sandbox_timeout(self, requested: int) -> float:
+        """
+        ツールの引数で指定されたタイムアウトを、上限 (`sandbox_max_timeout`) の範囲に収める。
+        """
+        if requested and requested > 0:
+            return min(float(requested), self.sandbox_max_timeout)
+        return self.sandbox_timeout
+
+    def _report_output(self, stream: str, text: str):
+        emit(EVENT_TOOL_OUTPUT, self.name, text)
+
+    def _record_usage(self, span, result: SandboxResult):
+        """
+        コマンドが使った CPU 時間と最大 RSS を、スパンとメトリクスに記録する。
+        """
+        span.set_attribute("sandbox.user_seconds", result.user_seconds)
+        span.set_attribute("sandbox.system_seconds", result.system_seconds)
+        span.set_attribute("sandbox.max_rss_kb", result.max_rss_kb)
+        self.metrics.add_time("sandbox.cpu_user", result.user_seconds)
+        self.metrics.add_time("sandbox.cpu_system", result.system_seconds)
+        self.metrics.observe("sandbox.max_rss_kb", result.max_rss_kb)
+
+    def _cpu_limit_exceeded(self, result: SandboxResult) -> bool:
+        """
+        CPU 時間の上限で終了させられたか。シェル経由では終了コードがシグナル番号にならないため、使用した CPU 時間で判定する。
+        """
+        limit = self.sandbox_limits.cpu_seconds
+        used = result.user_seconds + result.system_seconds
+        return bool(limit) and result.exit_code != 0 and used >= limit - 0.05
+
+    def _format_result(self, result: SandboxResult) -> str:
+        """
+        コマンドの実行結果をモデルに返すテキスト形式に整形する。
+        """
+        output = f"Exit Code: {result.exit_code}\n"
+        if self._cpu_limit_exceeded(result):
+            output += f"Error: CPU time limit of {self.sandbox_limits.cpu_seconds} seconds exceeded.\n"
+        output += (f"Resources: user {result.user_seconds:.2f}s, sys {result.system_seconds:.2f}s, "
+                   f"max RSS {result.max_rss_kb / 1024:.1f} MB\n")
+        return output + self._format_output(result.stdout, result.stderr)
+
+    def _format_output(self, stdout: str, stderr: str) -> str:
+        output = ""
+        if stdout:
+            output += f"STDOUT:\n{stdout}\n"
+        if stderr:
+            output += f"STDERR:\n{stderr}\n"
+        return output
+
+    @tool(parallel_safe=True, idempotent=True)
+    def search_code(self, query: str, max_results: int = 10) -> str:
+        """
+        sandbox 内のファイルの中身を検索し、一致した行を前後の行と合わせて、関連の高い順に返します。
+        
+        Args:
+            query (str): 検索する語（空白区切り。大文字小文字を区別しない。全ての語を含むファイルを優先）。
+            max_results (int): 返すスニペットの最大数。
             
-            # sandboxディレクトリ内でコマンドを実行
-            result = subprocess.run(
-                command,
-                shell=True,
-                cwd=self.sandbox_dir,
-                capture_output=True,
-                text=True,
-                timeout=30  # 暴走防止のためタイムアウトを設定
-            )
-            
-            output = f"Exit Code: {result.returncode}\n"
-            if result.stdout:
-                output += f"STDOUT:\n{result.stdout}\n"
-            if result.stderr:
-                output += f"STDERR:\n{result.stderr}\n"
-            
-            return output
+        Returns:
+            str: ファイルパスと行番号付きのスニペット。
+        """
+        try:
+            with self._workspace() as sandbox_dir:
+                return get_code_index(str(sandbox_dir)).search(query, max_results)
+        except Exception as e:
+            return f"Error searching code: {str(e)}"
+
+    @tool(parallel_safe=True, idempotent=True)
+    def read_file(self, file_path: str, start_line: int = 1, end_line: int = 0) -> str:
+        """
+        sandbox 内のファイルの指定した行範囲を、行番号付きで読みます。
+        
+        Args:
+            file_path (str): sandbox 内の相対パス（例: 'app.py'）。
+            start_line (int): 読み始める行（1 始まり）。
+            end_line (int): 読み終える行（この行を含む。0 でファイルの最後まで）。
             
-        except subprocess.TimeoutExpired:
-            return "Error: Command timed out after 30 seconds."
+        Returns:
+            str: 行番号付きのファイルの内容。
+        """
+        try:
+            with self._workspace() as sandbox_dir:
+                return get_code_index(str(sandbox_dir)).read(file_path, start_line, end_line)
         except Exception as e:
-            return f"Error executing command: {str(e)}"
+            return f"Error reading file: {str(e)}"
 
+    @tool(parallel_safe=True)
     def ask_question(self, to_whom: str, question: str) -> str:
         """
         Manager または Architect に対し、仕様の不明点や技術的な相談を行います。
@@ -125,12 +378,3 @@ class Coder(Agent):
         """
         console.print(f"[bold yellow]Coder asking {to_whom}:[/bold yellow] {question}")
         return f"質問を {to_whom} に送信しました。回答を得るために、現在のメッセージを終了して Manager の指示を待ってください。"
-
-    def execute_tool(self, tool_name: str, args: Dict[str, Any]) -> Any:
-        if tool_name == "write_to_sandbox":
-            return self.write_to_sandbox(**args)
-        elif tool_name == "execute_in_sandbox":
-            return self.execute_in_sandbox(**args)
-        elif tool_name == "ask_question":
-            return self.ask_question(**args)
-        return f"Tool {tool_name} not found."
@@ -0,0 +1,305 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import copy
+import json
+import os
+import re
+import threading
+
+try:
+    from .response_snapshot import to_plain
+    from .tool_output_store import ToolOutputStore, get_tool_output_store
+except ImportError:
+    from agent.response_snapshot import to_plain
+    from agent.tool_output_store import ToolOutputStore, get_tool_output_store
+
+# 要約を保持する先頭の user / model の組
+SUMMARY_HEADER = "[これまでの会話の要約]"
+SUMMARY_ACK = "了解しました。この要約を踏まえて会話を続けます。"
+# 要約が上限を超えた場合に、古い行を捨てたことを示す印
+SUMMARY_ELIDED = "…(これより前の要約は省略)"
+# 参照に置き換えたツール出力の先頭に残す文字数
+PAYLOAD_PREVIEW_CHARS = 200
+# 置き換え後のツール出力の末尾（置き換え済みの出力を再び置き換えないために使う）
+_PAYLOAD_REFERENCE_RE = re.compile(
+    r'\n\.\.\. \[[^\]\n]* output omitted from history: \d+ chars\. '
+    r'Read it with read_tool_output\("[^"]+", offset, length\)\] \.\.\.$'
+)
+
+# summarizer(これまでの要約, 要約するターンのリスト) -> 新しい要約
+Summarizer = Callable[[str, List[List[Dict[str, Any]]]], str]
+
+
+@dataclass
+class _Turn:
+    """
+    ユーザーのテキスト入力から、それに対する最終応答までの履歴（ツール呼び出しとその結果を含む）。
+    関数呼び出しと結果の組を壊さないよう、圧縮はターン単位で行う。
+    """
+    contents: List[Dict[str, Any]]
+    tokens: int
+
+
+class ConversationMemory:
+    """
+    チャットセッションの履歴を、トークン予算内のウィンドウに収める会話メモリ。
+
+    API 呼び出しのたびに履歴全体が送信されるため、長いセッションでは呼び出しごとのレイテンシとトークン数が
+    会話の長さに比例して増えていく。このメモリは送信前に履歴を次のように整える:
+
+    - 直近のターン以外に含まれる大きなツール出力（`delegate_task` の応答全文など）を、先頭の抜粋と参照 ID に置き換える。
+      全文はツール出力ストアに保存し、モデルは `read_tool_output` で読み直せる。
+    - 履歴の見積もりトークン数が `token_budget` を超えたら、古いターンを要約に畳み込み、
+      直近のターンが `token_budget` の半分に収まるまで残す（毎回の圧縮を避けるため余裕を持たせる）。
+
+    直近のターン（実行中のツール反復を含む）は常にそのまま残す。
+    """
+
+    def __init__(self, token_budget: int = 32000, tool_payload_chars: int = 2000, summary_max_chars: int = 4000,
+                 summarizer: Optional[Summarizer] = None, output_store: Optional[ToolOutputStore] = None):
+        """
+        Args:
+            token_budget (int): 履歴の見積もりトークン数の上限。0 以下で圧縮しない。
+            tool_payload_chars (int): これより長いツール出力を参照に置き換える（文字数）。0 以下で置き換えない。
+            summary_max_chars (int): 要約の最大文字数。超えた分は古い行から捨てる。
+            summarizer (callable, optional): 古いターンを要約する関数。省略時は抽出的な要約 (`extractive_summary`)。
+            output_store (ToolOutputStore, optional): 参照に置き換えた出力の保存先。省略時はプロセス共有のもの。
+        """
+        self.token_budget = max(0, token_budget)
+        self.tool_payload_chars = max(0, tool_payload_chars)
+        self.summary_max_chars = summary_max_chars
+        self.summarizer = summarizer or extractive_summary
+        self.output_store = output_store or get_tool_output_store()
+        self.summary = ""
+        self._offloaded_payloads = 0
+        self._compactions = 0
+        self._summarized_turns = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, llm_summarizer: Optional[Summarizer] = None,
+                 output_store: Optional[ToolOutputStore] = None) -> "ConversationMemory":
+        """
+        環境変数から設定を読み込んで生成する。
+
+        - `AGENT_MEMORY_TOKEN_BUDGET`: 履歴の見積もりトークン数の上限（デフォルト 32000、0 で圧縮しない）
+        - `AGENT_MEMORY_TOOL_PAYLOAD_CHARS`: 参照に置き換えるツール出力の長さ（デフォルト 2000、0 で置き換えない）
+        - `AGENT_MEMORY_SUMMARY_CHARS`: 要約の最大文字数（デフォルト 4000）
+        - `AGENT_MEMORY_SUMMARIZER`: `extractive`（デフォルト、API を呼ばない）または `llm`（`llm_summarizer` を使う）
+        """
+        use_llm = os.getenv("AGENT_MEMORY_SUMMARIZER", "extractive").lower() == "llm"
+        return cls(
+            token_budget=int(os.getenv("AGENT_MEMORY_TOKEN_BUDGET", "32000")),
+            tool_payload_chars=int(os.getenv("AGENT_MEMORY_TOOL_PAYLOAD_CHARS", "2000")),
+            summary_max_chars=int(os.getenv("AGENT_MEMORY_SUMMARY_CHARS", "4000")),
+            summarizer=llm_summarizer if use_llm else None,
+            output_store=output_store,
+        )
+
+    def apply(self, chat_session: Any) -> bool:
+        """
+        チャットセッションの履歴を整える。
+
+        Returns:
+            bool: 履歴を書き換えた場合は True。
+        """
+        history = self.compact(list(chat_session.history))
+        if history is None:
+            return False
+        chat_session.history = history
+        return True
+
+    def compact(self, history: List[Any]) -> Optional[List[Any]]:
+        """
+        履歴を整えた新しいリストを返す。変更が無い場合は None。
+        """
+        summary, turns = self._split(history)
+        changed = False
+        for turn in turns[:-1]:
+            changed = self._offload_payloads(turn) or changed
+
+        total = estimate_tokens(summary) + sum(turn.tokens for turn in turns)
+        if self.token_budget and total > self.token_budget and len(turns) > 1:
+            keep = _keep_count(turns, self.token_budget // 2)
+            dropped, turns = turns[:-keep], turns[-keep:]
+            summary = self._truncate_summary(self.summarizer(summary, [turn.contents for turn in dropped]))
+            with self._lock:
+                self._compactions += 1
+                self._summarized_turns += len(dropped)
+            changed = True
+
+        if not changed:
+            return None
+        self.summary = summary
+        compacted: List[Any] = []
+        if summary:
+            compacted.append({"role": "user", "parts": [{"text": f"{SUMMARY_HEADER}\n{summary}"}]})
+            compacted.append({"role": "model", "parts": [{"text": SUMMARY_ACK}]})
+        for turn in turns:
+            compacted.extend(turn.contents)
+        return compacted
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "compactions": self._compactions,
+                "summarized_turns": self._summarized_turns,
+                "offloaded_payloads": self._offloaded_payloads,
+                "summary_chars": len(self.summary),
+            }
+
+    def _split(self, history: List[Any]) -> Tuple[str, List[_Turn]]:
+        """
+        履歴を、先頭の要約とターンのリストに分ける。
+        """
+        contents = [plain_content(content) for content in history]
+        summary = ""
+        if len(contents) >= 2 and _is_summary(contents[0]):
+            summary = _texts(contents[0])[len(SUMMARY_HEADER):].strip()
+            contents = contents[2:]
+
+        turns: List[_Turn] = []
+        for content in contents:
+            if not turns or _starts_turn(content):
+                turns.append(_Turn([], 0))
+            turns[-1].contents.append(content)
+            turns[-1].tokens += estimate_tokens(content)
+        return summary, turns
+
+    def _offload_payloads(self, turn: _Turn) -> bool:
+        """
+        ターン内の大きなツール出力を、先頭の抜粋と参照 ID に置き換える。
+        """
+        if not self.tool_payload_chars:
+            return False
+        changed = False
+        for content in turn.contents:
+            for part in content.get("parts") or []:
+                response = (part.get("function_response") or {}).get("response")
+                result = response.get("result") if isinstance(response, dict) else None
+                if not isinstance(result, str) or len(result) <= self.tool_payload_chars:
+                    continue
+                # 上限が小さいと置き換え後の文字列も上限を超えるため、置き換え済みの出力は飛ばす
+                if _PAYLOAD_REFERENCE_RE.search(result):
+                    continue
+                changed = True
+                output_id = self.output_store.put(result)
+                with self._lock:
+                    self._offloaded_payloads += 1
+                name = part["function_response"].get("name", "tool")
+                response["result"] = (
+                    f"{result[:PAYLOAD_PREVIEW_CHARS]}\n"
+                    f"... [{name} output omitted from history: {len(result)} chars. "
+                    f"Read it with read_tool_output(\"{output_id}\", offset, length)] ..."
+                )
+        if changed:
+            turn.tokens = sum(estimate_tokens(content) for content in turn.contents)
+        return changed
+
+    def _truncate_summary(self, summary: str) -> str:
+        """
+        要約が上限を超えた場合は、新しい行を優先して残す。
+        """
+        summary = summary.strip()
+        if self.summary_max_chars <= 0 or len(summary) <= self.summary_max_chars:
+            return summary
+        tail = summary[-self.summary_max_chars:]
+        newline = tail.find("\n")
+        if newline != -1:
+            tail = tail[newline + 1:]
+        return f"{SUMMARY_ELIDED}\n{tail}"
+
+
+def extractive_summary(previous: str, turns: List[List[Dict[str, Any]]]) -> str:
+    """
+    API を呼ばずに、各ターンのユーザー入力・使用したツール・最終応答の抜粋を箇条書きにする要約。
+    """
+    lines = [previous] if previous else []
+    for contents in turns:
+        request = next((_texts(c) for c in contents if c.get("role") == "user" and _texts(c)), "")
+        answer = next((_texts(c) for c in reversed(contents) if c.get("role") == "model" and _texts(c)), "")
+        tools = [name for c in contents for name in _function_call_names(c)]
+        lines.append(f"- ユーザー: {_clip(request, 200)}")
+        if tools:
+            lines.append(f"  使用ツール: {', '.join(dict.fromkeys(tools))}")
+        if answer:
+            lines.append(f"  回答: {_clip(answer, 300)}")
+    return "\n".join(lines)
+
+
+def format_turns(turns: List[List[Dict[str, Any]]], max_chars: int = 2000) -> str:
+    """
+    ターンを LLM に要約させるためのテキストに整形する（各発言は `max_chars` 文字まで）。
+    """
+    lines = []
+    for contents in turns:
+        for content in contents:
+            role = content.get("role", "user")
+            text = _texts(content)
+            if text:
+                lines.append(f"{role}: {_clip(text, max_chars)}")
+            for name in _function_call_names(content):
+                lines.append(f"{role}: (call {name})")
+            for part in content.get("parts") or []:
+                if "function_response" in part:
+                    result = json.dumps(part["function_response"].get("response"), ensure_ascii=False, default=str)
+                    lines.append(f"tool {part['function_response'].get('name')}: {_clip(result, max_chars)}")
+    return "\n".join(lines)
+
+
+def estimate_tokens(value: Any) -> int:
+    """
+    トークナイザーを呼ばずに、JSON 化した UTF-8 のバイト数からおおよそ 4 バイト = 1 トークンとして見積もる。
+    """
+    if not value:
+        return 0
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+    return len(text.encode("utf-8")) // 4 + 1
+
+
+def plain_content(content: Any) -> Dict[str, Any]:
+    """
+    チャット履歴の要素 (protos.Content または辞書) を、書き換えても元に影響しない辞書に変換する。
+    """
+    to_dict = getattr(type(content), "to_dict", None)
+    if to_dict is not None:
+        return to_dict(content)
+    return copy.deepcopy(to_plain(content))
+
+
+def _keep_count(turns: List[_Turn], target: int) -> int:
+    """
+    直近から数えて `target` トークンに収まるターン数（最低 1）。
+    """
+    keep, total = 0, 0
+    for turn in reversed(turns):
+        if keep and total + turn.tokens > target:
+            break
+        keep += 1
+        total += turn.tokens
+    return keep
+
+
+def _starts_turn(content: Dict[str, Any]) -> bool:
+    """
+    ツール実行結果ではない user の発言をターンの始まりとみなす。
+    """
+    parts = content.get("parts") or []
+    return content.get("role") == "user" and not any("function_response" in part for part in parts)
+
+
+def _is_summary(content: Dict[str, Any]) -> bool:
+    return content.get("role") == "user" and _texts(content).startswith(SUMMARY_HEADER)
+
+
+def _texts(content: Dict[str, Any]) -> str:
+    return "".join(part.get("text") or "" for part in content.get("parts") or [])
+
+
+def _function_call_names(content: Dict[str, Any]) -> List[str]:
+    return [part["function_call"].get("name", "") for part in content.get("parts") or [] if part.get("function_call")]
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit] + "…"
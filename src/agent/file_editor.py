@@ -0,0 +1,309 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+import os
+import re
+import tempfile
+
+DEV_NULL = "/dev/null"
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+# 競合の報告に含める、ファイル側の行数
+_CONFLICT_CONTEXT_LINES = 3
+
+
+class EditError(ValueError):
+    """
+    編集を適用できない（置き換える文字列が見つからない、パッチが競合するなど）。ファイルは変更されていない。
+    """
+
+
+@dataclass
+class _Hunk:
+    header: str
+    old_start: int
+    # 見出しに書かれた変更前の行数（省略時は 1）
+    old_count: int = 1
+    old: List[str] = field(default_factory=list)
+    new: List[str] = field(default_factory=list)
+    added: int = 0
+    removed: int = 0
+    # 新しい内容の最後の行に改行が無い（"\ No newline at end of file"）
+    new_no_newline: bool = False
+
+
+@dataclass
+class _FilePatch:
+    old_path: Optional[str]
+    new_path: Optional[str]
+    hunks: List[_Hunk] = field(default_factory=list)
+
+    @property
+    def path(self) -> str:
+        return self.new_path or self.old_path
+
+
+@dataclass
+class _Text:
+    """
+    行のリストとして扱うファイルの内容。改行コードと最後の改行の有無を保つ。
+    """
+    lines: List[str]
+    newline: str = "\n"
+    trailing_newline: bool = True
+
+    @classmethod
+    def parse(cls, text: str) -> "_Text":
+        newline = "\r\n" if "\r\n" in text else "\n"
+        if not text:
+            return cls([], newline)
+        trailing = text.endswith(newline)
+        body = text[:-len(newline)] if trailing else text
+        return cls(body.split(newline), newline, trailing)
+
+    def render(self) -> str:
+        if not self.lines:
+            return ""
+        return self.newline.join(self.lines) + (self.newline if self.trailing_newline else "")
+
+
+class FileEditor:
+    """
+    ディレクトリ内のファイルを部分的に編集する。ファイル全体を送り直さずに、置き換えやパッチだけで修正できる。
+
+    - `edit`: 文字列の完全一致による置き換え。一致しない・複数に一致する場合は適用しない。
+    - `apply_patch`: unified diff（複数ファイル、追加・削除を含む）の適用。行番号がずれていても文脈の一致する位置に当てる。
+
+    どちらも全ての変更を検証してから書き込み、1つでも適用できない場合は何も変更しない。
+    書き込みは一時ファイルからの置き換え (`os.replace`) で行うため、途中の状態のファイルは見えない
+    （ハードリンクされたファイルも、リンクを切って新しいファイルになる）。
+    """
+
+    def __init__(self, root: str):
+        """
+        Args:
+            root (str): 編集を許可するディレクトリ。これより外のファイルは編集しない。
+        """
+        self.root = Path(root).resolve()
+
+    def edit(self, path: str, old: str, new: str, replace_all: bool = False) -> str:
+        """
+        ファイル内の old を new に置き換え、結果のメッセージを返す。
+        old が複数の箇所に一致する場合は、replace_all でない限り適用しない。
+        """
+        target = self._resolve(path)
+        if not old:
+            raise EditError("old_text must not be empty. Use a file write tool to create a new file.")
+        if not target.is_file():
+            raise EditError(f"File '{path}' does not exist.")
+        content = _read(target)
+        count = content.count(old)
+        if count == 0:
+            raise EditError(f"old_text was not found in '{path}'.{_near_miss(content, old)}")
+        if count > 1 and not replace_all:
+            lines = [str(content.count("\n", 0, match.start()) + 1) for match in re.finditer(re.escape(old), content)]
+            raise EditError(f"old_text matches {count} places in '{path}' (lines {', '.join(lines)}). "
+                            "Include more surrounding text to make it unique, or set replace_all.")
+        updated = content.replace(old, new) if replace_all else content.replace(old, new, 1)
+        _write_atomic(target, updated)
+        return f"Successfully edited {path} ({count if replace_all else 1} replacement{'s' if replace_all and count > 1 else ''})."
+
+    def apply_patch(self, patch: str) -> str:
+        """
+        unified diff を適用し、変更したファイルの一覧を返す。
+        """
+        file_patches = _parse_patch(patch)
+        if not file_patches:
+            raise EditError("No file changes found in the patch. Expected '--- a/path' / '+++ b/path' headers and '@@' hunks.")
+
+        # 全てのファイルの新しい内容を作ってから書き込む（1つでも競合すれば何も変更しない）
+        summaries: List[str] = []
+        pending: Dict[Path, Optional[str]] = {}
+        for file_patch in file_patches:
+            target = self._resolve(file_patch.path)
+            if target in pending:
+                original = pending[target]
+            elif file_patch.old_path is None:
+                if target.exists():
+                    raise EditError(f"Cannot create '{file_patch.path}': the file already exists.")
+                original = ""
+            else:
+                if not target.is_file():
+                    raise EditError(f"File '{file_patch.path}' does not exist.")
+                original = _read(target)
+            if original is None:
+                raise EditError(f"File '{file_patch.path}' is deleted earlier in the same patch.")
+            updated = _apply_hunks(file_patch, original)
+            content = None if file_patch.new_path is None else updated
+            pending[target] = content
+            summaries.append(_summary(file_patch))
+
+        for target, content in pending.items():
+            if content is None:
+                target.unlink()
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                _write_atomic(target, content)
+        return "Successfully applied patch:\n" + "\n".join(summaries)
+
+    def _resolve(self, path: str) -> Path:
+        target = (self.root / path).resolve()
+        if target == self.root or self.root not in target.parents:
+            raise EditError(f"Security violation. Cannot edit '{path}' outside the root directory.")
+        return target
+
+
+def _parse_patch(patch: str) -> List[_FilePatch]:
+    lines = patch.splitlines()
+    files: List[_FilePatch] = []
+    current: Optional[_FilePatch] = None
+    hunk: Optional[_Hunk] = None
+    last_kind = ""
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        # "--- " は、次の行が "+++ " の場合のみファイルの見出しとみなす（"--" で始まる行の削除と区別する）
+        if line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "):
+            current = _FilePatch(_patch_path(line[4:]), _patch_path(lines[i + 1][4:]))
+            if current.path is None:
+                raise EditError("Both the old and new paths of a file in the patch are /dev/null.")
+            files.append(current)
+            hunk = None
+            i += 2
+            continue
+        match = _HUNK_HEADER.match(line)
+        if match:
+            if current is None:
+                raise EditError(f"Hunk '{line}' appears before any '--- a/path' / '+++ b/path' header.")
+            hunk = _Hunk(line, int(match.group(1)), int(match.group(2)) if match.group(2) is not None else 1)
+            current.hunks.append(hunk)
+        elif hunk is not None and line.startswith("\\"):
+            if last_kind in ("+", " "):
+                hunk.new_no_newline = True
+        elif hunk is not None and (line[:1] in ("+", "-", " ") or line == ""):
+            kind, text = (line[:1] or " "), line[1:]
+            if kind != "+":
+                hunk.old.append(text)
+            if kind != "-":
+                hunk.new.append(text)
+            hunk.added += kind == "+"
+            hunk.removed += kind == "-"
+            last_kind = kind
+        else:
+            # "diff --git" や "index ..." などの見出し、説明の文章
+            hunk = None
+        i += 1
+    for file_patch in files:
+        for hunk in file_patch.hunks:
+            # パッチの後ろの空行を、文脈の行として取り込んだ分を落とす（見出しの行数を超えた空の文脈の行）
+            while (len(hunk.old) > hunk.old_count and hunk.old and hunk.new
+                   and hunk.old[-1] == "" and hunk.new[-1] == ""):
+                hunk.old.pop()
+                hunk.new.pop()
+    return files
+
+
+def _patch_path(raw: str) -> Optional[str]:
+    path = raw.split("\t", 1)[0].strip()
+    if path == DEV_NULL:
+        return None
+    if path[:2] in ("a/", "b/"):
+        path = path[2:]
+    return path
+
+
+def _apply_hunks(file_patch: _FilePatch, original: str) -> str:
+    text = _Text.parse(original)
+    lines = text.lines
+    offset = 0
+    for number, hunk in enumerate(file_patch.hunks, 1):
+        old = hunk.old
+        expected = max(0, hunk.old_start - 1 + offset) if hunk.old_start else 0
+        position = _find_hunk(lines, old, expected)
+        if position is None:
+            raise EditError(_conflict_message(file_patch.path, number, hunk, lines, expected))
+        lines[position:position + len(old)] = hunk.new
+        offset += len(hunk.new) - len(old)
+        if position + len(hunk.new) >= len(lines):
+            text.trailing_newline = not hunk.new_no_newline
+    text.lines = lines
+    if not file_patch.hunks:
+        return original
+    return text.render()
+
+
+def _find_hunk(lines: List[str], old: List[str], expected: int) -> Optional[int]:
+    """
+    old が一致する位置を、期待する位置から近い順に探す。完全に一致しない場合は、行末の空白を無視して探す。
+    """
+    if not old:
+        return min(expected, len(lines))
+    for normalize in (False, True):
+        target = [line.rstrip() for line in old] if normalize else old
+        candidates = sorted(range(len(lines) - len(old) + 1), key=lambda start: abs(start - expected))
+        for start in candidates:
+            window = lines[start:start + len(old)]
+            if normalize:
+                window = [line.rstrip() for line in window]
+            if window == target:
+                return start
+    return None
+
+
+def _conflict_message(path: str, number: int, hunk: _Hunk, lines: List[str], expected: int) -> str:
+    """
+    競合したハンクについて、ファイルの期待する位置の内容と、最初に食い違った行を示す。
+    """
+    mismatch = ""
+    for i, want in enumerate(hunk.old):
+        actual = lines[expected + i] if expected + i < len(lines) else "<end of file>"
+        if actual != want:
+            mismatch = (f"\nFirst difference at line {expected + i + 1}:\n"
+                        f"  patch expects: {want!r}\n  file has:      {actual!r}")
+            break
+    start = max(0, expected - _CONFLICT_CONTEXT_LINES)
+    end = min(len(lines), expected + len(hunk.old) + _CONFLICT_CONTEXT_LINES)
+    excerpt = "\n".join(f"{n + 1}| {lines[n]}" for n in range(start, end))
+    return (f"Patch conflict in '{path}', hunk #{number} ({hunk.header}): the context lines do not match the file. "
+            f"No files were changed.{mismatch}\nCurrent file around line {expected + 1}:\n{excerpt}")
+
+
+def _near_miss(content: str, old: str) -> str:
+    """
+    完全一致しない場合に、空白の違いを無視すれば一致する箇所があれば、その行を示す。
+    """
+    first = "".join(old.strip().splitlines()[0].split()) if old.strip() else ""
+    if not first:
+        return ""
+    for number, line in enumerate(content.splitlines(), 1):
+        if first in "".join(line.split()):
+            return (f" The first line of old_text resembles line {number}: {line!r}. "
+                    "Check whitespace, indentation and the following lines.")
+    return " Read the file again to get its current content."
+
+
+def _summary(file_patch: _FilePatch) -> str:
+    added = sum(hunk.added for hunk in file_patch.hunks)
+    removed = sum(hunk.removed for hunk in file_patch.hunks)
+    if file_patch.old_path is None:
+        return f"A {file_patch.path} (+{added})"
+    if file_patch.new_path is None:
+        return f"D {file_patch.path}"
+    return f"M {file_patch.path} (+{added} -{removed})"
+
+
+def _read(path: Path) -> str:
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+def _write_atomic(path: Path, content: str):
+    fd, temp = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(content)
+        if path.exists():
+            os.chmod(temp, path.stat().st_mode & 0o7777)
+        os.replace(temp, path)
+    except BaseException:
+        Path(temp).unlink(missing_ok=True)
+        raise
@@ -0,0 +1,112 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import os
+import threading
+import google.generativeai as genai
+from google.generativeai.types import content_types
+from rich.console import Console
+
+try:
+    from .llm_backend import LLMBackend
+except ImportError:
+    from agent.llm_backend import LLMBackend
+
+console = Console()
+
+
+class GeminiBackend(LLMBackend):
+    """
+    google-generativeai SDK を使って Gemini API と通信するバックエンド。
+    """
+
+    def __init__(self, api_key: Optional[str] = None, api_endpoint: Optional[str] = None):
+        """
+        Args:
+            api_key (str, optional): Gemini API キー。省略時は環境変数 `GEMINI_API_KEY`。
+            api_endpoint (str, optional): 接続先の URL（例: ベンチマーク用の偽サーバー "http://127.0.0.1:8089"）。
+                省略時は環境変数 `GEMINI_API_ENDPOINT`。指定した場合は REST トランスポートを使う。
+
+        Raises:
+            ValueError: API キーが設定されていない場合。
+        """
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            error_msg = "GEMINI_API_KEY environment variable is not set."
+            console.print(f"[bold red]Error:[/bold red] {error_msg}")
+            raise ValueError(error_msg)
+        api_endpoint = api_endpoint or os.getenv("GEMINI_API_ENDPOINT")
+        if api_endpoint:
+            genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": api_endpoint})
+        else:
+            genai.configure(api_key=api_key)
+        # 単発の生成に使うモデル（ツール無し）。モデル名とシステムプロンプトごとに1度だけ作って使い回す
+        self._models: Dict[Tuple[str, str], Any] = {}
+        self._models_lock = threading.Lock()
+
+    def start_chat(self, model_name: str, system_instruction: str, tools: Optional[List[Any]] = None) -> Any:
+        model = genai.GenerativeModel(
+            model_name=model_name,
+            system_instruction=system_instruction,
+            tools=function_tools(tools)
+        )
+        # 手動で関数呼び出しを制御するため False に設定
+        return model.start_chat(history=[], enable_automatic_function_calling=False)
+
+    def generate_content(self, model_name: str, system_instruction: str, prompt: str,
+                         response_schema: Optional[Dict[str, Any]] = None) -> Any:
+        model = self._model(model_name, system_instruction)
+        if response_schema is None:
+            return model.generate_content(prompt)
+        return model.generate_content(prompt, generation_config=json_generation_config(response_schema))
+
+    async def generate_content_async(self, model_name: str, system_instruction: str, prompt: str,
+                                     response_schema: Optional[Dict[str, Any]] = None) -> Any:
+        model = self._model(model_name, system_instruction)
+        if response_schema is None:
+            return await model.generate_content_async(prompt)
+        return await model.generate_content_async(prompt, generation_config=json_generation_config(response_schema))
+
+    def _model(self, model_name: str, system_instruction: str) -> Any:
+        key = (model_name, system_instruction)
+        with self._models_lock:
+            model = self._models.get(key)
+            if model is None:
+                model = genai.GenerativeModel(model_name=model_name, system_instruction=system_instruction)
+                self._models[key] = model
+            return model
+
+
+def json_generation_config(response_schema: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    出力をスキーマに従う JSON に制約する生成設定を返す。
+    """
+    return {"response_mime_type": "application/json", "response_schema": response_schema}
+
+
+# ツールの関数 → 関数宣言（SDK が docstring とシグネチャから作るスキーマ）。プロセス内で1度だけ作る
+_declarations: Dict[Callable, Any] = {}
+_tools: Dict[Tuple[Callable, ...], Any] = {}
+_declarations_lock = threading.Lock()
+
+
+def function_tools(tools: Optional[List[Any]]) -> Optional[List[Any]]:
+    """
+    ツールの関数のリストを、キャッシュした関数宣言からなる SDK の `Tool` に変換する。
+    SDK に関数をそのまま渡すと、モデルを作るたびに全てのツールのスキーマを生成し直す（1回あたり数十ミリ秒）。
+    宣言は関数（束縛したメソッドは元の関数）ごとに作るため、同じクラスの全てのインスタンスで共有される。
+    関数でないもの（SDK の `Tool` など）を含む場合はそのまま渡す。
+    """
+    if not tools or not all(callable(t) for t in tools):
+        return tools
+    keys = tuple(getattr(t, "__func__", t) for t in tools)
+    with _declarations_lock:
+        cached = _tools.get(keys)
+        if cached is None:
+            declarations = []
+            for key, func in zip(keys, tools):
+                if key not in _declarations:
+                    # 束縛したメソッドから作ると self を含まないスキーマになる
+                    _declarations[key] = content_types.FunctionDeclaration.from_function(func).to_proto()
+                declarations.append(_declarations[key])
+            cached = [content_types.Tool(function_declarations=declarations)]
+            _tools[keys] = cached
+        return cached
@@ -0,0 +1,111 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+import asyncio
+import os
+import threading
+
+
+class LLMBackend(ABC):
+    """
+    `Agent` が LLM と通信するためのバックエンドの基底クラス。
+
+    `start_chat` が返すセッションは、genai の `ChatSession` と同じく
+    `send_message(content)` / `send_message_async(content)` / `history` を持つ必要がある。
+    本番では `GeminiBackend`、ベンチマークやオフライン検証では `RecordingBackend` / `ReplayBackend` を使う。
+    """
+
+    @abstractmethod
+    def start_chat(self, model_name: str, system_instruction: str, tools: Optional[List[Any]] = None) -> Any:
+        """
+        チャットセッションを開始する（自動関数呼び出しは無効）。
+
+        Args:
+            model_name (str): 使用するモデル名。
+            system_instruction (str): システムプロンプト。
+            tools (list, optional): モデルに公開するツール。
+
+        Returns:
+            チャットセッション。
+        """
+        pass
+
+    @abstractmethod
+    def generate_content(self, model_name: str, system_instruction: str, prompt: str,
+                         response_schema: Optional[Dict[str, Any]] = None) -> Any:
+        """
+        ツールを持たないモデルで単発の生成を行う（`Manager.decompose_task` など）。
+
+        Args:
+            model_name (str): 使用するモデル名。
+            system_instruction (str): システムプロンプト。
+            prompt (str): 入力テキスト。
+            response_schema (dict, optional): 出力をこのスキーマ（OpenAPI のサブセット）の JSON に制約する。
+                制約に対応していないバックエンドは無視してよい（呼び出し側は出力を検証する）。
+
+        Returns:
+            `text` 属性を持つレスポンス。
+        """
+        pass
+
+    async def generate_content_async(self, model_name: str, system_instruction: str, prompt: str,
+                                     response_schema: Optional[Dict[str, Any]] = None) -> Any:
+        """
+        `generate_content` の非同期版。デフォルトではワーカースレッドで実行する。
+        """
+        return await asyncio.to_thread(self.generate_content, model_name, system_instruction, prompt, response_schema)
+
+
+_shared_backend: Optional[LLMBackend] = None
+_shared_lock = threading.Lock()
+
+
+def create_backend(kind: Optional[str] = None) -> LLMBackend:
+    """
+    種類名からバックエンドを生成する。
+
+    Args:
+        kind (str, optional): "gemini" / "record" / "replay"。省略時は環境変数 `AGENT_LLM_BACKEND`（デフォルト "gemini"）。
+            "record" / "replay" ではカセットファイルのパスを `AGENT_CASSETTE` で指定する。
+            "replay" の擬似レイテンシは `AGENT_REPLAY_LATENCY`（秒、未設定なら記録時の値）で指定する。
+
+    Returns:
+        LLMBackend: 生成されたバックエンド。
+    """
+    # 具象クラスは基底クラスに依存するため、ここで遅延インポートする
+    try:
+        from .gemini_backend import GeminiBackend
+        from .recording_backend import RecordingBackend
+        from .replay_backend import ReplayBackend
+    except ImportError:
+        from agent.gemini_backend import GeminiBackend
+        from agent.recording_backend import RecordingBackend
+        from agent.replay_backend import ReplayBackend
+
+    kind = (kind or os.getenv("AGENT_LLM_BACKEND") or "gemini").lower()
+    if kind == "gemini":
+        return GeminiBackend()
+
+    cassette = os.getenv("AGENT_CASSETTE")
+    if not cassette:
+        raise ValueError(f"AGENT_CASSETTE must be set to use the '{kind}' backend.")
+    if kind == "record":
+        return RecordingBackend(GeminiBackend(), cassette)
+    if kind == "replay":
+        latency = os.getenv("AGENT_REPLAY_LATENCY")
+        return ReplayBackend(cassette, latency=float(latency) if latency else None)
+    raise ValueError(f"Unknown LLM backend: {kind}")
+
+
+def get_backend() -> LLMBackend:
+    """
+    プロセス全体で共有されるバックエンドを返す（初回呼び出し時に環境変数から生成）。
+    Gemini バックエンドは共有せず、API キーの確認のため毎回生成する。
+    """
+    global _shared_backend
+    kind = (os.getenv("AGENT_LLM_BACKEND") or "gemini").lower()
+    if kind == "gemini":
+        return create_backend(kind)
+    with _shared_lock:
+        if _shared_backend is None:
+            _shared_backend = create_backend(kind)
+        return _shared_backend
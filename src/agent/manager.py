@@ -1,7 +1,14 @@
-from typing import Dict, Any, List
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Callable, Optional
 import json
 import ast
-import google.generativeai as genai
+import asyncio
+import contextvars
+import hashlib
+import re
+import threading
+import time
 from rich.console import Console
 
 # Consoleインスタンス
@@ -9,10 +16,46 @@ console = Console()
 
 # 相対インポートを使用（srcパッケージ内での実行を想定）
 try:
-    from .agent import Agent
+    from .agent import Agent, run_sync
+    from .agent_pool import AgentPool
+    from .llm_backend import LLMBackend
+    from .model_router import CALL_DECOMPOSITION
+    from .response_cache import ResponseCache
+    from .task_graph import TaskGraph, TaskNode
+    from .task_scheduler import TaskScheduler
+    from .tool_registry import COST_LLM, tool
 except ImportError:
     # テスト時などのために絶対インポートへのフォールバック
-    from agent.agent import Agent
+    from agent.agent import Agent, run_sync
+    from agent.agent_pool import AgentPool
+    from agent.llm_backend import LLMBackend
+    from agent.model_router import CALL_DECOMPOSITION
+    from agent.response_cache import ResponseCache
+    from agent.task_graph import TaskGraph, TaskNode
+    from agent.task_scheduler import TaskScheduler
+    from agent.tool_registry import COST_LLM, tool
+
+# 単発の生成の出力を制約するスキーマ（OpenAPI のサブセット）
+TASK_LIST_SCHEMA = {"type": "array", "items": {"type": "string"}}
+TASK_GRAPH_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "id": {"type": "string"},
+            "description": {"type": "string"},
+            "assignee": {"type": "string"},
+            "depends_on": {"type": "array", "items": {"type": "string"}},
+        },
+        "required": ["id", "description"],
+    },
+}
+# プロセス内で保持する、要件ごとのタスク分解の結果の数
+DECOMPOSITION_CACHE_SIZE = 128
+
+# マークダウンのコードブロック / 箇条書き・番号付きの行
+_FENCE_RE = re.compile(r"```[a-zA-Z]*\s*(.*?)```", re.DOTALL)
+_BULLET_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+(.+?)\s*$")
 
 class Manager(Agent):
     """
@@ -20,7 +63,12 @@ class Manager(Agent):
     ユーザーの意図を理解し、タスクを分解し、適切なワーカーエージェントに割り当てる。
     """
 
-    def __init__(self, name: str = "Manager"):
+    def __init__(self, name: str = "Manager", backend: Optional[LLMBackend] = None):
+        """
+        Args:
+            name (str): エージェント名。
+            backend (LLMBackend, optional): LLM バックエンド。省略時は `get_backend()`。
+        """
         role = """
         あなたはプロジェクトマネージャー兼テックリードです。
         以下の責任を持ちます：
@@ -34,18 +82,42 @@ class Manager(Agent):
         instructions = """
         ユーザーからの入力に対して、まず「何が必要か」を考え、必要に応じてツールを呼び出してください。
         設計が未完了の場合は必ず Architect に設計を依頼してください。
+        互いに依存しない複数のタスク（別々のファイルの実装など）は `delegate_many` でまとめて並列に依頼してください。
+        設計から実装までの複数工程をまとめて進める場合は `execute_plan` を使うと、依存関係に従って自動で割り当てられます。
         指示は具体的かつ簡潔に行ってください。
         """
-        super().__init__(name, role, instructions, tools=[self.decompose_task, self.delegate_task])
-        self.sub_agents: Dict[str, Agent] = {}
+        # ツールは `tool` で宣言したメソッドから、基底クラスの初期化時に登録される
+        super().__init__(name, role, instructions, backend=backend)
+        # 並列委任で1つのチャットセッションを共有しないよう、エージェントごとにインスタンスを貸し出す
+        self.agent_pools: Dict[str, AgentPool] = {}
+        # 要件のハッシュ → 分解したタスクのリスト（同じ要件の分解で LLM を呼ばない）
+        self._decompositions: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._decompositions_lock = threading.Lock()
 
-    def assign_agent(self, agent_name: str, agent: Agent):
+    @property
+    def sub_agents(self) -> Dict[str, Optional[Agent]]:
+        """
+        チームメンバーの名前と、最初のインスタンス（遅延生成でまだ作られていない場合は None）。
+        """
+        return {name: pool.primary for name, pool in self.agent_pools.items()}
+
+    def assign_agent(self, agent_name: str, agent: Optional[Agent] = None, factory: Optional[Callable[[], Agent]] = None,
+                     max_instances: int = 1):
         """
         チームメンバー（サブエージェント）を登録する。
+        agent を省略して factory だけを渡すと、最初に委任されるまでインスタンスを作らない
+        （モデルの準備や sandbox の作成を、そのエージェントが実際に使われるまで遅らせる）。
+
+        Args:
+            agent_name (str): エージェント名。
+            agent (Agent, optional): 登録するインスタンス。省略時は最初の委任時に factory で生成する。
+            factory (callable, optional): インスタンスを生成する関数（例: `Coder`）。並列タスク用の追加インスタンスの生成にも使う。
+            max_instances (int): 生成するインスタンス数の上限。
         """
-        self.sub_agents[agent_name] = agent
+        self.agent_pools[agent_name] = AgentPool(agent_name, agent, factory=factory, max_size=max_instances)
         console.print(f"[green]Manager assigned {agent_name} to the team.[/green]")
 
+    @tool(parallel_safe=True, idempotent=True, cost=COST_LLM)
     def decompose_task(self, requirements: str) -> List[str]:
         """
         ユーザーの要件を具体的なタスクのリスト（文字列の配列）に分解します。
@@ -57,48 +129,158 @@ class Manager(Agent):
             List[str]: 分解されたタスクのリスト。
         """
         console.print(f"[bold magenta]Manager thinking:[/bold magenta] Decomposing task: {requirements}")
-        
+
+        key = requirement_hash(requirements)
+        with self._decompositions_lock:
+            cached = self._decompositions.get(key)
+            if cached is not None:
+                self._decompositions.move_to_end(key)
+        if cached is not None:
+            console.print("[dim]Manager decomposition reused for the same requirements.[/dim]")
+            self.metrics.incr("manager.decomposition_cache_hits")
+            return list(cached)
+
         # LLMを使用してタスクを分解する
         try:
-            # 自身と同じモデル構成を使用するが、ツールは無効化して純粋なテキスト生成として扱う
-            decomposition_model = genai.GenerativeModel(
-                model_name=self.model_name,
+            tasks = self._generate_list(
                 system_instruction="""
                 あなたは熟練のプロジェクトマネージャーです。
                 与えられた要件を、実行可能な具体的なタスクのリストに分解してください。
                 
                 出力形式:
-                Pythonのリスト形式の文字列のみを出力してください。余計なマークダウンや説明は不要です。
+                文字列の JSON 配列のみを出力してください。余計なマークダウンや説明は不要です。
                 例: ["要件定義書の作成", "データベース設計", "API実装", "テスト"]
                 """,
+                prompt=f"要件: {requirements}",
+                response_schema=TASK_LIST_SCHEMA,
+                validate=normalize_task_list,
             )
-            
-            response = decomposition_model.generate_content(f"要件: {requirements}")
-            response_text = response.text.strip()
-            
-            # マークダウンのコードブロックが含まれている場合のクリーニング
-            if response_text.startswith("```"):
-                response_text = response_text.replace("```json", "").replace("```python", "").replace("```", "").strip()
-            
-            # 文字列をリストに変換
-            try:
-                tasks = ast.literal_eval(response_text)
-                if not isinstance(tasks, list):
-                    raise ValueError("Output is not a list")
-            except (ValueError, SyntaxError):
-                # パース失敗時は単純に改行で分割などのフォールバック、あるいはエラー
-                console.print(f"[red]Failed to parse task list from LLM: {response_text}[/red]")
-                # フォールバックとしてJSONパースを試みる
-                tasks = json.loads(response_text)
-            
-            console.print(f"[bold magenta]Manager result:[/bold magenta] Generated {len(tasks)} tasks.")
-            return tasks
-            
         except Exception as e:
             console.print(f"[red]Error in decompose_task: {str(e)}[/red]")
-            # エラー時のフォールバック
-            return ["タスク分解に失敗しました", "要件を再確認してください"]
+            # 分解に失敗した場合は要件全体を1つのタスクとして扱う（キャッシュしない）
+            return [requirements]
+
+        with self._decompositions_lock:
+            self._decompositions[key] = tasks
+            while len(self._decompositions) > DECOMPOSITION_CACHE_SIZE:
+                self._decompositions.popitem(last=False)
+        console.print(f"[bold magenta]Manager result:[/bold magenta] Generated {len(tasks)} tasks.")
+        return list(tasks)
+
+    def plan_tasks(self, requirements: str) -> TaskGraph:
+        """
+        ユーザーの要件を、担当者と依存関係付きのタスクグラフに分解する。
+
+        Args:
+            requirements (str): ユーザーからの要望や要件の記述。
 
+        Returns:
+            TaskGraph: 分解されたタスクグラフ。
+        """
+        return run_sync(self.plan_tasks_async(requirements, blocking=True))
+
+    async def plan_tasks_async(self, requirements: str, blocking: bool = False) -> TaskGraph:
+        """
+        `plan_tasks` の非同期版。
+
+        Args:
+            requirements (str): ユーザーからの要望や要件の記述。
+            blocking (bool): True の場合は同期の API 呼び出しを使う（`plan_tasks` 用）。
+        """
+        console.print(f"[bold magenta]Manager thinking:[/bold magenta] Planning task graph: {requirements}")
+        available_agents = list(self.agent_pools)
+
+        try:
+            items = await self._generate_list_async(
+                system_instruction=f"""
+                あなたは熟練のプロジェクトマネージャーです。
+                与えられた要件を、実行可能な具体的なタスクに分解し、依存関係付きのタスクグラフとして出力してください。
+                担当者 (assignee) は次のいずれかです: {available_agents}
+                互いに依存しないタスクは depends_on を空にし、並列に実行できるようにしてください。
+                
+                出力形式:
+                JSON の配列のみを出力してください。余計なマークダウンや説明は不要です。
+                例: [{{"id": "t1", "description": "システム設計", "assignee": "Architect", "depends_on": []}},
+                     {{"id": "t2", "description": "API実装", "assignee": "Coder", "depends_on": ["t1"]}}]
+                """,
+                prompt=f"要件: {requirements}",
+                response_schema=TASK_GRAPH_SCHEMA,
+                blocking=blocking,
+            )
+            try:
+                graph = TaskGraph.from_list(items, available_agents)
+            except ValueError as e:
+                # 循環依存などで DAG にならない場合は、記述順の直列実行にフォールバックする
+                console.print(f"[red]Invalid task graph from LLM ({e}). Falling back to sequential order.[/red]")
+                descriptions = [item.get("description", "") if isinstance(item, dict) else item for item in items]
+                graph = TaskGraph.from_list(descriptions, available_agents)
+
+        except Exception as e:
+            console.print(f"[red]Error in plan_tasks: {str(e)}[/red]")
+            # 分解に失敗した場合は要件全体を1つのタスクとして扱う
+            graph = TaskGraph.from_list([requirements], available_agents)
+
+        console.print(f"[bold magenta]Manager result:[/bold magenta] Planned {len(graph.nodes)} tasks.")
+        return graph
+
+    @tool(parallel_safe=True, cost=COST_LLM)
+    def execute_plan(self, requirements: str) -> str:
+        """
+        要件をタスクグラフに分解し、依存関係が解決したタスクから順に担当エージェントへ自動で割り当てて実行します。
+        独立したタスクは並列に実行されます。複数の工程からなる要件をまとめて進める場合に使用してください。
+        
+        Args:
+            requirements (str): ユーザーからの要望や要件の記述。
+            
+        Returns:
+            str: 各タスクの担当者・状態・所要時間・回答をまとめた実行レポート。
+        """
+        with self.tracer.span("plan.execute", **{"agent.name": self.name}) as span:
+            graph = self.plan_tasks(requirements)
+            span.set_attribute("plan.tasks", len(graph.nodes))
+            started_at = time.perf_counter()
+            # サブエージェントの失敗は例外として受け取り、スケジューラーがタスクを失敗として扱う
+            TaskScheduler().run(graph, lambda node: self._delegate(node.assignee, self._task_prompt(graph, node),
+                                                                   raise_errors=True))
+            span.set_attribute("plan.critical_path_seconds", graph.critical_path_seconds())
+            return self._plan_report(graph, time.perf_counter() - started_at)
+
+    async def execute_plan_async(self, requirements: str) -> str:
+        """
+        `execute_plan` の非同期版。
+        """
+        with self.tracer.span("plan.execute", **{"agent.name": self.name}) as span:
+            graph = await self.plan_tasks_async(requirements)
+            span.set_attribute("plan.tasks", len(graph.nodes))
+            started_at = time.perf_counter()
+
+            async def dispatch(node: TaskNode) -> str:
+                return await self._delegate_async(node.assignee, self._task_prompt(graph, node), raise_errors=True)
+
+            await TaskScheduler().run_async(graph, dispatch)
+            span.set_attribute("plan.critical_path_seconds", graph.critical_path_seconds())
+            return self._plan_report(graph, time.perf_counter() - started_at)
+
+    def _task_prompt(self, graph: TaskGraph, node: TaskNode) -> str:
+        """
+        サブエージェントへの依頼文を作る。依存タスクの回答を前提情報として添える。
+        """
+        if not node.depends_on:
+            return node.description
+        context = "\n\n".join(f"[{dep}] {graph.nodes[dep].description}\n{graph.nodes[dep].result}" for dep in node.depends_on)
+        return f"{node.description}\n\n前提となるタスクの結果:\n{context}"
+
+    def _plan_report(self, graph: TaskGraph, elapsed: float) -> str:
+        """
+        タスクグラフの実行結果をツール応答用のテキストにまとめる。
+        """
+        lines = [f"Plan finished in {elapsed:.1f}s (critical path {graph.critical_path_seconds():.1f}s, {len(graph.nodes)} tasks)."]
+        for node in graph.nodes.values():
+            duration = f"{node.duration:.1f}s" if node.duration is not None else "-"
+            lines.append(f"[{node.id}] {node.assignee} / {node.status} / {duration}: {node.description}\n{node.result}")
+        return "\n\n".join(lines)
+
+    @tool(parallel_safe=True, cost=COST_LLM)
     def delegate_task(self, agent_name: str, task_content: str) -> str:
         """
         指定されたエージェントに特定のタスクを依頼し、その結果を受け取ります。
@@ -113,23 +295,266 @@ class Manager(Agent):
         Returns:
             str: 依頼先エージェントからの回答。
         """
-        if agent_name not in self.sub_agents:
-            return f"Error: Agent {agent_name} is not in the team. Available agents: {list(self.sub_agents.keys())}"
-        
-        target_agent = self.sub_agents[agent_name]
+        return self._delegate(agent_name, task_content)
+
+    def _delegate(self, agent_name: str, task_content: str, raise_errors: bool = False) -> str:
+        """
+        `delegate_task` の本体。
+
+        Args:
+            raise_errors (bool): True の場合、未登録のエージェントやサブエージェントの失敗を
+                エラーメッセージとして返さず、例外として送出する。
+        """
+        if agent_name not in self.agent_pools:
+            error = f"Agent {agent_name} is not in the team. Available agents: {list(self.agent_pools)}"
+            if raise_errors:
+                raise LookupError(error)
+            return f"Error: {error}"
+
         console.print(f"[bold yellow]Manager to {agent_name}:[/bold yellow] {task_content}")
         
         # サブエージェントにメッセージを送信し、結果を受け取る
         # ここで別のエージェントの send_message が呼ばれ、再帰的に思考が走る
-        response = target_agent.send_message(task_content)
+        # 空いているインスタンスが無い場合は、他のタスクが終わるまで待つ
+        with self.tracer.span("agent.delegate", **{"agent.name": self.name, "delegate.target": agent_name}) as span:
+            with self.agent_pools[agent_name].lease() as target_agent:
+                span.set_attribute("delegate.pool_size", self.agent_pools[agent_name].size)
+                # ツールとしての委任（LLM に結果を返す）では、失敗もメッセージとして受け取る
+                response = target_agent.send_message(task_content, raise_errors=True) if raise_errors \
+                    else target_agent.send_message(task_content)
         return f"{agent_name} からの回答: {response}"
 
-    def execute_tool(self, tool_name: str, args: Dict[str, Any]) -> Any:
+    async def delegate_task_async(self, agent_name: str, task_content: str) -> str:
+        """
+        `delegate_task` の非同期版。サブエージェントの `send_message_async` を待つ間、イベントループを解放する。
+        """
+        return await self._delegate_async(agent_name, task_content)
+
+    async def _delegate_async(self, agent_name: str, task_content: str, raise_errors: bool = False) -> str:
+        """
+        `_delegate` の非同期版。
+        """
+        if agent_name not in self.agent_pools:
+            error = f"Agent {agent_name} is not in the team. Available agents: {list(self.agent_pools)}"
+            if raise_errors:
+                raise LookupError(error)
+            return f"Error: {error}"
+
+        console.print(f"[bold yellow]Manager to {agent_name}:[/bold yellow] {task_content}")
+
+        with self.tracer.span("agent.delegate", **{"agent.name": self.name, "delegate.target": agent_name}) as span:
+            async with self.agent_pools[agent_name].lease_async() as target_agent:
+                span.set_attribute("delegate.pool_size", self.agent_pools[agent_name].size)
+                response = await (target_agent.send_message_async(task_content, raise_errors=True) if raise_errors
+                                  else target_agent.send_message_async(task_content))
+        return f"{agent_name} からの回答: {response}"
+
+    @tool(parallel_safe=True, cost=COST_LLM)
+    def delegate_many(self, agent_names: List[str], task_contents: List[str]) -> str:
+        """
+        互いに依存しない複数のタスクを、それぞれ指定されたエージェントに同時に依頼し、全ての回答をまとめて受け取ります。
+        `agent_names[i]` に `task_contents[i]` を依頼します。同じエージェント名を複数回指定しても構いません。
+        
+        Args:
+            agent_names (List[str]): 依頼先のエージェント名のリスト（例: ["Coder", "Coder"]）。
+            task_contents (List[str]): 依頼する具体的な内容のリスト（agent_names と同じ長さ）。
+            
+        Returns:
+            str: 全ての依頼先エージェントからの回答（依頼した順）。
+        """
+        pairs = self._pair_tasks(agent_names, task_contents)
+        if isinstance(pairs, str):
+            return pairs
+
+        console.print(f"[bold yellow]Manager fan-out:[/bold yellow] {len(pairs)} tasks")
+        # 同時に動けるのは各エージェントのインスタンス数までなので、それを超えるスレッドは作らない
+        max_workers = min(len(pairs), sum(self.agent_pools[name].max_size for name in {name for name, _ in pairs}))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="delegate") as pool:
+            # 各委任を、呼び出し元のツール実行スパンの子として記録するためにコンテキストを引き継ぐ
+            futures = [pool.submit(contextvars.copy_context().run, self.delegate_task, *pair) for pair in pairs]
+            results = [future.result() for future in futures]
+        return self._merge_results(results)
+
+    async def delegate_many_async(self, agent_names: List[str], task_contents: List[str]) -> str:
+        """
+        `delegate_many` の非同期版。
+        """
+        pairs = self._pair_tasks(agent_names, task_contents)
+        if isinstance(pairs, str):
+            return pairs
+
+        console.print(f"[bold yellow]Manager fan-out:[/bold yellow] {len(pairs)} tasks")
+        results = await asyncio.gather(*(self.delegate_task_async(name, task) for name, task in pairs))
+        return self._merge_results(results)
+
+    def _pair_tasks(self, agent_names: List[str], task_contents: List[str]):
+        """
+        delegate_many の引数を (エージェント名, タスク) の組に変換する。不正な場合はエラーメッセージを返す。
+        """
+        agent_names, task_contents = list(agent_names), list(task_contents)
+        if len(agent_names) != len(task_contents):
+            return f"Error: agent_names ({len(agent_names)}) and task_contents ({len(task_contents)}) must have the same length."
+        if not agent_names:
+            return "Error: No tasks were given."
+        unknown = sorted({name for name in agent_names if name not in self.agent_pools})
+        if unknown:
+            return f"Error: Agent {', '.join(unknown)} is not in the team. Available agents: {list(self.agent_pools)}"
+        return list(zip(agent_names, task_contents))
+
+    def _generate_list(self, system_instruction: str, prompt: str, response_schema: Optional[Dict[str, Any]] = None,
+                       validate: Optional[Callable[[List[Any]], List[Any]]] = None) -> List[Any]:
+        """
+        ツールを持たないモデルでリスト形式の出力を生成し、パースして返す（`_generate_list_async` の同期ラッパー）。
+        """
+        return run_sync(self._generate_list_async(system_instruction, prompt, response_schema, validate, blocking=True))
+
+    async def _generate_list_async(self, system_instruction: str, prompt: str,
+                                   response_schema: Optional[Dict[str, Any]] = None,
+                                   validate: Optional[Callable[[List[Any]], List[Any]]] = None,
+                                   blocking: bool = False) -> List[Any]:
         """
-        自動関数呼び出しを使用するため、手動実行が必要な場合のみ使用。
+        ツールを持たないモデルでリスト形式の出力を生成し、パースして返す。
+        レスポンスキャッシュが有効な場合は、同じ指示・要件に対する結果を再利用する。
+        呼び出しはチャットと同じく、レートリミッターの予算を確保してから行う。
+
+        Args:
+            system_instruction (str): システムプロンプト。
+            prompt (str): 入力テキスト。
+            response_schema (dict, optional): 出力を制約する JSON スキーマ（対応するバックエンドのみ）。
+            validate (callable, optional): パースしたリストを検証・整形する関数。不正な場合は ValueError を送出する。
+            blocking (bool): True の場合は同期の API 呼び出しを使う。
         """
-        if tool_name == "decompose_task":
-            return self.decompose_task(**args)
-        elif tool_name == "delegate_task":
-            return self.delegate_task(**args)
-        return f"Tool {tool_name} not found."
+        # ツールは無効化して純粋なテキスト生成として扱う。モデルはルーターが選び（定型的なので安価なモデル）、
+        # 出力をリストとして解析できない場合は上位モデルで1度だけやり直す
+        escalation: Optional[str] = None
+        while True:
+            model_name = self._route_single(CALL_DECOMPOSITION, prompt, escalation)
+            # キーには実際に使うモデルとスキーマを含める（上位モデルでのやり直しに安価なモデルの結果を返さない）
+            cache_key = None
+            if self.response_cache:
+                cache_key = ResponseCache.make_key(model_name, system_instruction, prompt, response_schema)
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    console.print("[dim]Manager decomposition served from cache.[/dim]")
+                    self.metrics.incr("api.cache_hits")
+                    return cached["items"]
+
+            self.token_ledger.enforce(self.name)
+            if blocking:
+                response = self._generate_single(model_name, system_instruction, prompt, response_schema)
+            else:
+                response = await self._generate_single_async(model_name, system_instruction, prompt, response_schema)
+            try:
+                items = self._parse_list_output(response.text)
+                if validate is not None:
+                    items = validate(items)
+                break
+            except (ValueError, SyntaxError):
+                if escalation is not None or not self.model_router.can_escalate(model_name):
+                    raise
+                escalation = "unparseable task list"
+                console.print(f"[yellow]{model_name} returned an unparseable task list. Retrying with a stronger model.[/yellow]")
+                self.metrics.incr("router.escalations")
+
+        if cache_key:
+            self.response_cache.put(cache_key, {"items": items})
+        return items
+
+    def _parse_list_output(self, response_text: str) -> List[Any]:
+        """
+        LLM が出力したリスト形式のテキストを Python のリストに変換する。
+        JSON モードの出力はそのままパースでき、それ以外の崩れた出力はその場で修復する
+        （LLM を呼び直すより安い）。
+
+        - マークダウンのコードブロック（前後に説明文があっても可）
+        - 前後の説明文（最初の "[" から最後の "]" までを取り出す）
+        - {"tasks": [...]} のように1つのリストを包んだオブジェクト
+        - 箇条書き・番号付きの行
+
+        Raises:
+            ValueError: どの方法でもリストとして解釈できない場合。
+        """
+        response_text = response_text.strip()
+        fenced = _FENCE_RE.search(response_text)
+        candidates = [fenced.group(1).strip()] if fenced else []
+        candidates.append(response_text)
+        start, end = response_text.find("["), response_text.rfind("]")
+        if 0 <= start < end:
+            candidates.append(response_text[start:end + 1])
+
+        for candidate in candidates:
+            items = _unwrap_list(_load_literal(candidate))
+            if items is not None:
+                if candidate != response_text:
+                    self.metrics.incr("manager.list_repairs")
+                return items
+
+        lines = [m.group(1) for m in map(_BULLET_RE.match, response_text.splitlines()) if m]
+        if lines:
+            self.metrics.incr("manager.list_repairs")
+            return lines
+        console.print(f"[red]Failed to parse task list from LLM: {response_text}[/red]")
+        raise ValueError("Output is not a list")
+
+    def _merge_results(self, results: List[str]) -> str:
+        """
+        並列タスクの回答を、依頼した順に1つのツール応答へまとめる。
+        """
+        return "\n\n".join(f"[Task {i}] {result}" for i, result in enumerate(results, start=1))
+
+
+def requirement_hash(requirements: str) -> str:
+    """
+    要件のハッシュ（前後と連続する空白の違いは無視する）。
+    """
+    normalized = " ".join(requirements.split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def normalize_task_list(items: List[Any]) -> List[str]:
+    """
+    分解したタスクのリストを検証し、文字列のリストに整える。
+    オブジェクトは description（無ければ task / title）を使い、空のタスクと重複を取り除く。
+
+    Raises:
+        ValueError: 有効なタスクが1つも無い場合。
+    """
+    tasks: List[str] = []
+    for item in items:
+        if isinstance(item, dict):
+            item = item.get("description") or item.get("task") or item.get("title") or ""
+        if not isinstance(item, (str, int, float)) or isinstance(item, bool):
+            continue
+        task = str(item).strip()
+        if task and task not in tasks:
+            tasks.append(task)
+    if not tasks:
+        raise ValueError("Task list is empty")
+    return tasks
+
+
+def _load_literal(text: str) -> Any:
+    """
+    JSON（失敗したら Python のリテラル）としてパースする。どちらでもなければ None。
+    """
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+
+def _unwrap_list(value: Any) -> Optional[List[Any]]:
+    """
+    リストはそのまま、リストを1つだけ値に持つオブジェクトはそのリストを返す。それ以外は None。
+    """
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    if isinstance(value, dict):
+        lists = [v for v in value.values() if isinstance(v, list)]
+        if len(lists) == 1:
+            return lists[0]
+    return None
@@ -0,0 +1,148 @@
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict
+import threading
+import time
+
+
+@dataclass
+class _Timer:
+    """
+    1つの計測項目の累計。
+    """
+    count: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+
+@dataclass
+class _Observation:
+    """
+    時間以外の計測値（メモリ使用量など）の累計。
+    """
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+
+class Metrics:
+    """
+    エージェントの実行状況を集計する、プロセス内共有のカウンターとタイマー。
+
+    `Agent` は対話ターン数・ツール反復回数・API 呼び出し時間・レートリミット待ち時間などを、
+    `Coder` はサンドボックスでのコマンド実行時間（サブプロセスまたは常駐ワーカー）を記録する。
+    ベンチマーク (`benchmarks/run.py`) はリクエストの前後で `snapshot` を取り、差分を結果として保存する。
+    ツール実行時間にはサブエージェントへの委任（その中の API 呼び出し）も含まれる点に注意。
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        """
+        Args:
+            clock (callable): 経過時間の計測に使う時計。テスト用に差し替え可能。
+        """
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._timers: Dict[str, _Timer] = {}
+        self._observations: Dict[str, _Observation] = {}
+
+    def incr(self, name: str, value: float = 1):
+        """
+        カウンターを加算する。
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def add_time(self, name: str, seconds: float):
+        """
+        タイマーに1回分の経過時間を加算する。
+        """
+        with self._lock:
+            timer = self._timers.setdefault(name, _Timer())
+            timer.count += 1
+            timer.total_seconds += seconds
+            timer.max_seconds = max(timer.max_seconds, seconds)
+
+    def observe(self, name: str, value: float):
+        """
+        時間以外の計測値を1回分記録する（回数・合計・最大値を集計する）。
+        """
+        with self._lock:
+            observation = self._observations.setdefault(name, _Observation())
+            observation.count += 1
+            observation.total += value
+            observation.max = max(observation.max, value)
+
+    @contextmanager
+    def timer(self, name: str):
+        """
+        `with metrics.timer("api"):` の形でブロックの経過時間を計測する（例外時も記録する）。
+        """
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.add_time(name, self._clock() - start)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        現在の集計値を JSON 化できる辞書で返す。
+        """
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "timers": {
+                    name: {"count": t.count, "total_seconds": t.total_seconds, "max_seconds": t.max_seconds}
+                    for name, t in self._timers.items()
+                },
+                "observations": {
+                    name: {"count": o.count, "total": o.total, "max": o.max}
+                    for name, o in self._observations.items()
+                },
+            }
+
+    def reset(self):
+        """
+        全ての集計値を破棄する。
+        """
+        with self._lock:
+            self._counters.clear()
+            self._timers.clear()
+            self._observations.clear()
+
+
+def diff_snapshots(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    2つの `snapshot` の差分（after - before）を返す。`max_seconds` / `max` は区間内の値が分からないため after の値を使う。
+    """
+    counters = {
+        name: value - before["counters"].get(name, 0)
+        for name, value in after["counters"].items()
+    }
+    timers = {}
+    for name, timer in after["timers"].items():
+        prev = before["timers"].get(name, {"count": 0, "total_seconds": 0.0})
+        timers[name] = {
+            "count": timer["count"] - prev["count"],
+            "total_seconds": timer["total_seconds"] - prev["total_seconds"],
+            "max_seconds": timer["max_seconds"],
+        }
+    observations = {}
+    for name, observation in after.get("observations", {}).items():
+        prev = before.get("observations", {}).get(name, {"count": 0, "total": 0.0})
+        observations[name] = {
+            "count": observation["count"] - prev["count"],
+            "total": observation["total"] - prev["total"],
+            "max": observation["max"],
+        }
+    return {"counters": counters, "timers": timers, "observations": observations}
+
+
+_shared_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """
+    プロセス全体で共有されるメトリクスを返す。
+    """
+    return _shared_metrics
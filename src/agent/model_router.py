@@ -0,0 +1,200 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+import os
+import threading
+from rich.console import Console
+
+try:
+    from .token_ledger import BUDGET_OK, BUDGET_SOFT
+except ImportError:
+    from agent.token_ledger import BUDGET_OK, BUDGET_SOFT
+
+console = Console()
+
+# 呼び出しの種類
+CALL_TURN = "turn"                    # ユーザー（または委任元）のメッセージへの最初の呼び出し
+CALL_TOOL_FOLLOWUP = "tool_followup"  # ツールの実行結果を返す呼び出し
+CALL_DECOMPOSITION = "decomposition"  # 要件のタスクへの分解（リスト形式の単発の生成）
+CALL_SUMMARY = "summary"              # 会話履歴の要約
+
+# モデルの階層
+TIER_FAST = "fast"        # 安価で速いモデル（定型的な呼び出し向け）
+TIER_DEFAULT = "default"  # エージェントに設定されたモデル
+TIER_STRONG = "strong"    # 検証に失敗した後のやり直し向けの上位モデル
+TIERS = (TIER_FAST, TIER_DEFAULT, TIER_STRONG)
+
+# これより大きいプロンプトは安価なモデルに回さない（見積もりトークン数）
+DEFAULT_LONG_PROMPT_TOKENS = 32000
+# ツールの結果が全てこの文字数以下で、エラーでもなければ定型的な呼び出しとみなす
+DEFAULT_ROUTINE_RESULT_CHARS = 500
+
+
+@dataclass(frozen=True)
+class RouteRequest:
+    """
+    モデルを選ぶための、1回の呼び出しの情報。
+    """
+    agent_name: str
+    call_type: str
+    prompt_tokens: int = 0
+    budget_state: str = BUDGET_OK
+    # 直前の検証の失敗（上位モデルでやり直す理由）。無ければ None
+    escalation: Optional[str] = None
+    # ツールの結果が定型的（小さく、エラーを含まない）か
+    routine: bool = False
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    model: str
+    tier: str
+    reason: str
+
+
+class ModelRouter:
+    """
+    呼び出しごとに、エージェント・呼び出しの種類・プロンプトの大きさ・予算の状態からモデルを選ぶ。
+
+    - 検証に失敗した後のやり直し（解析できないタスクリスト、sandbox のコマンドの失敗など）は上位モデル
+    - 予算のソフトリミット超過後、タスクの分解・要約、定型的なツール結果の処理は安価なモデル
+      （ただしプロンプトが大きい場合はエージェントのモデル）
+    - それ以外は、エージェントごとの階層の指定（無ければエージェントに設定されたモデル）
+
+    安価なモデル・上位モデル・エージェントごとの指定のいずれも無い場合は無効で、常にエージェントのモデルを使う。
+    """
+
+    def __init__(self, fast_model: Optional[str] = None, strong_model: Optional[str] = None,
+                 agent_tiers: Optional[Dict[str, str]] = None, long_prompt_tokens: int = DEFAULT_LONG_PROMPT_TOKENS,
+                 routine_result_chars: int = DEFAULT_ROUTINE_RESULT_CHARS):
+        """
+        Args:
+            fast_model (str, optional): 安価で速いモデル。None の場合はエージェントのモデルを使う。
+            strong_model (str, optional): やり直しに使う上位モデル。None の場合はやり直しでもモデルを変えない。
+            agent_tiers (dict, optional): エージェント名ごとの基本の階層（例: {"Architect": "strong"}）。
+            long_prompt_tokens (int): 安価なモデルに回さないプロンプトの見積もりトークン数。
+            routine_result_chars (int): 定型的なツール結果とみなす、1件あたりの最大文字数。
+        """
+        self.fast_model = fast_model or None
+        self.strong_model = strong_model or None
+        self.agent_tiers = dict(agent_tiers or {})
+        self.long_prompt_tokens = long_prompt_tokens
+        self.routine_result_chars = routine_result_chars
+
+    @classmethod
+    def from_env(cls) -> "ModelRouter":
+        """
+        環境変数から設定を読み込んで生成する。
+
+        - `AGENT_MODEL_FAST` / `AGENT_MODEL_STRONG`: 安価なモデルと上位モデル
+        - `AGENT_MODEL_TIERS`: エージェントごとの基本の階層（例: "Architect=strong,Coder=default"）
+        - `AGENT_ROUTE_LONG_PROMPT_TOKENS` / `AGENT_ROUTE_ROUTINE_RESULT_CHARS`
+        """
+        return cls(
+            fast_model=os.getenv("AGENT_MODEL_FAST"),
+            strong_model=os.getenv("AGENT_MODEL_STRONG"),
+            agent_tiers=parse_agent_tiers(os.getenv("AGENT_MODEL_TIERS", "")),
+            long_prompt_tokens=_int_env("AGENT_ROUTE_LONG_PROMPT_TOKENS", DEFAULT_LONG_PROMPT_TOKENS),
+            routine_result_chars=_int_env("AGENT_ROUTE_ROUTINE_RESULT_CHARS", DEFAULT_ROUTINE_RESULT_CHARS),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.fast_model or self.strong_model or self.agent_tiers)
+
+    def route(self, request: RouteRequest, default_model: str) -> RouteDecision:
+        """
+        呼び出しに使うモデルを選ぶ。
+
+        Args:
+            request (RouteRequest): 呼び出しの情報。
+            default_model (str): エージェントに設定されたモデル。
+        """
+        if not self.enabled:
+            return RouteDecision(default_model, TIER_DEFAULT, "routing disabled")
+        base = self.agent_tiers.get(request.agent_name, TIER_DEFAULT)
+        if request.escalation:
+            return self._decide(TIER_STRONG, default_model, f"escalated: {request.escalation}")
+        if request.budget_state == BUDGET_SOFT:
+            return self._decide(TIER_FAST, default_model, "budget soft limit")
+        cheap = (request.call_type in (CALL_DECOMPOSITION, CALL_SUMMARY)
+                 or (request.call_type == CALL_TOOL_FOLLOWUP and request.routine))
+        if cheap and request.prompt_tokens > self.long_prompt_tokens:
+            return self._decide(base, default_model, f"long prompt ({request.prompt_tokens} tokens)")
+        if cheap:
+            return self._decide(TIER_FAST, default_model, request.call_type)
+        return self._decide(base, default_model, f"{request.agent_name} {request.call_type}")
+
+    def can_escalate(self, model_name: str) -> bool:
+        """
+        上位モデルでのやり直しで、実際にモデルが変わるか。
+        """
+        return self.strong_model is not None and self.strong_model != model_name
+
+    def is_routine(self, results: List[Any]) -> bool:
+        """
+        ツールの結果が定型的（全て短い文字列で、エラーを含まない）かどうか。
+        例: ファイルの書き込みの完了の通知だけを返す呼び出しは、安価なモデルでも十分に処理できる。
+        """
+        if not results:
+            return False
+        for result in results:
+            if not isinstance(result, str) or len(result) > self.routine_result_chars:
+                return False
+            if result.lstrip().lower().startswith("error"):
+                return False
+        return True
+
+    def model_for(self, tier: str, default_model: str) -> str:
+        if tier == TIER_FAST and self.fast_model:
+            return self.fast_model
+        if tier == TIER_STRONG and self.strong_model:
+            return self.strong_model
+        return default_model
+
+    def _decide(self, tier: str, default_model: str, reason: str) -> RouteDecision:
+        model = self.model_for(tier, default_model)
+        # 指定の階層のモデルが無い場合は、エージェントのモデルとして扱う
+        return RouteDecision(model, tier if model != default_model else TIER_DEFAULT, reason)
+
+
+def parse_agent_tiers(value: str) -> Dict[str, str]:
+    """
+    "Architect=strong,Coder=default" の形式の文字列を、エージェント名から階層への辞書に変換する。
+    """
+    tiers: Dict[str, str] = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, _, tier = item.partition("=")
+        tier = tier.strip().lower()
+        if tier not in TIERS:
+            console.print(f"[yellow]Invalid model tier for {name.strip()}: {tier!r}. Expected one of {', '.join(TIERS)}.[/yellow]")
+            continue
+        tiers[name.strip()] = tier
+    return tiers
+
+
+def _int_env(key: str, default: int) -> int:
+    value = os.getenv(key)
+    if value is None or not value.strip():
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        console.print(f"[yellow]Invalid value for {key}: {value!r}. Using default {default}.[/yellow]")
+        return default
+
+
+_shared_router: Optional[ModelRouter] = None
+_shared_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    """
+    プロセス全体で共有されるルーターを返す（初回呼び出し時に環境変数から生成）。
+    """
+    global _shared_router
+    with _shared_lock:
+        if _shared_router is None:
+            _shared_router = ModelRouter.from_env()
+        return _shared_router
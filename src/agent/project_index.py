@@ -0,0 +1,364 @@
+from dataclasses import dataclass, field
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import os
+import re
+import threading
+
+# .gitignore が無くても辿らないディレクトリ（依存ライブラリ・キャッシュ・VCS のメタデータ）
+DEFAULT_IGNORED_NAMES = frozenset({
+    ".git", ".hg", ".svn", ".venv", "venv", "node_modules", "__pycache__",
+    ".mypy_cache", ".pytest_cache", ".ruff_cache", ".tox",
+})
+# .gitignore が無くても一覧に含めないファイル
+DEFAULT_IGNORED_PATTERNS = ("*.pyc", "*.pyo")
+GITIGNORE = ".gitignore"
+# 一覧に含める最大のエントリ数（超えた分は件数だけを表示する）
+DEFAULT_MAX_ENTRIES = 500
+
+
+@dataclass
+class _IgnoreRule:
+    regex: "re.Pattern[str]"
+    negate: bool
+    dir_only: bool
+
+
+@dataclass
+class _IgnoreRules:
+    """
+    1つの .gitignore のルール。パスは .gitignore を置いたディレクトリからの相対パス（`/` 区切り）で照合する。
+    """
+    base: str
+    rules: List[_IgnoreRule] = field(default_factory=list)
+
+    @classmethod
+    def parse(cls, base: str, text: str) -> "_IgnoreRules":
+        rules = []
+        for line in text.splitlines():
+            line = line.rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            elif line.startswith("\\"):
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.strip("/") if dir_only else line
+            if not line:
+                continue
+            # スラッシュを含むパターンは .gitignore の場所に固定、含まないものはどの階層の名前にも一致する
+            anchored = "/" in line.lstrip("/")
+            pattern = _translate(line.lstrip("/"))
+            regex = re.compile(pattern if anchored else f"(?:.*/)?{pattern}")
+            rules.append(_IgnoreRule(regex, negate, dir_only))
+        return cls(base, rules)
+
+    def match(self, relative: str, is_dir: bool) -> Optional[bool]:
+        """
+        無視する場合は True、`!` で無視を取り消す場合は False、どのルールにも一致しない場合は None。
+        """
+        result = None
+        for rule in self.rules:
+            if rule.dir_only and not is_dir:
+                continue
+            if rule.regex.fullmatch(relative):
+                result = not rule.negate
+        return result
+
+
+def _translate(pattern: str) -> str:
+    """
+    gitignore のグロブ（`*`, `?`, `[...]`, `**`）を正規表現に変換する。
+    """
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = end
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+@dataclass
+class _Directory:
+    """
+    走査済みのディレクトリ。ディレクトリの mtime はエントリの追加・削除・名前の変更で変わるため、
+    mtime が同じ間は走査し直さずに使う（ファイルの中身の変更では変わらないが、一覧には影響しない）。
+    """
+    mtime_ns: int
+    dirs: List[str]
+    files: List[str]
+    gitignore_mtime_ns: Optional[int] = None
+    rules: Optional[_IgnoreRules] = None
+
+
+class ProjectIndex:
+    """
+    プロジェクトのファイル一覧のインデックス。
+
+    - 無視するディレクトリ（`.git`, `.venv`, `node_modules` など、および .gitignore に一致するもの）の中には入らない。
+    - ディレクトリごとに走査結果をキャッシュし、2回目以降は mtime が変わったディレクトリだけを走査し直す。
+      そのため、変更の無いプロジェクトの一覧はディレクトリの stat だけで返せる。
+    - 結果の大きさは max_entries で制限する。
+    """
+
+    def __init__(self, root: str, include_hidden: bool = False):
+        """
+        Args:
+            root (str): プロジェクトのルート。ルートと、その下の各ディレクトリの .gitignore を適用する。
+            include_hidden (bool): ドットで始まるファイル・ディレクトリを含めるか。
+        """
+        self.root = Path(root).resolve()
+        self.include_hidden = include_hidden
+        self.scanned_dirs = 0
+        self.cached_dirs = 0
+        self._dirs: Dict[str, _Directory] = {}
+        self._lock = threading.Lock()
+        self._default_rules = _IgnoreRules.parse("", "\n".join(DEFAULT_IGNORED_PATTERNS))
+
+    def walk(self, directory: str = ".", max_depth: int = 0) -> Iterator[Tuple[str, List[str], List[str]]]:
+        """
+        directory 以下を上から順に辿り、(ルートからの相対パス, サブディレクトリ名, ファイル名) を返す。
+        無視するものは含めない。max_depth は辿る深さ（1 で directory 直下のみ、0 以下で制限しない）。
+        """
+        start = self._relative(directory)
+        rules = self._ancestor_rules(start)
+        stack: List[Tuple[str, int, List[_IgnoreRules]]] = [(start, 1, rules)]
+        while stack:
+            relative, depth, rules = stack.pop()
+            entry = self._directory(relative)
+            if entry is None:
+                continue
+            if entry.rules is not None:
+                rules = rules + [entry.rules]
+            dirs = [name for name in entry.dirs if not self._ignored(_join(relative, name), True, rules)]
+            files = [name for name in entry.files if not self._ignored(_join(relative, name), False, rules)]
+            yield relative, dirs, files
+            if max_depth <= 0 or depth < max_depth:
+                # 名前順に辿るよう、逆順に積む
+                for name in reversed(dirs):
+                    stack.append((_join(relative, name), depth + 1, rules))
+
+    def files(self, directory: str = ".") -> Iterator[str]:
+        """
+        directory 以下の（無視しない）全てのファイルを、ルートからの相対パスで返す。
+        """
+        for relative, _, files in self.walk(directory):
+            for name in files:
+                yield _join(relative, name)
+
+    def tree(self, directory: str = ".", max_depth: int = 2, max_entries: int = DEFAULT_MAX_ENTRIES) -> str:
+        """
+        directory 以下のディレクトリツリーをテキストで返す。
+        """
+        start = self._relative(directory)
+        lines = [f"Directory structure of '{directory}':"]
+        omitted = 0
+        for relative, dirs, files in self.walk(directory, max_depth):
+            depth = 0 if relative == start else _depth(relative) - _depth(start)
+            # これ以上辿らない深さでは、サブディレクトリは名前だけを示す
+            entries = ([f"{name}/" for name in dirs] if 0 < max_depth <= depth + 1 else []) + files
+            if relative != start:
+                if len(lines) > max_entries:
+                    omitted += 1 + len(entries)
+                    continue
+                lines.append(f"{'  ' * (depth - 1)}- {relative.rsplit('/', 1)[-1]}/")
+            indent = "  " * depth
+            for name in entries:
+                if len(lines) > max_entries:
+                    omitted += 1
+                    continue
+                lines.append(f"{indent}- {name}")
+        if omitted:
+            lines.append(f"... ({omitted} more entries not shown; list a subdirectory or use a pattern)")
+        return "\n".join(lines) + "\n"
+
+    def find(self, directory: str = ".", pattern: str = "", min_size: int = 0, max_size: int = 0,
+             max_entries: int = DEFAULT_MAX_ENTRIES) -> str:
+        """
+        directory 以下のファイルのうち、パターンとサイズの条件に合うものをサイズ付きで一覧にする。
+        パターンは directory からの相対パス（`/` を含む場合、`**/` は任意の階層）またはファイル名に対するグロブ。
+        """
+        start = self._relative(directory)
+        lines = [f"Files under '{directory}' matching '{pattern or '*'}':"]
+        omitted = 0
+        for path in self.files(directory):
+            relative = path if start == "." else path[len(start) + 1:]
+            if pattern and not _glob_match(relative, pattern):
+                continue
+            if min_size or max_size:
+                # サイズはキャッシュせず、その都度 stat する（中身の変更はディレクトリの mtime に現れないため）
+                try:
+                    size = (self.root / path).stat().st_size
+                except OSError:
+                    continue
+                if size < min_size or (max_size and size > max_size):
+                    continue
+                label = f"{relative} ({size} bytes)"
+            else:
+                label = relative
+            if len(lines) > max_entries:
+                omitted += 1
+                continue
+            lines.append(f"- {label}")
+        if len(lines) == 1:
+            lines.append("(no matching files)")
+        if omitted:
+            lines.append(f"... ({omitted} more files not shown; narrow the pattern)")
+        return "\n".join(lines) + "\n"
+
+    def invalidate(self, directory: str = "."):
+        """
+        directory 以下のキャッシュを捨てる（mtime の分解能より短い間隔で変更した場合など）。
+        """
+        start = self._relative(directory)
+        with self._lock:
+            for key in [key for key in self._dirs if start == "." or key == start or key.startswith(start + "/")]:
+                del self._dirs[key]
+
+    def _relative(self, directory: str) -> str:
+        path = (self.root / directory).resolve()
+        if path != self.root and self.root not in path.parents:
+            raise ValueError(f"Directory '{directory}' is outside the project root.")
+        relative = path.relative_to(self.root).as_posix()
+        return relative or "."
+
+    def _ancestor_rules(self, relative: str) -> List[_IgnoreRules]:
+        """
+        directory より上（ルートから directory の親まで）の .gitignore のルールを集める。
+        """
+        rules = [self._default_rules]
+        if relative == ".":
+            return rules
+        parts = relative.split("/")
+        for i in range(len(parts)):
+            entry = self._directory("/".join(parts[:i]) or ".")
+            if entry is not None and entry.rules is not None:
+                rules.append(entry.rules)
+        return rules
+
+    def _directory(self, relative: str) -> Optional[_Directory]:
+        path = self.root / relative
+        try:
+            mtime_ns = path.stat().st_mtime_ns
+        except OSError:
+            return None
+        gitignore_mtime_ns = _mtime_ns(path / GITIGNORE)
+        with self._lock:
+            entry = self._dirs.get(relative)
+            if entry is not None and entry.mtime_ns == mtime_ns:
+                self.cached_dirs += 1
+                if entry.gitignore_mtime_ns != gitignore_mtime_ns:
+                    # .gitignore をその場で書き換えた場合（ディレクトリの mtime は変わらない）
+                    entry.gitignore_mtime_ns = gitignore_mtime_ns
+                    entry.rules = self._read_rules(relative, path)
+                return entry
+        entry = self._scan(relative, path, mtime_ns, gitignore_mtime_ns)
+        with self._lock:
+            self.scanned_dirs += 1
+            self._dirs[relative] = entry
+        return entry
+
+    def _scan(self, relative: str, path: Path, mtime_ns: int, gitignore_mtime_ns: Optional[int]) -> _Directory:
+        dirs, files = [], []
+        try:
+            with os.scandir(path) as entries:
+                for item in entries:
+                    if not self.include_hidden and item.name.startswith("."):
+                        continue
+                    if item.name in DEFAULT_IGNORED_NAMES:
+                        continue
+                    try:
+                        # ディレクトリへのシンボリックリンクは辿らない（循環を避ける）
+                        is_dir = item.is_dir(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    (dirs if is_dir else files).append(item.name)
+        except OSError:
+            pass
+        rules = self._read_rules(relative, path) if gitignore_mtime_ns is not None else None
+        return _Directory(mtime_ns, sorted(dirs), sorted(files), gitignore_mtime_ns, rules)
+
+    @staticmethod
+    def _read_rules(relative: str, path: Path) -> Optional[_IgnoreRules]:
+        try:
+            text = (path / GITIGNORE).read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            return None
+        return _IgnoreRules.parse("" if relative == "." else relative, text)
+
+    @staticmethod
+    def _ignored(relative: str, is_dir: bool, rules: List[_IgnoreRules]) -> bool:
+        ignored = False
+        for rule_set in rules:
+            if rule_set.base:
+                if not relative.startswith(rule_set.base + "/"):
+                    continue
+                matched = rule_set.match(relative[len(rule_set.base) + 1:], is_dir)
+            else:
+                matched = rule_set.match(relative, is_dir)
+            if matched is not None:
+                ignored = matched
+        return ignored
+
+
+def _join(relative: str, name: str) -> str:
+    return name if relative == "." else f"{relative}/{name}"
+
+
+def _depth(relative: str) -> int:
+    return 0 if relative == "." else relative.count("/") + 1
+
+
+def _mtime_ns(path: Path) -> Optional[int]:
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def _glob_match(relative: str, pattern: str) -> bool:
+    if "/" not in pattern:
+        return fnmatchcase(relative.rsplit("/", 1)[-1], pattern)
+    return re.fullmatch(_translate(pattern), relative) is not None
+
+
+_shared_indexes: Dict[Path, ProjectIndex] = {}
+_shared_lock = threading.Lock()
+
+
+def get_project_index(root: str = ".") -> ProjectIndex:
+    """
+    ルートごとにプロセス全体で共有されるインデックスを返す（複数の Architect でキャッシュを共有する）。
+    """
+    path = Path(root).resolve()
+    with _shared_lock:
+        if path not in _shared_indexes:
+            _shared_indexes[path] = ProjectIndex(str(path))
+        return _shared_indexes[path]
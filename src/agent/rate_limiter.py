@@ -0,0 +1,234 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+import asyncio
+import os
+import threading
+import time
+from rich.console import Console
+
+console = Console()
+
+# 無料枠の gemini-1.5-flash を想定したデフォルト値
+DEFAULT_RPM = 15.0
+DEFAULT_TPM = 1_000_000.0
+
+
+@dataclass
+class _Bucket:
+    """
+    1モデル分のトークンバケットの状態。
+    requests / tokens が負になっている場合は「前借り」した分の返済待ちを意味する。
+    """
+    rpm: Optional[float]
+    tpm: Optional[float]
+    requests: float = 0.0
+    tokens: float = 0.0
+    updated_at: float = 0.0
+    blocked_until: float = 0.0
+    waits: int = 0
+    waited_seconds: float = 0.0
+    rate_limited: int = 0
+
+
+class RateLimiter:
+    """
+    モデル名ごとのトークンバケットで、リクエスト数 (RPM) とトークン数 (TPM) を制御するレートリミッター。
+
+    プロセス内の全エージェントで共有されることを想定しており、
+    予算が実際に枯渇している場合にのみ呼び出し元をブロックする。
+    429 エラーを受けた場合は `penalize` で当該モデルを一定時間ブロックし、
+    同じモデルを使う他のエージェントも一緒に待機させる。
+    """
+
+    def __init__(
+        self,
+        rpm: Optional[float] = DEFAULT_RPM,
+        tpm: Optional[float] = DEFAULT_TPM,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        """
+        Args:
+            rpm (float, optional): 1分あたりの最大リクエスト数。None または 0 以下で無制限。
+            tpm (float, optional): 1分あたりの最大トークン数。None または 0 以下で無制限。
+            clock (callable): 現在時刻（秒）を返す関数。テスト用に差し替え可能。
+            sleep (callable): 待機に使う関数。テスト用に差し替え可能。
+        """
+        self.default_rpm = rpm if rpm and rpm > 0 else None
+        self.default_tpm = tpm if tpm and tpm > 0 else None
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, _Bucket] = {}
+        self._overrides: Dict[str, Tuple[Optional[float], Optional[float]]] = {}
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        """
+        環境変数 `GEMINI_RPM_LIMIT` / `GEMINI_TPM_LIMIT` から設定を読み込んで生成する。
+        """
+        return cls(
+            rpm=_float_env("GEMINI_RPM_LIMIT", DEFAULT_RPM),
+            tpm=_float_env("GEMINI_TPM_LIMIT", DEFAULT_TPM),
+        )
+
+    def configure(self, model_name: str, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        """
+        特定のモデルに対して個別の RPM/TPM 上限を設定する。
+
+        Args:
+            model_name (str): 対象のモデル名。
+            rpm (float, optional): 1分あたりの最大リクエスト数。
+            tpm (float, optional): 1分あたりの最大トークン数。
+        """
+        with self._lock:
+            self._overrides[model_name] = (
+                rpm if rpm and rpm > 0 else None,
+                tpm if tpm and tpm > 0 else None,
+            )
+            self._buckets.pop(model_name, None)
+
+    def reserve(self, model_name: str, tokens: int = 0) -> float:
+        """
+        リクエスト1回分（と見積もりトークン数）の予算を確保し、必要な待機時間を返す。
+        実際には待機しないため、非同期処理など呼び出し側で待機方法を選べる。
+
+        Args:
+            model_name (str): 対象のモデル名。
+            tokens (int): 事前に見積もったトークン数。
+
+        Returns:
+            float: 予算が回復するまでに待つべき秒数（0 なら即時実行可能）。
+        """
+        with self._lock:
+            now = self._clock()
+            bucket = self._refill(model_name, now)
+
+            wait = max(0.0, bucket.blocked_until - now)
+            if bucket.rpm is not None:
+                bucket.requests -= 1
+                if bucket.requests < 0:
+                    wait = max(wait, -bucket.requests / (bucket.rpm / 60.0))
+            if bucket.tpm is not None:
+                bucket.tokens -= tokens
+                # 過去のレスポンスで使いすぎた分（負の残高）もここで返済を待つ
+                if bucket.tokens < 0:
+                    wait = max(wait, -bucket.tokens / (bucket.tpm / 60.0))
+
+            if wait > 0:
+                bucket.waits += 1
+                bucket.waited_seconds += wait
+            return wait
+
+    def acquire(self, model_name: str, tokens: int = 0) -> float:
+        """
+        予算を確保し、枯渇している場合は回復するまでブロックする。
+
+        Args:
+            model_name (str): 対象のモデル名。
+            tokens (int): 事前に見積もったトークン数。
+
+        Returns:
+            float: 実際に待機した秒数。
+        """
+        wait = self.reserve(model_name, tokens)
+        if wait > 0:
+            console.print(f"[dim]Rate limit budget for {model_name} exhausted. Waiting {wait:.1f}s...[/dim]")
+            self._sleep(wait)
+        return wait
+
+    async def acquire_async(self, model_name: str, tokens: int = 0) -> float:
+        """
+        `acquire` の非同期版。待機中もイベントループをブロックしない。
+        """
+        wait = self.reserve(model_name, tokens)
+        if wait > 0:
+            console.print(f"[dim]Rate limit budget for {model_name} exhausted. Waiting {wait:.1f}s...[/dim]")
+            await asyncio.sleep(wait)
+        return wait
+
+    def record_usage(self, model_name: str, tokens: int):
+        """
+        レスポンスから判明した実際のトークン使用量を TPM バケットから差し引く。
+        """
+        if tokens <= 0:
+            return
+        with self._lock:
+            bucket = self._refill(model_name, self._clock())
+            if bucket.tpm is not None:
+                bucket.tokens -= tokens
+
+    def penalize(self, model_name: str, retry_after: float):
+        """
+        429 (Resource Exhausted) を受けたモデルを指定秒数ブロックする。
+        バケットも空にし、待機明けに一斉にリクエストが集中しないようにする。
+
+        Args:
+            model_name (str): 対象のモデル名。
+            retry_after (float): サーバーが示した、または推定した待機秒数。
+        """
+        with self._lock:
+            now = self._clock()
+            bucket = self._refill(model_name, now)
+            bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+            bucket.requests = min(bucket.requests, 0.0)
+            bucket.rate_limited += 1
+
+    def stats(self, model_name: str) -> Dict[str, float]:
+        """
+        モデルごとの待機回数・待機時間・429 受信回数を返す。
+        """
+        with self._lock:
+            bucket = self._buckets.get(model_name)
+            if bucket is None:
+                return {"waits": 0, "waited_seconds": 0.0, "rate_limited": 0}
+            return {
+                "waits": bucket.waits,
+                "waited_seconds": bucket.waited_seconds,
+                "rate_limited": bucket.rate_limited,
+            }
+
+    def _refill(self, model_name: str, now: float) -> _Bucket:
+        """
+        経過時間に応じてバケットを補充する。呼び出し側でロックを取得していること。
+        """
+        bucket = self._buckets.get(model_name)
+        if bucket is None:
+            rpm, tpm = self._overrides.get(model_name, (self.default_rpm, self.default_tpm))
+            bucket = _Bucket(rpm=rpm, tpm=tpm, requests=rpm or 0.0, tokens=tpm or 0.0, updated_at=now)
+            self._buckets[model_name] = bucket
+            return bucket
+
+        elapsed = max(0.0, now - bucket.updated_at)
+        if bucket.rpm is not None:
+            bucket.requests = min(bucket.rpm, bucket.requests + elapsed * bucket.rpm / 60.0)
+        if bucket.tpm is not None:
+            bucket.tokens = min(bucket.tpm, bucket.tokens + elapsed * bucket.tpm / 60.0)
+        bucket.updated_at = now
+        return bucket
+
+
+def _float_env(key: str, default: float) -> float:
+    value = os.getenv(key)
+    if value is None or not value.strip():
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        console.print(f"[yellow]Invalid value for {key}: {value!r}. Using default {default}.[/yellow]")
+        return default
+
+
+_shared_limiter: Optional[RateLimiter] = None
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    プロセス全体で共有されるレートリミッターを返す（初回呼び出し時に環境変数から生成）。
+    """
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter.from_env()
+        return _shared_limiter
@@ -0,0 +1,138 @@
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+import hashlib
+import json
+import threading
+import time
+
+try:
+    from .llm_backend import LLMBackend
+    from .response_snapshot import ResponseSnapshot, to_plain
+    from .streaming import StreamAssembler
+except ImportError:
+    from agent.llm_backend import LLMBackend
+    from agent.response_snapshot import ResponseSnapshot, to_plain
+    from agent.streaming import StreamAssembler
+
+
+def stream_key(kind: str, model_name: str, system_instruction: str) -> str:
+    """
+    カセット内で呼び出しを振り分けるためのキー（呼び出し種別・モデル名・システムプロンプトのハッシュ）。
+    """
+    digest = hashlib.sha256(system_instruction.encode("utf-8")).hexdigest()[:16]
+    return f"{kind}:{model_name}:{digest}"
+
+
+def request_hash(content: Any) -> str:
+    """
+    送信内容のハッシュ。再生時に同じストリーム内の呼び出しを照合するために使う。
+    """
+    payload = json.dumps(to_plain(content), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _RecordingChatSession:
+    """
+    内側のチャットセッションへの送受信をカセットに記録するラッパー。
+    """
+
+    def __init__(self, backend: "RecordingBackend", inner: Any, stream: str):
+        self._backend = backend
+        self._inner = inner
+        self._stream = stream
+        self.model = getattr(inner, "model", None)
+
+    @property
+    def history(self) -> List[Any]:
+        return self._inner.history
+
+    @history.setter
+    def history(self, history: List[Any]):
+        self._inner.history = history
+
+    def send_message(self, content: Any, stream: bool = False) -> Any:
+        started_at = time.perf_counter()
+        if stream:
+            return self._record_stream(content, self._inner.send_message(content, stream=True), started_at)
+        response = self._inner.send_message(content)
+        self._backend.record(self._stream, content, response, time.perf_counter() - started_at)
+        return response
+
+    async def send_message_async(self, content: Any, stream: bool = False) -> Any:
+        started_at = time.perf_counter()
+        if stream:
+            response = await self._inner.send_message_async(content, stream=True)
+            return self._record_stream_async(content, response, started_at)
+        response = await self._inner.send_message_async(content)
+        self._backend.record(self._stream, content, response, time.perf_counter() - started_at)
+        return response
+
+    def _record_stream(self, content: Any, response: Any, started_at: float) -> Iterator[Any]:
+        """
+        断片をそのまま返し、最後まで読み終えたら組み上がった応答を記録する。
+        """
+        assembler = StreamAssembler()
+        for chunk in response:
+            assembler.add(chunk)
+            yield chunk
+        self._backend.record(self._stream, content, assembler.response(), time.perf_counter() - started_at)
+
+    async def _record_stream_async(self, content: Any, response: Any, started_at: float) -> AsyncIterator[Any]:
+        assembler = StreamAssembler()
+        async for chunk in response:
+            assembler.add(chunk)
+            yield chunk
+        self._backend.record(self._stream, content, assembler.response(), time.perf_counter() - started_at)
+
+
+class RecordingBackend(LLMBackend):
+    """
+    内側のバックエンド（通常は `GeminiBackend`）への全リクエスト・レスポンスを
+    JSONL 形式のカセットファイルに記録するバックエンド。
+    記録したカセットは `ReplayBackend` でネットワーク無しに再生できる。
+    """
+
+    def __init__(self, inner: LLMBackend, cassette_path: str):
+        """
+        Args:
+            inner (LLMBackend): 実際に通信するバックエンド。
+            cassette_path (str): 記録先のファイルパス（追記される）。
+        """
+        self.inner = inner
+        self.cassette_path = Path(cassette_path)
+        self.cassette_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def start_chat(self, model_name: str, system_instruction: str, tools: Optional[List[Any]] = None) -> Any:
+        inner = self.inner.start_chat(model_name, system_instruction, tools)
+        return _RecordingChatSession(self, inner, stream_key("chat", model_name, system_instruction))
+
+    def generate_content(self, model_name: str, system_instruction: str, prompt: str,
+                         response_schema: Optional[Dict[str, Any]] = None) -> Any:
+        started_at = time.perf_counter()
+        response = self.inner.generate_content(model_name, system_instruction, prompt, response_schema)
+        self.record(stream_key("generate", model_name, system_instruction), prompt, response, time.perf_counter() - started_at)
+        return response
+
+    async def generate_content_async(self, model_name: str, system_instruction: str, prompt: str,
+                                     response_schema: Optional[Dict[str, Any]] = None) -> Any:
+        started_at = time.perf_counter()
+        response = await self.inner.generate_content_async(model_name, system_instruction, prompt, response_schema)
+        self.record(stream_key("generate", model_name, system_instruction), prompt, response, time.perf_counter() - started_at)
+        return response
+
+    def record(self, stream: str, content: Any, response: Any, latency: float):
+        """
+        1回分の呼び出しをカセットに追記する。
+        """
+        entry: Dict[str, Any] = {
+            "stream": stream,
+            "request_hash": request_hash(content),
+            "request": to_plain(content),
+            "response": ResponseSnapshot.from_response(response).to_dict(),
+            "latency": latency,
+        }
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.cassette_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
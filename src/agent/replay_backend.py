@@ -0,0 +1,164 @@
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+import asyncio
+import json
+import threading
+import time
+
+try:
+    from .llm_backend import LLMBackend
+    from .recording_backend import stream_key, request_hash
+    from .response_snapshot import ResponseSnapshot, PartSnapshot, UsageSnapshot, to_plain
+except ImportError:
+    from agent.llm_backend import LLMBackend
+    from agent.recording_backend import stream_key, request_hash
+    from agent.response_snapshot import ResponseSnapshot, PartSnapshot, UsageSnapshot, to_plain
+
+# ストリーミングで再生する場合の、テキストの断片1つあたりの文字数
+STREAM_CHUNK_CHARS = 32
+
+
+class _ReplayChatSession:
+    """
+    カセットから応答を返すチャットセッション。履歴は通常のセッションと同じ形で保持する。
+    """
+
+    def __init__(self, backend: "ReplayBackend", stream: str):
+        self._backend = backend
+        self._stream = stream
+        self.model = None
+        self.history: List[Any] = []
+
+    def send_message(self, content: Any, stream: bool = False) -> Any:
+        response, delay = self._backend.next_response(self._stream, content)
+        if stream:
+            return self._stream_chunks(content, response, delay)
+        if delay > 0:
+            time.sleep(delay)
+        self._append(content, response)
+        return response
+
+    async def send_message_async(self, content: Any, stream: bool = False) -> Any:
+        response, delay = self._backend.next_response(self._stream, content)
+        if stream:
+            return self._stream_chunks_async(content, response, delay)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._append(content, response)
+        return response
+
+    def _stream_chunks(self, content: Any, response: ResponseSnapshot, delay: float) -> Iterator[ResponseSnapshot]:
+        """
+        記録された応答を断片に分けて返す。擬似レイテンシは最初の断片の前に待つ。
+        """
+        if delay > 0:
+            time.sleep(delay)
+        yield from split_into_chunks(response)
+        self._append(content, response)
+
+    async def _stream_chunks_async(self, content: Any, response: ResponseSnapshot,
+                                   delay: float) -> AsyncIterator[ResponseSnapshot]:
+        if delay > 0:
+            await asyncio.sleep(delay)
+        for chunk in split_into_chunks(response):
+            yield chunk
+        self._append(content, response)
+
+    def _append(self, content: Any, response: ResponseSnapshot):
+        user_parts = [{"text": content}] if isinstance(content, str) else to_plain(content)
+        self.history = [*self.history, {"role": "user", "parts": user_parts}, response.to_content()]
+
+
+class ReplayBackend(LLMBackend):
+    """
+    `RecordingBackend` が記録したカセットから応答を返すバックエンド。
+
+    ネットワークを使わずに Manager→Architect→Coder の流れを再現でき、
+    擬似レイテンシを指定することで本番の遅延を再現したり、エージェント自身のオーバーヘッドだけを測定したりできる。
+    応答は (呼び出し種別, モデル名, システムプロンプト) ごとに記録順で返す。
+    同じストリーム内に送信内容が一致する記録があればそれを優先する。
+    """
+
+    def __init__(self, cassette_path: str, latency: Optional[float] = None, latency_scale: float = 1.0):
+        """
+        Args:
+            cassette_path (str): カセットファイルのパス。
+            latency (float, optional): 1回の呼び出しごとの擬似レイテンシ（秒）。省略時は記録時のレイテンシを使う。
+            latency_scale (float): 記録時のレイテンシに掛ける係数（0 で遅延無し）。
+        """
+        self.cassette_path = Path(cassette_path)
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._streams: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        with open(self.cassette_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._streams[entry["stream"]].append(entry)
+
+    def start_chat(self, model_name: str, system_instruction: str, tools: Optional[List[Any]] = None) -> Any:
+        return _ReplayChatSession(self, stream_key("chat", model_name, system_instruction))
+
+    def generate_content(self, model_name: str, system_instruction: str, prompt: str,
+                         response_schema: Optional[Dict[str, Any]] = None) -> Any:
+        response, delay = self.next_response(stream_key("generate", model_name, system_instruction), prompt)
+        if delay > 0:
+            time.sleep(delay)
+        return response
+
+    async def generate_content_async(self, model_name: str, system_instruction: str, prompt: str,
+                                     response_schema: Optional[Dict[str, Any]] = None) -> Any:
+        response, delay = self.next_response(stream_key("generate", model_name, system_instruction), prompt)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return response
+
+    def next_response(self, stream: str, content: Any):
+        """
+        ストリームから次の応答を取り出す。
+
+        Returns:
+            tuple: (ResponseSnapshot, 擬似レイテンシの秒数)
+
+        Raises:
+            LookupError: ストリームに残りの記録が無い場合。
+        """
+        digest = request_hash(content)
+        with self._lock:
+            entries = self._streams.get(stream)
+            if not entries:
+                raise LookupError(f"Cassette {self.cassette_path} has no more recorded responses for {stream}.")
+            index = next((i for i, e in enumerate(entries) if e["request_hash"] == digest), 0)
+            entry = entries.pop(index)
+            self.calls += 1
+
+        delay = self.latency if self.latency is not None else entry.get("latency", 0.0) * self.latency_scale
+        return ResponseSnapshot.from_dict(entry["response"]), delay
+
+    def remaining(self) -> int:
+        """
+        まだ再生されていない記録の件数。
+        """
+        with self._lock:
+            return sum(len(entries) for entries in self._streams.values())
+
+
+def split_into_chunks(response: ResponseSnapshot, chunk_chars: int = STREAM_CHUNK_CHARS) -> List[ResponseSnapshot]:
+    """
+    応答を、ストリーミング API が返すような断片のリストに分ける。
+    テキストは `chunk_chars` 文字ごと、関数呼び出しは1つずつ1断片とし、使用量は最後の断片に載せる。
+    """
+    chunks: List[ResponseSnapshot] = []
+    for part in response.parts:
+        if part.function_call:
+            chunks.append(ResponseSnapshot([part]))
+            continue
+        for start in range(0, max(len(part.text), 1), chunk_chars):
+            chunks.append(ResponseSnapshot([PartSnapshot(text=part.text[start:start + chunk_chars])]))
+    if not chunks:
+        chunks.append(ResponseSnapshot([]))
+    chunks[-1].usage_metadata = response.usage_metadata
+    return chunks
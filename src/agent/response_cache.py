@@ -0,0 +1,164 @@
+from pathlib import Path
+from typing import Any, Dict, Optional
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 5000
+
+
+class ResponseCache:
+    """
+    LLM 呼び出しの結果を SQLite に保存する永続キャッシュ（オプトイン）。
+
+    キーはモデル名・システムプロンプト・会話履歴のプレフィックス・ツールスキーマ・送信内容から作る。
+    同じ要件の再実行（回帰テストやユーザーのリトライ）では API を呼ばずにミリ秒で応答を返す。
+    TTL を過ぎたエントリは破棄し、件数が上限を超えた場合は最後に参照された時刻が古いものから削除する (LRU)。
+    """
+
+    def __init__(self, path: str, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 clock=time.time):
+        """
+        Args:
+            path (str): SQLite ファイルのパス（":memory:" も可）。
+            ttl_seconds (float): エントリの有効期間（秒）。0 以下で無期限。
+            max_entries (int): 保持するエントリ数の上限。
+            clock (callable): 現在時刻（秒）を返す関数。テスト用に差し替え可能。
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls) -> Optional["ResponseCache"]:
+        """
+        環境変数 `AGENT_RESPONSE_CACHE` にパスが設定されている場合のみキャッシュを生成する。
+        TTL は `AGENT_RESPONSE_CACHE_TTL`（秒）、上限は `AGENT_RESPONSE_CACHE_MAX_ENTRIES` で設定する。
+        """
+        path = os.getenv("AGENT_RESPONSE_CACHE")
+        if not path:
+            return None
+        return cls(
+            path,
+            ttl_seconds=float(os.getenv("AGENT_RESPONSE_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+            max_entries=int(os.getenv("AGENT_RESPONSE_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+        )
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """
+        任意の JSON 化可能な値からキャッシュキー (SHA-256) を作る。
+        """
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        キーに対応する値を返す。存在しない・期限切れの場合は None。
+        """
+        now = self._clock()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = row
+            if self.ttl_seconds > 0 and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(value)
+
+    def put(self, key: str, value: Dict[str, Any]):
+        """
+        値を保存し、上限を超えた分を LRU で削除する。
+        """
+        now = self._clock()
+        payload = json.dumps(value, ensure_ascii=False, default=str)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, payload, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def clear(self):
+        """
+        全てのエントリを削除する。
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        ヒット数・ミス数・ヒット率・エントリ数を返す。
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+        }
+
+    def _evict(self, now: float):
+        """
+        期限切れのエントリと、上限を超えた古いエントリを削除する。呼び出し側でロックを取得していること。
+        """
+        if self.ttl_seconds > 0:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        overflow = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            )
+
+
+_shared_cache: Optional[ResponseCache] = None
+_shared_loaded = False
+_shared_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    プロセス全体で共有されるレスポンスキャッシュを返す（無効な場合は None）。
+    """
+    global _shared_cache, _shared_loaded
+    with _shared_lock:
+        if not _shared_loaded:
+            _shared_cache = ResponseCache.from_env()
+            _shared_loaded = True
+        return _shared_cache
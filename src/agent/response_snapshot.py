@@ -0,0 +1,132 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+from collections.abc import Mapping
+
+
+@dataclass
+class FunctionCallSnapshot:
+    """
+    関数呼び出し要求のスナップショット（`protos.FunctionCall` と同じ属性を持つ）。
+    """
+    name: str
+    args: Dict[str, Any] = field(default_factory=dict)
+
+    def __bool__(self) -> bool:
+        return bool(self.name)
+
+
+@dataclass
+class PartSnapshot:
+    """
+    レスポンスの1パート（テキストまたは関数呼び出し）のスナップショット。
+    """
+    text: str = ""
+    function_call: Optional[FunctionCallSnapshot] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.function_call:
+            return {"function_call": {"name": self.function_call.name, "args": self.function_call.args}}
+        return {"text": self.text}
+
+
+@dataclass
+class UsageSnapshot:
+    """
+    トークン使用量のスナップショット（`usage_metadata` と同じ属性を持つ）。
+    """
+    prompt_token_count: int = 0
+    candidates_token_count: int = 0
+    total_token_count: int = 0
+
+
+class ResponseSnapshot:
+    """
+    Gemini のレスポンスを、保存・再生できるプレーンなデータに変換したもの。
+
+    `Agent` のループが参照する属性 (`text` / `parts[].function_call` / `usage_metadata`) だけを持ち、
+    キャッシュや記録からの再生時に本物のレスポンスの代わりに使う。
+    """
+
+    def __init__(self, parts: List[PartSnapshot], usage_metadata: Optional[UsageSnapshot] = None):
+        self.parts = parts
+        self.usage_metadata = usage_metadata or UsageSnapshot()
+
+    @property
+    def text(self) -> str:
+        """
+        テキストパートを連結した文字列。
+        """
+        return "".join(part.text for part in self.parts if not part.function_call)
+
+    @classmethod
+    def from_response(cls, response: Any) -> "ResponseSnapshot":
+        """
+        SDK のレスポンスオブジェクトからスナップショットを作る。
+        """
+        if isinstance(response, ResponseSnapshot):
+            return response
+        parts: List[PartSnapshot] = []
+        for part in response.parts:
+            fc = getattr(part, "function_call", None)
+            if fc:
+                parts.append(PartSnapshot(function_call=FunctionCallSnapshot(fc.name, to_plain(fc.args))))
+            else:
+                parts.append(PartSnapshot(text=getattr(part, "text", "") or ""))
+
+        usage = getattr(response, "usage_metadata", None)
+        return cls(parts, UsageSnapshot(
+            prompt_token_count=_int(getattr(usage, "prompt_token_count", 0)),
+            candidates_token_count=_int(getattr(usage, "candidates_token_count", 0)),
+            total_token_count=_int(getattr(usage, "total_token_count", 0)),
+        ))
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ResponseSnapshot":
+        """
+        `to_dict` の出力からスナップショットを復元する。
+        """
+        parts = []
+        for part in data.get("parts", []):
+            if "function_call" in part:
+                fc = part["function_call"]
+                parts.append(PartSnapshot(function_call=FunctionCallSnapshot(fc["name"], fc.get("args") or {})))
+            else:
+                parts.append(PartSnapshot(text=part.get("text", "")))
+        return cls(parts, UsageSnapshot(**data.get("usage", {})))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        JSON として保存できる辞書に変換する。
+        """
+        return {
+            "parts": [part.to_dict() for part in self.parts],
+            "usage": {
+                "prompt_token_count": self.usage_metadata.prompt_token_count,
+                "candidates_token_count": self.usage_metadata.candidates_token_count,
+                "total_token_count": self.usage_metadata.total_token_count,
+            },
+        }
+
+    def to_content(self) -> Dict[str, Any]:
+        """
+        チャット履歴に追加できる model ロールの Content（辞書形式）に変換する。
+        """
+        return {"role": "model", "parts": [part.to_dict() for part in self.parts]}
+
+
+def to_plain(value: Any) -> Any:
+    """
+    SDK の MapComposite / RepeatedComposite などを、JSON 化できる dict / list に再帰的に変換する。
+    """
+    if isinstance(value, Mapping):
+        return {str(k): to_plain(v) for k, v in value.items()}
+    if isinstance(value, (str, bytes, int, float, bool)) or value is None:
+        return value
+    try:
+        return [to_plain(v) for v in value]
+    except TypeError:
+        return str(value)
+
+
+def _int(value: Any) -> int:
+    return value if isinstance(value, int) else 0
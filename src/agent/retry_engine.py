@@ -0,0 +1,425 @@
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional, TypeVar
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+from rich.console import Console
+
+console = Console()
+
+T = TypeVar("T")
+
+# エラーの分類
+ERROR_RATE_LIMIT = "rate_limit"    # 429。待てば回復する（サーバーが待機時間を示すことがある）
+ERROR_NO_QUOTA = "no_quota"        # 429 かつ "limit: 0"。このモデルはそもそも使えない（待っても回復しない）
+ERROR_SERVER = "server"            # 500 / 502 / 503 / 504。一時的な障害
+ERROR_NETWORK = "network"          # 接続の失敗・タイムアウト
+ERROR_FATAL = "fatal"              # それ以外（400 の不正なリクエスト、認証エラーなど）。リトライしない
+
+RETRYABLE_ERRORS = frozenset({ERROR_RATE_LIMIT, ERROR_SERVER, ERROR_NETWORK})
+
+# サーキットブレーカーの状態
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_COOLDOWN = 30.0
+DEFAULT_MAX_COOLDOWN = 600.0
+
+# 例外のクラス名から分類する（SDK をインポートせずに google.api_core.exceptions などを判別する）
+_RATE_LIMIT_TYPES = {"ResourceExhausted", "TooManyRequests"}
+_SERVER_TYPES = {"InternalServerError", "ServiceUnavailable", "BadGateway", "GatewayTimeout", "DeadlineExceeded"}
+_SERVER_STATUSES = {500, 502, 503, 504}
+_STATUS_PATTERN = re.compile(r"^\s*(\d{3})\b")
+# ステータスから始まらないメッセージでも、割り当て超過を示す 429 は拾う
+_QUOTA_PATTERN = re.compile(r"\b429\b.*(quota|limit|exhausted)", re.IGNORECASE | re.DOTALL)
+_RETRY_AFTER_PATTERNS = [
+    re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE),
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)"),
+    re.compile(r"\"retryDelay\"\s*:\s*\"([\d.]+)s\""),
+]
+
+
+@dataclass(frozen=True)
+class ErrorInfo:
+    """
+    LLM 呼び出しの失敗の分類と、サーバーが示した待機秒数（Retry-After）。
+    """
+    kind: str
+    status: Optional[int] = None
+    retry_after: Optional[float] = None
+
+    @property
+    def retryable(self) -> bool:
+        return self.kind in RETRYABLE_ERRORS
+
+
+class CircuitOpenError(Exception):
+    """
+    モデルのサーキットブレーカーが開いている（失敗が続いたため冷却中）。API を呼ばずに即座に失敗する。
+    """
+
+    def __init__(self, model_name: str, retry_in: float):
+        super().__init__(f"Model {model_name} is cooling down after repeated failures. Retry in {retry_in:.0f}s.")
+        self.model_name = model_name
+        self.retry_in = retry_in
+
+
+@dataclass
+class _Circuit:
+    """
+    1モデル分のサーキットブレーカーの状態。
+    """
+    state: str = CIRCUIT_CLOSED
+    failures: int = 0
+    open_until: float = 0.0
+    cooldown: float = 0.0
+    # 半開状態で試行を任された呼び出しの期限（結果が返らないまま期限が過ぎたら、別の呼び出しに試行を任せる）
+    probe_until: float = 0.0
+    opened: int = 0
+    rejected: int = 0
+
+
+class RetryEngine:
+    """
+    プロセス内の全エージェントで共有する、LLM 呼び出しのリトライとサーキットブレーカー。
+
+    - 失敗を種類ごとに分類し、一時的なもの（429・5xx・接続の失敗）だけをリトライする。
+    - 待機時間は、サーバーが示した Retry-After があればそれに従い、無ければ decorrelated jitter で決める
+      （同時に失敗した呼び出しが、同じ時刻に一斉にリトライしないように）。
+    - モデルごとに、リトライできる失敗が続いたら（エージェントをまたいで数える）ブレーカーを開き、
+      冷却期間が明けるまでそのモデルへの呼び出しを即座に失敗させる（代わりのモデルがあればそちらへ切り替える）。
+      冷却期間の後は1つの呼び出しだけを試し、成功すれば閉じ、失敗すれば冷却期間を倍にして開き直す。
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        base_delay: float = DEFAULT_BASE_DELAY,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        cooldown: float = DEFAULT_COOLDOWN,
+        max_cooldown: float = DEFAULT_MAX_COOLDOWN,
+        failover_model: Optional[str] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        rng: Optional[random.Random] = None,
+    ):
+        """
+        Args:
+            max_attempts (int): 1回の呼び出しあたりの最大試行回数。
+            base_delay (float): サーバーが待機時間を示さない場合の、最初の待機秒数の下限。
+            max_delay (float): サーバーが待機時間を示さない場合の、待機秒数の上限。
+            failure_threshold (int): ブレーカーを開く、リトライできる失敗の連続回数。0 以下でブレーカーを使わない。
+            cooldown (float): ブレーカーを開いてから、次の試行を許すまでの秒数。
+            max_cooldown (float): 冷却期間の上限（試行の失敗のたびに倍にする）。
+            failover_model (str, optional): ブレーカーが開いている間に切り替える代わりのモデル。
+            clock (callable): 現在時刻（秒）を返す関数。テスト用に差し替え可能。
+            sleep (callable): `call` の待機に使う関数。テスト用に差し替え可能。
+            rng (random.Random, optional): ジッターの乱数。テスト用に差し替え可能。
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = max(0.0, base_delay)
+        self.max_delay = max(self.base_delay, max_delay)
+        self.failure_threshold = failure_threshold
+        self.cooldown = max(0.0, cooldown)
+        self.max_cooldown = max(self.cooldown, max_cooldown)
+        self.failover_model = failover_model or None
+        self._clock = clock
+        self._sleep = sleep
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._circuits: Dict[str, _Circuit] = {}
+
+    @classmethod
+    def from_env(cls) -> "RetryEngine":
+        """
+        環境変数 `AGENT_RETRY_*` / `AGENT_CIRCUIT_*` / `AGENT_FAILOVER_MODEL` から設定を読み込んで生成する。
+        """
+        return cls(
+            max_attempts=int(_float_env("AGENT_RETRY_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)),
+            base_delay=_float_env("AGENT_RETRY_BASE_DELAY", DEFAULT_BASE_DELAY),
+            max_delay=_float_env("AGENT_RETRY_MAX_DELAY", DEFAULT_MAX_DELAY),
+            failure_threshold=int(_float_env("AGENT_CIRCUIT_FAILURE_THRESHOLD", DEFAULT_FAILURE_THRESHOLD)),
+            cooldown=_float_env("AGENT_CIRCUIT_COOLDOWN", DEFAULT_COOLDOWN),
+            max_cooldown=_float_env("AGENT_CIRCUIT_MAX_COOLDOWN", DEFAULT_MAX_COOLDOWN),
+            failover_model=os.getenv("AGENT_FAILOVER_MODEL"),
+        )
+
+    def classify(self, error: BaseException) -> ErrorInfo:
+        """
+        例外を分類し、リトライできる場合はサーバーが示した待機秒数を添えて返す。
+        """
+        return classify_error(error)
+
+    def backoff(self, previous: float, info: ErrorInfo) -> float:
+        """
+        次の試行までの待機秒数を返す。
+
+        Args:
+            previous (float): 前回の待機秒数（初回は 0）。
+            info (ErrorInfo): 直前の失敗の分類。
+        """
+        if info.retry_after is not None:
+            return info.retry_after
+        # decorrelated jitter: 前回の3倍までの範囲から一様に選ぶ
+        upper = max(self.base_delay, previous * 3)
+        return min(self.max_delay, self._rng.uniform(self.base_delay, upper))
+
+    def allow(self, model_name: str) -> bool:
+        """
+        モデルを呼び出してよいかを返す。冷却期間が明けた直後は、最初の1件だけに試行を許す。
+        """
+        with self._lock:
+            circuit = self._circuits.get(model_name)
+            if circuit is None or circuit.state == CIRCUIT_CLOSED:
+                return True
+            now = self._clock()
+            if circuit.state == CIRCUIT_OPEN and now >= circuit.open_until:
+                circuit.state = CIRCUIT_HALF_OPEN
+                circuit.probe_until = 0.0
+            if circuit.state == CIRCUIT_HALF_OPEN and now >= circuit.probe_until:
+                circuit.probe_until = now + max(self.cooldown, 1.0)
+                return True
+            circuit.rejected += 1
+            return False
+
+    def check(self, model_name: str):
+        """
+        `allow` が False の場合に `CircuitOpenError` を送出する。
+        """
+        if not self.allow(model_name):
+            raise CircuitOpenError(model_name, self.retry_in(model_name))
+
+    def retry_in(self, model_name: str) -> float:
+        """
+        ブレーカーが次の試行を許すまでの秒数（閉じている場合は 0）。
+        """
+        with self._lock:
+            circuit = self._circuits.get(model_name)
+            if circuit is None or circuit.state == CIRCUIT_CLOSED:
+                return 0.0
+            until = circuit.open_until if circuit.state == CIRCUIT_OPEN else circuit.probe_until
+            return max(0.0, until - self._clock())
+
+    def record_success(self, model_name: str):
+        """
+        呼び出しの成功を記録し、ブレーカーを閉じる。
+        """
+        with self._lock:
+            circuit = self._circuits.get(model_name)
+            if circuit is not None:
+                circuit.state = CIRCUIT_CLOSED
+                circuit.failures = 0
+                circuit.cooldown = 0.0
+
+    def record_failure(self, model_name: str, info: ErrorInfo) -> bool:
+        """
+        呼び出しの失敗を記録する。ブレーカーを開いた場合は True を返す。
+        リトライしない種類の失敗（不正なリクエストなど）はモデルが応答している証拠として、成功と同じに扱う。
+        """
+        if not info.retryable and info.kind != ERROR_NO_QUOTA:
+            self.record_success(model_name)
+            return False
+        if self.failure_threshold <= 0:
+            return False
+        with self._lock:
+            circuit = self._circuits.setdefault(model_name, _Circuit())
+            circuit.failures += 1
+            if info.kind == ERROR_NO_QUOTA:
+                cooldown = self.max_cooldown
+            elif circuit.state == CIRCUIT_HALF_OPEN:
+                cooldown = min(self.max_cooldown, max(circuit.cooldown, self.cooldown) * 2)
+            elif circuit.state == CIRCUIT_CLOSED and circuit.failures >= self.failure_threshold:
+                cooldown = self.cooldown
+            else:
+                return False
+            # サーバーが示した待機時間より先には試さない
+            cooldown = max(cooldown, info.retry_after or 0.0)
+            circuit.state = CIRCUIT_OPEN
+            circuit.cooldown = cooldown
+            circuit.open_until = self._clock() + cooldown
+            circuit.opened += 1
+        console.print(f"[yellow]Circuit for {model_name} opened for {cooldown:.0f}s ({info.kind}).[/yellow]")
+        return True
+
+    def state(self, model_name: str) -> str:
+        with self._lock:
+            circuit = self._circuits.get(model_name)
+            if circuit is None:
+                return CIRCUIT_CLOSED
+            if circuit.state == CIRCUIT_OPEN and self._clock() >= circuit.open_until:
+                return CIRCUIT_HALF_OPEN
+            return circuit.state
+
+    def stats(self, model_name: str) -> Dict[str, Any]:
+        """
+        モデルごとのブレーカーの状態・連続失敗回数・開いた回数・即座に失敗させた回数を返す。
+        """
+        state = self.state(model_name)
+        with self._lock:
+            circuit = self._circuits.get(model_name) or _Circuit()
+            return {"state": state, "failures": circuit.failures, "opened": circuit.opened, "rejected": circuit.rejected}
+
+    def call(self, model_name: str, func: Callable[[], T],
+             on_rate_limit: Optional[Callable[[str, float], None]] = None) -> T:
+        """
+        func を、分類・待機・ブレーカーを伴ってリトライしながら呼ぶ（ツールを使わない単発の生成など向け）。
+
+        Args:
+            model_name (str): 呼び出すモデル名（ブレーカーの単位）。
+            func (callable): 呼び出す関数。
+            on_rate_limit (callable, optional): 429 を受けたときに (モデル名, 待機秒数) で呼ぶ関数
+                （例: `RateLimiter.penalize`。同じモデルを使う他の呼び出しも待たせる）。
+
+        Raises:
+            CircuitOpenError: ブレーカーが開いている場合。
+        """
+        delay, attempt = 0.0, 0
+        while True:
+            self.check(model_name)
+            try:
+                result = func()
+            except Exception as e:
+                delay = self._on_failure(model_name, e, attempt, delay, on_rate_limit)
+                self._sleep(delay)
+                attempt += 1
+                continue
+            self.record_success(model_name)
+            return result
+
+    async def call_async(self, model_name: str, func: Callable[[], Any],
+                         on_rate_limit: Optional[Callable[[str, float], None]] = None) -> Any:
+        """
+        `call` の非同期版。func はコルーチンを返す関数で、待機中もイベントループをブロックしない。
+        """
+        delay, attempt = 0.0, 0
+        while True:
+            self.check(model_name)
+            try:
+                result = await func()
+            except Exception as e:
+                delay = self._on_failure(model_name, e, attempt, delay, on_rate_limit)
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.record_success(model_name)
+            return result
+
+    def _on_failure(self, model_name: str, error: Exception, attempt: int, previous: float,
+                    on_rate_limit: Optional[Callable[[str, float], None]]) -> float:
+        """
+        失敗を記録し、リトライする場合は待機秒数を返す。リトライしない場合は元の例外を送出する。
+        """
+        info = self.classify(error)
+        self.record_failure(model_name, info)
+        if not info.retryable or attempt >= self.max_attempts - 1:
+            raise error
+        delay = self.backoff(previous, info)
+        console.print(f"[yellow]{model_name}: {info.kind} error. Retrying in {delay:.1f}s...[/yellow]")
+        if info.kind == ERROR_RATE_LIMIT and on_rate_limit is not None:
+            on_rate_limit(model_name, delay)
+        return delay
+
+
+def classify_error(error: BaseException) -> ErrorInfo:
+    """
+    例外の型名・ステータスコード・メッセージから失敗を分類する。
+    """
+    message = str(error)
+    status = _status_of(error, message)
+    name = type(error).__name__
+    if status == 429 or name in _RATE_LIMIT_TYPES:
+        # 割り当てが 0 のモデル（無料枠で使えないモデルなど）は待っても使えるようにならない
+        if "limit: 0" in message:
+            return ErrorInfo(ERROR_NO_QUOTA, 429)
+        return ErrorInfo(ERROR_RATE_LIMIT, 429, parse_retry_after(error))
+    if status in _SERVER_STATUSES or name in _SERVER_TYPES:
+        return ErrorInfo(ERROR_SERVER, status, parse_retry_after(error))
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return ErrorInfo(ERROR_NETWORK)
+    return ErrorInfo(ERROR_FATAL, status)
+
+
+def parse_retry_after(error: BaseException) -> Optional[float]:
+    """
+    サーバーが示した待機秒数を取り出す。HTTP の Retry-After ヘッダー（秒数または日時）と、
+    エラーメッセージ中の表記（例: "Please retry in 27.5s." / "retry_delay { seconds: 27 }" / "retryDelay": "27s"）に対応する。
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        try:
+            value = headers.get("Retry-After")
+        except Exception:
+            value = None
+        if value:
+            seconds = _parse_header_value(str(value))
+            if seconds is not None:
+                return seconds
+    message = str(error)
+    for pattern in _RETRY_AFTER_PATTERNS:
+        match = pattern.search(message)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def _parse_header_value(value: str) -> Optional[float]:
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _status_of(error: BaseException, message: str) -> Optional[int]:
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and 100 <= code < 600:
+        return code
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status
+    # SDK のエラーは "429 Resource has been exhausted ..." のようにステータスから始まる
+    match = _STATUS_PATTERN.match(message)
+    if match:
+        return int(match.group(1))
+    return 429 if _QUOTA_PATTERN.search(message) else None
+
+
+def _float_env(key: str, default: float) -> float:
+    value = os.getenv(key)
+    if value is None or not value.strip():
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        console.print(f"[yellow]Invalid value for {key}: {value!r}. Using default {default}.[/yellow]")
+        return default
+
+
+_shared_engine: Optional[RetryEngine] = None
+_shared_lock = threading.Lock()
+
+
+def get_retry_engine() -> RetryEngine:
+    """
+    プロセス全体で共有されるリトライエンジンを返す（初回呼び出し時に環境変数から生成）。
+    """
+    global _shared_engine
+    with _shared_lock:
+        if _shared_engine is None:
+            _shared_engine = RetryEngine.from_env()
+        return _shared_engine
@@ -0,0 +1,262 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+import codecs
+import os
+import select
+import signal
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# このモジュールは sandbox のワーカープロセスからも読み込まれるため、標準ライブラリ以外をインポートしないこと。
+
+# 1回の読み込みの最大バイト数
+READ_CHUNK_BYTES = 65536
+# pidfd が使えない環境で、子プロセスの終了を確認する間隔（秒）
+POLL_INTERVAL_SECONDS = 0.05
+
+# on_output(ストリーム名 ("stdout" / "stderr"), 届いたテキスト)
+OutputCallback = Callable[[str, str], None]
+
+
+class OutputCapture:
+    """
+    コマンドの出力を、先頭と末尾だけを保持するリングバッファに取り込む。
+    出力がどれだけ多くても、保持するのは `max_bytes` バイトまで（先頭と末尾で半分ずつ）。
+    """
+
+    def __init__(self, max_bytes: int = 200000):
+        """
+        Args:
+            max_bytes (int): 保持する最大バイト数。0 以下で制限しない。
+        """
+        self.max_bytes = max(0, max_bytes)
+        self.total_bytes = 0
+        self._head = bytearray()
+        self._tail = bytearray()
+        self._head_limit = self.max_bytes // 2 if self.max_bytes else None
+        self._tail_limit = self.max_bytes - self.max_bytes // 2
+
+    @property
+    def omitted_bytes(self) -> int:
+        return self.total_bytes - len(self._head) - len(self._tail)
+
+    def feed(self, data: bytes):
+        self.total_bytes += len(data)
+        if self._head_limit is None:
+            self._head += data
+            return
+        room = self._head_limit - len(self._head)
+        if room > 0:
+            self._head += data[:room]
+            data = data[room:]
+        if not data:
+            return
+        self._tail += data
+        # 削除のコピーを減らすため、上限の2倍を超えたときにまとめて切り詰める
+        if len(self._tail) > 2 * self._tail_limit:
+            del self._tail[:len(self._tail) - self._tail_limit]
+
+    def text(self) -> str:
+        """
+        保持している出力を文字列で返す。省略した部分は印に置き換える。
+        """
+        if self._head_limit is not None and len(self._tail) > self._tail_limit:
+            del self._tail[:len(self._tail) - self._tail_limit]
+        head = self._head.decode("utf-8", errors="replace")
+        if not self.omitted_bytes:
+            return head + self._tail.decode("utf-8", errors="replace")
+        tail = bytes(self._tail).decode("utf-8", errors="ignore")
+        return f"{head}\n... [{self.omitted_bytes} bytes of output omitted] ...\n{tail}"
+
+
+@dataclass
+class SandboxLimits:
+    """
+    sandbox で実行するコマンドに課すリソースの上限 (rlimit)。0 の項目は制限しない。
+    上限はコマンドのプロセス（と、その子孫）に、引き上げられないハードリミットとして設定する。
+    """
+    cpu_seconds: int = 300
+    memory_mb: int = 4096
+    # RLIMIT_NPROC は実ユーザー単位で数えるため、sandbox 専用のユーザーで動かす場合にのみ設定する
+    max_processes: int = 0
+    open_files: int = 1024
+
+    @classmethod
+    def from_env(cls) -> "SandboxLimits":
+        """
+        環境変数から設定を読み込んで生成する。
+
+        - `AGENT_SANDBOX_CPU_SECONDS`: CPU 時間の上限（秒, デフォルト 300）。超えると SIGXCPU で終了する
+        - `AGENT_SANDBOX_MEMORY_MB`: アドレス空間の上限（MB, デフォルト 4096）。超えた確保は失敗する (MemoryError)
+        - `AGENT_SANDBOX_MAX_PROCESSES`: プロセス数の上限（デフォルト 0 = 制限しない）
+        - `AGENT_SANDBOX_OPEN_FILES`: 開けるファイル数の上限（デフォルト 1024）
+        """
+        return cls(
+            cpu_seconds=int(os.getenv("AGENT_SANDBOX_CPU_SECONDS", "300")),
+            memory_mb=int(os.getenv("AGENT_SANDBOX_MEMORY_MB", "4096")),
+            max_processes=int(os.getenv("AGENT_SANDBOX_MAX_PROCESSES", "0")),
+            open_files=int(os.getenv("AGENT_SANDBOX_OPEN_FILES", "1024")),
+        )
+
+    def apply(self):
+        """
+        現在のプロセスに上限を設定する（fork した子プロセスで、コマンドを実行する前に呼ぶ）。
+        既存のハードリミットより緩い値は、既存の値に切り詰める。
+        """
+        if resource is None:
+            return
+        for name, value in (("RLIMIT_CPU", self.cpu_seconds), ("RLIMIT_AS", self.memory_mb * 1024 * 1024),
+                            ("RLIMIT_NPROC", self.max_processes), ("RLIMIT_NOFILE", self.open_files)):
+            limit = getattr(resource, name, None)
+            if limit is None or value <= 0:
+                continue
+            _, hard = resource.getrlimit(limit)
+            if hard != resource.RLIM_INFINITY:
+                value = min(value, hard)
+            # CPU 時間はソフトリミットで SIGXCPU を送り、1秒後のハードリミットで強制終了する
+            soft_hard = (value, value + 1) if name == "RLIMIT_CPU" and value != hard else (value, value)
+            resource.setrlimit(limit, soft_hard)
+
+
+@dataclass
+class SandboxResult:
+    """
+    sandbox で実行したコマンドの結果。exit_code は `subprocess` と同様に、シグナルで終了した場合は負の値になる。
+    タイムアウトした場合も、それまでに取り込んだ出力を stdout / stderr に持つ。
+    """
+    exit_code: int
+    stdout: str = ""
+    stderr: str = ""
+    timed_out: bool = False
+    duration: float = 0.0
+    stdout_bytes: int = 0
+    stderr_bytes: int = 0
+    truncated: bool = False
+    # コマンドのプロセス（と、その終了を待った子孫）が使った CPU 時間と最大 RSS
+    # fork した子プロセスの最大 RSS は、fork 元と共有するページも含む
+    user_seconds: float = 0.0
+    system_seconds: float = 0.0
+    max_rss_kb: int = 0
+
+
+def run_command(command: str, cwd: str, timeout: float, max_output_bytes: int = 200000,
+                on_output: Optional[OutputCallback] = None, limits: Optional[SandboxLimits] = None,
+                env: Optional[Dict[str, str]] = None) -> SandboxResult:
+    """
+    シェルでコマンドを実行し、出力を取り込みながら終了を待つ。
+    コマンドは新しいプロセスグループで、limits の上限を設定して動かし、タイムアウト時はグループごと強制終了する。
+    env は現在の環境変数に上書きする値。
+    """
+    process = subprocess.Popen(
+        command,
+        shell=True,
+        cwd=cwd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env={**os.environ, **env} if env else None,
+        start_new_session=True,
+        # apply は標準ライブラリの関数を呼ぶだけで、ロックを取らないため fork 後に実行しても安全
+        preexec_fn=limits.apply if limits is not None else None,
+    )
+    try:
+        result = collect_output(process.pid, process.stdout.fileno(), process.stderr.fileno(),
+                                timeout, max_output_bytes, on_output)
+    finally:
+        process.stdout.close()
+        process.stderr.close()
+    # 終了ステータスは collect_output が回収済み
+    process.returncode = result.exit_code
+    return result
+
+
+def collect_output(pid: int, stdout_fd: int, stderr_fd: int, timeout: float, max_output_bytes: int = 200000,
+                   on_output: Optional[OutputCallback] = None) -> SandboxResult:
+    """
+    子プロセス (pid) の標準出力・エラー出力のパイプを読みながら、終了またはタイムアウトまで待つ。
+    読んだ出力は `OutputCapture` に取り込み、届くたびに on_output にも渡す。
+    子プロセスの終了後（またはタイムアウト時）は、プロセスグループに残ったプロセスも強制終了する。
+    """
+    started_at = time.monotonic()
+    deadline = started_at + timeout
+    captures = {stdout_fd: OutputCapture(max_output_bytes), stderr_fd: OutputCapture(max_output_bytes)}
+    names = {stdout_fd: "stdout", stderr_fd: "stderr"}
+    decoders = {fd: codecs.getincrementaldecoder("utf-8")(errors="replace") for fd in captures}
+    open_fds = set(captures)
+    pidfd = os.pidfd_open(pid) if hasattr(os, "pidfd_open") else None
+    status = None
+    usage = None
+    timed_out = False
+
+    def drain(fd: int) -> bool:
+        """読めるだけ読む。EOF に達したら False。"""
+        data = os.read(fd, READ_CHUNK_BYTES)
+        if not data:
+            return False
+        captures[fd].feed(data)
+        if on_output is not None:
+            text = decoders[fd].decode(data)
+            if text:
+                on_output(names[fd], text)
+        return True
+
+    try:
+        while status is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                break
+            watched = list(open_fds) + ([pidfd] if pidfd is not None else [])
+            wait = remaining if pidfd is not None else min(remaining, POLL_INTERVAL_SECONDS)
+            if watched:
+                ready = select.select(watched, [], [], wait)[0]
+            else:
+                # 出力のパイプが両方閉じ、pidfd も使えない場合は一定間隔で終了を確認する
+                time.sleep(wait)
+                ready = []
+            for fd in ready:
+                if fd in open_fds and not drain(fd):
+                    open_fds.discard(fd)
+            if pidfd is None or pidfd in ready or not watched:
+                done, raw_status, raw_usage = os.wait4(pid, os.WNOHANG)
+                if done:
+                    status, usage = raw_status, raw_usage
+        _kill_group(pid)
+        if timed_out:
+            _, status, usage = os.wait4(pid, 0)
+        # 終了までに書かれた残りの出力を読む（グループ外に残ったプロセスが書き続ける分は読まない）
+        for fd in list(open_fds):
+            while select.select([fd], [], [], 0)[0] and drain(fd):
+                pass
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+
+    stdout, stderr = captures[stdout_fd], captures[stderr_fd]
+    return SandboxResult(
+        exit_code=os.waitstatus_to_exitcode(status),
+        stdout=stdout.text(),
+        stderr=stderr.text(),
+        timed_out=timed_out,
+        duration=time.monotonic() - started_at,
+        stdout_bytes=stdout.total_bytes,
+        stderr_bytes=stderr.total_bytes,
+        truncated=bool(stdout.omitted_bytes or stderr.omitted_bytes),
+        user_seconds=usage.ru_utime,
+        system_seconds=usage.ru_stime,
+        # Linux の ru_maxrss は KiB 単位、macOS はバイト単位
+        max_rss_kb=usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss,
+    )
+
+
+def _kill_group(pid: int):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
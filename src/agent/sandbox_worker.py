@@ -0,0 +1,397 @@
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+import json
+import os
+import select
+import shlex
+import subprocess
+import sys
+import threading
+import time
+
+# このモジュールはワーカープロセスのスクリプトとしても実行されるため、標準ライブラリ以外をインポートしないこと。
+if __package__:
+    from .sandbox_process import OutputCallback, SandboxLimits, SandboxResult, collect_output
+else:
+    # ワーカーとして実行された場合は、このファイルのディレクトリがインポートパスの先頭にある
+    from sandbox_process import OutputCallback, SandboxLimits, SandboxResult, collect_output
+
+# Python で直接実行するコマンドとみなす実行ファイル名
+PYTHON_EXECUTABLES = ("python", "python3", f"python3.{sys.version_info.minor}")
+# 引用符の外でシェルの解釈が必要な文字と、二重引用符の中でも解釈される文字
+SHELL_METACHARACTERS = set("|&;<>()$`\\*?[]{}~!#\n")
+DOUBLE_QUOTED_METACHARACTERS = set("$`\\!")
+# コマンドのタイムアウトに加えて、ワーカーの応答を待つ猶予（秒）
+RESPONSE_GRACE_SECONDS = 5.0
+# ワーカーの起動（インポートの事前読み込みを含む）を待つ時間（秒）
+STARTUP_TIMEOUT_SECONDS = 60.0
+
+
+class SandboxWorkerError(RuntimeError):
+    """
+    ワーカープロセスとの通信に失敗した（ワーカーが異常終了した）ことを表す例外。
+    """
+
+
+class SandboxWorker:
+    """
+    sandbox でのコマンド実行を、常駐するワーカープロセス経由で行うランナー。
+
+    `subprocess.run(command, shell=True)` では、`python app.py` のたびにシェルと Python インタプリタを起動し、
+    依存ライブラリを読み込み直す。ワーカーは起動時に重いモジュールを事前にインポートしておき、
+    コマンドごとに自身を fork した子プロセスで実行する（フォークサーバー方式）。
+
+    - `python FILE ...` / `python -c CODE ...` / `python -m MODULE ...` は、子プロセスで `runpy` / `exec` により実行する。
+      インタプリタの起動と事前読み込み済みモジュールのインポートが省ける。
+    - それ以外のコマンドは、子プロセスから `/bin/sh -c` を exec して実行する。
+    - 子プロセスは新しいプロセスグループで動かし、タイムアウト時はグループごと強制終了する。
+    - 各コマンドはワーカーの状態のコピーで動くため、コマンド間で状態は残らない。
+      事前読み込みしたモジュールを読み込み直す場合は `reset()` でワーカーを再起動する。
+
+    ワーカーとは標準入出力のパイプで、1行1メッセージの JSON をやり取りする。
+    子プロセスの出力はワーカーがパイプで読み取り、`collect_output` で上限付きで取り込む（要求に応じて途中経過も送る）。
+    fork を使うため POSIX 環境でのみ利用できる（`is_supported()`）。
+    """
+
+    def __init__(self, cwd: Any = ".", preload: Sequence[str] = (), python: Optional[str] = None):
+        """
+        Args:
+            cwd (path): ワーカーの作業ディレクトリ（コマンドごとに `run` の cwd で上書きできる）。
+            preload (list[str]): ワーカーの起動時にインポートしておくモジュール名。
+            python (str, optional): ワーカーを動かす Python。省略時はこのプロセスと同じインタプリタ。
+        """
+        self.cwd = Path(cwd)
+        self.preload = [name for name in preload if name]
+        self.python = python or sys.executable
+        self.starts = 0
+        self.preload_failures: Dict[str, str] = {}
+        self._process: Optional[subprocess.Popen] = None
+        self._buffer = b""
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, cwd: Any = ".") -> Optional["SandboxWorker"]:
+        """
+        環境変数から設定を読み込んで生成する。無効な場合やこの環境で利用できない場合は None。
+
+        - `AGENT_SANDBOX_WORKER`: 1 で常駐ワーカーを使う（デフォルト 0）
+        - `AGENT_SANDBOX_PRELOAD`: ワーカーの起動時にインポートするモジュール（カンマ区切り、例: `numpy,pandas`）
+        """
+        if os.getenv("AGENT_SANDBOX_WORKER", "0").lower() not in ("1", "true", "yes") or not cls.is_supported():
+            return None
+        preload = [name.strip() for name in os.getenv("AGENT_SANDBOX_PRELOAD", "").split(",")]
+        return cls(cwd, preload=preload)
+
+    @staticmethod
+    def is_supported() -> bool:
+        return hasattr(os, "fork") and os.path.exists("/bin/sh")
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        """
+        ワーカーを起動し、事前読み込みが終わるまで待つ（起動済みの場合は何もしない）。
+        """
+        with self._lock:
+            self._ensure_started()
+
+    def run(self, command: str, cwd: Any = None, timeout: float = 30, max_output_bytes: int = 200000,
+            on_output: Optional[OutputCallback] = None, limits: Optional[SandboxLimits] = None,
+            env: Optional[Dict[str, str]] = None) -> SandboxResult:
+        """
+        コマンドを実行して結果を返す。ワーカーが起動していない場合は起動する。
+
+        Args:
+            command (str): 実行するコマンド（例: 'python app.py'）。
+            cwd (path, optional): 実行するディレクトリ。省略時はワーカーの作業ディレクトリ。
+            timeout (float): タイムアウト（秒）。超えた場合は子プロセスを強制終了し、timed_out=True の結果を返す。
+            max_output_bytes (int): 標準出力・エラー出力ごとに保持する最大バイト数（`OutputCapture`）。
+            on_output (callable, optional): 出力が届くたびに (ストリーム名, テキスト) で呼ばれる。
+            limits (SandboxLimits, optional): 子プロセスに課すリソースの上限（ワーカー自身には課さない）。
+            env (dict, optional): 子プロセスの環境変数に上書きする値。`VIRTUAL_ENV` がある場合は、
+                Python の実行でもその仮想環境の site-packages を使う。
+        """
+        request = parse_command(command)
+        request["cwd"] = str(Path(cwd if cwd is not None else self.cwd).resolve())
+        request["timeout"] = timeout
+        request["max_output_bytes"] = max_output_bytes
+        request["stream"] = on_output is not None
+        request["limits"] = asdict(limits) if limits is not None else None
+        request["env"] = env or {}
+        with self._lock:
+            self._ensure_started()
+            try:
+                self._send(request)
+                deadline = time.monotonic() + timeout + RESPONSE_GRACE_SECONDS
+                response = self._receive(deadline)
+                # 実行中の出力は、結果の前に1件ずつ届く
+                while "output" in response:
+                    on_output(response["stream"], response["output"])
+                    response = self._receive(deadline)
+            except TimeoutError:
+                # ワーカー自体が応答しない場合は、作り直して次のコマンドに備える
+                self._stop()
+                return SandboxResult(exit_code=-9, timed_out=True, duration=timeout)
+            except (OSError, SandboxWorkerError) as e:
+                self._stop()
+                raise SandboxWorkerError(f"Sandbox worker failed: {e}") from e
+        if "error" in response:
+            raise SandboxWorkerError(response["error"])
+        return SandboxResult(**response["result"])
+
+    def reset(self):
+        """
+        ワーカーを終了する。次のコマンドで、事前読み込みからやり直した新しいワーカーが起動する。
+        """
+        with self._lock:
+            self._stop()
+
+    def close(self):
+        self.reset()
+
+    def _ensure_started(self):
+        if self.running:
+            return
+        self._stop()
+        self._buffer = b""
+        self._process = subprocess.Popen(
+            [self.python, os.path.abspath(__file__), *self.preload],
+            cwd=self.cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env={**os.environ, "PYTHONIOENCODING": "utf-8"},
+            # Ctrl+C がワーカーに届かないようにする（親プロセスが終了すると標準入力が閉じてワーカーも終了する）
+            start_new_session=True,
+        )
+        self.starts += 1
+        try:
+            ready = self._receive(time.monotonic() + STARTUP_TIMEOUT_SECONDS)
+        except (TimeoutError, SandboxWorkerError) as e:
+            self._stop()
+            raise SandboxWorkerError(f"Sandbox worker failed to start: {e}") from e
+        self.preload_failures = ready.get("failed", {})
+
+    def _stop(self):
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+            process.wait(timeout=1)
+        except (OSError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+        process.stdout.close()
+
+    def _send(self, message: Dict[str, Any]):
+        self._process.stdin.write(json.dumps(message).encode("utf-8") + b"\n")
+        self._process.stdin.flush()
+
+    def _receive(self, deadline: float) -> Dict[str, Any]:
+        """
+        ワーカーから1行のメッセージを読む。期限を過ぎた場合は TimeoutError。
+        """
+        fd = self._process.stdout.fileno()
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("no response from sandbox worker")
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+            data = os.read(fd, 65536)
+            if not data:
+                raise SandboxWorkerError(f"worker exited with code {self._process.wait()}")
+            self._buffer += data
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return json.loads(line)
+
+
+def parse_command(command: str) -> Dict[str, Any]:
+    """
+    コマンドを、ワーカーへの要求に変換する。
+    シェルの機能（パイプ、リダイレクト、変数展開など）を使わない Python の起動はワーカー内で直接実行し、
+    それ以外はシェルで実行する。
+    """
+    shell = {"op": "shell", "command": command}
+    if _needs_shell(command):
+        return shell
+    argv = shlex.split(command)
+    if len(argv) < 2 or argv[0] not in PYTHON_EXECUTABLES:
+        return shell
+    if argv[1] == "-c":
+        return {"op": "code", "code": argv[2], "args": argv[3:]} if len(argv) >= 3 else shell
+    if argv[1] == "-m":
+        return {"op": "module", "module": argv[2], "args": argv[3:]} if len(argv) >= 3 else shell
+    if argv[1].startswith("-"):
+        return shell
+    return {"op": "file", "path": argv[1], "args": argv[2:]}
+
+
+def _needs_shell(command: str) -> bool:
+    """
+    引用符を考慮して、シェルの機能が使われているかを判定する。
+    """
+    quote = None
+    for char in command:
+        if quote == "'":
+            quote = None if char == "'" else quote
+        elif quote == '"':
+            if char in DOUBLE_QUOTED_METACHARACTERS:
+                return True
+            quote = None if char == '"' else quote
+        elif char in ("'", '"'):
+            quote = char
+        elif char in SHELL_METACHARACTERS:
+            return True
+    # 閉じていない引用符はシェルにエラーを任せる
+    return quote is not None
+
+
+# ---- ここから下はワーカープロセス内で動くコード ----
+
+def _serve(preload: List[str]):
+    """
+    ワーカーのメインループ。標準入力から要求を読み、子プロセスで実行した結果を標準出力に書く。
+    """
+    import importlib
+
+    # 応答の送信には元の標準出力を複製して使い、以降の print などはエラー出力に回す
+    channel = os.fdopen(os.dup(1), "wb", buffering=0)
+    os.dup2(2, 1)
+    # このスクリプトのディレクトリ（agent パッケージ）がインポートパスに入らないようにし、
+    # sandbox のコードが同名のモジュールを読み込めるよう、読み込み済みの sandbox_process を登録から外す
+    sys.path[0] = os.getcwd()
+    sys.modules.pop("sandbox_process", None)
+
+    failed = {}
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            failed[name] = f"{type(e).__name__}: {e}"
+    _write(channel, {"ready": True, "pid": os.getpid(), "failed": failed})
+    for line in sys.stdin.buffer:
+        try:
+            response = _execute(json.loads(line), channel)
+        except Exception as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+        _write(channel, response)
+
+
+def _write(channel, message: Dict[str, Any]):
+    channel.write(json.dumps(message).encode("utf-8") + b"\n")
+
+
+def _execute(request: Dict[str, Any], channel) -> Dict[str, Any]:
+    """
+    要求を fork した子プロセスで実行し、出力を読みながら終了を待つ。
+    """
+    on_output = None
+    if request["stream"]:
+        on_output = lambda stream, text: _write(channel, {"output": text, "stream": stream})
+    stdout_read, stdout_write = os.pipe()
+    stderr_read, stderr_write = os.pipe()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        os.close(stdout_read)
+        os.close(stderr_read)
+        _run_child(request, stdout_write, stderr_write)
+    os.close(stdout_write)
+    os.close(stderr_write)
+    try:
+        result = collect_output(pid, stdout_read, stderr_read, request["timeout"], request["max_output_bytes"],
+                                on_output)
+    finally:
+        os.close(stdout_read)
+        os.close(stderr_read)
+    return {"result": asdict(result)}
+
+
+def _run_child(request: Dict[str, Any], stdout_fd: int, stderr_fd: int):
+    """
+    子プロセス側の処理。標準入出力を付け替えて要求を実行し、終了コードで終了する（戻らない）。
+    """
+    code = 1
+    try:
+        os.setpgid(0, 0)
+        if request["limits"]:
+            SandboxLimits(**request["limits"]).apply()
+        os.chdir(request["cwd"])
+        os.environ.update(request["env"])
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(stdout_fd, 1)
+        os.dup2(stderr_fd, 2)
+        for fd in (devnull, stdout_fd, stderr_fd):
+            os.close(fd)
+        if request["op"] == "shell":
+            os.execv("/bin/sh", ["/bin/sh", "-c", request["command"]])
+        code = _run_python(request)
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def _run_python(request: Dict[str, Any]) -> int:
+    """
+    `python FILE` / `python -c` / `python -m` と同じ sys.argv・sys.path で実行し、終了コードを返す。
+    """
+    import runpy
+    import traceback
+
+    if os.environ.get("VIRTUAL_ENV"):
+        _activate_virtualenv(os.environ["VIRTUAL_ENV"])
+    try:
+        if request["op"] == "file":
+            path = request["path"]
+            sys.argv = [path, *request["args"]]
+            sys.path[0] = os.path.dirname(os.path.abspath(path))
+            runpy.run_path(path, run_name="__main__")
+        elif request["op"] == "code":
+            sys.argv = ["-c", *request["args"]]
+            sys.path[0] = ""
+            exec(compile(request["code"], "<string>", "exec"), {"__name__": "__main__"})
+        else:
+            sys.argv = [request["module"], *request["args"]]
+            sys.path[0] = os.getcwd()
+            runpy.run_module(request["module"], run_name="__main__", alter_sys=True)
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+def _activate_virtualenv(venv: str):
+    """
+    仮想環境の site-packages を、ワーカーのものより優先してインポートパスに加える（.pth も処理する）。
+    """
+    import glob
+    import site
+
+    for site_packages in glob.glob(os.path.join(venv, "lib", "python*", "site-packages")):
+        sys.path.insert(1, site_packages)
+        site.addsitedir(site_packages)
+
+
+if __name__ == "__main__":
+    _serve(sys.argv[1:])
@@ -0,0 +1,133 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator, List, Optional
+import time
+
+try:
+    from .response_snapshot import ResponseSnapshot, PartSnapshot, UsageSnapshot
+except ImportError:
+    from agent.response_snapshot import ResponseSnapshot, PartSnapshot, UsageSnapshot
+
+# イベントの種類
+EVENT_START = "start"              # エージェントがメッセージの処理を始めた
+EVENT_TEXT = "text"                # 応答テキストの断片（届いた順に連結すると応答全体になる）
+EVENT_TOOL_CALL = "tool_call"      # ツールの呼び出し（text は "名前(引数)"）
+EVENT_TOOL_RESULT = "tool_result"  # ツールの実行結果（text は結果の先頭）
+EVENT_TOOL_OUTPUT = "tool_output"  # 実行中のツールの途中経過（sandbox のコマンド出力の断片など）
+EVENT_END = "end"                  # エージェントがメッセージの処理を終えた
+
+# ツール結果のイベントに含める文字数
+TOOL_RESULT_PREVIEW_CHARS = 200
+
+
+@dataclass
+class StreamEvent:
+    """
+    エージェントの処理の途中経過を表すイベント。
+    depth は委任の深さで、ユーザーから直接呼ばれたエージェントが 0、その委任先が 1 となる。
+    """
+    kind: str
+    agent: str
+    text: str = ""
+    depth: int = 0
+
+
+StreamCallback = Callable[[StreamEvent], None]
+
+# イベントの送り先と、現在のターンの入れ子の深さ。スパンと同様に、委任先のサブエージェントにも引き継がれる。
+_current_callback: ContextVar[Optional[StreamCallback]] = ContextVar("agent_stream_callback", default=None)
+_current_depth: ContextVar[int] = ContextVar("agent_stream_depth", default=0)
+
+
+@contextmanager
+def stream_events(callback: StreamCallback) -> Iterator[None]:
+    """
+    ブロック内で動くエージェント（委任先を含む）のイベントを callback に送る。
+    並列に委任されたエージェントのイベントは別スレッドから届くため、callback はスレッドセーフにすること。
+    """
+    token = _current_callback.set(callback)
+    try:
+        yield
+    finally:
+        _current_callback.reset(token)
+
+
+def current_stream_callback() -> Optional[StreamCallback]:
+    return _current_callback.get()
+
+
+@contextmanager
+def stream_turn(agent: str) -> Iterator[None]:
+    """
+    エージェントの1回のメッセージ処理を start / end のイベントで囲み、ブロック内の委任を1段深くする。
+    """
+    callback = _current_callback.get()
+    if callback is None:
+        yield
+        return
+    depth = _current_depth.get()
+    callback(StreamEvent(EVENT_START, agent, depth=depth))
+    token = _current_depth.set(depth + 1)
+    try:
+        yield
+    finally:
+        _current_depth.reset(token)
+        callback(StreamEvent(EVENT_END, agent, depth=depth))
+
+
+def emit(kind: str, agent: str, text: str = ""):
+    """
+    ターンの中からイベントを現在の送り先に送る（送り先が無い場合は何もしない）。
+    """
+    callback = _current_callback.get()
+    if callback is not None:
+        # `stream_turn` の中では、自身のターンの分だけ深さが1つ進んでいる
+        callback(StreamEvent(kind, agent, text, max(0, _current_depth.get() - 1)))
+
+
+class StreamAssembler:
+    """
+    ストリーミングで届くレスポンスの断片 (chunk) を1つのレスポンスに組み立てる。
+    関数呼び出しは断片ごとにパートとして集め、テキストは連結する。
+    agent を指定した場合は、テキストを届いた順にそのエージェントのイベントとして送る。
+    """
+
+    def __init__(self, agent: Optional[str] = None, clock: Callable[[], float] = time.perf_counter):
+        self.agent = agent
+        self.time_to_first_chunk: Optional[float] = None
+        self._parts: List[PartSnapshot] = []
+        self._usage = UsageSnapshot()
+        self._clock = clock
+        self._started_at = clock()
+
+    def add(self, chunk: Any):
+        if self.time_to_first_chunk is None:
+            self.time_to_first_chunk = self._clock() - self._started_at
+        try:
+            snapshot = ResponseSnapshot.from_response(chunk)
+        except ValueError:
+            # 候補を含まない断片（使用量だけの最後の断片など）
+            snapshot = ResponseSnapshot([], _usage_of(chunk))
+        for part in snapshot.parts:
+            if part.function_call:
+                self._parts.append(part)
+            elif part.text:
+                if self.agent is not None:
+                    emit(EVENT_TEXT, self.agent, part.text)
+                if self._parts and not self._parts[-1].function_call:
+                    self._parts[-1] = PartSnapshot(text=self._parts[-1].text + part.text)
+                else:
+                    self._parts.append(PartSnapshot(text=part.text))
+        # 使用量は断片ごとの累計で届くため、最後に届いた値を使う
+        if snapshot.usage_metadata.total_token_count:
+            self._usage = snapshot.usage_metadata
+
+    def response(self) -> ResponseSnapshot:
+        return ResponseSnapshot(list(self._parts), self._usage)
+
+
+def _usage_of(chunk: Any) -> UsageSnapshot:
+    usage = getattr(chunk, "usage_metadata", None)
+    counts = [getattr(usage, attr, 0) for attr in ("prompt_token_count", "candidates_token_count", "total_token_count")]
+    return UsageSnapshot(*[count if isinstance(count, int) else 0 for count in counts])
@@ -0,0 +1,184 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+
+# タスクの状態
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+@dataclass
+class TaskNode:
+    """
+    タスクグラフの1ノード。実行結果と所要時間も保持する。
+    """
+    id: str
+    description: str
+    assignee: str
+    depends_on: List[str] = field(default_factory=list)
+    status: str = PENDING
+    result: Optional[str] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        """
+        実行にかかった秒数（未完了の場合は None）。
+        """
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "description": self.description,
+            "assignee": self.assignee,
+            "depends_on": list(self.depends_on),
+            "status": self.status,
+            "duration": self.duration,
+        }
+
+
+class TaskGraph:
+    """
+    依存関係付きのタスク集合 (DAG)。
+    `Manager.plan_tasks` が生成し、`TaskScheduler` が依存の解決した順に実行する。
+    """
+
+    def __init__(self, nodes: Iterable[TaskNode]):
+        """
+        Args:
+            nodes (Iterable[TaskNode]): タスクノード。id は一意である必要がある。
+
+        Raises:
+            ValueError: id の重複、未知の依存先、循環依存がある場合。
+        """
+        self.nodes: Dict[str, TaskNode] = {}
+        for node in nodes:
+            if node.id in self.nodes:
+                raise ValueError(f"Duplicate task id: {node.id}")
+            self.nodes[node.id] = node
+        self._validate()
+
+    @classmethod
+    def from_list(cls, items: List[Any], available_agents: List[str], default_assignee: Optional[str] = None) -> "TaskGraph":
+        """
+        LLM の出力（辞書または文字列のリスト）からタスクグラフを組み立てる。
+
+        辞書は id / description / assignee / depends_on を持つことを想定する。
+        文字列のみのリストの場合は、元の順序を守るため直前のタスクに依存する直列のグラフとする。
+        未知の担当者は `default_assignee` に、未知の依存先は無視する。
+
+        Args:
+            items (list): LLM が出力したタスクのリスト。
+            available_agents (list): 割り当て可能なエージェント名。
+            default_assignee (str, optional): 担当者が不明な場合の割り当て先。
+
+        Returns:
+            TaskGraph: 組み立てたタスクグラフ。
+        """
+        if default_assignee is None:
+            default_assignee = "Coder" if "Coder" in available_agents else (available_agents[0] if available_agents else "Coder")
+
+        nodes: List[TaskNode] = []
+        for index, item in enumerate(items, start=1):
+            if isinstance(item, dict):
+                task_id = str(item.get("id") or f"t{index}")
+                description = str(item.get("description") or item.get("task") or "")
+                assignee = str(item.get("assignee") or default_assignee)
+                depends_on = item.get("depends_on") or []
+                # 単一の ID が文字列や数値で渡されることがあるため、リスト以外はひとつの依存として扱う
+                if not isinstance(depends_on, (list, tuple)):
+                    depends_on = [depends_on]
+                depends_on = [str(d) for d in depends_on]
+            else:
+                task_id = f"t{index}"
+                description = str(item)
+                assignee = default_assignee
+                depends_on = [nodes[-1].id] if nodes else []
+
+            if assignee not in available_agents:
+                assignee = default_assignee
+            nodes.append(TaskNode(task_id, description, assignee, depends_on))
+
+        known = {node.id for node in nodes}
+        for node in nodes:
+            node.depends_on = [d for d in node.depends_on if d in known and d != node.id]
+        return cls(nodes)
+
+    def ready(self) -> List[TaskNode]:
+        """
+        依存タスクが全て完了しており、まだ実行されていないタスクを返す。
+        """
+        return [
+            node for node in self.nodes.values()
+            if node.status == PENDING and all(self.nodes[d].status == DONE for d in node.depends_on)
+        ]
+
+    def skip_blocked(self) -> List[TaskNode]:
+        """
+        依存タスクが失敗・スキップしたために実行できないタスクをスキップ扱いにする（連鎖的に適用）。
+        """
+        skipped: List[TaskNode] = []
+        changed = True
+        while changed:
+            changed = False
+            for node in self.nodes.values():
+                if node.status != PENDING:
+                    continue
+                if any(self.nodes[d].status in (FAILED, SKIPPED) for d in node.depends_on):
+                    node.status = SKIPPED
+                    node.result = "Skipped because a dependency did not complete."
+                    skipped.append(node)
+                    changed = True
+        return skipped
+
+    def is_finished(self) -> bool:
+        """
+        全てのタスクが完了・失敗・スキップのいずれかになったかどうか。
+        """
+        return all(node.status in (DONE, FAILED, SKIPPED) for node in self.nodes.values())
+
+    def critical_path_seconds(self) -> float:
+        """
+        実測の所要時間に基づくクリティカルパスの長さ（秒）。
+        """
+        memo: Dict[str, float] = {}
+
+        def finish(task_id: str) -> float:
+            if task_id not in memo:
+                node = self.nodes[task_id]
+                memo[task_id] = (node.duration or 0.0) + max((finish(d) for d in node.depends_on), default=0.0)
+            return memo[task_id]
+
+        return max((finish(task_id) for task_id in self.nodes), default=0.0)
+
+    def _validate(self):
+        """
+        未知の依存先と循環依存を検出する。
+        """
+        for node in self.nodes.values():
+            for dep in node.depends_on:
+                if dep not in self.nodes:
+                    raise ValueError(f"Task {node.id} depends on unknown task {dep}")
+
+        visiting, visited = set(), set()
+
+        def visit(task_id: str):
+            if task_id in visited:
+                return
+            if task_id in visiting:
+                raise ValueError(f"Cyclic dependency detected at task {task_id}")
+            visiting.add(task_id)
+            for dep in self.nodes[task_id].depends_on:
+                visit(dep)
+            visiting.discard(task_id)
+            visited.add(task_id)
+
+        for task_id in self.nodes:
+            visit(task_id)
@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Awaitable, Callable, Dict, Optional
+import asyncio
+import contextvars
+import os
+import time
+from rich.console import Console
+
+try:
+    from .task_graph import TaskGraph, TaskNode, RUNNING, DONE, FAILED
+except ImportError:
+    from agent.task_graph import TaskGraph, TaskNode, RUNNING, DONE, FAILED
+
+console = Console()
+
+
+class TaskScheduler:
+    """
+    タスクグラフを依存関係の順に実行するローカルスケジューラー。
+
+    依存タスクが完了した時点で、そのタスクを即座にサブエージェントへ割り当てる。
+    LLM に「次に何をするか」を考えさせる往復が不要になり、独立した枝は並列に進む。
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None, clock: Callable[[], float] = time.perf_counter):
+        """
+        Args:
+            max_concurrency (int, optional): 同時に実行するタスク数の上限。
+                省略時は環境変数 `AGENT_MAX_PARALLEL_TASKS`（デフォルト 3）。
+            clock (callable): 所要時間の計測に使う時計。
+        """
+        self.max_concurrency = max(1, max_concurrency or int(os.getenv("AGENT_MAX_PARALLEL_TASKS", "3")))
+        self._clock = clock
+
+    def run(self, graph: TaskGraph, dispatch: Callable[[TaskNode], str]) -> TaskGraph:
+        """
+        タスクグラフを同期的に実行する。
+
+        Args:
+            graph (TaskGraph): 実行するタスクグラフ。
+            dispatch (callable): タスクを受け取り、担当エージェントの回答を返す関数。例外は失敗として扱う。
+
+        Returns:
+            TaskGraph: 各タスクの状態・結果・所要時間が記録されたグラフ。
+        """
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="task") as pool:
+            running: Dict = {}
+            while True:
+                graph.skip_blocked()
+                for node in graph.ready()[: self.max_concurrency - len(running)]:
+                    self._start(node)
+                    # 呼び出し元のスパンを親として引き継ぐため、コンテキストをコピーしてワーカーで実行する
+                    running[pool.submit(contextvars.copy_context().run, dispatch, node)] = node
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    error = future.exception()
+                    self._finish(node, None if error else future.result(), error)
+        return graph
+
+    async def run_async(self, graph: TaskGraph, dispatch: Callable[[TaskNode], Awaitable[str]]) -> TaskGraph:
+        """
+        `run` の非同期版。
+
+        Args:
+            graph (TaskGraph): 実行するタスクグラフ。
+            dispatch (callable): タスクを受け取り、担当エージェントの回答を返すコルーチン関数。例外は失敗として扱う。
+
+        Returns:
+            TaskGraph: 各タスクの状態・結果・所要時間が記録されたグラフ。
+        """
+        running: Dict[asyncio.Task, TaskNode] = {}
+        while True:
+            graph.skip_blocked()
+            for node in graph.ready()[: self.max_concurrency - len(running)]:
+                self._start(node)
+                running[asyncio.ensure_future(dispatch(node))] = node
+            if not running:
+                break
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                node = running.pop(task)
+                error = task.exception()
+                self._finish(node, None if error else task.result(), error)
+        return graph
+
+    def _start(self, node: TaskNode):
+        node.status = RUNNING
+        node.started_at = self._clock()
+        console.print(f"[bold yellow]Scheduler:[/bold yellow] start {node.id} -> {node.assignee}")
+
+    def _finish(self, node: TaskNode, result: Optional[str], error: Optional[BaseException]):
+        node.finished_at = self._clock()
+        if error is not None:
+            node.status = FAILED
+            node.result = f"Error: {error}"
+        else:
+            node.status = DONE
+            node.result = result
+        console.print(f"[dim]Scheduler: {node.id} {node.status} in {node.duration:.1f}s[/dim]")
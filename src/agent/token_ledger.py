@@ -0,0 +1,214 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Iterator, Optional
+import os
+import threading
+import uuid
+
+# 予算の状態
+BUDGET_OK = "ok"
+BUDGET_SOFT = "soft"
+BUDGET_HARD = "hard"
+
+DEFAULT_SESSION = "default"
+
+# 現在のセッション ID。スパンと同様に、委任先のサブエージェントにも引き継がれる。
+_current_session: ContextVar[str] = ContextVar("agent_token_session", default=DEFAULT_SESSION)
+
+
+class TokenBudgetExceeded(Exception):
+    """
+    トークン予算のハードリミットを超えたため、API 呼び出しを中止したことを表す例外。
+    """
+
+
+@dataclass
+class TokenUsage:
+    """
+    1つの集計単位（エージェント・セッション・プロセス）のトークン使用量。
+    """
+    calls: int = 0
+    prompt_tokens: int = 0
+    candidates_tokens: int = 0
+    total_tokens: int = 0
+
+    def add(self, prompt_tokens: int, candidates_tokens: int, total_tokens: int):
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.candidates_tokens += candidates_tokens
+        self.total_tokens += total_tokens
+
+
+class TokenLedger:
+    """
+    レスポンスの usage_metadata から読み取ったトークン使用量を、エージェント・セッション・プロセス単位で集計し、
+    予算を超えた場合に処理を打ち切る（ハードリミット）か縮退させる（ソフトリミット）台帳。
+
+    `max_iterations` はエージェント・呼び出しごとの上限で、`delegate_task` の入れ子では掛け算で増えてしまう。
+    この台帳はプロセス内の全エージェントで共有され、セッション全体の消費量で判断する。
+    ソフトリミットを超えた場合、エージェントは安価なモデル (`fallback_model`) に切り替え、
+    残りのツール反復を `soft_extra_iterations` 回までに制限する。
+    """
+
+    def __init__(self, session_soft_limit: Optional[int] = None, session_hard_limit: Optional[int] = None,
+                 process_soft_limit: Optional[int] = None, process_hard_limit: Optional[int] = None,
+                 fallback_model: Optional[str] = None, soft_extra_iterations: int = 1):
+        """
+        Args:
+            session_soft_limit (int, optional): セッションあたりのソフトリミット（合計トークン数）。None または 0 以下で無制限。
+            session_hard_limit (int, optional): セッションあたりのハードリミット。
+            process_soft_limit (int, optional): プロセス全体のソフトリミット。
+            process_hard_limit (int, optional): プロセス全体のハードリミット。
+            fallback_model (str, optional): ソフトリミット超過時に切り替えるモデル。None の場合は切り替えない。
+            soft_extra_iterations (int): ソフトリミット超過後に許可するツール反復の回数。
+        """
+        self.session_soft_limit = _limit(session_soft_limit)
+        self.session_hard_limit = _limit(session_hard_limit)
+        self.process_soft_limit = _limit(process_soft_limit)
+        self.process_hard_limit = _limit(process_hard_limit)
+        self.fallback_model = fallback_model or None
+        self.soft_extra_iterations = max(0, soft_extra_iterations)
+        self._lock = threading.Lock()
+        self._process = TokenUsage()
+        self._sessions: Dict[str, TokenUsage] = {}
+        self._agents: Dict[str, TokenUsage] = {}
+        self._models: Dict[str, TokenUsage] = {}
+
+    @classmethod
+    def from_env(cls) -> "TokenLedger":
+        """
+        環境変数から予算を読み込んで生成する（未設定または 0 で無制限）。
+
+        - `AGENT_SESSION_TOKEN_SOFT_LIMIT` / `AGENT_SESSION_TOKEN_HARD_LIMIT`
+        - `AGENT_PROCESS_TOKEN_SOFT_LIMIT` / `AGENT_PROCESS_TOKEN_HARD_LIMIT`
+        - `AGENT_BUDGET_FALLBACK_MODEL`: ソフトリミット超過時に切り替えるモデル
+        - `AGENT_BUDGET_SOFT_EXTRA_ITERATIONS`: ソフトリミット超過後に許可するツール反復の回数（デフォルト 1、0 で許可しない）
+        """
+        extra_iterations = _int_env("AGENT_BUDGET_SOFT_EXTRA_ITERATIONS")
+        return cls(
+            session_soft_limit=_int_env("AGENT_SESSION_TOKEN_SOFT_LIMIT"),
+            session_hard_limit=_int_env("AGENT_SESSION_TOKEN_HARD_LIMIT"),
+            process_soft_limit=_int_env("AGENT_PROCESS_TOKEN_SOFT_LIMIT"),
+            process_hard_limit=_int_env("AGENT_PROCESS_TOKEN_HARD_LIMIT"),
+            fallback_model=os.getenv("AGENT_BUDGET_FALLBACK_MODEL"),
+            # 0 は「超過後はツールを実行しない」という明示的な指定
+            soft_extra_iterations=extra_iterations if extra_iterations is not None else 1,
+        )
+
+    @contextmanager
+    def session(self, session_id: Optional[str] = None) -> Iterator[str]:
+        """
+        `with ledger.session() as session_id:` のブロック内の使用量を、1つのセッションとして集計する。
+        """
+        session_id = session_id or uuid.uuid4().hex[:12]
+        token = _current_session.set(session_id)
+        try:
+            yield session_id
+        finally:
+            _current_session.reset(token)
+
+    def current_session(self) -> str:
+        return _current_session.get()
+
+    def record(self, agent_name: str, model_name: str, prompt_tokens: int = 0, candidates_tokens: int = 0,
+               total_tokens: int = 0):
+        """
+        1回の API 呼び出しの使用量を、エージェント・モデル・現在のセッション・プロセスに加算する。
+        """
+        total_tokens = total_tokens or prompt_tokens + candidates_tokens
+        session_id = _current_session.get()
+        with self._lock:
+            for usage in (
+                self._process,
+                self._sessions.setdefault(session_id, TokenUsage()),
+                self._agents.setdefault(agent_name, TokenUsage()),
+                self._models.setdefault(model_name, TokenUsage()),
+            ):
+                usage.add(prompt_tokens, candidates_tokens, total_tokens)
+
+    def check(self) -> str:
+        """
+        現在のセッションとプロセス全体の使用量から、予算の状態 ("ok" / "soft" / "hard") を返す。
+        """
+        with self._lock:
+            session_total = self._sessions.get(_current_session.get(), TokenUsage()).total_tokens
+            process_total = self._process.total_tokens
+        if _reached(session_total, self.session_hard_limit) or _reached(process_total, self.process_hard_limit):
+            return BUDGET_HARD
+        if _reached(session_total, self.session_soft_limit) or _reached(process_total, self.process_soft_limit):
+            return BUDGET_SOFT
+        return BUDGET_OK
+
+    def enforce(self, agent_name: str) -> str:
+        """
+        API 呼び出しの前に予算を確認する。ハードリミットを超えている場合は例外を送出する。
+
+        Returns:
+            str: 予算の状態 ("ok" / "soft")。
+
+        Raises:
+            TokenBudgetExceeded: ハードリミットを超えている場合。
+        """
+        state = self.check()
+        if state == BUDGET_HARD:
+            usage = self.usage()
+            raise TokenBudgetExceeded(
+                f"Token budget exceeded for {agent_name} "
+                f"(session {usage['session']['total_tokens']} tokens, process {usage['process']['total_tokens']} tokens)."
+            )
+        return state
+
+    def usage(self) -> Dict[str, Any]:
+        """
+        現在のセッションとプロセス全体の使用量を返す。
+        """
+        with self._lock:
+            session = self._sessions.get(_current_session.get(), TokenUsage())
+            return {"session": asdict(session), "process": asdict(self._process)}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        全ての集計単位の使用量と予算を JSON 化できる辞書で返す。
+        """
+        with self._lock:
+            return {
+                "process": asdict(self._process),
+                "sessions": {key: asdict(value) for key, value in self._sessions.items()},
+                "agents": {key: asdict(value) for key, value in self._agents.items()},
+                "models": {key: asdict(value) for key, value in self._models.items()},
+                "limits": {
+                    "session_soft": self.session_soft_limit,
+                    "session_hard": self.session_hard_limit,
+                    "process_soft": self.process_soft_limit,
+                    "process_hard": self.process_hard_limit,
+                },
+            }
+
+
+def _limit(value: Optional[int]) -> Optional[int]:
+    return value if value and value > 0 else None
+
+
+def _reached(total: int, limit: Optional[int]) -> bool:
+    return limit is not None and total >= limit
+
+
+def _int_env(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+_shared_ledger: Optional[TokenLedger] = None
+_shared_lock = threading.Lock()
+
+
+def get_token_ledger() -> TokenLedger:
+    """
+    プロセス全体で共有されるトークン台帳を返す（初回呼び出し時に環境変数から生成）。
+    """
+    global _shared_ledger
+    with _shared_lock:
+        if _shared_ledger is None:
+            _shared_ledger = TokenLedger.from_env()
+        return _shared_ledger
@@ -0,0 +1,273 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import asyncio
+import contextvars
+import os
+
+try:
+    from .tracing import Span, get_tracer
+except ImportError:
+    from agent.tracing import Span, get_tracer
+
+# (ツール名, 引数) の組
+ToolCall = Tuple[str, Dict[str, Any]]
+
+
+def parallel_safe(func: Callable) -> Callable:
+    """
+    ツールを「他のツールと並列実行しても安全」とマークするデコレーター。
+    マークされていないツールは、同じターン内の他のツールと重ならないよう単独で実行される。
+    エージェントのメソッドには、メタデータもまとめて宣言できる `tool_registry.tool(parallel_safe=True)` を使う。
+    """
+    func.parallel_safe = True
+    return func
+
+
+class ToolExecutor:
+    """
+    1ターン分のツール呼び出しを実行する実行器の基底クラス（逐次実行）。
+
+    呼び出しは「連続する並列安全なツール」ごとにバッチへまとめられ、
+    並列安全でないツールは単独のバッチとして元の順序どおりに実行される。
+    結果は常に元の呼び出し順で返す。
+    """
+
+    def run(self, agent: Any, calls: List[ToolCall]) -> List[Any]:
+        """
+        ツール呼び出しを実行し、結果を元の順序で返す。
+
+        Args:
+            agent (Agent): `execute_tool` / `is_tool_parallel_safe` を持つエージェント。
+            calls (list): (ツール名, 引数) のリスト。
+
+        Returns:
+            list: 各呼び出しの結果。
+        """
+        results: List[Any] = [None] * len(calls)
+        for batch in self.plan_batches(agent, calls):
+            if len(batch) == 1:
+                index = batch[0]
+                name, args = calls[index]
+                results[index] = self._invoke(agent, name, args)
+            else:
+                for index, result in zip(batch, self._run_batch(agent, [calls[i] for i in batch])):
+                    results[index] = result
+        return results
+
+    async def run_async(self, agent: Any, calls: List[ToolCall]) -> List[Any]:
+        """
+        `run` の非同期版。各ツールは `execute_tool_async` で実行する。
+
+        Args:
+            agent (Agent): `execute_tool_async` / `is_tool_parallel_safe` を持つエージェント。
+            calls (list): (ツール名, 引数) のリスト。
+
+        Returns:
+            list: 各呼び出しの結果。
+        """
+        results: List[Any] = [None] * len(calls)
+        for batch in self.plan_batches(agent, calls):
+            if len(batch) == 1:
+                index = batch[0]
+                name, args = calls[index]
+                results[index] = await self._invoke_async(agent, name, args)
+            else:
+                batch_results = await self.run_batch_async(agent, [calls[i] for i in batch])
+                for index, result in zip(batch, batch_results):
+                    results[index] = result
+        return results
+
+    def plan_batches(self, agent: Any, calls: List[ToolCall]) -> List[List[int]]:
+        """
+        呼び出しのインデックスを、同時実行してよいバッチ単位に分割する。
+        並列安全なツールでも、同じファイルを対象とする呼び出し（例: 同じパスへの2回の書き込み）は
+        同じバッチに入れず、元の順序どおりに実行する。
+        """
+        batches: List[List[int]] = []
+        current: List[int] = []
+        paths: set = set()
+        for index, (name, args) in enumerate(calls):
+            if agent.is_tool_parallel_safe(name):
+                path = _target_path(args)
+                if path is not None and path in paths:
+                    batches.append(current)
+                    current, paths = [], set()
+                current.append(index)
+                if path is not None:
+                    paths.add(path)
+                continue
+            if current:
+                batches.append(current)
+                current, paths = [], set()
+            batches.append([index])
+        if current:
+            batches.append(current)
+        return batches
+
+    def _run_batch(self, agent: Any, calls: List[ToolCall]) -> List[Any]:
+        """
+        並列安全なツールのバッチを実行する。基底クラスでは逐次実行する。
+        """
+        return [self._invoke(agent, name, args) for name, args in calls]
+
+    async def run_batch_async(self, agent: Any, calls: List[ToolCall]) -> List[Any]:
+        """
+        並列安全なツールのバッチを非同期に実行する。基底クラスでは1つずつ順に待つ。
+        """
+        return [await self._invoke_async(agent, name, args) for name, args in calls]
+
+    def _invoke(self, agent: Any, name: str, args: Dict[str, Any]) -> Any:
+        """
+        1つのツールを `tool.execute` スパンの中で実行する。
+        """
+        with get_tracer().span("tool.execute", **_tool_attributes(agent, name)) as span:
+            result = agent.execute_tool(name, args)
+            _record_result(span, result)
+            return result
+
+    async def _invoke_async(self, agent: Any, name: str, args: Dict[str, Any]) -> Any:
+        """
+        `_invoke` の非同期版。
+        """
+        with get_tracer().span("tool.execute", **_tool_attributes(agent, name)) as span:
+            result = await agent.execute_tool_async(name, args)
+            _record_result(span, result)
+            return result
+
+    def close(self):
+        """
+        実行器が保持するリソースを解放する。
+        """
+        pass
+
+
+class ThreadPoolToolExecutor(ToolExecutor):
+    """
+    並列安全なツールのバッチをスレッドプールで同時実行する実行器。
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        """
+        Args:
+            max_workers (int, optional): 最大ワーカー数。省略時は環境変数 `AGENT_TOOL_WORKERS`（デフォルト 4）。
+        """
+        self.max_workers = max_workers or int(os.getenv("AGENT_TOOL_WORKERS", "4"))
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def _run_batch(self, agent: Any, calls: List[ToolCall]) -> List[Any]:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tool")
+        # 呼び出し元のスパンを親として引き継ぐため、コンテキストをコピーしてワーカーで実行する
+        futures = [
+            self._pool.submit(contextvars.copy_context().run, self._invoke, agent, name, args)
+            for name, args in calls
+        ]
+        # 全ての完了を待ってから、元の順序で結果（または最初の例外）を返す
+        errors = [f.exception() for f in futures]
+        for error in errors:
+            if error is not None:
+                raise error
+        return [f.result() for f in futures]
+
+    async def run_batch_async(self, agent: Any, calls: List[ToolCall]) -> List[Any]:
+        # 非同期実行ではスレッドプールを使わず、イベントループ上で同時に待つ
+        return await asyncio.gather(*(self._invoke_async(agent, name, args) for name, args in calls))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+
+class AsyncioToolExecutor(ToolExecutor):
+    """
+    並列安全なツールのバッチを asyncio のタスクとして同時実行する実行器。
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None):
+        """
+        Args:
+            max_concurrency (int, optional): 同時実行数の上限。省略時は環境変数 `AGENT_TOOL_WORKERS`（デフォルト 4）。
+        """
+        self.max_concurrency = max_concurrency or int(os.getenv("AGENT_TOOL_WORKERS", "4"))
+
+    def _run_batch(self, agent: Any, calls: List[ToolCall]) -> List[Any]:
+        # 同期経路では同期ツールをワーカースレッドで同時実行する
+        async def run_one(semaphore: asyncio.Semaphore, name: str, args: Dict[str, Any]) -> Any:
+            async with semaphore:
+                return await asyncio.to_thread(self._invoke, agent, name, args)
+
+        async def run_all() -> List[Any]:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            return await asyncio.gather(*(run_one(semaphore, name, args) for name, args in calls))
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(run_all())
+        # 同期のターン（`Agent.send_message`）はイベントループの中からここを呼ぶため、
+        # 実行中のループは使えない。ワーカースレッドの専用のループで実行する
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="tool-batch") as pool:
+            return pool.submit(contextvars.copy_context().run, asyncio.run, run_all()).result()
+
+    async def run_batch_async(self, agent: Any, calls: List[ToolCall]) -> List[Any]:
+        """
+        バッチ内のツールを `execute_tool_async` で同時実行し、結果を元の順序で返す。
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run_one(name: str, args: Dict[str, Any]) -> Any:
+            async with semaphore:
+                return await self._invoke_async(agent, name, args)
+
+        return await asyncio.gather(*(run_one(name, args) for name, args in calls))
+
+
+def _target_path(args: Dict[str, Any]) -> Optional[str]:
+    """
+    ツールの引数から対象のファイルのパスを取り出す（`file_path` 引数が無ければ None）。
+    """
+    path = args.get("file_path") if isinstance(args, dict) else None
+    if not isinstance(path, str) or not path:
+        return None
+    return os.path.normpath(path)
+
+
+def _tool_attributes(agent: Any, name: str) -> Dict[str, Any]:
+    attributes = {"agent.name": getattr(agent, "name", type(agent).__name__), "tool.name": name}
+    # `tool` で宣言したツールは、コストの分類と冪等性も記録する
+    spec = agent.tool_spec(name) if hasattr(agent, "tool_spec") else None
+    if spec is not None:
+        attributes["tool.cost"] = spec.cost
+        attributes["tool.idempotent"] = spec.idempotent
+    return attributes
+
+
+def _record_result(span: Span, result: Any):
+    """
+    ツールの結果の大きさと、エラー文字列が返された場合はその旨をスパンに記録する。
+    """
+    if isinstance(result, str):
+        span.set_attribute("tool.result_chars", len(result))
+        if result.startswith("Error"):
+            span.record_error(result.splitlines()[0])
+
+
+def create_tool_executor(kind: Optional[str] = None) -> ToolExecutor:
+    """
+    種類名から実行器を生成する。
+
+    Args:
+        kind (str, optional): "thread" / "asyncio" / "sequential"。省略時は環境変数 `AGENT_TOOL_EXECUTOR`（デフォルト "thread"）。
+
+    Returns:
+        ToolExecutor: 生成された実行器。
+    """
+    kind = (kind or os.getenv("AGENT_TOOL_EXECUTOR") or "thread").lower()
+    if kind == "thread":
+        return ThreadPoolToolExecutor()
+    if kind == "asyncio":
+        return AsyncioToolExecutor()
+    if kind == "sequential":
+        return ToolExecutor()
+    raise ValueError(f"Unknown tool executor: {kind}")
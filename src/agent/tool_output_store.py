@@ -0,0 +1,131 @@
+from pathlib import Path
+from typing import Optional
+import atexit
+import os
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+
+# 保存した出力の ID（ファイル名にそのまま使うため英数字とハイフンのみ）
+_OUTPUT_ID_PATTERN = re.compile(r"^[A-Za-z0-9-]+$")
+
+
+class ToolOutputStore:
+    """
+    ツールの実行結果の大きさを制限し、上限を超えた出力の全文をディスクに退避するストア。
+
+    ツールの結果はチャット履歴に残り、以降の全ての API 呼び出しで送信される。
+    `pytest -v` や `pip install` の出力をそのまま返すと、それだけで以降の呼び出しが数十 KB 重くなる。
+    上限を超えた結果は先頭と末尾だけを残し、全文は ID を付けて保存する。
+    モデルは `read_tool_output(output_id, offset, length)` ツールで続きを読める。
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_result_bytes: int = 8000):
+        """
+        Args:
+            directory (str, optional): 出力を保存するディレクトリ。省略時はプロセス終了時に削除される一時ディレクトリ。
+            max_result_bytes (int): モデルに返す結果の最大バイト数（UTF-8）。0 以下で制限しない。
+        """
+        self.max_result_bytes = max(0, max_result_bytes)
+        self._directory = Path(directory) if directory else None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ToolOutputStore":
+        """
+        環境変数から設定を読み込んで生成する。
+
+        - `AGENT_TOOL_RESULT_MAX_BYTES`: モデルに返す結果の最大バイト数（デフォルト 8000、0 で制限しない）
+        - `AGENT_TOOL_OUTPUT_DIR`: 全文の保存先（未設定の場合は一時ディレクトリ）
+        """
+        return cls(
+            directory=os.getenv("AGENT_TOOL_OUTPUT_DIR") or None,
+            max_result_bytes=int(os.getenv("AGENT_TOOL_RESULT_MAX_BYTES", "8000")),
+        )
+
+    @property
+    def directory(self) -> Path:
+        """
+        保存先のディレクトリ（初回の保存時に作成する）。
+        """
+        with self._lock:
+            if self._directory is None:
+                self._directory = Path(tempfile.mkdtemp(prefix="agent-tool-outputs-"))
+                atexit.register(shutil.rmtree, self._directory, ignore_errors=True)
+            self._directory.mkdir(parents=True, exist_ok=True)
+            return self._directory
+
+    def put(self, text: str) -> str:
+        """
+        出力の全文を保存し、その ID を返す。
+        """
+        output_id = f"out-{uuid.uuid4().hex[:12]}"
+        (self.directory / f"{output_id}.txt").write_bytes(text.encode("utf-8"))
+        return output_id
+
+    def get(self, output_id: str) -> Optional[str]:
+        """
+        保存した出力の全文を返す（不明な ID の場合は None）。
+        """
+        data = self._read_bytes(output_id)
+        return data.decode("utf-8", errors="replace") if data is not None else None
+
+    def limit(self, result: str) -> str:
+        """
+        結果が上限を超えている場合は全文を保存し、先頭と末尾だけを残した文字列を返す。
+        """
+        data = result.encode("utf-8")
+        if not self.max_result_bytes or len(data) <= self.max_result_bytes:
+            return result
+        output_id = self.put(result)
+        head_bytes = self.max_result_bytes // 2
+        tail_bytes = self.max_result_bytes - head_bytes
+        head = data[:head_bytes].decode("utf-8", errors="ignore")
+        tail = data[-tail_bytes:].decode("utf-8", errors="ignore")
+        omitted = len(data) - head_bytes - tail_bytes
+        return (
+            f"{head}\n"
+            f"... [truncated: showing first {head_bytes} and last {tail_bytes} of {len(data)} bytes, "
+            f"{omitted} bytes omitted. Read the rest with read_tool_output(\"{output_id}\", offset, length)] ...\n"
+            f"{tail}"
+        )
+
+    def read(self, output_id: str, offset: int = 0, length: int = 4000) -> str:
+        """
+        保存した出力の一部をバイト単位の位置で読み出す（`read_tool_output` ツールの本体）。
+        1回に読み出せるのは `max_result_bytes` バイトまで。
+        """
+        data = self._read_bytes(output_id)
+        if data is None:
+            return f"Error: Unknown tool output id '{output_id}'."
+        if offset < 0 or length <= 0:
+            return "Error: offset must be >= 0 and length must be > 0."
+        if self.max_result_bytes:
+            length = min(length, self.max_result_bytes)
+        end = min(offset + length, len(data))
+        chunk = data[offset:end].decode("utf-8", errors="ignore")
+        return f"[{output_id}: bytes {offset}-{end} of {len(data)}]\n{chunk}"
+
+    def _read_bytes(self, output_id: str) -> Optional[bytes]:
+        if not _OUTPUT_ID_PATTERN.match(output_id or ""):
+            return None
+        path = self.directory / f"{output_id}.txt"
+        return path.read_bytes() if path.exists() else None
+
+
+_shared_store: Optional[ToolOutputStore] = None
+_shared_lock = threading.Lock()
+
+
+def get_tool_output_store() -> ToolOutputStore:
+    """
+    プロセス全体で共有されるツール出力ストアを返す（初回呼び出し時に環境変数から生成）。
+    委任先のエージェントが保存した出力も、同じ ID で読み出せる。
+    """
+    global _shared_store
+    with _shared_lock:
+        if _shared_store is None:
+            _shared_store = ToolOutputStore.from_env()
+        return _shared_store
@@ -0,0 +1,117 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+import inspect
+import threading
+
+# ツールの実行コストの分類（スケジューラーやトレースが参照する）
+COST_LOCAL = "local"            # プロセス内で完結する（ファイルの読み書き、索引の検索など）
+COST_SUBPROCESS = "subprocess"  # サブプロセスやコマンドを実行する
+COST_LLM = "llm"                # LLM を呼び出す（他のエージェントへの委任を含む）
+
+# ネイティブな非同期版として扱うメソッド名の接尾辞（例: `delegate_task` に対する `delegate_task_async`）
+ASYNC_SUFFIX = "_async"
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    """
+    ツールのメタデータ。
+
+    - parallel_safe: 同じターン内の他のツールと並列実行しても安全か
+    - idempotent: 同じ引数で繰り返し呼んでも結果・副作用が変わらないか（リトライや結果の再利用をしてよい）
+    - cost: 実行コストの分類（`COST_LOCAL` / `COST_SUBPROCESS` / `COST_LLM`）
+    - async_name: ネイティブな非同期版のメソッド名（無い場合は None）
+    """
+    name: str
+    parallel_safe: bool = False
+    idempotent: bool = False
+    cost: str = COST_LOCAL
+    async_name: Optional[str] = None
+
+
+def tool(parallel_safe: bool = False, idempotent: bool = False, cost: str = COST_LOCAL) -> Callable[[Callable], Callable]:
+    """
+    エージェントのメソッドをツールとして宣言するデコレーター。
+    宣言したツールはクラスごとに `ToolRegistry` へ集められ、モデルへの公開と実行に使われる。
+    引数の説明はメソッドの docstring（Args）から生成されるため、docstring を丁寧に書くこと。
+    """
+    def decorate(func: Callable) -> Callable:
+        func.tool_spec = ToolSpec(func.__name__, parallel_safe, idempotent, cost)
+        # `parallel_safe` 属性だけを見る既存の実行器・テストとの互換のため
+        func.parallel_safe = parallel_safe
+        return func
+    return decorate
+
+
+def spec_of(func: Any) -> ToolSpec:
+    """
+    関数のツールのメタデータを返す。`tool` で宣言されていない関数は `parallel_safe` 属性だけを見る。
+    """
+    spec = getattr(func, "tool_spec", None)
+    if spec is not None:
+        return spec
+    return ToolSpec(getattr(func, "__name__", str(func)), parallel_safe=bool(getattr(func, "parallel_safe", False)))
+
+
+class ToolRegistry:
+    """
+    エージェントのクラスが `tool` で宣言したツールの一覧。クラスごとに1度だけ作り、プロセス内で共有する。
+    ツールの名前からメタデータを引くのは辞書の参照のみで、呼び出しのたびにクラスを調べ直さない。
+    """
+
+    def __init__(self, specs: List[ToolSpec]):
+        self._specs: Dict[str, ToolSpec] = {spec.name: spec for spec in specs}
+
+    @classmethod
+    def for_class(cls, agent_class: type) -> "ToolRegistry":
+        """
+        クラス（と、その基底クラス）で宣言されたツールのレジストリを返す。
+        サブクラスで宣言したものを先に、同じクラスの中では定義順に並べる。
+        """
+        with _registries_lock:
+            registry = _registries.get(agent_class)
+            if registry is None:
+                registry = cls(_collect_specs(agent_class))
+                _registries[agent_class] = registry
+            return registry
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._specs)
+
+    def get(self, name: str) -> Optional[ToolSpec]:
+        return self._specs.get(name)
+
+    def bind(self, instance: Any) -> List[Callable]:
+        """
+        インスタンスに束縛したツールのメソッドを、宣言の順に返す。
+        """
+        return [getattr(instance, name) for name in self._specs]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._specs
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+
+def _collect_specs(agent_class: type) -> List[ToolSpec]:
+    specs: List[ToolSpec] = []
+    seen = set()
+    for klass in agent_class.__mro__:
+        for name, member in vars(klass).items():
+            if name in seen:
+                continue
+            seen.add(name)
+            spec = getattr(member, "tool_spec", None)
+            if spec is None:
+                continue
+            async_variant = getattr(agent_class, name + ASYNC_SUFFIX, None)
+            if async_variant is not None and inspect.iscoroutinefunction(async_variant):
+                spec = ToolSpec(spec.name, spec.parallel_safe, spec.idempotent, spec.cost, name + ASYNC_SUFFIX)
+            specs.append(spec)
+    return specs
+
+
+_registries: Dict[type, ToolRegistry] = {}
+_registries_lock = threading.Lock()
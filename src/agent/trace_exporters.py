@@ -0,0 +1,136 @@
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List
+import json
+import threading
+
+try:
+    from .tracing import Span, STATUS_OK, STATUS_ERROR
+except ImportError:
+    from agent.tracing import Span, STATUS_OK, STATUS_ERROR
+
+# OTLP の SpanKind / StatusCode
+_OTLP_SPAN_KIND_INTERNAL = 1
+_OTLP_STATUS_CODES = {STATUS_OK: 1, STATUS_ERROR: 2}
+
+
+class SpanExporter(ABC):
+    """
+    終了したスパンを出力するエクスポーターの基底クラス。
+    """
+
+    @abstractmethod
+    def export(self, span: Span):
+        """
+        終了したスパンを1件出力する。
+
+        Args:
+            span (Span): 終了したスパン。
+        """
+        pass
+
+    def shutdown(self):
+        pass
+
+
+class InMemorySpanExporter(SpanExporter):
+    """
+    スパンをメモリ上のリストに保持するエクスポーター（テストや対話的な分析用）。
+    """
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+
+class _FileSpanExporter(SpanExporter):
+    """
+    スパンを1行1レコードでファイルに追記するエクスポーターの共通部分。
+    プロセスが途中で終了しても、それまでのスパンが残るよう1件ごとに書き出す。
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(self.to_record(span), ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def shutdown(self):
+        with self._lock:
+            self._file.close()
+
+    @abstractmethod
+    def to_record(self, span: Span) -> Dict[str, Any]:
+        """
+        スパンを1行分のレコード（JSON 化できる辞書）に変換する。
+        """
+        pass
+
+
+class JsonlSpanExporter(_FileSpanExporter):
+    """
+    スパンを `Span.to_dict` の形式で JSONL ファイルに追記するエクスポーター。
+    """
+
+    def to_record(self, span: Span) -> Dict[str, Any]:
+        return span.to_dict()
+
+
+class OtlpJsonSpanExporter(_FileSpanExporter):
+    """
+    スパンを OpenTelemetry の OTLP/JSON 形式 (ExportTraceServiceRequest) で1行ずつ追記するエクスポーター。
+    OpenTelemetry Collector の `otlpjsonfile` レシーバーなどで読み込み、Jaeger などに送れる。
+    """
+
+    def __init__(self, path: str, service_name: str = "agent-team"):
+        super().__init__(path)
+        self.service_name = service_name
+
+    def to_record(self, span: Span) -> Dict[str, Any]:
+        otlp_span: Dict[str, Any] = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": _OTLP_SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(span.start_time_ns),
+            "endTimeUnixNano": str(span.end_time_ns or span.start_time_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in span.attributes.items()],
+            "status": {"code": _OTLP_STATUS_CODES.get(span.status, 0)},
+        }
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        if span.error:
+            otlp_span["status"]["message"] = span.error
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{"scope": {"name": "agent"}, "spans": [otlp_span]}],
+            }]
+        }
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    """
+    属性値を OTLP の AnyValue に変換する（int64 は JSON では文字列で表す）。
+    """
+    if isinstance(value, bool):
+        any_value: Dict[str, Any] = {"boolValue": value}
+    elif isinstance(value, int):
+        any_value = {"intValue": str(value)}
+    elif isinstance(value, float):
+        any_value = {"doubleValue": value}
+    else:
+        any_value = {"stringValue": str(value)}
+    return {"key": key, "value": any_value}
@@ -0,0 +1,177 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import os
+import secrets
+import threading
+import time
+
+# 現在のスパン。asyncio のタスクと `asyncio.to_thread` には自動で引き継がれる。
+# スレッドプールに処理を渡す場合は `contextvars.copy_context().run` で引き継ぐこと。
+_current_span: ContextVar[Optional["Span"]] = ContextVar("agent_current_span", default=None)
+
+# スパンの状態
+STATUS_UNSET = "unset"
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+
+
+@dataclass
+class Span:
+    """
+    トレースの1区間（エージェントのターン、API 呼び出し、ツール実行など）。
+    同じリクエストから派生したスパンは同じ trace_id を持ち、parent_id で親子関係をたどれる。
+    """
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    start_time_ns: int = 0
+    end_time_ns: Optional[int] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: str = STATUS_UNSET
+    error: Optional[str] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        """
+        スパンの長さ（秒）。終了していない場合は None。
+        """
+        if self.end_time_ns is None:
+            return None
+        return (self.end_time_ns - self.start_time_ns) / 1e9
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add(self, key: str, value: float = 1):
+        """
+        数値の属性に加算する（トークン数やリトライ回数の集計用）。
+        """
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def record_error(self, error: Any):
+        """
+        スパンを失敗として記録する。
+        """
+        self.status = STATUS_ERROR
+        self.error = str(error)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time_ns / 1e9,
+            "duration": self.duration,
+            "status": self.status,
+            "error": self.error,
+            "attributes": dict(self.attributes),
+        }
+
+
+class Tracer:
+    """
+    ネストしたスパンを記録し、終了したスパンをエクスポーターへ渡すトレーサー。
+
+    親スパンは contextvars で暗黙に引き継ぐため、Manager のターンから委任された Coder のツール実行までが
+    1つのトレースとしてつながる。エクスポーターが無い場合もスパンは作られるが、どこにも出力されない。
+    """
+
+    def __init__(self, exporters: Optional[List[Any]] = None, clock: Callable[[], int] = time.time_ns):
+        """
+        Args:
+            exporters (list, optional): `export(span)` / `shutdown()` を持つエクスポーター。
+            clock (callable): 現在時刻（UNIX エポックからのナノ秒）を返す関数。テスト用に差し替え可能。
+        """
+        self.exporters = list(exporters or [])
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        """
+        環境変数からエクスポーターを設定したトレーサーを生成する。
+        `AGENT_TRACE_FILE` に JSONL 形式、`AGENT_TRACE_OTLP_FILE` に OpenTelemetry (OTLP/JSON) 形式で出力する。
+        """
+        try:
+            from .trace_exporters import JsonlSpanExporter, OtlpJsonSpanExporter
+        except ImportError:
+            from agent.trace_exporters import JsonlSpanExporter, OtlpJsonSpanExporter
+
+        exporters: List[Any] = []
+        if os.getenv("AGENT_TRACE_FILE"):
+            exporters.append(JsonlSpanExporter(os.environ["AGENT_TRACE_FILE"]))
+        if os.getenv("AGENT_TRACE_OTLP_FILE"):
+            exporters.append(OtlpJsonSpanExporter(os.environ["AGENT_TRACE_OTLP_FILE"]))
+        return cls(exporters)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """
+        `with tracer.span("tool.execute", **{"tool.name": name}) as span:` の形でスパンを記録する。
+        ブロック内で例外が発生した場合はスパンを失敗として記録し、例外はそのまま送出する。
+        """
+        parent = _current_span.get()
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent else secrets.token_hex(16),
+            span_id=secrets.token_hex(8),
+            parent_id=parent.span_id if parent else None,
+            start_time_ns=self._clock(),
+            attributes=attributes,
+        )
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_time_ns = self._clock()
+            if span.status == STATUS_UNSET:
+                span.status = STATUS_OK
+            self._export(span)
+
+    def current_span(self) -> Optional[Span]:
+        """
+        現在のコンテキストで開いているスパン（無い場合は None）。
+        """
+        return _current_span.get()
+
+    def add_exporter(self, exporter: Any):
+        with self._lock:
+            self.exporters.append(exporter)
+
+    def shutdown(self):
+        """
+        全てのエクスポーターを閉じる。
+        """
+        with self._lock:
+            exporters, self.exporters = self.exporters, []
+        for exporter in exporters:
+            exporter.shutdown()
+
+    def _export(self, span: Span):
+        with self._lock:
+            exporters = list(self.exporters)
+        for exporter in exporters:
+            exporter.export(span)
+
+
+_shared_tracer: Optional[Tracer] = None
+_shared_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """
+    プロセス全体で共有されるトレーサーを返す（初回呼び出し時に環境変数から生成）。
+    """
+    global _shared_tracer
+    with _shared_lock:
+        if _shared_tracer is None:
+            _shared_tracer = Tracer.from_env()
+        return _shared_tracer
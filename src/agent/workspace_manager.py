@@ -0,0 +1,314 @@
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# ワークスペースのキー（ディレクトリ名にそのまま使えるもの）
+_KEY_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+# Linux の FICLONE ioctl（ファイルの reflink コピー）
+_FICLONE = 0x40049409
+# テンプレートの仮想環境を置くディレクトリ名
+VENV_DIR = ".venv"
+# 最終使用時刻の記録と、作成途中のディレクトリの置き場所（ワークスペースとして扱わない）
+_META_DIR = ".meta"
+_TMP_PREFIX = ".tmp-"
+# 仮想環境の bin/ のうち、パスを書き換えるスクリプトの最大サイズ
+_RELOCATE_MAX_BYTES = 1024 * 1024
+
+COPY_AUTO = "auto"          # ファイルごとに reflink を試し、使えなければ通常のコピー
+COPY_HARDLINK = "hardlink"  # ハードリンク（最速。テンプレートのファイルをその場で書き換えないこと）
+COPY_COPY = "copy"          # 通常のコピー
+
+
+class WorkspaceManager:
+    """
+    セッションごとの sandbox ディレクトリ（ワークスペース）を払い出すマネージャー。
+
+    ワークスペースは `root/<キー>` に作成し、テンプレート（仮想環境や共通の依存ライブラリを入れたディレクトリ）があれば
+    その内容をコピーして始める。コピーはデフォルトで reflink（ファイルシステムのコピーオンライト）を使い、
+    使えない場合は通常のコピーになる。`copy_mode="hardlink"` ではハードリンクで作るため最も速いが、
+    テンプレートのファイルをその場で書き換えると他のワークスペースにも波及する（`write_to_sandbox` はリンクを切ってから書く）。
+
+    古いワークスペースは、最後に使われた順 (LRU) に `retention` 個を超えた分を削除する。
+    使用中（`lease` の中）のもの、および `min_idle_seconds` 以内に使われたもの（別プロセスが使っている可能性がある）は削除しない。
+    """
+
+    def __init__(self, root: str, template: Optional[str] = None, retention: int = 20,
+                 min_idle_seconds: float = 600, copy_mode: str = COPY_AUTO, clock: Callable[[], float] = time.time):
+        """
+        Args:
+            root (str): ワークスペースを作成するディレクトリ。
+            template (str, optional): 新しいワークスペースの初期内容となるディレクトリ。
+            retention (int): 残しておくワークスペースの数。0 以下で削除しない。
+            min_idle_seconds (float): この秒数以内に使われたワークスペースは削除しない。
+            copy_mode (str): テンプレートのコピー方法（`auto` / `hardlink` / `copy`）。
+            clock (callable): 最終使用時刻に使う時計。テスト用に差し替え可能。
+        """
+        if copy_mode not in (COPY_AUTO, COPY_HARDLINK, COPY_COPY):
+            raise ValueError(f"Unknown workspace copy mode: {copy_mode}")
+        self.root = Path(root)
+        self.template = Path(template) if template else None
+        self.retention = max(0, retention)
+        self.min_idle_seconds = min_idle_seconds
+        self.copy_mode = copy_mode
+        self._clock = clock
+        self._leases: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._created = 0
+        self._reused = 0
+        self._removed = 0
+        self._create_seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> Optional["WorkspaceManager"]:
+        """
+        環境変数から設定を読み込んで生成する。`AGENT_WORKSPACE_ROOT` が未設定の場合は None。
+
+        - `AGENT_WORKSPACE_ROOT`: ワークスペースを作成するディレクトリ
+        - `AGENT_WORKSPACE_TEMPLATE`: テンプレートのディレクトリ（`create_template` で作成できる）
+        - `AGENT_WORKSPACE_RETENTION`: 残しておくワークスペースの数（デフォルト 20）
+        - `AGENT_WORKSPACE_MIN_IDLE_SECONDS`: 削除の対象にしない、直近の使用からの秒数（デフォルト 600）
+        - `AGENT_WORKSPACE_COPY`: テンプレートのコピー方法（`auto` / `hardlink` / `copy`、デフォルト auto）
+        """
+        root = os.getenv("AGENT_WORKSPACE_ROOT")
+        if not root:
+            return None
+        return cls(
+            root,
+            template=os.getenv("AGENT_WORKSPACE_TEMPLATE") or None,
+            retention=int(os.getenv("AGENT_WORKSPACE_RETENTION", "20")),
+            min_idle_seconds=float(os.getenv("AGENT_WORKSPACE_MIN_IDLE_SECONDS", "600")),
+            copy_mode=os.getenv("AGENT_WORKSPACE_COPY", COPY_AUTO),
+        )
+
+    def path(self, key: str) -> Path:
+        """
+        キーに対応するワークスペースのパスを返す。存在しない場合はテンプレートから作成する。
+        """
+        name = _dir_name(key)
+        workspace = self.root / name
+        if workspace.is_dir():
+            with self._lock:
+                self._reused += 1
+            self._touch(name)
+        else:
+            self._create(name, workspace)
+            self._touch(name)
+            self.prune()
+        return workspace
+
+    @contextmanager
+    def lease(self, key: str) -> Iterator[Path]:
+        """
+        ブロック内でワークスペースを使用中にする（使用中のワークスペースは削除しない）。
+        """
+        name = _dir_name(key)
+        with self._lock:
+            self._leases[name] = self._leases.get(name, 0) + 1
+        try:
+            yield self.path(key)
+        finally:
+            with self._lock:
+                self._leases[name] -= 1
+                if not self._leases[name]:
+                    del self._leases[name]
+            self._touch(name)
+
+    def workspaces(self) -> List[str]:
+        """
+        既存のワークスペースのディレクトリ名を、最後に使われた順（古い順）に返す。
+        """
+        if not self.root.is_dir():
+            return []
+        names = [p.name for p in self.root.iterdir()
+                 if p.is_dir() and p.name != _META_DIR and not p.name.startswith(_TMP_PREFIX)]
+        return sorted(names, key=self._last_used)
+
+    def prune(self) -> List[str]:
+        """
+        保持数を超えた古いワークスペースを削除し、削除したディレクトリ名を返す。
+        """
+        if not self.retention:
+            return []
+        names = self.workspaces()
+        now = self._clock()
+        removed = []
+        for name in names[:max(0, len(names) - self.retention)]:
+            with self._lock:
+                in_use = name in self._leases
+            if in_use or now - self._last_used(name) < self.min_idle_seconds:
+                continue
+            self.remove(name)
+            removed.append(name)
+        return removed
+
+    def remove(self, key: str):
+        name = _dir_name(key)
+        shutil.rmtree(self.root / name, ignore_errors=True)
+        (self.root / _META_DIR / name).unlink(missing_ok=True)
+        with self._lock:
+            self._removed += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "created": self._created,
+                "reused": self._reused,
+                "removed": self._removed,
+                "create_seconds": self._create_seconds,
+            }
+
+    def _create(self, name: str, workspace: Path):
+        """
+        一時ディレクトリに作成してから名前を変えることで、作成途中のワークスペースを他から見せない。
+        """
+        started_at = time.perf_counter()
+        self.root.mkdir(parents=True, exist_ok=True)
+        staging = self.root / f"{_TMP_PREFIX}{uuid.uuid4().hex[:8]}"
+        if self.template is not None and self.template.is_dir():
+            copy_tree(self.template, staging, self.copy_mode)
+            _relocate_virtualenv(staging / VENV_DIR, self.template / VENV_DIR, workspace / VENV_DIR)
+        else:
+            staging.mkdir()
+        try:
+            staging.rename(workspace)
+        except OSError:
+            # 同時に作成した別のスレッド・プロセスのものを使う
+            shutil.rmtree(staging, ignore_errors=True)
+            if not workspace.is_dir():
+                raise
+        with self._lock:
+            self._created += 1
+            self._create_seconds += time.perf_counter() - started_at
+
+    def _touch(self, name: str):
+        marker = self.root / _META_DIR / name
+        marker.parent.mkdir(parents=True, exist_ok=True)
+        marker.touch()
+        now = self._clock()
+        os.utime(marker, (now, now))
+
+    def _last_used(self, name: str) -> float:
+        try:
+            return (self.root / _META_DIR / name).stat().st_mtime
+        except FileNotFoundError:
+            return 0.0
+
+
+def copy_tree(source: Path, destination: Path, mode: str = COPY_AUTO):
+    """
+    ディレクトリを丸ごとコピーする（シンボリックリンクはリンクのまま）。
+    """
+    reflink_supported = [mode == COPY_AUTO and fcntl is not None]
+
+    def copy_file(src: str, dst: str):
+        if mode == COPY_HARDLINK:
+            try:
+                os.link(src, dst)
+                return
+            except OSError:
+                pass  # 別のファイルシステムなど
+        elif reflink_supported[0]:
+            try:
+                _reflink(src, dst)
+                return
+            except OSError:
+                # 対応していないファイルシステムでは、以降は試さない
+                reflink_supported[0] = False
+        shutil.copy2(src, dst)
+
+    shutil.copytree(source, destination, symlinks=True, copy_function=copy_file)
+
+
+def create_template(directory: str, packages: Sequence[str] = (), with_pip: bool = True,
+                    python: Optional[str] = None) -> Path:
+    """
+    ワークスペースのテンプレートを作成する。`directory/.venv` に仮想環境を作り、packages をインストールする。
+
+    例: `python -c "from agent.workspace_manager import create_template; create_template('.cache/template', ['pytest'])"`
+    """
+    target = Path(directory)
+    target.mkdir(parents=True, exist_ok=True)
+    venv = target / VENV_DIR
+    command = [python or sys.executable, "-m", "venv", str(venv)]
+    if not with_pip:
+        command.append("--without-pip")
+    subprocess.run(command, check=True)
+    if packages:
+        subprocess.run([str(venv / "bin" / "python"), "-m", "pip", "install", "--quiet", *packages], check=True)
+    return target
+
+
+def workspace_env(workspace: Path) -> Dict[str, str]:
+    """
+    ワークスペースに仮想環境がある場合に、コマンドをその仮想環境で動かすための環境変数を返す。
+    """
+    venv = Path(workspace).resolve() / VENV_DIR
+    if not (venv / "bin").is_dir():
+        return {}
+    return {"VIRTUAL_ENV": str(venv), "PATH": f"{venv / 'bin'}{os.pathsep}{os.environ.get('PATH', '')}"}
+
+
+def _reflink(src: str, dst: str):
+    with open(src, "rb") as source, open(dst, "wb") as destination:
+        fcntl.ioctl(destination.fileno(), _FICLONE, source.fileno())
+    shutil.copystat(src, dst)
+
+
+def _relocate_virtualenv(venv: Path, old: Path, new: Path):
+    """
+    コピーした仮想環境の bin/ のスクリプト（pip のシェバンや activate）に残るテンプレートのパスを書き換える。
+    書き換えないと、コピー先の `pip install` がテンプレートの仮想環境にインストールしてしまう。
+    """
+    bin_dir = venv / "bin"
+    if not bin_dir.is_dir():
+        return
+    old_path, new_path = str(old.resolve()).encode(), str(new.resolve()).encode()
+    for script in bin_dir.iterdir():
+        if script.is_symlink() or not script.is_file() or script.stat().st_size > _RELOCATE_MAX_BYTES:
+            continue
+        content = script.read_bytes()
+        if old_path not in content:
+            continue
+        mode = script.stat().st_mode
+        # ハードリンクやコピーオンライトの元を書き換えないよう、新しいファイルとして作り直す
+        script.unlink()
+        script.write_bytes(content.replace(old_path, new_path))
+        script.chmod(mode)
+
+
+def _dir_name(key: str) -> str:
+    if _KEY_PATTERN.match(key) and not key.startswith("."):
+        return key
+    return "ws-" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+_shared_manager: Optional[WorkspaceManager] = None
+_shared_loaded = False
+_shared_lock = threading.Lock()
+
+
+def get_workspace_manager() -> Optional[WorkspaceManager]:
+    """
+    プロセス全体で共有されるワークスペースマネージャーを返す（`AGENT_WORKSPACE_ROOT` が未設定の場合は None）。
+    使用中のワークスペースを削除しないよう、同じプロセスの Coder は同じマネージャーを使う。
+    """
+    global _shared_manager, _shared_loaded
+    with _shared_lock:
+        if not _shared_loaded:
+            _shared_manager = WorkspaceManager.from_env()
+            _shared_loaded = True
+        return _shared_manager
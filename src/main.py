@@ -1,55 +1,249 @@
-import typer
+import time
+
+# `--startup-profile` でインポートにかかった時間を示すため、他のモジュールより先に時刻を取る
+_IMPORT_STARTED_AT = time.perf_counter()
+
+import argparse
+import os
+import threading
+from functools import partial
+from typing import Dict, Optional, Tuple
 from rich.console import Console
+from rich.markup import escape
+from agent.llm_backend import LLMBackend
 from agent.manager import Manager
+from agent.metrics import get_metrics
+from agent.streaming import (
+    StreamCallback, StreamEvent, EVENT_START, EVENT_END, EVENT_TEXT, EVENT_TOOL_CALL, EVENT_TOOL_OUTPUT,
+)
+from agent.token_ledger import TokenLedger, get_token_ledger
 
-app = typer.Typer()
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED_AT
 console = Console()
 
-@app.command()
-def chat():
+# エラー応答の後、リクエストの連打を防ぐために待機する秒数
+ERROR_COOLDOWN_SECONDS = 2
+# ツール呼び出しの表示で引数を切り詰める文字数
+TOOL_CALL_PREVIEW_CHARS = 100
+
+
+def build_team(backend: Optional[LLMBackend] = None) -> Manager:
+    """
+    Manager / Architect / Coder からなるチームを組み立て、Manager を返す。
+    `chat` コマンドとベンチマーク (`benchmarks/run.py`) の両方から使う。
+    Architect と Coder は最初に委任された時点で生成する（一度も委任しないセッションではモデルも sandbox も作らない）。
+
+    Args:
+        backend (LLMBackend, optional): チーム全員で共有する LLM バックエンド。省略時は各エージェントが `get_backend()` で用意する。
+    """
+    from agent import Manager, Architect, Coder
+    manager = Manager(backend=backend)
+
+    manager.assign_agent("Architect", factory=partial(Architect, backend=backend))
+    # 独立した実装タスクを並列に進められるよう、Coder は必要に応じて追加生成する
+    manager.assign_agent("Coder", factory=partial(Coder, backend=backend), max_instances=3)
+    return manager
+
+
+def handle_input(manager: Manager, user_input: str, on_event: Optional[StreamCallback] = None) -> str:
+    """
+    ユーザーの入力1件を Manager に渡して応答を返す。
+    on_event を指定した場合は、Manager と委任先のエージェントの応答をストリーミングで受け取る。
+    """
+    response = manager.send_message(user_input, on_event=on_event)
+
+    # エラー応答だった場合、リクエストの連打を防ぐために少し待機する
+    if "エラーが発生しました" in response:
+        with get_metrics().timer("session.cooldown"):
+            time.sleep(ERROR_COOLDOWN_SECONDS)
+    return response
+
+
+class LiveRenderer:
+    """
+    Manager と委任先のエージェントのストリーミングイベントを、届いた順にコンソールへ表示する。
+    委任先の出力は委任の深さに応じてインデントする。並列に動くエージェントから同時に呼ばれるためロックで保護する。
+    """
+
+    def __init__(self, console: Console):
+        self.console = console
+        self._lock = threading.Lock()
+        # 直前にテキストを表示したエージェントと深さ（行の途中であることを表す）
+        self._speaker: Optional[Tuple[str, int]] = None
+        self._streamed = ""
+
+    def __call__(self, event: StreamEvent):
+        with self._lock:
+            indent = "  " * event.depth
+            if event.kind == EVENT_TEXT:
+                if self._speaker != (event.agent, event.depth):
+                    self._end_line()
+                    self.console.print(f"{indent}[bold blue]{escape(event.agent)}:[/bold blue] ", end="")
+                    self._speaker = (event.agent, event.depth)
+                self.console.print(event.text.replace("\n", "\n" + indent), end="", markup=False, highlight=False)
+                if event.depth == 0:
+                    self._streamed += event.text
+            elif event.kind == EVENT_TOOL_CALL:
+                self._end_line()
+                call = event.text if len(event.text) <= TOOL_CALL_PREVIEW_CHARS else event.text[:TOOL_CALL_PREVIEW_CHARS] + "…"
+                self.console.print(f"{indent}[dim]{escape(event.agent)} → {escape(call)}[/dim]", highlight=False)
+            elif event.kind == EVENT_TOOL_OUTPUT:
+                # 実行中のコマンドの出力（断片の区切りは行の区切りとは限らない）
+                self._end_line()
+                for line in event.text.rstrip("\n").split("\n"):
+                    self.console.print(f"{indent}[dim]│ {escape(line)}[/dim]", highlight=False)
+            elif event.kind in (EVENT_START, EVENT_END) and event.depth > 0:
+                self._end_line()
+                state = "started" if event.kind == EVENT_START else "finished"
+                self.console.print(f"{indent}[dim]↳ {escape(event.agent)} {state}[/dim]")
+
+    def finish(self, response: str) -> str:
+        """
+        1件の入力の表示を終え、最終応答のうちまだ表示していない部分（警告やエラーなど）を返す。
+        """
+        with self._lock:
+            self._end_line()
+            streamed, self._streamed = self._streamed, ""
+        if streamed and response.startswith(streamed):
+            return response[len(streamed):].strip()
+        return response
+
+    def _end_line(self):
+        if self._speaker is not None:
+            self.console.print()
+            self._speaker = None
+
+
+def streaming_enabled() -> bool:
     """
-    Start a chat session with the Manager Agent.
-    Try asking: "ログイン機能を実装したい"
-    Type 'exit' or 'quit' to end the session.
+    応答をストリーミングで表示するかどうか（`AGENT_STREAM=0` で無効）。
+    """
+    return os.getenv("AGENT_STREAM", "1") != "0"
+
+
+def format_usage(ledger: TokenLedger) -> str:
+    """
+    現在のセッションとプロセス全体のトークン使用量を1行にまとめる。
+    """
+    usage = ledger.usage()
+    session, process = usage["session"], usage["process"]
+    line = f"tokens: session {session['total_tokens']:,} ({session['calls']} calls) / process {process['total_tokens']:,}"
+    limit = ledger.session_hard_limit or ledger.session_soft_limit
+    if limit:
+        line += f" / session budget {limit:,}"
+    return line
+
+
+def print_usage_table(ledger: TokenLedger):
+    """
+    エージェント・モデルごとのトークン使用量を表で表示する。
+    """
+    # 表の描画は `usage` コマンドでしか使わないため、起動を軽くするためにここでインポートする
+    from rich.table import Table
+
+    snapshot = ledger.snapshot()
+    table = Table(title="Token usage")
+    for column in ["scope", "name", "calls", "prompt", "candidates", "total"]:
+        table.add_column(column, justify="left" if column in ("scope", "name") else "right")
+    for scope in ["agents", "models"]:
+        for name, usage in snapshot[scope].items():
+            table.add_row(scope, name, str(usage["calls"]), f"{usage['prompt_tokens']:,}",
+                          f"{usage['candidates_tokens']:,}", f"{usage['total_tokens']:,}")
+    process = snapshot["process"]
+    table.add_row("process", "-", str(process["calls"]), f"{process['prompt_tokens']:,}",
+                  f"{process['candidates_tokens']:,}", f"{process['total_tokens']:,}")
+    console.print(table)
+
+
+def format_startup_profile(phases: Dict[str, float], manager: Manager) -> str:
+    """
+    起動の各段階にかかった時間と、まだ生成していない（遅延生成の）エージェントを1行にまとめる。
+    """
+    parts = [f"{name} {seconds:.3f}s" for name, seconds in phases.items()]
+    line = f"startup: {' / '.join(parts)} / total {sum(phases.values()):.3f}s"
+    lazy = [name for name, agent in manager.sub_agents.items() if agent is None]
+    if lazy:
+        line += f" (not yet created: {', '.join(lazy)})"
+    return line
+
+
+def chat(startup_profile: bool = False):
+    """
+    Manager とのチャットセッションを開始する。
+
+    Args:
+        startup_profile (bool): インポート・LLM バックエンドの準備・チームの組み立てにかかった時間を表示する。
     """
     console.print("[bold green]GeminiCLI Agent Team Started![/bold green]")
-    console.print("Type 'exit' or 'quit' to end the session.")
+    console.print("Type 'usage' to show token usage, 'exit' or 'quit' to end the session.")
 
     try:
-        from agent import Manager, Architect, Coder
-        manager = Manager()
-        architect = Architect()
-        coder = Coder()
-        
-        manager.assign_agent("Architect", architect)
-        manager.assign_agent("Coder", coder)
-        
-        while True:
-            try:
-                # 入力待ち。EOF (Ctrl+D) や Abort (Ctrl+C) を明示的にキャッチする
-                user_input = typer.prompt("You", default=None, show_default=False)
-            except (EOFError, typer.Abort):
-                console.print("\n[bold green]Goodbye![/bold green]")
-                break
-            
-            # 入力が None または空文字だけの場合はスキップ
-            if not user_input or not user_input.strip():
-                continue
-
-            if user_input.lower() in ["exit", "quit"]:
-                console.print("[bold green]Goodbye![/bold green]")
-                break
-            
-            response = manager.send_message(user_input)
-            console.print(f"[bold blue]Manager:[/bold blue] {response}")
+        metrics = get_metrics()
+        metrics.add_time("startup.imports", IMPORT_SECONDS)
+        phases = {"imports": IMPORT_SECONDS}
+        started_at = time.perf_counter()
+        with metrics.timer("startup.backend"):
+            # LLM SDK のインポートと初期化（Gemini の場合）。作ったバックエンドをチーム全員で使う
+            from agent.llm_backend import get_backend
+            backend = get_backend()
+        phases["backend"] = time.perf_counter() - started_at
+        started_at = time.perf_counter()
+        with metrics.timer("startup.team"):
+            manager = build_team(backend)
+        phases["team"] = time.perf_counter() - started_at
+        if startup_profile:
+            console.print(f"[dim]{format_startup_profile(phases, manager)}[/dim]")
 
-            # エラー応答だった場合、リクエストの連打を防ぐために少し待機する
-            if "エラーが発生しました" in response:
-                import time
-                time.sleep(2)
+        ledger = get_token_ledger()
+        # このチャットセッション内の消費量をセッション予算の対象として集計する
+        with ledger.session():
+            _chat_loop(manager, ledger)
             
     except Exception as e:
         console.print(f"[bold red]Critical Error:[/bold red] {e}")
 
+
+def _chat_loop(manager: Manager, ledger: TokenLedger):
+    renderer = LiveRenderer(console) if streaming_enabled() else None
+    while True:
+        try:
+            # 入力待ち。EOF (Ctrl+D) や中断 (Ctrl+C) を明示的にキャッチする
+            user_input = console.input("You: ")
+        except (EOFError, KeyboardInterrupt):
+            console.print("\n[bold green]Goodbye![/bold green]")
+            break
+        
+        # 入力が空文字だけの場合はスキップ
+        if not user_input or not user_input.strip():
+            continue
+
+        if user_input.lower() in ["exit", "quit"]:
+            console.print("[bold green]Goodbye![/bold green]")
+            break
+
+        if user_input.lower() == "usage":
+            print_usage_table(ledger)
+            continue
+        
+        response = handle_input(manager, user_input, on_event=renderer)
+        # ストリーミングで表示済みの部分は繰り返さない
+        remaining = renderer.finish(response) if renderer else response
+        if remaining:
+            console.print(f"[bold blue]Manager:[/bold blue] {remaining}")
+        console.print(f"[dim]{format_usage(ledger)}[/dim]")
+
+
+def main(argv=None):
+    # typer は click 8.3 と組み合わせるとオプションを解釈できず、インポートにも 0.2 秒近くかかるため argparse を使う
+    parser = argparse.ArgumentParser(
+        description="Start a chat session with the Manager Agent. Try asking: \"ログイン機能を実装したい\". "
+                    "Type 'usage' to show token usage, 'exit' or 'quit' to end the session.")
+    parser.add_argument("command", nargs="?", default="chat", choices=["chat"], help="実行するコマンド（省略時は chat）")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="起動時のインポートと初期化にかかった時間を表示する")
+    args = parser.parse_args(argv)
+    chat(startup_profile=args.startup_profile)
+
+
 if __name__ == "__main__":
-    app()
+    main()
@@ -0,0 +1,25 @@
+import pytest
+
+
+class FakeClock:
+    """
+    テスト用の時計。`sleep` / `advance` で時間が進み、`sleep` した秒数は `slept` に記録する。
+    """
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.advance(seconds)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
@@ -1,7 +1,13 @@
 import pytest
 import os
-from unittest.mock import MagicMock, patch
-from agent.agent import Agent
+import asyncio
+from unittest.mock import MagicMock, AsyncMock, patch
+from agent.agent import Agent, run_sync
+from agent.metrics import Metrics
+from agent.rate_limiter import RateLimiter
+from agent.token_ledger import TokenLedger
+from agent.tracing import Tracer
+from agent.trace_exporters import InMemorySpanExporter
 
 # 抽象クラスAgentをテストするための具象クラス
 class ConcreteAgent(Agent):
@@ -36,3 +42,421 @@ def test_agent_send_message(agent, mock_genai):
     
     assert response == "Hello from Gemini"
     mock_genai.send_message.assert_called_with("Hello")
+
+def test_agent_send_message_does_not_sleep_without_tool_calls(agent, mock_genai):
+    mock_response = MagicMock()
+    mock_response.text = "Done"
+    mock_response.parts = []
+    mock_genai.send_message.return_value = mock_response
+
+    with patch('time.sleep') as mock_sleep:
+        assert agent.send_message("Hello") == "Done"
+
+    mock_sleep.assert_not_called()
+
+def test_agent_call_api_penalizes_rate_limiter_on_429(agent, mock_genai):
+    mock_response = MagicMock()
+    mock_genai.send_message.side_effect = [
+        Exception("429 Resource has been exhausted (e.g. check quota). Please retry in 7s."),
+        mock_response,
+    ]
+    agent.rate_limiter = MagicMock(spec=RateLimiter)
+    agent.rate_limiter.acquire_async = AsyncMock(return_value=0)
+
+    assert agent._call_api("Hello") is mock_response
+
+    agent.rate_limiter.penalize.assert_called_once_with(agent.model_name, 7.0)
+    assert agent.rate_limiter.acquire_async.await_count == 2
+
+def test_agent_send_message_runs_tool_calls_in_order(agent, mock_genai):
+    def make_call(name, args):
+        part = MagicMock()
+        part.function_call.name = name
+        part.function_call.args = args
+        return part
+
+    tool_response = MagicMock()
+    tool_response.parts = [make_call("first", {"n": 1}), make_call("second", {"n": 2})]
+    final_response = MagicMock()
+    final_response.text = "Done"
+    final_response.parts = []
+    mock_genai.send_message.side_effect = [tool_response, final_response]
+
+    assert agent.send_message("Hello") == "Done"
+
+    sent_results = mock_genai.send_message.call_args_list[1][0][0]
+    assert [r["function_response"]["name"] for r in sent_results] == ["first", "second"]
+    assert sent_results[0]["function_response"]["response"]["result"] == "Executed first with {'n': 1}"
+
+def test_agent_send_message_records_metrics(agent, mock_genai):
+    tool_part = MagicMock()
+    tool_part.function_call.name = "echo"
+    tool_part.function_call.args = {}
+    tool_response = MagicMock()
+    tool_response.parts = [tool_part]
+    tool_response.usage_metadata.total_token_count = 10
+    final_response = MagicMock()
+    final_response.text = "Done"
+    final_response.parts = []
+    final_response.usage_metadata.total_token_count = 5
+    mock_genai.send_message.side_effect = [tool_response, final_response]
+    agent.metrics = Metrics()
+
+    agent.send_message("Hello")
+
+    snapshot = agent.metrics.snapshot()
+    assert snapshot["counters"] == {"agent.turns": 1, "agent.tool_iterations": 1, "api.calls": 2, "api.tokens": 15}
+    assert snapshot["timers"]["api.request"]["count"] == 2
+    assert snapshot["timers"]["agent.tools"]["count"] == 1
+
+def test_agent_send_message_records_spans(agent, mock_genai):
+    tool_part = MagicMock()
+    tool_part.function_call.name = "echo"
+    tool_part.function_call.args = {}
+    tool_response = MagicMock()
+    tool_response.parts = [tool_part]
+    tool_response.usage_metadata.prompt_token_count = 7
+    tool_response.usage_metadata.candidates_token_count = 3
+    tool_response.usage_metadata.total_token_count = 10
+    final_response = MagicMock()
+    final_response.text = "Done"
+    final_response.parts = []
+    final_response.usage_metadata.total_token_count = 5
+    mock_genai.send_message.side_effect = [tool_response, final_response]
+    exporter = InMemorySpanExporter()
+    agent.tracer = Tracer([exporter])
+    agent.tool_executor.run = lambda owner, calls: [owner.execute_tool(name, args) for name, args in calls]
+
+    agent.send_message("Hello")
+
+    spans = {s.name: s for s in exporter.spans}
+    turn = spans["agent.send_message"]
+    assert [s.name for s in exporter.spans].count("llm.call") == 2
+    assert spans["llm.call"].parent_id == turn.span_id
+    assert spans["llm.attempt"].parent_id == spans["llm.call"].span_id
+    assert turn.attributes["agent.tool_iterations"] == 1
+    assert turn.attributes["llm.calls"] == 2
+    assert turn.attributes["llm.total_tokens"] == 15
+    assert turn.attributes["llm.retries"] == 0
+    first_call = next(s for s in exporter.spans if s.name == "llm.call")
+    assert first_call.attributes["llm.prompt_tokens"] == 7
+
+def test_agent_call_api_span_counts_retries(agent, mock_genai):
+    mock_genai.send_message.side_effect = [Exception("429 quota exceeded. Please retry in 1s."), MagicMock()]
+    agent.rate_limiter = MagicMock(spec=RateLimiter)
+    agent.rate_limiter.acquire_async = AsyncMock(return_value=0)
+    exporter = InMemorySpanExporter()
+    agent.tracer = Tracer([exporter])
+
+    agent._call_api("Hello")
+
+    attempts = [s for s in exporter.spans if s.name == "llm.attempt"]
+    assert [s.status for s in attempts] == ["error", "ok"]
+    assert exporter.spans[-1].name == "llm.call"
+    assert exporter.spans[-1].attributes["llm.retries"] == 1
+
+def make_tool_response(total_tokens):
+    tool_part = MagicMock()
+    tool_part.function_call.name = "echo"
+    tool_part.function_call.args = {}
+    response = MagicMock()
+    response.parts = [tool_part]
+    response.text = ""
+    response.usage_metadata.prompt_token_count = total_tokens
+    response.usage_metadata.candidates_token_count = 0
+    response.usage_metadata.total_token_count = total_tokens
+    return response
+
+def test_agent_hard_token_budget_stops_calls(agent, mock_genai):
+    agent.token_ledger = TokenLedger(session_hard_limit=100)
+    with agent.token_ledger.session("s1"):
+        agent.token_ledger.record("Other", agent.model_name, total_tokens=100)
+        response = agent.send_message("Hello")
+
+    assert "Token budget exceeded" in response
+    mock_genai.send_message.assert_not_called()
+
+def test_agent_soft_token_budget_switches_model_and_skips_iterations(agent, mock_genai):
+    agent.token_ledger = TokenLedger(session_soft_limit=100, fallback_model="gemini-cheap", soft_extra_iterations=1)
+    agent.tool_executor.run = lambda owner, calls: [owner.execute_tool(name, args) for name, args in calls]
+    mock_genai.send_message.side_effect = [make_tool_response(150), make_tool_response(10), make_tool_response(10)]
+
+    with patch('google.generativeai.GenerativeModel') as MockModel, agent.token_ledger.session("s1"):
+        fallback_chat = MockModel.return_value.start_chat.return_value
+        fallback_chat.send_message.side_effect = [make_tool_response(10)]
+        response = agent.send_message("Hello")
+
+    assert "Token budget soft limit reached" in response
+    # 1回目の呼び出しでソフトリミットを超え、2回目以降は安価なモデルで1反復だけ続ける
+    assert mock_genai.send_message.call_count == 1
+    assert fallback_chat.send_message.call_count == 1
+    assert agent.model_name == "gemini-cheap"
+    assert MockModel.call_args.kwargs["model_name"] == "gemini-cheap"
+    usage = agent.token_ledger.snapshot()
+    assert usage["models"]["gemini-cheap"]["total_tokens"] == 10
+    assert usage["agents"]["TestBot"]["calls"] == 2
+
+def test_agent_send_message_async_uses_async_sdk(agent, mock_genai):
+    mock_response = MagicMock()
+    mock_response.text = "Hello async"
+    mock_response.parts = []
+    mock_genai.send_message_async = AsyncMock(return_value=mock_response)
+
+    response = asyncio.run(agent.send_message_async("Hello"))
+
+    assert response == "Hello async"
+    mock_genai.send_message_async.assert_awaited_once_with("Hello")
+    mock_genai.send_message.assert_not_called()
+
+def test_agent_execute_tool_async_defaults_to_execute_tool(agent):
+    result = asyncio.run(agent.execute_tool_async("echo", {"x": 1}))
+
+    assert result == "Executed echo with {'x': 1}"
+
+def test_run_sync_inside_running_loop():
+    async def inner():
+        return 42
+
+    async def outer():
+        # イベントループ実行中のスレッドからでも同期ラッパーを呼べる
+        return run_sync(inner())
+
+    assert run_sync(inner()) == 42
+    assert asyncio.run(outer()) == 42
+
+def test_agent_response_cache_hit_skips_api(mock_genai):
+    from agent.response_cache import ResponseCache
+    cache = ResponseCache(":memory:")
+    mock_response = MagicMock()
+    mock_response.text = "Cached answer"
+    text_part = MagicMock()
+    text_part.function_call = None
+    text_part.text = "Cached answer"
+    mock_response.parts = [text_part]
+    mock_genai.send_message.return_value = mock_response
+
+    with patch.dict(os.environ, {"GEMINI_API_KEY": "dummy"}):
+        first = ConcreteAgent("TestBot", "Tester", "Just testing", response_cache=cache)
+        second = ConcreteAgent("TestBot", "Tester", "Just testing", response_cache=cache)
+
+    assert first.send_message("Hello") == "Cached answer"
+    mock_genai.send_message.reset_mock()
+
+    assert second.send_message("Hello") == "Cached answer"
+    mock_genai.send_message.assert_not_called()
+    assert cache.stats()["hits"] == 1
+    # API を呼ばなくても会話履歴は進める
+    assert second.chat_session.history[-1]["role"] == "model"
+
+def test_agent_compacts_history_before_api_call(agent, mock_genai):
+    from agent.conversation_memory import ConversationMemory, SUMMARY_HEADER
+
+    turns = [[{"role": "user", "parts": [{"text": f"質問 {i}" + "。" * 100}]},
+              {"role": "model", "parts": [{"text": f"回答 {i}"}]}] for i in range(20)]
+    mock_genai.history = [content for turn in turns for content in turn]
+    sent_history = []
+    mock_response = MagicMock()
+    mock_response.text = "Done"
+    mock_response.parts = []
+    mock_genai.send_message.side_effect = lambda content: sent_history.append(list(mock_genai.history)) or mock_response
+    agent.memory = ConversationMemory(token_budget=500)
+    agent.metrics = Metrics()
+
+    assert agent.send_message("次の質問") == "Done"
+
+    history = sent_history[0]
+    assert history[0]["parts"][0]["text"].startswith(SUMMARY_HEADER)
+    assert history[-2:] == turns[-1]
+    assert len(history) < 40
+    assert agent.metrics.snapshot()["counters"]["memory.compactions"] == 1
+
+def test_agent_llm_summary_does_not_block_event_loop_and_uses_rate_limiter(agent, mock_genai):
+    import threading
+    from agent.conversation_memory import ConversationMemory
+
+    turns = [[{"role": "user", "parts": [{"text": f"質問 {i}" + "。" * 100}]},
+              {"role": "model", "parts": [{"text": f"回答 {i}"}]}] for i in range(20)]
+    mock_genai.history = [content for turn in turns for content in turn]
+    mock_genai.send_message_async = AsyncMock(return_value=MagicMock(parts=[], text="Done"))
+    agent.memory = ConversationMemory(token_budget=500, summarizer=agent._summarize_with_llm)
+    agent.rate_limiter = MagicMock(spec=RateLimiter)
+    agent.rate_limiter.acquire_async = AsyncMock(return_value=0)
+    summary_threads = []
+
+    def generate_content(model_name, system_instruction, prompt, response_schema=None):
+        summary_threads.append(threading.current_thread())
+        return MagicMock(text="- 要約", usage_metadata=MagicMock(total_token_count=42))
+
+    agent.backend = MagicMock()
+    agent.backend.generate_content.side_effect = generate_content
+
+    async def run():
+        loop_thread = threading.current_thread()
+        return await agent.send_message_async("次の質問"), loop_thread
+
+    result, loop_thread = asyncio.run(run())
+
+    assert result == "Done"
+    # 要約の呼び出しはイベントループのスレッドの外で行い、共有の予算を確保・消費する
+    assert summary_threads and loop_thread not in summary_threads
+    agent.rate_limiter.acquire.assert_called_once_with(agent.model_name)
+    agent.rate_limiter.record_usage.assert_any_call(agent.model_name, 42)
+
+def test_agent_truncates_large_tool_results(agent, mock_genai, tmp_path):
+    from agent.tool_output_store import ToolOutputStore
+
+    part = MagicMock()
+    part.function_call.name = "dump"
+    part.function_call.args = {}
+    tool_response = MagicMock()
+    tool_response.parts = [part]
+    final_response = MagicMock()
+    final_response.text = "Done"
+    final_response.parts = []
+    mock_genai.send_message.side_effect = [tool_response, final_response]
+    agent.execute_tool = MagicMock(return_value="A" * 5000 + "Z")
+    agent.tool_output_store = ToolOutputStore(str(tmp_path), max_result_bytes=1000)
+
+    assert agent.send_message("Hello") == "Done"
+
+    result = mock_genai.send_message.call_args_list[1].args[0][0]["function_response"]["response"]["result"]
+    assert len(result) < 1300
+    assert result.endswith("Z")
+    output_id = result.split('read_tool_output("')[1].split('"')[0]
+    assert agent.read_tool_output(output_id, 4990, 20).endswith("AAAAAAAAAAZ")
+
+def test_agent_adds_read_tool_output_to_tools(mock_genai):
+    with patch.dict(os.environ, {"GEMINI_API_KEY": "dummy"}):
+        with_tools = ConcreteAgent("A", "r", "i", tools=[len])
+        without_tools = ConcreteAgent("B", "r", "i")
+
+    assert with_tools.tools == [len, with_tools.read_tool_output]
+    assert without_tools.tools is None
+
+def test_agent_streaming_failure_restores_history(agent, mock_genai):
+    mock_genai.history = [{"role": "user", "parts": [{"text": "before"}]}]
+
+    def broken_stream(content, stream=False):
+        assert stream
+        yield MagicMock(parts=[])
+        mock_genai.history = ["broken"]
+        raise Exception("connection reset")
+
+    mock_genai.send_message.side_effect = broken_stream
+    events = []
+
+    response = agent.send_message("Hello", on_event=events.append)
+
+    assert "connection reset" in response
+    assert mock_genai.history == [{"role": "user", "parts": [{"text": "before"}]}]
+    assert [e.kind for e in events] == ["start", "end"]
+
+def test_agent_retries_server_errors_with_backoff(agent, mock_genai):
+    from agent.retry_engine import RetryEngine
+    mock_response = MagicMock()
+    mock_genai.send_message.side_effect = [Exception("503 The service is currently unavailable."), mock_response]
+    agent.rate_limiter = MagicMock(spec=RateLimiter)
+    agent.rate_limiter.acquire_async = AsyncMock(return_value=0)
+    agent.retry_engine = RetryEngine(base_delay=0.01, max_delay=0.01)
+
+    assert agent._call_api("Hello") is mock_response
+
+    # 5xx は他のエージェントを止めず、この呼び出しだけが待つ
+    agent.rate_limiter.penalize.assert_not_called()
+    assert mock_genai.send_message.call_count == 2
+
+def test_agent_does_not_retry_fatal_errors(agent, mock_genai):
+    mock_genai.send_message.side_effect = Exception("400 API key not valid.")
+    agent.rate_limiter = MagicMock(spec=RateLimiter)
+    agent.rate_limiter.acquire_async = AsyncMock(return_value=0)
+
+    with pytest.raises(Exception, match="400"):
+        agent._call_api("Hello")
+    assert mock_genai.send_message.call_count == 1
+
+def test_agent_fails_fast_while_model_circuit_is_open(agent, mock_genai):
+    from agent.retry_engine import RetryEngine, CircuitOpenError, ErrorInfo, ERROR_SERVER
+    agent.retry_engine = RetryEngine(failure_threshold=1)
+    agent.retry_engine.record_failure(agent.model_name, ErrorInfo(ERROR_SERVER, 503))
+
+    with pytest.raises(CircuitOpenError):
+        agent._call_api("Hello")
+    mock_genai.send_message.assert_not_called()
+
+def test_agent_fails_over_while_model_circuit_is_open_and_switches_back(agent, mock_genai):
+    from agent.retry_engine import RetryEngine, ErrorInfo, ERROR_SERVER
+    clock = MagicMock(return_value=0.0)
+    engine = RetryEngine(failure_threshold=1, cooldown=30, failover_model="backup-model", clock=clock)
+    agent.retry_engine = engine
+    agent.rate_limiter = MagicMock(spec=RateLimiter)
+    agent.rate_limiter.acquire_async = AsyncMock(return_value=0)
+    primary = agent.model_name
+    mock_genai.history = ["earlier turn"]
+    engine.record_failure(primary, ErrorInfo(ERROR_SERVER, 503))
+
+    agent._call_api("Hello")
+    assert agent.model_name == "backup-model"
+    assert agent.chat_session.history == ["earlier turn"]
+
+    clock.return_value = 31.0
+    agent._call_api("Hello again")
+    assert agent.model_name == primary
+    assert engine.state(primary) == "closed"
+
+def test_agent_routes_routine_tool_followups_to_fast_model(agent, mock_genai):
+    from agent.model_router import ModelRouter
+    agent.model_router = ModelRouter(fast_model="fast-model", strong_model="strong-model")
+    agent.rate_limiter = MagicMock(spec=RateLimiter)
+    agent.rate_limiter.acquire_async = AsyncMock(return_value=0)
+    agent.tool_executor = MagicMock()
+    agent.tool_executor.run.side_effect = [["Successfully saved to a.py"], ["Error: Command failed"]]
+    models = []
+    mock_genai.send_message.side_effect = lambda content: (models.append(agent.model_name), responses.pop(0))[1]
+    responses = [make_tool_response(10), make_tool_response(10), MagicMock(parts=[], text="done")]
+
+    assert agent.send_message("Write it") == "done"
+
+    # ユーザーのメッセージ → 定型的なツール結果 → エラーを含むツール結果
+    assert models == [agent.default_model, "fast-model", agent.default_model]
+
+def test_agent_escalates_next_call_when_requested(agent, mock_genai):
+    from agent.model_router import ModelRouter
+    agent.model_router = ModelRouter(strong_model="strong-model")
+    agent.rate_limiter = MagicMock(spec=RateLimiter)
+    agent.rate_limiter.acquire_async = AsyncMock(return_value=0)
+
+    agent.request_escalation("sandbox exit code 1")
+    agent._call_api("Fix it")
+    assert agent.model_name == "strong-model"
+
+    # やり直しの後は元のモデルに戻る
+    agent._call_api("Next")
+    assert agent.model_name == agent.default_model
+
+def test_agent_send_message_runs_parallel_tools_with_asyncio_executor(agent, mock_genai):
+    from agent.tool_executor import AsyncioToolExecutor
+    agent.tool_executor = AsyncioToolExecutor(max_concurrency=2)
+    agent.rate_limiter = MagicMock(spec=RateLimiter)
+    agent.rate_limiter.acquire_async = AsyncMock(return_value=0)
+    agent.is_tool_parallel_safe = lambda name: True
+    tool_response = make_tool_response(10)
+    tool_response.parts = tool_response.parts * 2
+    mock_genai.send_message.side_effect = [tool_response, MagicMock(parts=[], text="done")]
+
+    # 同期のターンはイベントループの中でツールを実行するため、バッチは別のループで動かす必要がある
+    assert agent.send_message("Use tools") == "done"
+
+    sent_results = mock_genai.send_message.call_args_list[1][0][0]
+    assert [r["function_response"]["response"]["result"] for r in sent_results] == ["Executed echo with {}"] * 2
+
+def test_agent_iteration_limit_with_function_call_only_response(agent, mock_genai):
+    agent.rate_limiter = MagicMock(spec=RateLimiter)
+    agent.rate_limiter.acquire_async = AsyncMock(return_value=0)
+    tool_response = make_tool_response(10)
+    # SDK の関数呼び出しのみのレスポンスは text が例外になる
+    type(tool_response).text = property(lambda self: (_ for _ in ()).throw(ValueError("no text")))
+    mock_genai.send_message.return_value = tool_response
+
+    result = agent.send_message("Loop", max_iterations=1)
+
+    assert result.startswith("\n[System Warning] Tool execution limit reached (1 iterations)")
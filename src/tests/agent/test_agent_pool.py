@@ -0,0 +1,153 @@
+import pytest
+import asyncio
+import threading
+import time
+from agent.agent_pool import AgentPool
+
+class Counter:
+    """factory が生成したインスタンスを数えるためのヘルパー"""
+    def __init__(self):
+        self.created = []
+
+    def __call__(self):
+        instance = object()
+        self.created.append(instance)
+        return instance
+
+def test_pool_without_factory_lends_primary_only():
+    primary = object()
+    pool = AgentPool("Coder", primary)
+
+    with pool.lease() as agent:
+        assert agent is primary
+    assert pool.size == 1
+    assert pool.max_size == 1
+
+def test_pool_creates_instances_up_to_max_size():
+    primary, factory = object(), Counter()
+    pool = AgentPool("Coder", primary, factory=factory, max_size=3)
+
+    leased = [pool.acquire() for _ in range(3)]
+
+    assert leased[0] is primary
+    assert len(set(map(id, leased))) == 3
+    assert pool.size == 3
+    assert len(factory.created) == 2
+
+def test_pool_reuses_released_instances():
+    primary, factory = object(), Counter()
+    pool = AgentPool("Coder", primary, factory=factory, max_size=3)
+
+    for _ in range(5):
+        with pool.lease():
+            pass
+
+    assert factory.created == []
+
+def test_acquire_blocks_until_release():
+    pool = AgentPool("Coder", object())
+    first = pool.acquire()
+    acquired = []
+
+    thread = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    thread.start()
+    time.sleep(0.05)
+    assert acquired == []
+
+    pool.release(first)
+    thread.join(timeout=1)
+    assert acquired == [first]
+
+def test_acquire_async_waits_for_release():
+    pool = AgentPool("Coder", object())
+
+    async def scenario():
+        first = await pool.acquire_async()
+        waiter = asyncio.create_task(pool.acquire_async())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        pool.release(first)
+        return first, await asyncio.wait_for(waiter, timeout=1)
+
+    first, second = asyncio.run(scenario())
+    assert first is second
+
+def test_cancelled_async_waiter_does_not_leak_instance():
+    primary = object()
+    pool = AgentPool("Coder", primary)
+
+    async def scenario():
+        first = await pool.acquire_async()
+        waiter = asyncio.create_task(pool.acquire_async())
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        pool.release(first)
+
+    asyncio.run(scenario())
+    assert pool.acquire() is primary
+
+def test_factory_error_frees_slot():
+    def broken():
+        raise RuntimeError("boom")
+
+    pool = AgentPool("Coder", object(), factory=broken, max_size=2)
+    pool.acquire()
+
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+
+def test_pool_without_primary_creates_on_first_lease():
+    factory = Counter()
+    pool = AgentPool("Coder", factory=factory, max_size=2)
+    assert pool.size == 0
+    assert pool.primary is None
+
+    with pool.lease() as agent:
+        assert agent is factory.created[0]
+    with pool.lease() as agent:
+        assert agent is factory.created[0]
+
+    assert pool.primary is factory.created[0]
+    assert pool.size == 1
+
+def test_pool_requires_primary_or_factory():
+    with pytest.raises(ValueError):
+        AgentPool("Coder")
+
+def test_failed_lazy_creation_hands_slot_to_waiter():
+    attempts = []
+    started = threading.Event()
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            started.set()
+            time.sleep(0.05)
+            raise RuntimeError("boom")
+        return "agent"
+
+    pool = AgentPool("Coder", factory=flaky, max_size=1)
+    errors, acquired = [], []
+
+    def first():
+        try:
+            pool.acquire()
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    started.wait(timeout=1)
+    # 生成中のため待機に回った呼び出し元が、失敗の後に自分で生成し直す
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+    waiter.start()
+    thread.join(timeout=1)
+    waiter.join(timeout=1)
+
+    assert len(errors) == 1
+    assert acquired == ["agent"]
+    assert pool.size == 1
@@ -73,3 +73,56 @@ def test_execute_tool_dispatch(architect):
     with patch.object(architect, 'list_project_files') as mock_list:
         architect.execute_tool("list_project_files", {"directory": "src"})
         mock_list.assert_called_once_with(directory="src")
+
+def test_list_project_files_skips_ignored_and_filters(architect, tmp_path):
+    architect.project_root = tmp_path
+
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src/main.py").write_text("print('hi')")
+    (tmp_path / "node_modules/lib").mkdir(parents=True)
+    (tmp_path / "node_modules/lib/index.js").touch()
+    (tmp_path / ".gitignore").write_text("*.log\n")
+    (tmp_path / "debug.log").touch()
+
+    result = architect.execute_tool("list_project_files", {"directory": ".", "max_depth": 3})
+    assert "main.py" in result
+    assert "node_modules" not in result
+    assert "debug.log" not in result
+
+    result = architect.execute_tool("list_project_files", {"directory": ".", "pattern": "*.py", "min_size": 1})
+    assert "src/main.py (11 bytes)" in result
+
+def test_search_code_and_read_file(architect, tmp_path):
+    architect.project_root = tmp_path
+    (tmp_path / "app.py").write_text("def handler():\n    return 'ok'\n")
+
+    result = architect.execute_tool("search_code", {"query": "handler"})
+    assert "app.py:1-2" in result
+    assert "1| def handler():" in result
+
+    result = architect.execute_tool("read_file", {"file_path": "app.py", "start_line": 2, "end_line": 2})
+    assert "2|     return 'ok'" in result
+
+def test_edit_design_doc_with_patch(architect, tmp_path):
+    architect.project_root = tmp_path
+    architect.write_design_doc("docs/design.md", "# Design\n\n- API: REST\n")
+
+    result = architect.execute_tool("edit_file", {
+        "file_path": "docs/design.md", "old_text": "- API: REST", "new_text": "- API: gRPC",
+    })
+    assert "Successfully edited" in result
+
+    patch = "--- a/docs/design.md\n+++ b/docs/design.md\n@@ -3 +3,2 @@\n - API: gRPC\n+- DB: PostgreSQL\n"
+    assert "M docs/design.md (+1 -0)" in architect.execute_tool("apply_patch", {"patch": patch})
+    assert (tmp_path / "docs/design.md").read_text() == "# Design\n\n- API: gRPC\n- DB: PostgreSQL\n"
+
+    result = architect.execute_tool("apply_patch", {"patch": "--- a/../x.md\n+++ b/../x.md\n@@ -1 +1 @@\n-a\n+b\n"})
+    assert result.startswith("Error: Security violation")
+
+def test_architect_tools_reach_the_model(mock_env):
+    with patch('google.generativeai.GenerativeModel') as MockModel:
+        Architect()
+    tools = MockModel.call_args.kwargs["tools"]
+    names = [d.name for d in tools[0].to_proto().function_declarations]
+    assert names == ["write_design_doc", "edit_file", "apply_patch", "list_project_files",
+                     "search_code", "read_file", "read_tool_output"]
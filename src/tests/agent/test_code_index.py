@@ -0,0 +1,88 @@
+import os
+import pytest
+from agent.code_index import CodeIndex, get_code_index
+from agent.project_index import ProjectIndex
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "cache.py").write_text(
+        "import time\n\n\nclass ResponseCache:\n    def get(self, key):\n        return self.lookup(key)\n"
+        + "\n" * 20 + "def helper():\n    return ResponseCache()\n"
+    )
+    (tmp_path / "pkg" / "other.py").write_text("def lookup(key):\n    return key\n")
+    (tmp_path / "notes.md").write_text("The cache is described here.\n")
+    (tmp_path / "data.bin").write_bytes(b"ResponseCache\0\x01\x02")
+    return tmp_path
+
+
+def _index(root):
+    return CodeIndex(str(root), project_index=ProjectIndex(str(root)))
+
+
+def _bump_mtime(path):
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10_000_000))
+
+
+def test_search_returns_ranked_snippets_with_line_numbers(project):
+    result = _index(project).search("responsecache lookup")
+    assert result.startswith("Found 2 snippets in 1 files")
+    # 両方の語を含むスニペットが先
+    first = result.split("\n\n")[1]
+    assert first.startswith("pkg/cache.py:2-8")
+    assert "4| class ResponseCache:" in first
+    assert "6|         return self.lookup(key)" in first
+    assert "pkg/cache.py:26-28" in result
+    assert "other.py" not in result
+    assert "data.bin" not in result
+
+
+def test_search_falls_back_to_any_term(project):
+    result = _index(project).search("lookup notfoundanywhere")
+    assert "pkg/other.py:1-2" in result
+    assert "pkg/cache.py" in result
+    assert _index(project).search("nothingmatches").startswith("No matches")
+
+
+def test_search_limits_results(project):
+    result = _index(project).search("cache", max_results=1)
+    assert "(showing 1)" in result
+    assert result.count("\n\n") == 1
+
+
+def test_refresh_reindexes_only_changed_files(project):
+    index = _index(project)
+    assert index.refresh() == 3
+    assert index.refresh() == 0
+
+    other = project / "pkg" / "other.py"
+    other.write_text("def fetch_value():\n    pass\n")
+    _bump_mtime(other)
+    (project / "notes.md").unlink()
+    _bump_mtime(project)
+    assert index.refresh() == 1
+    assert "pkg/other.py:1-2" in index.search("fetch_value")
+    assert index.search("described").startswith("No matches")
+
+
+def test_read_returns_numbered_line_range(project):
+    index = _index(project)
+    result = index.read("pkg/cache.py", 4, 5)
+    assert result == "pkg/cache.py (lines 4-5 of 28):\n4| class ResponseCache:\n5|     def get(self, key):\n"
+    assert "lines 1-28 of 28" in index.read("pkg/cache.py")
+    truncated = index.read("pkg/cache.py", 1, 0, max_lines=3)
+    assert "continue with start_line=4" in truncated
+
+
+def test_read_errors(project):
+    index = _index(project)
+    assert index.read("../outside.txt").startswith("Error: Security violation")
+    assert index.read("missing.py").startswith("Error: File 'missing.py' does not exist")
+    assert "binary" in index.read("data.bin")
+    assert "beyond the end" in index.read("pkg/other.py", 10)
+
+
+def test_shared_index_per_root(project):
+    assert get_code_index(str(project)) is get_code_index(str(project / "pkg" / ".."))
@@ -1,5 +1,6 @@
 import pytest
 import os
+import asyncio
 from unittest.mock import MagicMock, patch
 from agent.coder import Coder
 
@@ -75,3 +76,138 @@ def test_coder_ask_question(coder):
     assert "質問を Manager に送信しました" in result
     assert "指示を待ってください" in result
 
+
+def test_coder_tool_parallel_safety(coder):
+    assert coder.is_tool_parallel_safe("write_to_sandbox")
+    # 同じファイルへの書き込みは、並列安全なツールでも同じバッチで同時に実行しない
+    calls = [("write_to_sandbox", {"file_path": "a.py", "content": "1"}),
+             ("write_to_sandbox", {"file_path": "a.py", "content": "2"})]
+    assert coder.tool_executor.plan_batches(coder, calls) == [[0], [1]]
+    # sandbox 内でのコマンド実行は副作用が大きいため単独で実行する
+    assert not coder.is_tool_parallel_safe("execute_in_sandbox")
+
+def test_coder_execute_in_sandbox_async(coder, tmp_path):
+    coder.sandbox_dir = tmp_path
+
+    result = asyncio.run(coder.execute_tool_async("execute_in_sandbox", {"command": "echo 'Hello async'"}))
+
+    assert "Exit Code: 0" in result
+    assert "Hello async" in result
+
+def test_coder_executes_through_sandbox_worker(coder, tmp_path):
+    from agent.sandbox_worker import SandboxWorker
+    if not SandboxWorker.is_supported():
+        pytest.skip("fork が使えない環境")
+    coder.sandbox_dir = tmp_path
+    coder.sandbox_worker = SandboxWorker(tmp_path)
+    coder.write_to_sandbox("app.py", "print('warm')")
+    try:
+        result = coder.execute_in_sandbox("python app.py")
+        async_result = asyncio.run(coder.execute_tool_async("execute_in_sandbox", {"command": "python app.py"}))
+    finally:
+        coder.sandbox_worker.close()
+
+    assert result.startswith("Exit Code: 0\nResources: user ")
+    assert result.endswith("STDOUT:\nwarm\n\n")
+    assert async_result.endswith("STDOUT:\nwarm\n\n")
+    assert coder.sandbox_worker.starts == 1
+
+def test_coder_returns_partial_output_on_timeout(coder, tmp_path):
+    coder.sandbox_dir = tmp_path
+    coder.sandbox_timeout = 0.5
+
+    result = coder.execute_in_sandbox("echo partial; sleep 10")
+
+    assert result.startswith("Error: Command timed out after 0.5 seconds.")
+    assert "STDOUT:\npartial" in result
+
+def test_coder_timeout_argument_is_capped(coder):
+    coder.sandbox_max_timeout = 60
+
+    assert coder._sandbox_timeout(0) == coder.sandbox_timeout
+    assert coder._sandbox_timeout(45) == 45
+    assert coder._sandbox_timeout(600) == 60
+
+def test_coder_streams_sandbox_output_as_events(coder, tmp_path):
+    from agent.streaming import EVENT_TOOL_OUTPUT, stream_events
+    coder.sandbox_dir = tmp_path
+    events = []
+
+    with stream_events(events.append):
+        coder.execute_in_sandbox("echo live")
+
+    assert [(e.kind, e.agent, e.text) for e in events] == [(EVENT_TOOL_OUTPUT, "Coder", "live\n")]
+
+def test_coder_reports_cpu_limit(coder, tmp_path):
+    coder.sandbox_dir = tmp_path
+    coder.sandbox_limits.cpu_seconds = 1
+
+    result = coder.execute_in_sandbox("python -c \"while True: pass\"")
+
+    assert "Error: CPU time limit of 1 seconds exceeded." in result
+    assert coder.metrics.snapshot()["observations"]["sandbox.max_rss_kb"]["max"] > 0
+
+def test_coder_uses_workspace_per_session(mock_env, tmp_path):
+    from agent.workspace_manager import WorkspaceManager
+    workspaces = WorkspaceManager(str(tmp_path / "root"))
+    with patch('google.generativeai.GenerativeModel'):
+        coder = Coder(workspaces=workspaces)
+
+    with coder.token_ledger.session("one"):
+        coder.write_to_sandbox("app.py", "print('one')")
+        first = coder.execute_in_sandbox("python app.py")
+    with coder.token_ledger.session("two"):
+        second = coder.execute_in_sandbox("ls")
+
+    assert "one" in first
+    assert "app.py" not in second
+    assert workspaces.workspaces() == ["session-one", "session-two"]
+
+def test_coder_write_breaks_hardlinks_to_template(mock_env, tmp_path):
+    from agent.workspace_manager import COPY_HARDLINK, WorkspaceManager
+    template = tmp_path / "template"
+    template.mkdir()
+    (template / "app.py").write_text("print('template')")
+    workspaces = WorkspaceManager(str(tmp_path / "root"), template=str(template), copy_mode=COPY_HARDLINK)
+    with patch('google.generativeai.GenerativeModel'):
+        coder = Coder(workspaces=workspaces)
+
+    coder.write_to_sandbox("app.py", "print('changed')")
+
+    assert (template / "app.py").read_text() == "print('template')"
+    assert (coder.sandbox_dir / "app.py").read_text() == "print('changed')"
+
+def test_coder_search_code_and_read_file_in_sandbox(coder, tmp_path):
+    coder.sandbox_dir = tmp_path
+    coder.write_to_sandbox("calc.py", "def add(a, b):\n    return a + b\n")
+
+    result = coder.execute_tool("search_code", {"query": "def add"})
+    assert "calc.py:1-2" in result
+
+    result = coder.execute_tool("read_file", {"file_path": "calc.py", "start_line": 2})
+    assert result == "calc.py (lines 2-2 of 2):\n2|     return a + b\n"
+    assert coder.read_file("../secret.txt").startswith("Error: Security violation")
+
+def test_coder_edit_file_and_apply_patch(coder, tmp_path):
+    coder.sandbox_dir = tmp_path
+    coder.write_to_sandbox("calc.py", "def add(a, b):\n    return a + b\n")
+
+    result = coder.execute_tool("edit_file", {"file_path": "calc.py", "old_text": "a + b", "new_text": "b + a"})
+    assert result == "Successfully edited calc.py (1 replacement)."
+
+    patch = "--- a/calc.py\n+++ b/calc.py\n@@ -2 +2 @@\n-    return b + a\n+    return sum((a, b))\n"
+    result = coder.execute_tool("apply_patch", {"patch": patch})
+    assert result == "Successfully applied patch:\nM calc.py (+1 -1)"
+    assert (tmp_path / "calc.py").read_text() == "def add(a, b):\n    return sum((a, b))\n"
+
+    result = coder.execute_tool("edit_file", {"file_path": "calc.py", "old_text": "missing", "new_text": "x"})
+    assert result.startswith("Error: old_text was not found in 'calc.py'.")
+    assert not getattr(coder.edit_file, "parallel_safe", False)
+
+def test_coder_requests_escalation_on_failed_command(coder, tmp_path):
+    coder.sandbox_dir = tmp_path
+    coder.execute_in_sandbox("true")
+    assert coder._escalation is None
+
+    coder.execute_in_sandbox("exit 3")
+    assert coder._escalation == "sandbox exit code 3"
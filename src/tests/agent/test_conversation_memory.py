@@ -0,0 +1,167 @@
+import re
+from unittest.mock import MagicMock
+
+from agent.conversation_memory import (
+    ConversationMemory, SUMMARY_HEADER, estimate_tokens, extractive_summary, plain_content,
+)
+from agent.tool_output_store import ToolOutputStore
+
+
+def user(text):
+    return {"role": "user", "parts": [{"text": text}]}
+
+
+def model(text):
+    return {"role": "model", "parts": [{"text": text}]}
+
+
+def call(name, **args):
+    return {"role": "model", "parts": [{"function_call": {"name": name, "args": args}}]}
+
+
+def result(name, text):
+    return {"role": "user", "parts": [{"function_response": {"name": name, "response": {"result": text}}}]}
+
+
+def tool_turn(index, payload="ok"):
+    return [user(f"質問 {index}"), call("delegate_task", agent_name="Coder"), result("delegate_task", payload), model(f"回答 {index}")]
+
+
+class FakeSession:
+    def __init__(self, history):
+        self.history = history
+
+
+def test_memory_leaves_small_history_untouched():
+    memory = ConversationMemory(token_budget=10000)
+    session = FakeSession([user("こんにちは"), model("はい")])
+
+    assert memory.apply(session) is False
+    assert session.history == [user("こんにちは"), model("はい")]
+
+
+def test_memory_compacts_old_turns_into_summary_within_budget():
+    history = [content for i in range(20) for content in tool_turn(i, payload="x" * 100)]
+    memory = ConversationMemory(token_budget=300, tool_payload_chars=0, summary_max_chars=200)
+
+    compacted = memory.compact(history)
+
+    assert compacted[0]["parts"][0]["text"].startswith(SUMMARY_HEADER)
+    assert compacted[1]["role"] == "model"
+    assert "質問 18" in memory.summary or "質問 17" in memory.summary
+    # 直近のターンはそのまま残り、見積もりは予算内に収まる
+    assert compacted[-4:] == tool_turn(19, payload="x" * 100)
+    assert estimate_tokens(compacted) <= 300
+    assert memory.stats()["summarized_turns"] == len(history) // 4 - (len(compacted) - 2) // 4
+
+
+def test_memory_keeps_function_call_pairs_together():
+    history = [content for i in range(10) for content in tool_turn(i)]
+    compacted = ConversationMemory(token_budget=150, tool_payload_chars=0).compact(history)
+
+    turns = compacted[2:]
+    # 要約の直後は必ずターンの始まり（ツール結果だけが取り残されない）
+    assert turns[0]["parts"][0].get("text", "").startswith("質問")
+    assert len(turns) % 4 == 0
+
+
+def test_memory_merges_previous_summary():
+    memory = ConversationMemory(token_budget=150, tool_payload_chars=0)
+    history = [content for i in range(10) for content in tool_turn(i)]
+    first = memory.compact(history)
+    second = memory.compact(first + [content for i in range(10, 20) for content in tool_turn(i)])
+
+    assert second[0]["parts"][0]["text"].count(SUMMARY_HEADER) == 1
+    assert "質問 0" in memory.summary and "質問 10" in memory.summary
+    assert memory.stats()["compactions"] == 2
+
+
+def test_memory_replaces_bulky_tool_payloads_with_references(tmp_path):
+    payload = "詳細な出力" * 1000
+    memory = ConversationMemory(token_budget=0, tool_payload_chars=500, output_store=ToolOutputStore(str(tmp_path)))
+    history = tool_turn(0, payload) + tool_turn(1, payload)
+
+    compacted = memory.compact(history)
+
+    old = compacted[2]["parts"][0]["function_response"]["response"]["result"]
+    assert len(old) < 500
+    output_id = re.search(r'read_tool_output\("([^"]+)"', old).group(1)
+    assert memory.output_store.get(output_id) == payload
+    # 直近のターンの出力は置き換えない
+    assert compacted[6]["parts"][0]["function_response"]["response"]["result"] == payload
+    # 元の履歴は書き換えない
+    assert history[2]["parts"][0]["function_response"]["response"]["result"] == payload
+    # 置き換え済みの履歴は再び変更されない
+    assert memory.compact(compacted) is None
+
+
+def test_memory_does_not_offload_references_again_with_small_threshold(tmp_path):
+    memory = ConversationMemory(token_budget=0, tool_payload_chars=50, output_store=ToolOutputStore(str(tmp_path)))
+    session = MagicMock(history=tool_turn(0, "x" * 1000) + tool_turn(1))
+
+    assert memory.apply(session)
+    reference = session.history[2]["parts"][0]["function_response"]["response"]["result"]
+    # 置き換え後の文字列は上限より長いが、再び置き換えない
+    assert len(reference) > 50
+    assert not memory.apply(session)
+    assert session.history[2]["parts"][0]["function_response"]["response"]["result"] == reference
+    assert memory.stats()["offloaded_payloads"] == 1
+    assert len([path for path in tmp_path.rglob("*") if path.is_file()]) == 1
+
+
+def test_memory_truncates_summary_keeping_newest_lines():
+    memory = ConversationMemory(token_budget=100, tool_payload_chars=0, summary_max_chars=120)
+    history = [content for i in range(30) for content in tool_turn(i)]
+
+    memory.compact(history)
+
+    assert len(memory.summary) <= 160
+    assert "質問 0" not in memory.summary
+
+
+def test_memory_uses_custom_summarizer():
+    seen = []
+
+    def summarizer(previous, turns):
+        seen.append((previous, len(turns)))
+        return "要約"
+
+    memory = ConversationMemory(token_budget=100, tool_payload_chars=0, summarizer=summarizer)
+    memory.compact([content for i in range(10) for content in tool_turn(i)])
+
+    assert seen and seen[0][0] == ""
+    assert memory.summary == "要約"
+
+
+def test_extractive_summary_lists_requests_tools_and_answers():
+    summary = extractive_summary("以前の要約", [tool_turn(0)])
+
+    assert summary.splitlines()[0] == "以前の要約"
+    assert "ユーザー: 質問 0" in summary
+    assert "使用ツール: delegate_task" in summary
+    assert "回答: 回答 0" in summary
+
+
+def test_plain_content_converts_sdk_contents():
+    from google.generativeai import protos
+
+    content = protos.Content(role="user", parts=[protos.Part(
+        function_response=protos.FunctionResponse(name="x", response={"result": "abc"}))])
+
+    plain = plain_content(content)
+
+    assert plain["role"] == "user"
+    assert plain["parts"][0]["function_response"]["response"] == {"result": "abc"}
+
+
+def test_memory_from_env(monkeypatch):
+    monkeypatch.setenv("AGENT_MEMORY_TOKEN_BUDGET", "500")
+    monkeypatch.setenv("AGENT_MEMORY_TOOL_PAYLOAD_CHARS", "100")
+    monkeypatch.setenv("AGENT_MEMORY_SUMMARIZER", "llm")
+    llm = lambda previous, turns: "llm"
+
+    memory = ConversationMemory.from_env(llm_summarizer=llm)
+
+    assert memory.token_budget == 500
+    assert memory.tool_payload_chars == 100
+    assert memory.summarizer is llm
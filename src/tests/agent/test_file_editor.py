@@ -0,0 +1,122 @@
+import pytest
+from agent.file_editor import EditError, FileEditor
+
+
+@pytest.fixture
+def editor(tmp_path):
+    (tmp_path / "app.py").write_text("def add(a, b):\n    return a + b\n\n\ndef sub(a, b):\n    return a - b\n")
+    return FileEditor(str(tmp_path))
+
+
+def test_edit_replaces_unique_text(editor, tmp_path):
+    result = editor.edit("app.py", "return a - b", "return a - b  # subtract")
+    assert result == "Successfully edited app.py (1 replacement)."
+    assert "return a - b  # subtract\n" in (tmp_path / "app.py").read_text()
+
+
+def test_edit_rejects_ambiguous_and_missing_text(editor, tmp_path):
+    before = (tmp_path / "app.py").read_text()
+    with pytest.raises(EditError, match=r"matches 2 places in 'app.py' \(lines 1, 5\)"):
+        editor.edit("app.py", "(a, b):", "(x, y):")
+    with pytest.raises(EditError, match="resembles line 2"):
+        editor.edit("app.py", "return a+b\n", "return 0\n")
+    with pytest.raises(EditError, match="does not exist"):
+        editor.edit("missing.py", "x", "y")
+    with pytest.raises(EditError, match="Security violation"):
+        editor.edit("../outside.py", "x", "y")
+    assert (tmp_path / "app.py").read_text() == before
+
+    assert editor.edit("app.py", "(a, b):", "(x, y):", replace_all=True) == "Successfully edited app.py (2 replacements)."
+
+
+def test_edit_breaks_hardlinks(editor, tmp_path):
+    original = tmp_path / "template.py"
+    original.write_text("x = 1\n")
+    (tmp_path / "linked.py").hardlink_to(original)
+    editor.edit("linked.py", "x = 1", "x = 2")
+    assert original.read_text() == "x = 1\n"
+    assert (tmp_path / "linked.py").read_text() == "x = 2\n"
+
+
+def test_apply_patch_modifies_creates_and_deletes(editor, tmp_path):
+    (tmp_path / "old.txt").write_text("obsolete\n")
+    patch = """diff --git a/app.py b/app.py
+--- a/app.py
++++ b/app.py
+@@ -4,3 +4,3 @@
+ 
+ def sub(a, b):
+-    return a - b
++    return a - b - 0
+--- /dev/null
++++ b/pkg/new.py
+@@ -0,0 +1,2 @@
++VALUE = 1
++OTHER = 2
+--- a/old.txt
++++ /dev/null
+@@ -1 +0,0 @@
+-obsolete
+"""
+    result = editor.apply_patch(patch)
+    assert result == "Successfully applied patch:\nM app.py (+1 -1)\nA pkg/new.py (+2)\nD old.txt"
+    assert (tmp_path / "app.py").read_text().endswith("def sub(a, b):\n    return a - b - 0\n")
+    assert (tmp_path / "pkg/new.py").read_text() == "VALUE = 1\nOTHER = 2\n"
+    assert not (tmp_path / "old.txt").exists()
+
+
+def test_apply_patch_tolerates_wrong_line_numbers(editor, tmp_path):
+    patch = """--- a/app.py
++++ b/app.py
+@@ -40,2 +40,2 @@
+ def add(a, b):
+-    return a + b
++    return b + a
+"""
+    editor.apply_patch(patch)
+    assert (tmp_path / "app.py").read_text().startswith("def add(a, b):\n    return b + a\n")
+
+
+def test_apply_patch_conflict_changes_nothing(editor, tmp_path):
+    before = (tmp_path / "app.py").read_text()
+    patch = """--- a/app.py
++++ b/app.py
+@@ -1,2 +1,2 @@
+ def add(a, b):
+-    return a + b
++    return a + b + 1
+@@ -5,2 +5,2 @@
+ def sub(a, b):
+-    return a * b
++    return a / b
+"""
+    with pytest.raises(EditError) as excinfo:
+        editor.apply_patch(patch)
+    message = str(excinfo.value)
+    assert "Patch conflict in 'app.py', hunk #2" in message
+    assert "patch expects: '    return a * b'" in message
+    assert "file has:      '    return a - b'" in message
+    assert "6|     return a - b" in message
+    assert (tmp_path / "app.py").read_text() == before
+
+
+def test_apply_patch_preserves_crlf_and_missing_final_newline(tmp_path):
+    (tmp_path / "win.txt").write_bytes(b"one\r\ntwo\r\nthree")
+    patch = """--- a/win.txt
++++ b/win.txt
+@@ -2,2 +2,2 @@
+ two
+-three
+\\ No newline at end of file
++THREE
+\\ No newline at end of file
+"""
+    FileEditor(str(tmp_path)).apply_patch(patch)
+    assert (tmp_path / "win.txt").read_bytes() == b"one\r\ntwo\r\nTHREE"
+
+
+def test_apply_patch_without_file_headers(editor):
+    with pytest.raises(EditError, match="No file changes"):
+        editor.apply_patch("just some text")
+    with pytest.raises(EditError, match="before any"):
+        editor.apply_patch("@@ -1 +1 @@\n-a\n+b\n")
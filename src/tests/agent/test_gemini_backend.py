@@ -0,0 +1,77 @@
+import pytest
+import os
+from unittest.mock import patch
+from agent.gemini_backend import GeminiBackend, function_tools
+
+def test_requires_api_key():
+    with patch.dict(os.environ, {}, clear=True):
+        with pytest.raises(ValueError, match="GEMINI_API_KEY"):
+            GeminiBackend()
+
+def test_start_chat_disables_automatic_function_calling():
+    with patch.dict(os.environ, {"GEMINI_API_KEY": "dummy"}), patch('google.generativeai.GenerativeModel') as MockModel:
+        session = GeminiBackend().start_chat("gemini-test", "system", tools=None)
+
+    MockModel.assert_called_once_with(model_name="gemini-test", system_instruction="system", tools=None)
+    MockModel.return_value.start_chat.assert_called_once_with(history=[], enable_automatic_function_calling=False)
+    assert session is MockModel.return_value.start_chat.return_value
+
+def test_generate_content():
+    with patch.dict(os.environ, {"GEMINI_API_KEY": "dummy"}), patch('google.generativeai.GenerativeModel') as MockModel:
+        GeminiBackend().generate_content("gemini-test", "system", "prompt")
+
+    MockModel.return_value.generate_content.assert_called_once_with("prompt")
+
+def test_api_endpoint_uses_rest_transport():
+    with patch.dict(os.environ, {"GEMINI_API_KEY": "dummy", "GEMINI_API_ENDPOINT": "http://127.0.0.1:9"}), \
+            patch('google.generativeai.configure') as mock_configure:
+        GeminiBackend()
+
+    mock_configure.assert_called_once_with(
+        api_key="dummy", transport="rest", client_options={"api_endpoint": "http://127.0.0.1:9"}
+    )
+
+class _Tools:
+    def greet(self, name: str) -> str:
+        """
+        挨拶を返します。
+
+        Args:
+            name (str): 相手の名前。
+        """
+        return f"hello {name}"
+
+    def add(self, a: int, b: int = 0) -> int:
+        """
+        足し算をします。
+        """
+        return a + b
+
+def test_function_tools_are_built_once_and_shared():
+    first, second = _Tools(), _Tools()
+    tools = function_tools([first.greet, first.add])
+    assert function_tools([second.greet, second.add]) is tools
+
+    declarations = tools[0].to_proto().function_declarations
+    assert [d.name for d in declarations] == ["greet", "add"]
+    assert list(declarations[1].parameters.required) == ["a"]
+    assert function_tools(None) is None
+
+def test_start_chat_passes_cached_tools():
+    instance = _Tools()
+    with patch.dict(os.environ, {"GEMINI_API_KEY": "dummy"}), patch('google.generativeai.GenerativeModel') as MockModel:
+        GeminiBackend().start_chat("gemini-test", "system", tools=[instance.greet])
+
+    assert MockModel.call_args.kwargs["tools"] is function_tools([instance.greet])
+
+def test_generate_content_reuses_model_and_constrains_json():
+    schema = {"type": "array", "items": {"type": "string"}}
+    with patch.dict(os.environ, {"GEMINI_API_KEY": "dummy"}), patch('google.generativeai.GenerativeModel') as MockModel:
+        backend = GeminiBackend()
+        backend.generate_content("gemini-test", "system", "first")
+        backend.generate_content("gemini-test", "system", "second", response_schema=schema)
+
+    MockModel.assert_called_once_with(model_name="gemini-test", system_instruction="system")
+    MockModel.return_value.generate_content.assert_called_with(
+        "second", generation_config={"response_mime_type": "application/json", "response_schema": schema}
+    )
@@ -0,0 +1,27 @@
+import pytest
+import os
+from unittest.mock import patch
+from agent.llm_backend import create_backend
+from agent.gemini_backend import GeminiBackend
+from agent.recording_backend import RecordingBackend
+from agent.replay_backend import ReplayBackend
+
+def test_create_backend_defaults_to_gemini():
+    with patch.dict(os.environ, {"GEMINI_API_KEY": "dummy"}, clear=True):
+        assert isinstance(create_backend(), GeminiBackend)
+
+def test_create_backend_record_and_replay(tmp_path):
+    cassette = tmp_path / "session.jsonl"
+    with patch.dict(os.environ, {"GEMINI_API_KEY": "dummy", "AGENT_CASSETTE": str(cassette)}):
+        assert isinstance(create_backend("record"), RecordingBackend)
+        cassette.touch()
+        with patch.dict(os.environ, {"AGENT_REPLAY_LATENCY": "0.5"}):
+            backend = create_backend("replay")
+
+    assert isinstance(backend, ReplayBackend)
+    assert backend.latency == 0.5
+
+def test_create_backend_requires_cassette():
+    with patch.dict(os.environ, {}, clear=True):
+        with pytest.raises(ValueError, match="AGENT_CASSETTE"):
+            create_backend("replay")
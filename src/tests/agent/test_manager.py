@@ -1,8 +1,12 @@
 import pytest
 import os
-from unittest.mock import MagicMock, patch
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, AsyncMock, patch
 from agent.manager import Manager
 from agent.agent import Agent
+from agent.rate_limiter import RateLimiter
 
 # 具象クラスが必要なのでAgentのダミーを作る
 class DummyAgent(Agent):
@@ -21,6 +25,8 @@ def mock_env():
 def manager(mock_env):
     with patch('google.generativeai.GenerativeModel'):
         m = Manager("Manager")
+        # タスクの分解も共有のレートリミッターを通るため、テストでは上限の無いものに差し替える
+        m.rate_limiter = RateLimiter(rpm=None, tpm=None)
         return m
 
 @pytest.fixture
@@ -43,6 +49,20 @@ def test_manager_assign_agent(manager, dummy_agent):
     assert "Coder" in manager.sub_agents
     assert manager.sub_agents["Coder"] == dummy_agent
 
+def test_manager_lazy_agent_is_created_on_first_delegation(manager, dummy_agent):
+    factory = MagicMock(return_value=dummy_agent)
+    manager.assign_agent("Coder", factory=factory)
+
+    assert manager.sub_agents == {"Coder": None}
+    factory.assert_not_called()
+    assert "not in the team" in manager.delegate_task("Architect", "design")
+    factory.assert_not_called()
+
+    assert manager.delegate_task("Coder", "task1") == "Coder からの回答: Mocked Response"
+    assert manager.delegate_task("Coder", "task2") == "Coder からの回答: Mocked Response"
+    factory.assert_called_once()
+    assert manager.sub_agents["Coder"] is dummy_agent
+
 def test_manager_decompose_task(manager):
     """
     LLMを使用したタスク分解のテスト。
@@ -105,3 +125,268 @@ def test_manager_delegate_task_unknown_agent(manager):
     result = manager.delegate_task("Unknown", "do something")
     assert "Error" in result
     assert "not in the team" in result
+
+def test_manager_delegate_task_tools_are_parallel_safe(manager):
+    assert manager.is_tool_parallel_safe("delegate_task")
+    assert manager.is_tool_parallel_safe("delegate_many")
+    assert manager.is_tool_parallel_safe("decompose_task")
+    assert not manager.is_tool_parallel_safe("execute_tool")
+
+def test_manager_delegate_task_async(manager, dummy_agent):
+    dummy_agent.send_message_async = AsyncMock(return_value="Async Response")
+    manager.assign_agent("Coder", dummy_agent)
+
+    result = asyncio.run(manager.execute_tool_async("delegate_task", {"agent_name": "Coder", "task_content": "Implement login"}))
+
+    assert "Coder からの回答: Async Response" in result
+    dummy_agent.send_message_async.assert_awaited_once_with("Implement login")
+    dummy_agent.send_message.assert_not_called()
+
+def make_slow_agent(name, reply, delay=0.2):
+    agent = MagicMock(spec=Agent)
+    agent.name = name
+
+    def send_message(task):
+        time.sleep(delay)
+        return f"{reply}: {task}"
+
+    agent.send_message.side_effect = send_message
+    return agent
+
+def test_manager_delegate_many_runs_pooled_coders_concurrently(manager):
+    coders = [make_slow_agent("Coder", f"coder{i}") for i in range(3)]
+    spare = iter(coders[1:])
+    manager.assign_agent("Coder", coders[0], factory=lambda: next(spare), max_instances=3)
+    manager.assign_agent("Architect", make_slow_agent("Architect", "architect"))
+
+    start = time.perf_counter()
+    result = manager.execute_tool("delegate_many", {
+        "agent_names": ["Coder", "Coder", "Architect"],
+        "task_contents": ["a.py", "b.py", "design"],
+    })
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.5
+    # 結果は依頼した順にまとめられる
+    assert result.index("[Task 1]") < result.index("[Task 2]") < result.index("[Task 3]")
+    assert "a.py" in result and "b.py" in result and "architect: design" in result
+    # 各 Coder インスタンスは1つのタスクだけを受け持つ（チャットセッションを共有しない）
+    assert sum(c.send_message.call_count for c in coders) == 2
+    assert all(c.send_message.call_count <= 1 for c in coders)
+
+def test_manager_delegate_many_without_pool_serializes_same_agent(manager, dummy_agent):
+    manager.assign_agent("Coder", dummy_agent)
+
+    result = manager.delegate_many(["Coder", "Coder"], ["task1", "task2"])
+
+    assert dummy_agent.send_message.call_count == 2
+    assert "[Task 2] Coder からの回答: Mocked Response" in result
+
+def test_manager_delegate_many_caps_threads_at_pool_size(manager, dummy_agent):
+    manager.assign_agent("Coder", dummy_agent)
+
+    with patch("agent.manager.ThreadPoolExecutor", wraps=ThreadPoolExecutor) as executor:
+        result = manager.delegate_many(["Coder"] * 20, [f"task{i}" for i in range(20)])
+
+    # インスタンスが1つしかなければ、タスク数にかかわらずスレッドも1つだけ作る
+    assert executor.call_args.kwargs["max_workers"] == 1
+    assert dummy_agent.send_message.call_count == 20
+    assert "[Task 20]" in result
+
+def test_manager_delegate_many_validates_arguments(manager, dummy_agent):
+    manager.assign_agent("Coder", dummy_agent)
+
+    assert "same length" in manager.delegate_many(["Coder"], ["a", "b"])
+    assert "not in the team" in manager.delegate_many(["Unknown"], ["a"])
+    dummy_agent.send_message.assert_not_called()
+
+def test_manager_delegate_many_async(manager):
+    agents = []
+    for i in range(2):
+        agent = MagicMock(spec=Agent)
+        agent.send_message_async = AsyncMock(side_effect=lambda task, i=i: f"async{i}: {task}")
+        agents.append(agent)
+    spare = iter(agents[1:])
+    manager.assign_agent("Coder", agents[0], factory=lambda: next(spare), max_instances=2)
+
+    result = asyncio.run(manager.execute_tool_async("delegate_many", {"agent_names": ["Coder", "Coder"], "task_contents": ["x", "y"]}))
+
+    assert "[Task 1]" in result and "[Task 2]" in result
+    assert sum(a.send_message_async.await_count for a in agents) == 2
+
+def test_manager_plan_tasks_builds_graph(manager, dummy_agent):
+    manager.assign_agent("Coder", dummy_agent)
+    with patch('google.generativeai.GenerativeModel') as MockModel:
+        MockModel.return_value.generate_content.return_value.text = (
+            '```json\n[{"id": "t1", "description": "API実装", "assignee": "Coder", "depends_on": []},'
+            ' {"id": "t2", "description": "テスト", "assignee": "Coder", "depends_on": ["t1"]}]\n```'
+        )
+
+        graph = manager.plan_tasks("Make an API")
+
+    assert list(graph.nodes) == ["t1", "t2"]
+    assert graph.nodes["t2"].depends_on == ["t1"]
+
+def test_manager_plan_tasks_falls_back_on_cycle(manager, dummy_agent):
+    manager.assign_agent("Coder", dummy_agent)
+    with patch('google.generativeai.GenerativeModel') as MockModel:
+        MockModel.return_value.generate_content.return_value.text = (
+            '[{"id": "a", "description": "A", "depends_on": ["b"]}, {"id": "b", "description": "B", "depends_on": ["a"]}]'
+        )
+
+        graph = manager.plan_tasks("req")
+
+    assert [n.description for n in graph.nodes.values()] == ["A", "B"]
+    assert graph.nodes["t2"].depends_on == ["t1"]
+
+def test_manager_execute_plan_dispatches_with_dependency_context(manager, dummy_agent):
+    manager.assign_agent("Coder", dummy_agent)
+    with patch('google.generativeai.GenerativeModel') as MockModel:
+        MockModel.return_value.generate_content.return_value.text = (
+            '[{"id": "t1", "description": "API実装", "assignee": "Coder", "depends_on": []},'
+            ' {"id": "t2", "description": "テスト", "assignee": "Coder", "depends_on": ["t1"]}]'
+        )
+
+        report = manager.execute_tool("execute_plan", {"requirements": "Make an API"})
+
+    assert "2 tasks" in report
+    assert "[t1] Coder / done" in report
+    assert "[t2] Coder / done" in report
+    second_prompt = dummy_agent.send_message.call_args_list[1][0][0]
+    assert second_prompt.startswith("テスト")
+    assert "Mocked Response" in second_prompt
+
+@pytest.mark.parametrize("run_plan", [
+    lambda manager: manager.execute_plan("Make an API"),
+    lambda manager: asyncio.run(manager.execute_plan_async("Make an API")),
+])
+def test_manager_execute_plan_stops_dependents_on_sub_agent_api_error(manager, mock_env, run_plan):
+    with patch('google.generativeai.GenerativeModel') as MockModel:
+        coder = DummyAgent("Coder", "Coder", "Implement")
+        coder.rate_limiter = RateLimiter(rpm=None, tpm=None)
+        # 再試行しない失敗（400）にして、サブエージェントのターンを即座に失敗させる
+        MockModel.return_value.start_chat.return_value.send_message.side_effect = Exception("400 Invalid argument")
+        MockModel.return_value.start_chat.return_value.send_message_async.side_effect = Exception("400 Invalid argument")
+        manager.assign_agent("Coder", coder)
+        plan = MagicMock(text=(
+            '[{"id": "t1", "description": "API実装", "assignee": "Coder", "depends_on": []},'
+            ' {"id": "t2", "description": "テスト", "assignee": "Coder", "depends_on": ["t1"]}]'
+        ))
+        manager.backend = MagicMock()
+        manager.backend.generate_content.return_value = plan
+        manager.backend.generate_content_async = AsyncMock(return_value=plan)
+
+        report = run_plan(manager)
+
+    assert "[t1] Coder / failed" in report
+    assert "400 Invalid argument" in report
+    assert "[t2] Coder / skipped" in report
+
+def test_manager_decompose_task_uses_response_cache(manager):
+    from agent.response_cache import ResponseCache
+    manager.response_cache = ResponseCache(":memory:")
+    with patch('google.generativeai.GenerativeModel') as MockModel:
+        MockModel.return_value.generate_content.return_value.text = '["A", "B"]'
+
+        assert manager.decompose_task("same requirement") == ["A", "B"]
+        assert manager.decompose_task("same requirement") == ["A", "B"]
+
+    assert MockModel.return_value.generate_content.call_count == 1
+
+def test_manager_decompose_task_escalates_unparseable_output(manager):
+    from agent.model_router import ModelRouter
+    manager.model_router = ModelRouter(fast_model="fast-model", strong_model="strong-model")
+    models = []
+
+    def generate(model_name, system_instruction, prompt, response_schema=None):
+        models.append(model_name)
+        return MagicMock(text="tasks: A and B" if model_name == "fast-model" else '["A", "B"]')
+
+    manager.backend = MagicMock()
+    manager.backend.generate_content.side_effect = generate
+
+    assert manager.decompose_task("req") == ["A", "B"]
+    assert models == ["fast-model", "strong-model"]
+
+def test_manager_decompose_task_requests_json_and_caches_per_requirement(manager):
+    from agent.manager import TASK_LIST_SCHEMA
+    from agent.metrics import Metrics
+    manager.metrics = Metrics()
+    manager.backend = MagicMock()
+    manager.backend.generate_content.return_value = MagicMock(text='["A", "B"]')
+
+    assert manager.decompose_task("Make an  API") == ["A", "B"]
+    # 空白の違いだけの要件は同じ要件として扱う
+    assert manager.decompose_task(" Make an API\n") == ["A", "B"]
+
+    manager.backend.generate_content.assert_called_once()
+    assert manager.backend.generate_content.call_args[0][3] == TASK_LIST_SCHEMA
+    assert manager.metrics.snapshot()["counters"]["manager.decomposition_cache_hits"] == 1
+
+@pytest.mark.parametrize("text", [
+    'Here is the plan:\n```json\n["A", "B"]\n```\nGood luck!',
+    'Sure! ["A", "B"] are the tasks.',
+    '{"tasks": ["A", "B"]}',
+    '1. A\n2. B',
+    '- A\n- B\n- A',
+    '[{"description": "A"}, {"task": "B"}, ""]',
+])
+def test_manager_decompose_task_repairs_output_locally(manager, text):
+    manager.backend = MagicMock()
+    manager.backend.generate_content.return_value = MagicMock(text=text)
+
+    assert manager.decompose_task("req") == ["A", "B"]
+    manager.backend.generate_content.assert_called_once()
+
+def test_manager_decompose_task_falls_back_to_requirement_without_caching(manager):
+    manager.backend = MagicMock()
+    manager.backend.generate_content.side_effect = [MagicMock(text="[]"), MagicMock(text='["A"]')]
+
+    assert manager.decompose_task("Make an API") == ["Make an API"]
+    assert manager.decompose_task("Make an API") == ["A"]
+
+def test_build_team_shares_one_backend(mock_env):
+    from main import build_team
+    backend = MagicMock()
+
+    manager = build_team(backend)
+
+    assert manager.backend is backend
+    with manager.agent_pools["Architect"].lease() as architect:
+        assert architect.backend is backend
+
+def test_manager_response_cache_key_includes_model_and_schema(manager):
+    from agent.model_router import ModelRouter
+    from agent.response_cache import ResponseCache
+    manager.response_cache = ResponseCache(":memory:")
+    manager.model_router = ModelRouter(fast_model="fast-model", strong_model="strong-model")
+    manager.backend = MagicMock()
+    manager.backend.generate_content.side_effect = lambda model_name, *args: MagicMock(
+        text="not a list" if model_name == "fast-model" else '["A"]')
+
+    # 安価なモデルの失敗の後、上位モデルでのやり直しの結果だけがキャッシュされる
+    assert manager._generate_list("sys", "prompt") == ["A"]
+    assert manager._generate_list("sys", "prompt", response_schema={"type": "array"}) == ["A"]
+
+    assert manager.backend.generate_content.call_count == 4
+    # 同じモデル・スキーマの上位モデルでのやり直しはキャッシュから返す
+    assert manager._generate_list("sys", "prompt") == ["A"]
+    assert manager.backend.generate_content.call_count == 5
+
+def test_manager_list_generation_goes_through_rate_limiter(manager):
+    manager.rate_limiter = MagicMock(spec=RateLimiter)
+    manager.rate_limiter.acquire_async = AsyncMock(return_value=0)
+    response = MagicMock(text='["A"]', usage_metadata=MagicMock(total_token_count=30))
+    manager.backend = MagicMock()
+    manager.backend.generate_content.return_value = response
+    manager.backend.generate_content_async = AsyncMock(return_value=response)
+
+    assert manager.decompose_task("sync") == ["A"]
+    manager.rate_limiter.acquire.assert_called_once_with(manager.model_name)
+    manager.rate_limiter.record_usage.assert_called_once_with(manager.model_name, 30)
+
+    # 非同期の計画はイベントループを止めない経路（非同期の予算の確保と生成）を使う
+    asyncio.run(manager.plan_tasks_async("async"))
+    manager.rate_limiter.acquire_async.assert_awaited_once_with(manager.model_name)
+    manager.backend.generate_content_async.assert_awaited_once()
+    manager.backend.generate_content.assert_called_once()
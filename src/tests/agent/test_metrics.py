@@ -0,0 +1,58 @@
+import pytest
+from agent.metrics import Metrics, diff_snapshots
+
+
+def test_counters_and_timers():
+    metrics = Metrics()
+    metrics.incr("agent.turns")
+    metrics.incr("api.tokens", 120)
+    metrics.add_time("api.request", 0.5)
+    metrics.add_time("api.request", 1.5)
+
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"] == {"agent.turns": 1, "api.tokens": 120}
+    assert snapshot["timers"]["api.request"] == {"count": 2, "total_seconds": 2.0, "max_seconds": 1.5}
+
+
+def test_timer_records_even_on_exception(clock):
+    metrics = Metrics(clock=clock)
+
+    with pytest.raises(RuntimeError):
+        with metrics.timer("agent.tools"):
+            clock.now += 2.0
+            raise RuntimeError("boom")
+
+    assert metrics.snapshot()["timers"]["agent.tools"]["total_seconds"] == 2.0
+
+
+def test_diff_snapshots():
+    metrics = Metrics()
+    metrics.incr("agent.turns")
+    metrics.add_time("api.request", 1.0)
+    before = metrics.snapshot()
+
+    metrics.incr("agent.turns")
+    metrics.incr("agent.tool_iterations", 3)
+    metrics.add_time("api.request", 2.0)
+    diff = diff_snapshots(before, metrics.snapshot())
+
+    assert diff["counters"] == {"agent.turns": 1, "agent.tool_iterations": 3}
+    assert diff["timers"]["api.request"]["count"] == 1
+    assert diff["timers"]["api.request"]["total_seconds"] == 2.0
+
+
+def test_reset():
+    metrics = Metrics()
+    metrics.incr("agent.turns")
+    metrics.reset()
+    assert metrics.snapshot() == {"counters": {}, "timers": {}, "observations": {}}
+
+
+def test_observe_records_count_total_and_max():
+    metrics = Metrics()
+    before = metrics.snapshot()
+    metrics.observe("sandbox.max_rss_kb", 100)
+    metrics.observe("sandbox.max_rss_kb", 300)
+
+    assert metrics.snapshot()["observations"]["sandbox.max_rss_kb"] == {"count": 2, "total": 400, "max": 300}
+    assert diff_snapshots(before, metrics.snapshot())["observations"]["sandbox.max_rss_kb"]["count"] == 2
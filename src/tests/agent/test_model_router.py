@@ -0,0 +1,82 @@
+import pytest
+from agent.model_router import (
+    ModelRouter, RouteRequest, parse_agent_tiers,
+    CALL_TURN, CALL_TOOL_FOLLOWUP, CALL_DECOMPOSITION, CALL_SUMMARY, TIER_FAST, TIER_DEFAULT, TIER_STRONG,
+)
+from agent.token_ledger import BUDGET_SOFT
+
+DEFAULT = "gemini-default"
+
+
+@pytest.fixture
+def router():
+    return ModelRouter(fast_model="gemini-fast", strong_model="gemini-strong", long_prompt_tokens=1000)
+
+
+def test_disabled_router_always_uses_agent_model():
+    router = ModelRouter()
+    assert not router.enabled
+    for call_type in (CALL_TURN, CALL_DECOMPOSITION):
+        decision = router.route(RouteRequest("Manager", call_type, escalation="failed"), DEFAULT)
+        assert (decision.model, decision.tier) == (DEFAULT, TIER_DEFAULT)
+
+
+def test_routine_calls_go_to_fast_model(router):
+    for request in (RouteRequest("Manager", CALL_DECOMPOSITION),
+                    RouteRequest("Coder", CALL_SUMMARY),
+                    RouteRequest("Coder", CALL_TOOL_FOLLOWUP, routine=True)):
+        decision = router.route(request, DEFAULT)
+        assert (decision.model, decision.tier) == ("gemini-fast", TIER_FAST)
+
+
+def test_turns_and_non_routine_followups_use_agent_model(router):
+    assert router.route(RouteRequest("Coder", CALL_TURN), DEFAULT).model == DEFAULT
+    assert router.route(RouteRequest("Coder", CALL_TOOL_FOLLOWUP, routine=False), DEFAULT).model == DEFAULT
+
+
+def test_long_prompts_are_not_sent_to_fast_model(router):
+    decision = router.route(RouteRequest("Coder", CALL_TOOL_FOLLOWUP, prompt_tokens=5000, routine=True), DEFAULT)
+    assert decision.model == DEFAULT
+    assert "long prompt" in decision.reason
+
+
+def test_escalation_and_budget(router):
+    decision = router.route(RouteRequest("Coder", CALL_TOOL_FOLLOWUP, escalation="sandbox exit code 1"), DEFAULT)
+    assert (decision.model, decision.tier) == ("gemini-strong", TIER_STRONG)
+    assert "sandbox exit code 1" in decision.reason
+    assert router.route(RouteRequest("Coder", CALL_TURN, budget_state=BUDGET_SOFT), DEFAULT).model == "gemini-fast"
+
+
+def test_agent_tiers(router):
+    router.agent_tiers = {"Architect": TIER_STRONG}
+    assert router.route(RouteRequest("Architect", CALL_TURN), DEFAULT).model == "gemini-strong"
+    assert router.route(RouteRequest("Coder", CALL_TURN), DEFAULT).model == DEFAULT
+
+
+def test_missing_tier_model_falls_back_to_agent_model():
+    router = ModelRouter(fast_model="gemini-fast")
+    decision = router.route(RouteRequest("Coder", CALL_TURN, escalation="failed"), DEFAULT)
+    assert (decision.model, decision.tier) == (DEFAULT, TIER_DEFAULT)
+    assert not router.can_escalate(DEFAULT)
+
+
+def test_is_routine(router):
+    assert router.is_routine(["Successfully saved to a.py", "Successfully saved to b.py"])
+    assert not router.is_routine([])
+    assert not router.is_routine(["Error: File not found"])
+    assert not router.is_routine(["x" * 2000])
+    assert not router.is_routine([{"result": 1}])
+
+
+def test_parse_agent_tiers():
+    assert parse_agent_tiers("Architect=strong, Coder = fast,,Bad=unknown") == {"Architect": "strong", "Coder": "fast"}
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("AGENT_MODEL_FAST", "lite")
+    monkeypatch.setenv("AGENT_MODEL_TIERS", "Manager=fast")
+    router = ModelRouter.from_env()
+    assert router.enabled
+    assert router.fast_model == "lite"
+    assert router.strong_model is None
+    assert router.agent_tiers == {"Manager": "fast"}
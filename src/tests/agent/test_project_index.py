@@ -0,0 +1,119 @@
+import os
+import pytest
+from agent.project_index import ProjectIndex, get_project_index
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "src" / "pkg").mkdir(parents=True)
+    (tmp_path / "src" / "main.py").write_text("print('hi')\n")
+    (tmp_path / "src" / "pkg" / "util.py").write_text("x = 1\n")
+    (tmp_path / "README.md").write_text("# readme\n")
+    (tmp_path / ".env").write_text("SECRET=1\n")
+    for ignored in (".git/objects", "node_modules/lib", ".venv/lib", "src/__pycache__"):
+        (tmp_path / ignored).mkdir(parents=True)
+        (tmp_path / ignored / "file.txt").write_text("x")
+    return tmp_path
+
+
+def _bump_mtime(path):
+    # mtime の分解能が粗いファイルシステムでも変更を検出できるよう、明示的に進める
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10_000_000))
+
+
+def test_tree_skips_default_ignored_and_hidden(project):
+    index = ProjectIndex(str(project))
+    tree = index.tree(".", max_depth=3)
+    assert "- README.md" in tree
+    assert "- src/" in tree
+    assert "    - util.py" in tree
+    for name in (".git", "node_modules", ".venv", "__pycache__", ".env"):
+        assert name not in tree
+    assert not any(path.startswith((".git", "node_modules")) for path in index.files())
+
+
+def test_tree_max_depth_lists_subdirectories_without_descending(project):
+    tree = ProjectIndex(str(project)).tree(".", max_depth=2)
+    assert "  - main.py" in tree
+    assert "  - pkg/" in tree
+    assert "util.py" not in tree
+
+
+def test_gitignore_rules(project):
+    (project / ".gitignore").write_text("*.log\nbuild/\n/src/generated.py\n!keep.log\n")
+    (project / "build").mkdir()
+    (project / "build" / "out.js").write_text("x")
+    (project / "src" / "debug.log").write_text("x")
+    (project / "src" / "keep.log").write_text("x")
+    (project / "src" / "generated.py").write_text("x")
+    (project / "src" / "pkg" / ".gitignore").write_text("util.py\n")
+    (project / "src" / "pkg" / "api.py").write_text("x")
+
+    files = set(ProjectIndex(str(project)).files())
+    assert files == {"README.md", "src/main.py", "src/keep.log", "src/pkg/api.py"}
+
+
+def test_gitignore_of_ancestor_applies_to_subdirectory_listing(project):
+    (project / ".gitignore").write_text("util.py\n")
+    files = list(ProjectIndex(str(project)).files("src"))
+    assert files == ["src/main.py"]
+
+
+def test_rescans_only_changed_directories(project):
+    index = ProjectIndex(str(project))
+    first = index.tree(".", max_depth=3)
+    scanned = index.scanned_dirs
+    assert index.tree(".", max_depth=3) == first
+    assert index.scanned_dirs == scanned
+
+    (project / "src" / "pkg" / "new.py").write_text("y")
+    _bump_mtime(project / "src" / "pkg")
+    tree = index.tree(".", max_depth=3)
+    assert "new.py" in tree
+    assert index.scanned_dirs == scanned + 1
+
+
+def test_gitignore_edited_in_place_is_reloaded(project):
+    index = ProjectIndex(str(project))
+    (project / ".gitignore").write_text("")
+    _bump_mtime(project)
+    assert "README.md" in index.tree()
+
+    gitignore = project / ".gitignore"
+    gitignore.write_text("README.md\n")
+    _bump_mtime(gitignore)
+    assert "README.md" not in index.tree()
+
+
+def test_max_entries_truncates_output(project):
+    for i in range(20):
+        (project / f"file{i:02d}.txt").write_text("x")
+    tree = ProjectIndex(str(project)).tree(".", max_depth=1, max_entries=5)
+    assert tree.count("\n- ") == 5
+    assert "more entries not shown" in tree
+
+
+def test_find_by_pattern_and_size(project):
+    (project / "src" / "big.py").write_text("x" * 2000)
+    index = ProjectIndex(str(project))
+
+    found = index.find(".", pattern="*.py")
+    assert "- src/main.py" in found
+    assert "- src/pkg/util.py" in found
+    assert "README.md" not in found
+
+    assert "- pkg/util.py" in index.find("src", pattern="pkg/*.py")
+    big = index.find(".", min_size=1000)
+    assert "src/big.py (2000 bytes)" in big
+    assert "main.py" not in big
+    assert "(no matching files)" in index.find(".", pattern="*.rs")
+
+
+def test_outside_root_is_rejected(project):
+    with pytest.raises(ValueError):
+        ProjectIndex(str(project / "src")).tree("..")
+
+
+def test_shared_index_per_root(project):
+    assert get_project_index(str(project)) is get_project_index(str(project / "src" / ".."))
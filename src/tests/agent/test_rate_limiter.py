@@ -0,0 +1,63 @@
+import pytest
+import os
+from unittest.mock import patch
+from agent.rate_limiter import RateLimiter, get_rate_limiter
+
+def test_acquire_does_not_wait_within_budget(clock):
+    limiter = RateLimiter(rpm=60, tpm=None, clock=clock, sleep=clock.sleep)
+
+    for _ in range(60):
+        assert limiter.acquire("model-a") == 0
+
+    assert clock.slept == []
+
+def test_acquire_waits_when_rpm_exhausted(clock):
+    limiter = RateLimiter(rpm=60, tpm=None, clock=clock, sleep=clock.sleep)
+    for _ in range(60):
+        limiter.acquire("model-a")
+
+    # 61回目は 1 リクエスト分 (60rpm -> 1秒) の回復を待つ
+    waited = limiter.acquire("model-a")
+
+    assert waited == pytest.approx(1.0)
+    assert limiter.stats("model-a")["waits"] == 1
+
+def test_buckets_are_keyed_by_model(clock):
+    limiter = RateLimiter(rpm=1, tpm=None, clock=clock, sleep=clock.sleep)
+    limiter.acquire("model-a")
+
+    assert limiter.acquire("model-b") == 0
+    assert limiter.acquire("model-a") > 0
+
+def test_record_usage_drains_tpm(clock):
+    limiter = RateLimiter(rpm=None, tpm=600, clock=clock, sleep=clock.sleep)
+    limiter.acquire("model-a")
+    limiter.record_usage("model-a", 700)
+
+    # 100 トークン超過 -> 600tpm (10 token/s) で 10 秒待機
+    assert limiter.acquire("model-a") == pytest.approx(10.0)
+
+def test_penalize_blocks_all_callers_of_model(clock):
+    limiter = RateLimiter(rpm=None, tpm=None, clock=clock, sleep=clock.sleep)
+    limiter.penalize("model-a", 20)
+
+    assert limiter.acquire("model-a") == pytest.approx(20.0)
+    assert limiter.acquire("model-b") == 0
+    assert limiter.stats("model-a")["rate_limited"] == 1
+
+def test_configure_overrides_model_limits(clock):
+    limiter = RateLimiter(rpm=1, tpm=None, clock=clock, sleep=clock.sleep)
+    limiter.configure("model-fast", rpm=120)
+
+    for _ in range(120):
+        assert limiter.acquire("model-fast") == 0
+
+def test_from_env():
+    with patch.dict(os.environ, {"GEMINI_RPM_LIMIT": "30", "GEMINI_TPM_LIMIT": "0"}):
+        limiter = RateLimiter.from_env()
+
+    assert limiter.default_rpm == 30
+    assert limiter.default_tpm is None
+
+def test_get_rate_limiter_is_shared():
+    assert get_rate_limiter() is get_rate_limiter()
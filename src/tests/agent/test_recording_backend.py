@@ -0,0 +1,72 @@
+import asyncio
+import json
+from agent.llm_backend import LLMBackend
+from agent.recording_backend import RecordingBackend, stream_key
+from agent.response_snapshot import ResponseSnapshot, PartSnapshot
+
+class ScriptedSession:
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.history = []
+
+    def send_message(self, content):
+        return ResponseSnapshot([PartSnapshot(text=self.replies.pop(0))])
+
+    async def send_message_async(self, content):
+        return self.send_message(content)
+
+class ScriptedBackend(LLMBackend):
+    def start_chat(self, model_name, system_instruction, tools=None):
+        return ScriptedSession(["first", "second"])
+
+    def generate_content(self, model_name, system_instruction, prompt, response_schema=None):
+        return ResponseSnapshot([PartSnapshot(text='["A"]')])
+
+def read_cassette(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+def test_records_chat_and_generate_calls(tmp_path):
+    cassette = tmp_path / "cassette.jsonl"
+    backend = RecordingBackend(ScriptedBackend(), str(cassette))
+
+    session = backend.start_chat("model", "system")
+    assert session.send_message("hello").text == "first"
+    assert asyncio.run(session.send_message_async([{"function_response": {"name": "f", "response": {"result": 1}}}])).text == "second"
+    backend.generate_content("model", "planner", "要件: x")
+
+    entries = read_cassette(cassette)
+    assert [e["stream"] for e in entries] == [
+        stream_key("chat", "model", "system"),
+        stream_key("chat", "model", "system"),
+        stream_key("generate", "model", "planner"),
+    ]
+    assert entries[0]["request"] == "hello"
+    assert entries[1]["response"]["parts"] == [{"text": "second"}]
+    assert all(e["latency"] >= 0 for e in entries)
+
+def test_history_is_delegated(tmp_path):
+    backend = RecordingBackend(ScriptedBackend(), str(tmp_path / "c.jsonl"))
+    session = backend.start_chat("model", "system")
+
+    session.history = [{"role": "user", "parts": [{"text": "x"}]}]
+
+    assert session._inner.history == [{"role": "user", "parts": [{"text": "x"}]}]
+
+def test_records_streamed_response_after_last_chunk(tmp_path):
+    cassette = tmp_path / "cassette.jsonl"
+
+    class StreamingSession(ScriptedSession):
+        def send_message(self, content, stream=False):
+            return iter([ResponseSnapshot([PartSnapshot(text="fi")]), ResponseSnapshot([PartSnapshot(text="rst")])])
+
+    class StreamingBackend(ScriptedBackend):
+        def start_chat(self, model_name, system_instruction, tools=None):
+            return StreamingSession([])
+
+    session = RecordingBackend(StreamingBackend(), str(cassette)).start_chat("model", "system")
+    chunks = session.send_message("hello", stream=True)
+
+    assert next(chunks).text == "fi"
+    assert not cassette.exists() or read_cassette(cassette) == []
+    assert [c.text for c in chunks] == ["rst"]
+    assert read_cassette(cassette)[0]["response"]["parts"] == [{"text": "first"}]
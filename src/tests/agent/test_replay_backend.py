@@ -0,0 +1,136 @@
+import pytest
+import asyncio
+import json
+import time
+from agent.agent import Agent
+from agent.recording_backend import stream_key, request_hash
+from agent.replay_backend import ReplayBackend
+from agent.rate_limiter import RateLimiter
+
+class EchoAgent(Agent):
+    def execute_tool(self, tool_name, args):
+        return f"{tool_name} ok"
+
+def write_cassette(path, entries):
+    with open(path, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+def entry(stream, request, parts, latency=0.0):
+    return {"stream": stream, "request_hash": request_hash(request), "request": request,
+            "response": {"parts": parts, "usage": {"total_token_count": 3}}, "latency": latency}
+
+def make_agent(backend):
+    return EchoAgent("Bot", "Tester", "testing", model_name="replay-model", backend=backend,
+                     rate_limiter=RateLimiter(rpm=None, tpm=None))
+
+@pytest.fixture
+def agent_stream(tmp_path):
+    empty = tmp_path / "empty.jsonl"
+    empty.write_text("")
+    probe = make_agent(ReplayBackend(str(empty)))
+    return stream_key("chat", "replay-model", probe._build_system_prompt())
+
+def test_replays_tool_loop_without_network(tmp_path, agent_stream):
+    cassette = tmp_path / "cassette.jsonl"
+    write_cassette(cassette, [
+        entry(agent_stream, "build it", [{"function_call": {"name": "write", "args": {"path": "a.py"}}}]),
+        entry(agent_stream, [{"function_response": {"name": "write", "response": {"result": "write ok"}}}], [{"text": "done"}]),
+    ])
+    backend = ReplayBackend(str(cassette), latency=0)
+
+    agent = make_agent(backend)
+
+    assert agent.send_message("build it") == "done"
+    assert backend.remaining() == 0
+    assert len(agent.chat_session.history) == 4
+
+def test_prefers_matching_request_within_stream(tmp_path):
+    cassette = tmp_path / "cassette.jsonl"
+    write_cassette(cassette, [
+        entry("chat:m:s", "first", [{"text": "one"}]),
+        entry("chat:m:s", "second", [{"text": "two"}]),
+    ])
+    backend = ReplayBackend(str(cassette), latency=0)
+
+    response, _ = backend.next_response("chat:m:s", "second")
+
+    assert response.text == "two"
+
+def test_simulated_latency(tmp_path):
+    cassette = tmp_path / "cassette.jsonl"
+    write_cassette(cassette, [entry("chat:m:s", "x", [{"text": "a"}], latency=10.0)])
+
+    _, delay = ReplayBackend(str(cassette), latency_scale=0.5).next_response("chat:m:s", "x")
+
+    assert delay == 5.0
+
+def test_async_session_sleeps_fixed_latency(tmp_path):
+    cassette = tmp_path / "cassette.jsonl"
+    write_cassette(cassette, [entry(stream_key("chat", "m", "s"), "x", [{"text": "a"}])])
+    session = ReplayBackend(str(cassette), latency=0.05).start_chat("m", "s")
+
+    start = time.perf_counter()
+    response = asyncio.run(session.send_message_async("x"))
+
+    assert response.text == "a"
+    assert time.perf_counter() - start >= 0.05
+
+def test_exhausted_cassette_raises(tmp_path):
+    cassette = tmp_path / "cassette.jsonl"
+    cassette.write_text("")
+
+    with pytest.raises(LookupError):
+        ReplayBackend(str(cassette)).generate_content("m", "s", "p")
+
+def test_stream_replay_splits_response_and_appends_history(tmp_path):
+    cassette = tmp_path / "cassette.jsonl"
+    text = "あ" * 40
+    write_cassette(cassette, [entry(stream_key("chat", "m", "s"), "x", [{"text": text}, {"function_call": {"name": "f", "args": {}}}])])
+    session = ReplayBackend(str(cassette), latency=0).start_chat("m", "s")
+
+    chunks = list(session.send_message("x", stream=True))
+
+    assert [c.text for c in chunks[:-1]] == ["あ" * 32, "あ" * 8]
+    assert chunks[-1].parts[0].function_call.name == "f"
+    assert chunks[-1].usage_metadata.total_token_count == 3
+    assert len(session.history) == 2
+
+def test_streaming_agent_reports_nested_events(tmp_path):
+    from agent.streaming import EVENT_START, EVENT_END, EVENT_TEXT, EVENT_TOOL_CALL, EVENT_TOOL_RESULT
+
+    class ParentAgent(Agent):
+        def execute_tool(self, tool_name, args):
+            return self.child.send_message(args["task"])
+
+    empty = tmp_path / "empty.jsonl"
+    empty.write_text("")
+    rate_limiter = RateLimiter(rpm=None, tpm=None)
+    parent_stream = stream_key("chat", "replay-model", ParentAgent("Parent", "r", "i", model_name="replay-model",
+                                                                    backend=ReplayBackend(str(empty)))._build_system_prompt())
+    child_stream = stream_key("chat", "replay-model", make_agent(ReplayBackend(str(empty)))._build_system_prompt())
+    cassette = tmp_path / "cassette.jsonl"
+    write_cassette(cassette, [
+        entry(parent_stream, "go", [{"text": "委任します"}, {"function_call": {"name": "ask", "args": {"task": "sub"}}}]),
+        entry(child_stream, "sub", [{"text": "sub done"}]),
+        entry(parent_stream, [{"function_response": {"name": "ask", "response": {"result": "sub done"}}}], [{"text": "all done"}]),
+    ])
+    backend = ReplayBackend(str(cassette), latency=0)
+    parent = ParentAgent("Parent", "r", "i", model_name="replay-model", backend=backend, rate_limiter=rate_limiter)
+    parent.child = make_agent(backend)
+    events = []
+
+    assert parent.send_message("go", on_event=events.append) == "all done"
+
+    assert [(e.kind, e.agent, e.depth) for e in events if e.kind != EVENT_TEXT] == [
+        (EVENT_START, "Parent", 0),
+        (EVENT_TOOL_CALL, "Parent", 0),
+        (EVENT_START, "Bot", 1),
+        (EVENT_END, "Bot", 1),
+        (EVENT_TOOL_RESULT, "Parent", 0),
+        (EVENT_END, "Parent", 0),
+    ]
+    texts = [(e.agent, e.depth, e.text) for e in events if e.kind == EVENT_TEXT]
+    assert texts == [("Parent", 0, "委任します"), ("Bot", 1, "sub done"), ("Parent", 0, "all done")]
+    assert backend.remaining() == 0
+    assert len(parent.chat_session.history) == 4
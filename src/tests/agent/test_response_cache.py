@@ -0,0 +1,56 @@
+import pytest
+import os
+from unittest.mock import patch
+from agent.response_cache import ResponseCache
+
+def test_put_and_get(clock):
+    cache = ResponseCache(":memory:", clock=clock)
+    key = ResponseCache.make_key("model", "prompt")
+
+    assert cache.get(key) is None
+    cache.put(key, {"parts": [{"text": "hi"}]})
+
+    assert cache.get(key) == {"parts": [{"text": "hi"}]}
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "entries": 1}
+
+def test_make_key_is_stable_and_distinct():
+    assert ResponseCache.make_key("m", {"a": 1, "b": 2}) == ResponseCache.make_key("m", {"b": 2, "a": 1})
+    assert ResponseCache.make_key("m", "x") != ResponseCache.make_key("m", "y")
+
+def test_expired_entries_are_misses(clock):
+    cache = ResponseCache(":memory:", ttl_seconds=60, clock=clock)
+    cache.put("k", {"v": 1})
+
+    clock.now += 61
+
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+def test_lru_eviction(clock):
+    cache = ResponseCache(":memory:", max_entries=2, clock=clock)
+    cache.put("a", {"v": "a"})
+    clock.now += 1
+    cache.put("b", {"v": "b"})
+    clock.now += 1
+    cache.get("a")  # a を最近参照したので b が最も古い
+    clock.now += 1
+    cache.put("c", {"v": "c"})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": "a"}
+    assert cache.get("c") == {"v": "c"}
+
+def test_persists_across_instances(tmp_path):
+    path = str(tmp_path / "cache" / "responses.sqlite")
+    ResponseCache(path).put("k", {"v": 1})
+
+    assert ResponseCache(path).get("k") == {"v": 1}
+
+def test_from_env_is_opt_in(tmp_path):
+    with patch.dict(os.environ, {}, clear=True):
+        assert ResponseCache.from_env() is None
+
+    with patch.dict(os.environ, {"AGENT_RESPONSE_CACHE": str(tmp_path / "c.sqlite"), "AGENT_RESPONSE_CACHE_MAX_ENTRIES": "10"}):
+        cache = ResponseCache.from_env()
+
+    assert cache.max_entries == 10
@@ -0,0 +1,35 @@
+from unittest.mock import MagicMock
+from agent.response_snapshot import ResponseSnapshot, to_plain
+
+def make_response():
+    text_part = MagicMock()
+    text_part.function_call = None
+    text_part.text = "設計します。"
+    call_part = MagicMock()
+    call_part.function_call.name = "write_design_doc"
+    call_part.function_call.args = {"file_path": "doc.md", "tags": ("a", "b")}
+    response = MagicMock()
+    response.parts = [text_part, call_part]
+    response.usage_metadata.prompt_token_count = 10
+    response.usage_metadata.candidates_token_count = 5
+    response.usage_metadata.total_token_count = 15
+    return response
+
+def test_from_response_round_trip():
+    snapshot = ResponseSnapshot.from_response(make_response())
+    restored = ResponseSnapshot.from_dict(snapshot.to_dict())
+
+    assert restored.text == "設計します。"
+    calls = [p.function_call for p in restored.parts if p.function_call]
+    assert calls[0].name == "write_design_doc"
+    assert dict(calls[0].args) == {"file_path": "doc.md", "tags": ["a", "b"]}
+    assert restored.usage_metadata.total_token_count == 15
+
+def test_to_content_is_model_role():
+    content = ResponseSnapshot.from_response(make_response()).to_content()
+
+    assert content["role"] == "model"
+    assert content["parts"][1]["function_call"]["name"] == "write_design_doc"
+
+def test_to_plain_converts_nested_containers():
+    assert to_plain({"a": [1, {"b": (2, 3)}]}) == {"a": [1, {"b": [2, 3]}]}
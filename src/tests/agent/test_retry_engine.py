@@ -0,0 +1,178 @@
+import random
+import pytest
+from unittest.mock import MagicMock
+from agent.retry_engine import (
+    RetryEngine, CircuitOpenError, ErrorInfo, classify_error, parse_retry_after,
+    ERROR_RATE_LIMIT, ERROR_NO_QUOTA, ERROR_SERVER, ERROR_NETWORK, ERROR_FATAL,
+    CIRCUIT_CLOSED, CIRCUIT_OPEN, CIRCUIT_HALF_OPEN,
+)
+
+
+class ApiError(Exception):
+    """google.api_core の例外と同じく code と response を持つ例外"""
+    def __init__(self, message, code=None, headers=None):
+        super().__init__(message)
+        self.code = code
+        self.response = MagicMock(headers=headers or {})
+
+
+class ResourceExhausted(Exception):
+    pass
+
+
+@pytest.fixture
+def engine(clock):
+    return RetryEngine(failure_threshold=3, cooldown=30, max_cooldown=120, clock=clock,
+                       sleep=MagicMock(), rng=random.Random(0))
+
+
+def test_classify_error_kinds():
+    assert classify_error(Exception("429 Resource has been exhausted (e.g. check quota).")).kind == ERROR_RATE_LIMIT
+    assert classify_error(ResourceExhausted("too many")).kind == ERROR_RATE_LIMIT
+    assert classify_error(Exception("Error: 429 quota exceeded")).kind == ERROR_RATE_LIMIT
+    assert classify_error(Exception("429 Quota exceeded for metric ... limit: 0")).kind == ERROR_NO_QUOTA
+    assert classify_error(ApiError("boom", code=503)).kind == ERROR_SERVER
+    assert classify_error(Exception("500 Internal error")).kind == ERROR_SERVER
+    assert classify_error(ConnectionResetError("reset")).kind == ERROR_NETWORK
+    assert classify_error(TimeoutError()).kind == ERROR_NETWORK
+    assert classify_error(ApiError("400 Invalid argument", code=400)).kind == ERROR_FATAL
+    assert classify_error(ValueError("bad")).kind == ERROR_FATAL
+    assert not classify_error(ValueError("bad")).retryable
+
+
+def test_parse_retry_after_from_header_and_message():
+    assert parse_retry_after(ApiError("429", headers={"Retry-After": "12"})) == 12.0
+    assert parse_retry_after(Exception("429 ... Please retry in 27.5s.")) == 27.5
+    assert parse_retry_after(Exception("retry_delay {\n  seconds: 40\n}")) == 40.0
+    assert parse_retry_after(Exception('{"retryDelay": "9s"}')) == 9.0
+    assert parse_retry_after(Exception("429 quota")) is None
+    assert classify_error(Exception("429 quota. Please retry in 3s.")).retry_after == 3.0
+
+
+def test_backoff_honors_retry_after_and_jitters_otherwise(engine):
+    assert engine.backoff(0.0, ErrorInfo(ERROR_RATE_LIMIT, 429, 7.0)) == 7.0
+
+    delays, previous = [], 0.0
+    for _ in range(20):
+        previous = engine.backoff(previous, ErrorInfo(ERROR_SERVER, 503))
+        delays.append(previous)
+    assert all(engine.base_delay <= d <= engine.max_delay for d in delays)
+    # 同じ失敗でも待機時間がばらつく（一斉にリトライしない）
+    assert len(set(delays)) > 1
+    assert max(delays) > engine.base_delay * 3
+
+
+def test_circuit_opens_after_consecutive_failures_and_half_opens(engine, clock):
+    error = ErrorInfo(ERROR_SERVER, 503)
+    assert not engine.record_failure("m", error)
+    assert not engine.record_failure("m", error)
+    assert engine.record_failure("m", error)
+    assert engine.state("m") == CIRCUIT_OPEN
+    assert not engine.allow("m")
+    with pytest.raises(CircuitOpenError) as raised:
+        engine.check("m")
+    assert raised.value.retry_in == pytest.approx(30)
+    # 他のモデルには影響しない
+    assert engine.allow("other")
+
+    clock.advance(30)
+    assert engine.state("m") == CIRCUIT_HALF_OPEN
+    # 冷却期間の後は1件だけ試行を許す
+    assert engine.allow("m")
+    assert not engine.allow("m")
+    engine.record_success("m")
+    assert engine.state("m") == CIRCUIT_CLOSED
+    assert engine.allow("m")
+    assert engine.stats("m")["opened"] == 1
+
+
+def test_failed_probe_doubles_cooldown(engine, clock):
+    for _ in range(3):
+        engine.record_failure("m", ErrorInfo(ERROR_SERVER, 503))
+    clock.advance(30)
+    assert engine.allow("m")
+    assert engine.record_failure("m", ErrorInfo(ERROR_SERVER, 503))
+    assert engine.retry_in("m") == pytest.approx(60)
+    clock.advance(60)
+    assert engine.allow("m")
+    engine.record_failure("m", ErrorInfo(ERROR_SERVER, 503))
+    assert engine.retry_in("m") == pytest.approx(120)
+
+
+def test_probe_that_never_reports_is_handed_to_another_caller(engine, clock):
+    for _ in range(3):
+        engine.record_failure("m", ErrorInfo(ERROR_SERVER, 503))
+    clock.advance(30)
+    assert engine.allow("m")
+    clock.advance(31)
+    assert engine.allow("m")
+
+
+def test_success_resets_failure_count_and_fatal_errors_do_not_count(engine):
+    engine.record_failure("m", ErrorInfo(ERROR_SERVER, 503))
+    engine.record_failure("m", ErrorInfo(ERROR_SERVER, 503))
+    engine.record_failure("m", ErrorInfo(ERROR_FATAL, 400))
+    assert not engine.record_failure("m", ErrorInfo(ERROR_SERVER, 503))
+    assert engine.state("m") == CIRCUIT_CLOSED
+
+
+def test_no_quota_opens_immediately_for_max_cooldown(engine):
+    assert engine.record_failure("m", ErrorInfo(ERROR_NO_QUOTA, 429))
+    assert engine.retry_in("m") == pytest.approx(120)
+
+
+def test_open_circuit_waits_at_least_retry_after(engine):
+    for _ in range(2):
+        engine.record_failure("m", ErrorInfo(ERROR_RATE_LIMIT, 429))
+    engine.record_failure("m", ErrorInfo(ERROR_RATE_LIMIT, 429, retry_after=90))
+    assert engine.retry_in("m") == pytest.approx(90)
+
+
+def test_threshold_zero_disables_circuit(clock):
+    engine = RetryEngine(failure_threshold=0, clock=clock)
+    for _ in range(10):
+        engine.record_failure("m", ErrorInfo(ERROR_SERVER, 503))
+    assert engine.allow("m")
+
+
+def test_call_retries_transient_errors(engine):
+    func = MagicMock(side_effect=[Exception("503 unavailable"), Exception("429 quota. retry in 4s"), "ok"])
+    penalize = MagicMock()
+
+    assert engine.call("m", func, on_rate_limit=penalize) == "ok"
+
+    assert func.call_count == 3
+    penalize.assert_called_once_with("m", 4.0)
+    assert engine._sleep.call_count == 2
+    assert engine.state("m") == CIRCUIT_CLOSED
+
+
+def test_call_does_not_retry_fatal_errors_and_gives_up_after_max_attempts(engine):
+    func = MagicMock(side_effect=ValueError("bad request"))
+    with pytest.raises(ValueError):
+        engine.call("m", func)
+    assert func.call_count == 1
+
+    func = MagicMock(side_effect=Exception("503 unavailable"))
+    with pytest.raises(Exception, match="503"):
+        engine.call("m2", func)
+    assert func.call_count == engine.max_attempts
+
+
+def test_call_fails_fast_while_circuit_is_open(engine):
+    for _ in range(3):
+        engine.record_failure("m", ErrorInfo(ERROR_SERVER, 503))
+    func = MagicMock()
+    with pytest.raises(CircuitOpenError):
+        engine.call("m", func)
+    func.assert_not_called()
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("AGENT_RETRY_MAX_ATTEMPTS", "5")
+    monkeypatch.setenv("AGENT_CIRCUIT_COOLDOWN", "10")
+    monkeypatch.setenv("AGENT_FAILOVER_MODEL", "gemini-lite")
+    engine = RetryEngine.from_env()
+    assert engine.max_attempts == 5
+    assert engine.cooldown == 10
+    assert engine.failover_model == "gemini-lite"
@@ -0,0 +1,118 @@
+import os
+
+import pytest
+
+from agent.sandbox_process import OutputCapture, SandboxLimits, run_command
+
+pytestmark = pytest.mark.skipif(os.name != "posix", reason="POSIX のプロセスグループを使う")
+
+
+def test_output_capture_keeps_everything_under_limit():
+    capture = OutputCapture(max_bytes=100)
+    capture.feed(b"hello ")
+    capture.feed(b"world")
+
+    assert capture.text() == "hello world"
+    assert capture.omitted_bytes == 0
+
+
+def test_output_capture_keeps_head_and_tail_of_large_output():
+    capture = OutputCapture(max_bytes=20)
+    for i in range(1000):
+        capture.feed(f"{i:04d}\n".encode())
+
+    text = capture.text()
+
+    assert text.startswith("0000\n0001\n")
+    assert text.endswith("0998\n0999\n")
+    assert capture.total_bytes == 5000
+    assert capture.omitted_bytes == 4980
+    assert "[4980 bytes of output omitted]" in text
+    # 保持するバイト数は上限の数倍を超えない
+    assert len(capture._tail) <= 2 * 10
+
+
+def test_output_capture_without_limit():
+    capture = OutputCapture(max_bytes=0)
+    capture.feed(b"x" * 10000)
+
+    assert capture.text() == "x" * 10000
+
+
+def test_run_command_captures_exit_code_and_streams(tmp_path):
+    seen = []
+
+    result = run_command("echo out; echo err >&2; exit 4", cwd=str(tmp_path), timeout=5,
+                         on_output=lambda stream, text: seen.append((stream, text)))
+
+    assert result.exit_code == 4
+    assert result.stdout == "out\n"
+    assert result.stderr == "err\n"
+    assert sorted(seen) == [("stderr", "err\n"), ("stdout", "out\n")]
+
+
+def test_run_command_returns_partial_output_on_timeout(tmp_path):
+    result = run_command("echo started; sleep 10", cwd=str(tmp_path), timeout=0.5)
+
+    assert result.timed_out
+    assert result.stdout == "started\n"
+    assert result.duration < 5
+
+
+def test_run_command_bounds_noisy_output(tmp_path):
+    result = run_command("python -c \"print('y' * 1000000)\"", cwd=str(tmp_path), timeout=10, max_output_bytes=1000)
+
+    assert result.exit_code == 0
+    assert result.truncated
+    assert result.stdout_bytes == 1000001
+    assert len(result.stdout) < 1100
+
+
+def test_run_command_does_not_wait_for_background_processes(tmp_path):
+    result = run_command("sleep 10 & echo done", cwd=str(tmp_path), timeout=5)
+
+    assert result.stdout == "done\n"
+    assert not result.timed_out
+    assert result.duration < 5
+
+
+def test_run_command_reports_resource_usage(tmp_path):
+    result = run_command("python -c \"sum(range(3000000)); b = bytearray(50 * 1024 * 1024)\"",
+                         cwd=str(tmp_path), timeout=10)
+
+    assert result.exit_code == 0
+    assert result.user_seconds + result.system_seconds > 0
+    assert result.max_rss_kb > 50 * 1024
+
+
+def test_run_command_applies_memory_limit(tmp_path):
+    limits = SandboxLimits(cpu_seconds=0, memory_mb=256, open_files=0)
+
+    result = run_command("python -c \"b = bytearray(1024 * 1024 * 1024)\"", cwd=str(tmp_path), timeout=10,
+                         limits=limits)
+
+    assert result.exit_code == 1
+    assert "MemoryError" in result.stderr
+
+
+def test_run_command_applies_open_files_limit(tmp_path):
+    limits = SandboxLimits(cpu_seconds=0, memory_mb=0, open_files=32)
+
+    result = run_command("python -c \"import resource; print(resource.getrlimit(resource.RLIMIT_NOFILE))\"",
+                         cwd=str(tmp_path), timeout=10, limits=limits)
+
+    assert result.stdout == "(32, 32)\n"
+
+
+def test_sandbox_limits_from_env(monkeypatch):
+    monkeypatch.setenv("AGENT_SANDBOX_CPU_SECONDS", "5")
+    monkeypatch.setenv("AGENT_SANDBOX_MEMORY_MB", "512")
+    monkeypatch.setenv("AGENT_SANDBOX_MAX_PROCESSES", "64")
+
+    assert SandboxLimits.from_env() == SandboxLimits(cpu_seconds=5, memory_mb=512, max_processes=64, open_files=1024)
+
+
+def test_run_command_overrides_environment(tmp_path):
+    result = run_command("echo $SANDBOX_FLAG", cwd=str(tmp_path), timeout=5, env={"SANDBOX_FLAG": "on"})
+
+    assert result.stdout == "on\n"
@@ -0,0 +1,142 @@
+import pytest
+
+from agent.sandbox_process import SandboxLimits
+from agent.sandbox_worker import SandboxWorker, parse_command
+
+pytestmark = pytest.mark.skipif(not SandboxWorker.is_supported(), reason="fork が使えない環境")
+
+
+@pytest.fixture
+def worker(tmp_path):
+    worker = SandboxWorker(tmp_path)
+    yield worker
+    worker.close()
+
+
+def test_parse_command_runs_plain_python_in_worker():
+    assert parse_command("python app.py a b") == {"op": "file", "path": "app.py", "args": ["a", "b"]}
+    assert parse_command("python3 -c \"print('x')\"") == {"op": "code", "code": "print('x')", "args": []}
+    assert parse_command("python -m pytest -q") == {"op": "module", "module": "pytest", "args": ["-q"]}
+
+
+@pytest.mark.parametrize("command", [
+    "ls -la", "python app.py | head", "python app.py > out.txt", "python -c \"print($HOME)\"",
+    "FOO=1 python app.py", "python -u app.py", "python",
+])
+def test_parse_command_falls_back_to_shell(command):
+    assert parse_command(command) == {"op": "shell", "command": command}
+
+
+def test_worker_runs_python_file_like_interpreter(worker, tmp_path):
+    (tmp_path / "helper.py").write_text("VALUE = 42\n")
+    (tmp_path / "app.py").write_text(
+        "import sys, helper\nprint(sys.argv, helper.VALUE)\nprint('oops', file=sys.stderr)\nsys.exit(3)\n")
+
+    result = worker.run("python app.py x")
+
+    assert result.exit_code == 3
+    assert result.stdout == "['app.py', 'x'] 42\n"
+    assert result.stderr == "oops\n"
+
+
+def test_worker_reports_uncaught_exceptions(worker, tmp_path):
+    (tmp_path / "app.py").write_text("raise ValueError('bad')\n")
+
+    result = worker.run("python app.py")
+
+    assert result.exit_code == 1
+    assert "ValueError: bad" in result.stderr
+
+
+def test_worker_runs_shell_commands_in_cwd(worker, tmp_path):
+    (tmp_path / "sub").mkdir()
+
+    result = worker.run("pwd && echo done | tr a-z A-Z", cwd=tmp_path / "sub")
+
+    assert result.stdout == f"{(tmp_path / 'sub').resolve()}\nDONE\n"
+
+
+def test_worker_is_reused_and_state_does_not_leak(worker):
+    first = worker.run("python -c \"import sys; sys.leaked = 1; print(id(sys))\"")
+    second = worker.run("python -c \"import sys; print(hasattr(sys, 'leaked'))\"")
+
+    assert first.exit_code == 0
+    assert second.stdout == "False\n"
+    assert worker.starts == 1
+
+
+def test_worker_enforces_timeout_and_keeps_serving(worker):
+    result = worker.run("python -c \"import time; time.sleep(10)\"", timeout=0.5)
+
+    assert result.timed_out
+    assert result.duration < 5
+    assert worker.run("echo ok").stdout == "ok\n"
+    assert worker.starts == 1
+
+
+def test_worker_preloads_modules_and_reports_failures(tmp_path):
+    worker = SandboxWorker(tmp_path, preload=["json", "no_such_module_xyz"])
+    try:
+        result = worker.run("python -c \"import sys; print('json' in sys.modules)\"")
+    finally:
+        worker.close()
+
+    assert result.stdout == "True\n"
+    assert list(worker.preload_failures) == ["no_such_module_xyz"]
+
+
+def test_worker_reset_restarts_process(worker):
+    worker.run("echo 1")
+    worker.reset()
+
+    assert not worker.running
+    assert worker.run("echo 2").stdout == "2\n"
+    assert worker.starts == 2
+
+
+def test_worker_from_env(monkeypatch, tmp_path):
+    monkeypatch.delenv("AGENT_SANDBOX_WORKER", raising=False)
+    assert SandboxWorker.from_env(tmp_path) is None
+
+    monkeypatch.setenv("AGENT_SANDBOX_WORKER", "1")
+    monkeypatch.setenv("AGENT_SANDBOX_PRELOAD", "json, csv")
+    worker = SandboxWorker.from_env(tmp_path)
+
+    assert worker.preload == ["json", "csv"]
+    assert not worker.running
+
+
+def test_worker_streams_output_and_bounds_capture(worker):
+    seen = []
+
+    result = worker.run("python -c \"print('z' * 100000)\"", max_output_bytes=100,
+                        on_output=lambda stream, text: seen.append(text))
+
+    assert result.truncated
+    assert result.stdout_bytes == 100001
+    assert "".join(seen) == "z" * 100000 + "\n"
+
+
+def test_worker_returns_partial_output_on_timeout(worker):
+    result = worker.run("python -c \"print('begin', flush=True); import time; time.sleep(10)\"", timeout=0.5)
+
+    assert result.timed_out
+    assert result.stdout == "begin\n"
+
+
+def test_worker_applies_limits_to_commands_only(worker):
+    limits = SandboxLimits(cpu_seconds=1, memory_mb=0, open_files=0)
+
+    result = worker.run("python -c \"while True: pass\"", limits=limits)
+
+    assert result.exit_code < 0
+    assert result.user_seconds >= 0.9
+    # ワーカー自身には上限を課さないため、次のコマンドも実行できる
+    assert worker.run("echo ok").stdout == "ok\n"
+
+
+def test_worker_applies_environment_to_commands(worker):
+    result = worker.run("python -c \"import os; print(os.environ['SANDBOX_FLAG'])\"", env={"SANDBOX_FLAG": "on"})
+
+    assert result.stdout == "on\n"
+    assert "SANDBOX_FLAG" not in worker.run("env").stdout
@@ -0,0 +1,71 @@
+from unittest.mock import MagicMock
+
+from agent.response_snapshot import ResponseSnapshot, PartSnapshot, FunctionCallSnapshot, UsageSnapshot
+from agent.streaming import (
+    StreamAssembler, emit, stream_events, stream_turn, current_stream_callback,
+    EVENT_START, EVENT_END, EVENT_TEXT, EVENT_TOOL_CALL,
+)
+
+
+def text_chunk(text, total=0):
+    return ResponseSnapshot([PartSnapshot(text=text)], UsageSnapshot(total_token_count=total))
+
+
+def call_chunk(name, **args):
+    return ResponseSnapshot([PartSnapshot(function_call=FunctionCallSnapshot(name, args))])
+
+
+def test_emit_without_callback_is_noop():
+    assert current_stream_callback() is None
+    emit(EVENT_TEXT, "Bot", "ignored")
+
+
+def test_stream_turn_reports_nested_depth():
+    events = []
+    with stream_events(events.append):
+        with stream_turn("Manager"):
+            emit(EVENT_TOOL_CALL, "Manager", "delegate_task()")
+            with stream_turn("Coder"):
+                emit(EVENT_TEXT, "Coder", "hi")
+
+    assert [(e.kind, e.agent, e.depth) for e in events] == [
+        (EVENT_START, "Manager", 0),
+        (EVENT_TOOL_CALL, "Manager", 0),
+        (EVENT_START, "Coder", 1),
+        (EVENT_TEXT, "Coder", 1),
+        (EVENT_END, "Coder", 1),
+        (EVENT_END, "Manager", 0),
+    ]
+    assert current_stream_callback() is None
+
+
+def test_assembler_joins_text_and_collects_function_calls():
+    events = []
+    assembler = StreamAssembler("Bot")
+    with stream_events(events.append):
+        for chunk in [text_chunk("Hel"), text_chunk("lo"), call_chunk("run", cmd="ls"), text_chunk("", total=42)]:
+            assembler.add(chunk)
+
+    response = assembler.response()
+
+    assert [e.text for e in events] == ["Hel", "lo"]
+    assert response.text == "Hello"
+    assert response.parts[1].function_call.name == "run"
+    assert response.parts[1].function_call.args == {"cmd": "ls"}
+    assert response.usage_metadata.total_token_count == 42
+    assert assembler.time_to_first_chunk is not None
+
+
+def test_assembler_accepts_chunks_without_candidates():
+    chunk = MagicMock()
+    type(chunk).parts = property(lambda self: (_ for _ in ()).throw(ValueError("no candidates")))
+    chunk.usage_metadata.prompt_token_count = 3
+    chunk.usage_metadata.candidates_token_count = 4
+    chunk.usage_metadata.total_token_count = 7
+    assembler = StreamAssembler()
+
+    assembler.add(text_chunk("ok"))
+    assembler.add(chunk)
+
+    assert assembler.response().text == "ok"
+    assert assembler.response().usage_metadata.total_token_count == 7
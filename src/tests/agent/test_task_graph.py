@@ -0,0 +1,72 @@
+import pytest
+from agent.task_graph import TaskGraph, TaskNode, DONE, FAILED, SKIPPED, PENDING
+
+AGENTS = ["Architect", "Coder"]
+
+def test_from_list_with_structured_items():
+    graph = TaskGraph.from_list([
+        {"id": "t1", "description": "設計", "assignee": "Architect", "depends_on": []},
+        {"id": "t2", "description": "API実装", "assignee": "Coder", "depends_on": ["t1"]},
+        {"id": "t3", "description": "UI実装", "assignee": "Coder", "depends_on": "t1"},
+    ], AGENTS)
+
+    assert graph.nodes["t2"].depends_on == ["t1"]
+    assert graph.nodes["t3"].depends_on == ["t1"]
+    assert [n.id for n in graph.ready()] == ["t1"]
+
+def test_from_list_with_plain_strings_is_sequential():
+    graph = TaskGraph.from_list(["設計", "実装", "テスト"], AGENTS)
+
+    assert graph.nodes["t2"].depends_on == ["t1"]
+    assert graph.nodes["t3"].depends_on == ["t2"]
+    assert all(n.assignee == "Coder" for n in graph.nodes.values())
+
+def test_from_list_sanitizes_unknown_assignee_and_dependencies():
+    graph = TaskGraph.from_list([
+        {"id": "a", "description": "x", "assignee": "Reviewer", "depends_on": ["missing", "a"]},
+    ], AGENTS)
+
+    assert graph.nodes["a"].assignee == "Coder"
+    assert graph.nodes["a"].depends_on == []
+
+def test_from_list_accepts_scalar_dependency():
+    graph = TaskGraph.from_list([
+        {"id": "1", "description": "設計", "assignee": "Architect"},
+        {"id": "2", "description": "実装", "assignee": "Coder", "depends_on": 1},
+    ], AGENTS)
+
+    assert graph.nodes["2"].depends_on == ["1"]
+
+def test_cycle_is_rejected():
+    with pytest.raises(ValueError, match="Cyclic"):
+        TaskGraph([
+            TaskNode("a", "x", "Coder", ["b"]),
+            TaskNode("b", "y", "Coder", ["a"]),
+        ])
+
+def test_duplicate_id_is_rejected():
+    with pytest.raises(ValueError, match="Duplicate"):
+        TaskGraph([TaskNode("a", "x", "Coder"), TaskNode("a", "y", "Coder")])
+
+def test_ready_and_skip_blocked():
+    graph = TaskGraph([
+        TaskNode("a", "x", "Coder"),
+        TaskNode("b", "y", "Coder", ["a"]),
+        TaskNode("c", "z", "Coder", ["b"]),
+    ])
+    graph.nodes["a"].status = FAILED
+
+    skipped = graph.skip_blocked()
+
+    assert [n.id for n in skipped] == ["b", "c"]
+    assert graph.nodes["c"].status == SKIPPED
+    assert graph.is_finished()
+
+def test_critical_path_seconds():
+    graph = TaskGraph([
+        TaskNode("a", "x", "Coder", status=DONE, started_at=0, finished_at=2),
+        TaskNode("b", "y", "Coder", ["a"], status=DONE, started_at=2, finished_at=5),
+        TaskNode("c", "z", "Coder", ["a"], status=DONE, started_at=2, finished_at=3),
+    ])
+
+    assert graph.critical_path_seconds() == 5
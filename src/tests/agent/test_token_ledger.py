@@ -0,0 +1,81 @@
+import pytest
+import os
+import threading
+import contextvars
+from unittest.mock import patch
+from agent.token_ledger import TokenLedger, TokenBudgetExceeded, BUDGET_OK, BUDGET_SOFT, BUDGET_HARD, get_token_ledger
+
+
+def test_record_aggregates_by_agent_session_model_and_process():
+    ledger = TokenLedger()
+    with ledger.session("s1"):
+        ledger.record("Manager", "flash", prompt_tokens=10, candidates_tokens=5, total_tokens=15)
+        ledger.record("Coder", "flash", prompt_tokens=20, candidates_tokens=10)
+    with ledger.session("s2"):
+        ledger.record("Coder", "pro", total_tokens=100)
+
+    snapshot = ledger.snapshot()
+    assert snapshot["process"] == {"calls": 3, "prompt_tokens": 30, "candidates_tokens": 15, "total_tokens": 145}
+    assert snapshot["sessions"]["s1"]["total_tokens"] == 45
+    assert snapshot["sessions"]["s2"]["total_tokens"] == 100
+    assert snapshot["agents"]["Coder"]["calls"] == 2
+    assert snapshot["models"]["pro"]["total_tokens"] == 100
+
+
+def test_session_limits_apply_per_session():
+    ledger = TokenLedger(session_soft_limit=50, session_hard_limit=100)
+    with ledger.session("s1"):
+        assert ledger.check() == BUDGET_OK
+        ledger.record("Manager", "flash", total_tokens=60)
+        assert ledger.check() == BUDGET_SOFT
+        ledger.record("Manager", "flash", total_tokens=40)
+        assert ledger.check() == BUDGET_HARD
+        with pytest.raises(TokenBudgetExceeded, match="Manager"):
+            ledger.enforce("Manager")
+    with ledger.session("s2"):
+        assert ledger.enforce("Manager") == BUDGET_OK
+
+
+def test_process_hard_limit_spans_sessions():
+    ledger = TokenLedger(process_hard_limit=100)
+    with ledger.session("s1"):
+        ledger.record("Manager", "flash", total_tokens=100)
+    with ledger.session("s2"):
+        assert ledger.check() == BUDGET_HARD
+
+
+def test_session_is_inherited_by_worker_threads():
+    ledger = TokenLedger()
+    with ledger.session("s1"):
+        thread = threading.Thread(target=contextvars.copy_context().run, args=(ledger.record, "Coder", "flash", 0, 0, 7))
+        thread.start()
+        thread.join()
+    assert ledger.snapshot()["sessions"]["s1"]["total_tokens"] == 7
+
+
+def test_from_env():
+    env = {
+        "AGENT_SESSION_TOKEN_SOFT_LIMIT": "1000",
+        "AGENT_SESSION_TOKEN_HARD_LIMIT": "2000",
+        "AGENT_PROCESS_TOKEN_HARD_LIMIT": "0",
+        "AGENT_BUDGET_FALLBACK_MODEL": "gemini-cheap",
+        "AGENT_BUDGET_SOFT_EXTRA_ITERATIONS": "2",
+    }
+    with patch.dict(os.environ, env, clear=True):
+        ledger = TokenLedger.from_env()
+    assert ledger.session_soft_limit == 1000
+    assert ledger.session_hard_limit == 2000
+    assert ledger.process_hard_limit is None
+    assert ledger.fallback_model == "gemini-cheap"
+    assert ledger.soft_extra_iterations == 2
+
+
+@pytest.mark.parametrize("value, expected", [("0", 0), ("", 1), (None, 1)])
+def test_from_env_soft_extra_iterations(value, expected):
+    env = {} if value is None else {"AGENT_BUDGET_SOFT_EXTRA_ITERATIONS": value}
+    with patch.dict(os.environ, env, clear=True):
+        assert TokenLedger.from_env().soft_extra_iterations == expected
+
+
+def test_get_token_ledger_is_shared():
+    assert get_token_ledger() is get_token_ledger()
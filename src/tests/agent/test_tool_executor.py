@@ -0,0 +1,137 @@
+import pytest
+import asyncio
+import threading
+import time
+from agent.tool_executor import (
+    ToolExecutor,
+    ThreadPoolToolExecutor,
+    AsyncioToolExecutor,
+    create_tool_executor,
+    parallel_safe,
+)
+
+class FakeAgent:
+    """execute_tool / is_tool_parallel_safe だけを持つテスト用エージェント"""
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    @parallel_safe
+    def read(self, value):
+        return value
+
+    def write(self, value):
+        return value
+
+    async def execute_tool_async(self, tool_name, args):
+        return await asyncio.to_thread(self.execute_tool, tool_name, args)
+
+    def is_tool_parallel_safe(self, tool_name):
+        return bool(getattr(getattr(self, tool_name, None), "parallel_safe", False))
+
+    def execute_tool(self, tool_name, args):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        if args.get("fail"):
+            raise RuntimeError(f"{tool_name} failed")
+        return f"{tool_name}:{args['value']}"
+
+def test_plan_batches_isolates_unsafe_tools():
+    calls = [("read", {}), ("read", {}), ("write", {}), ("read", {})]
+
+    assert ToolExecutor().plan_batches(FakeAgent(), calls) == [[0, 1], [2], [3]]
+
+def test_plan_batches_serializes_calls_on_the_same_file():
+    calls = [("read", {"file_path": "a.py"}), ("read", {"file_path": "b.py"}),
+             ("read", {"file_path": "./a.py"}), ("read", {"file_path": "c.py"})]
+
+    # 同じファイルへの呼び出しは別のバッチに分け、元の順序で実行する
+    assert ToolExecutor().plan_batches(FakeAgent(), calls) == [[0, 1], [2, 3]]
+
+@pytest.mark.parametrize("executor_cls", [ToolExecutor, ThreadPoolToolExecutor, AsyncioToolExecutor])
+def test_results_keep_original_order(executor_cls):
+    calls = [("read", {"value": i}) for i in range(5)] + [("write", {"value": 5})]
+    executor = executor_cls()
+
+    results = executor.run(FakeAgent(), calls)
+    executor.close()
+
+    assert results == [f"read:{i}" for i in range(5)] + ["write:5"]
+
+@pytest.mark.parametrize("executor_cls", [ThreadPoolToolExecutor, AsyncioToolExecutor])
+def test_parallel_safe_tools_run_concurrently(executor_cls):
+    agent = FakeAgent(delay=0.2)
+    executor = executor_cls()
+
+    start = time.perf_counter()
+    executor.run(agent, [("read", {"value": i}) for i in range(4)])
+    elapsed = time.perf_counter() - start
+    executor.close()
+
+    assert agent.max_active > 1
+    assert elapsed < 0.6
+
+def test_unsafe_tools_never_overlap():
+    agent = FakeAgent(delay=0.05)
+    executor = ThreadPoolToolExecutor()
+
+    executor.run(agent, [("write", {"value": i}) for i in range(3)] + [("read", {"value": 3})])
+    executor.close()
+
+    assert agent.max_active == 1
+
+def test_thread_pool_reraises_tool_error():
+    executor = ThreadPoolToolExecutor()
+
+    with pytest.raises(RuntimeError, match="read failed"):
+        executor.run(FakeAgent(), [("read", {"value": 0}), ("read", {"value": 1, "fail": True})])
+    executor.close()
+
+def test_create_tool_executor():
+    assert isinstance(create_tool_executor("thread"), ThreadPoolToolExecutor)
+    assert isinstance(create_tool_executor("asyncio"), AsyncioToolExecutor)
+    assert type(create_tool_executor("sequential")) is ToolExecutor
+    with pytest.raises(ValueError):
+        create_tool_executor("unknown")
+
+@pytest.mark.parametrize("executor_cls", [ToolExecutor, ThreadPoolToolExecutor, AsyncioToolExecutor])
+def test_run_async_keeps_original_order(executor_cls):
+    calls = [("read", {"value": i}) for i in range(3)] + [("write", {"value": 3}), ("read", {"value": 4})]
+
+    results = asyncio.run(executor_cls().run_async(FakeAgent(delay=0.01), calls))
+
+    assert results == ["read:0", "read:1", "read:2", "write:3", "read:4"]
+
+def test_asyncio_executor_run_async_is_concurrent():
+    agent = FakeAgent(delay=0.2)
+
+    start = time.perf_counter()
+    asyncio.run(AsyncioToolExecutor().run_async(agent, [("read", {"value": i}) for i in range(4)]))
+
+    assert time.perf_counter() - start < 0.6
+
+@pytest.mark.parametrize("executor", [ThreadPoolToolExecutor(max_workers=2), AsyncioToolExecutor(max_concurrency=2)])
+def test_tool_spans_are_children_of_caller_span(executor):
+    from agent.tracing import get_tracer
+    from agent.trace_exporters import InMemorySpanExporter
+
+    exporter = InMemorySpanExporter()
+    tracer = get_tracer()
+    tracer.add_exporter(exporter)
+    try:
+        with tracer.span("agent.send_message") as root:
+            executor.run(FakeAgent(), [("read", {"value": 1}), ("read", {"value": 2})])
+    finally:
+        tracer.exporters.remove(exporter)
+        executor.close()
+
+    tool_spans = [s for s in exporter.spans if s.name == "tool.execute"]
+    assert len(tool_spans) == 2
+    assert {s.parent_id for s in tool_spans} == {root.span_id}
+    assert {s.attributes["tool.name"] for s in tool_spans} == {"read"}
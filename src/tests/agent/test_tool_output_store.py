@@ -0,0 +1,78 @@
+import re
+
+from agent.tool_output_store import ToolOutputStore
+
+
+def output_id_of(text):
+    return re.search(r'read_tool_output\("([^"]+)"', text).group(1)
+
+
+def test_limit_returns_small_results_unchanged(tmp_path):
+    store = ToolOutputStore(str(tmp_path), max_result_bytes=100)
+
+    assert store.limit("short") == "short"
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_limit_keeps_head_and_tail_and_stores_full_output(tmp_path):
+    store = ToolOutputStore(str(tmp_path), max_result_bytes=100)
+    output = "HEAD" + "x" * 1000 + "TAIL"
+
+    limited = store.limit(output)
+
+    assert limited.startswith("HEAD")
+    assert limited.endswith("TAIL")
+    assert "showing first 50 and last 50 of 1008 bytes, 908 bytes omitted" in limited
+    assert store.get(output_id_of(limited)) == output
+
+
+def test_limit_does_not_split_multibyte_characters(tmp_path):
+    store = ToolOutputStore(str(tmp_path), max_result_bytes=101)
+
+    limited = store.limit("あ" * 1000)
+
+    assert "�" not in limited
+    assert limited.startswith("あ" * 16)
+
+
+def test_read_pages_through_stored_output(tmp_path):
+    store = ToolOutputStore(str(tmp_path), max_result_bytes=10)
+    output_id = store.put("0123456789abcdefghij")
+
+    assert store.read(output_id, 0, 5) == f"[{output_id}: bytes 0-5 of 20]\n01234"
+    assert store.read(output_id, 15, 100).endswith("fghij")
+    # 1回に読み出せるのは max_result_bytes まで
+    assert store.read(output_id, 0, 100).endswith("0123456789")
+
+
+def test_read_rejects_unknown_and_unsafe_ids(tmp_path):
+    store = ToolOutputStore(str(tmp_path))
+
+    assert store.read("out-missing").startswith("Error:")
+    assert store.read("../secret").startswith("Error:")
+    assert store.read(store.put("x"), offset=-1).startswith("Error:")
+
+
+def test_zero_limit_disables_truncation(tmp_path):
+    store = ToolOutputStore(str(tmp_path), max_result_bytes=0)
+
+    assert store.limit("x" * 100000) == "x" * 100000
+
+
+def test_default_directory_is_created_lazily():
+    store = ToolOutputStore(max_result_bytes=10)
+
+    output_id = store.put("hello")
+
+    assert store.directory.exists()
+    assert store.get(output_id) == "hello"
+
+
+def test_from_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("AGENT_TOOL_RESULT_MAX_BYTES", "123")
+    monkeypatch.setenv("AGENT_TOOL_OUTPUT_DIR", str(tmp_path))
+
+    store = ToolOutputStore.from_env()
+
+    assert store.max_result_bytes == 123
+    assert store.directory == tmp_path
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import pytest
+from unittest.mock import patch
+from agent.agent import Agent
+from agent.tool_registry import COST_LLM, COST_LOCAL, ToolRegistry, ToolSpec, spec_of, tool
+from agent.tool_executor import parallel_safe
+
+
+class BaseToolAgent(Agent):
+    @tool(parallel_safe=True, idempotent=True)
+    def lookup(self, key: str) -> str:
+        """
+        値を引きます。
+        """
+        return f"value of {key}"
+
+
+class ToolAgent(BaseToolAgent):
+    def __init__(self, **kwargs):
+        super().__init__("ToolBot", "Tester", "Just testing", **kwargs)
+
+    @tool(cost=COST_LLM)
+    def ask(self, question: str) -> str:
+        """
+        質問します。
+        """
+        return f"sync answer to {question}"
+
+    async def ask_async(self, question: str) -> str:
+        return f"async answer to {question}"
+
+    def helper(self) -> str:
+        return "not a tool"
+
+
+@pytest.fixture
+def agent():
+    with patch.dict(os.environ, {"GEMINI_API_KEY": "dummy"}), patch('google.generativeai.GenerativeModel'):
+        yield ToolAgent()
+
+
+def test_registry_collects_declared_tools_once_per_class():
+    registry = ToolRegistry.for_class(ToolAgent)
+    assert registry is ToolRegistry.for_class(ToolAgent)
+    assert registry.names == ["ask", "lookup", "read_tool_output"]
+    assert registry.get("ask") == ToolSpec("ask", parallel_safe=False, idempotent=False, cost=COST_LLM, async_name="ask_async")
+    assert registry.get("lookup") == ToolSpec("lookup", parallel_safe=True, idempotent=True, cost=COST_LOCAL)
+    assert "helper" not in registry
+
+
+def test_agent_exposes_declared_tools(agent):
+    assert [t.__name__ for t in agent.tools] == ["ask", "lookup", "read_tool_output"]
+    assert agent.is_tool_parallel_safe("lookup")
+    assert not agent.is_tool_parallel_safe("ask")
+    assert not agent.is_tool_parallel_safe("helper")
+    assert agent.tool_spec("ask").cost == COST_LLM
+    assert agent.tool_spec("helper") is None
+
+
+def test_execute_tool_dispatches_by_name(agent):
+    assert agent.execute_tool("lookup", {"key": "a"}) == "value of a"
+    assert agent.execute_tool("helper", {}) == "Tool helper not found."
+    with patch.object(agent, "lookup", return_value="mocked"):
+        assert agent.execute_tool("lookup", {"key": "a"}) == "mocked"
+
+
+def test_execute_tool_async_prefers_native_async_variant(agent):
+    assert asyncio.run(agent.execute_tool_async("ask", {"question": "q"})) == "async answer to q"
+    assert asyncio.run(agent.execute_tool_async("lookup", {"key": "b"})) == "value of b"
+
+
+def test_explicit_tools_override_declarations():
+    @parallel_safe
+    def ping() -> str:
+        return "pong"
+
+    with patch.dict(os.environ, {"GEMINI_API_KEY": "dummy"}), patch('google.generativeai.GenerativeModel'):
+        explicit = type("ExplicitAgent", (Agent,), {})("Explicit", "Tester", "Just testing", tools=[ping])
+
+    assert [t.__name__ for t in explicit.tools] == ["ping", "read_tool_output"]
+    assert explicit.execute_tool("ping", {}) == "pong"
+    assert explicit.is_tool_parallel_safe("ping")
+    assert spec_of(ping) == ToolSpec("ping", parallel_safe=True)
+
+
+def test_agent_without_declared_tools_has_none():
+    with patch.dict(os.environ, {"GEMINI_API_KEY": "dummy"}), patch('google.generativeai.GenerativeModel'):
+        plain = type("PlainAgent", (Agent,), {})("Plain", "Tester", "Just testing")
+    assert plain.tools is None
+    assert plain.execute_tool("read_tool_output", {"output_id": "x"}) == "Tool read_tool_output not found."
@@ -0,0 +1,56 @@
+import json
+from agent.tracing import Tracer
+from agent.trace_exporters import JsonlSpanExporter, OtlpJsonSpanExporter
+
+
+def test_jsonl_exporter_writes_one_line_per_span(tmp_path):
+    path = tmp_path / "traces" / "spans.jsonl"
+    exporter = JsonlSpanExporter(str(path))
+    tracer = Tracer([exporter])
+
+    with tracer.span("agent.send_message", **{"agent.name": "Coder"}):
+        with tracer.span("sandbox.exec", **{"sandbox.exit_code": 0}):
+            pass
+    tracer.shutdown()
+
+    records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [r["name"] for r in records] == ["sandbox.exec", "agent.send_message"]
+    assert records[0]["parent_id"] == records[1]["span_id"]
+    assert records[0]["attributes"] == {"sandbox.exit_code": 0}
+    assert records[1]["status"] == "ok"
+
+
+def test_otlp_exporter_writes_export_requests(tmp_path):
+    path = tmp_path / "spans.otlp.jsonl"
+    tracer = Tracer([OtlpJsonSpanExporter(str(path), service_name="bench")], clock=iter([1_000, 5_000]).__next__)
+
+    try:
+        with tracer.span("llm.attempt", **{"llm.total_tokens": 42, "llm.cache_hit": False, "llm.model": "m", "x": 0.5}):
+            raise ValueError("boom")
+    except ValueError:
+        pass
+    tracer.shutdown()
+
+    request = json.loads(path.read_text(encoding="utf-8"))
+    resource_spans = request["resourceSpans"][0]
+    assert resource_spans["resource"]["attributes"] == [{"key": "service.name", "value": {"stringValue": "bench"}}]
+    span = resource_spans["scopeSpans"][0]["spans"][0]
+    assert len(span["traceId"]) == 32 and len(span["spanId"]) == 16
+    assert "parentSpanId" not in span
+    assert span["startTimeUnixNano"] == "1000" and span["endTimeUnixNano"] == "5000"
+    assert span["status"] == {"code": 2, "message": "boom"}
+    assert span["attributes"] == [
+        {"key": "llm.total_tokens", "value": {"intValue": "42"}},
+        {"key": "llm.cache_hit", "value": {"boolValue": False}},
+        {"key": "llm.model", "value": {"stringValue": "m"}},
+        {"key": "x", "value": {"doubleValue": 0.5}},
+    ]
+
+
+def test_export_after_shutdown_is_ignored(tmp_path):
+    exporter = JsonlSpanExporter(str(tmp_path / "spans.jsonl"))
+    tracer = Tracer([exporter])
+    exporter.shutdown()
+    with tracer.span("late"):
+        pass
+    assert (tmp_path / "spans.jsonl").read_text(encoding="utf-8") == ""
@@ -0,0 +1,87 @@
+import pytest
+import asyncio
+import os
+from unittest.mock import patch
+from agent.tracing import Tracer, get_tracer, STATUS_OK, STATUS_ERROR
+from agent.trace_exporters import InMemorySpanExporter, JsonlSpanExporter, OtlpJsonSpanExporter
+
+
+@pytest.fixture
+def exporter():
+    return InMemorySpanExporter()
+
+
+@pytest.fixture
+def tracer(exporter):
+    return Tracer([exporter])
+
+
+def test_nested_spans_share_trace(tracer, exporter):
+    with tracer.span("agent.send_message", **{"agent.name": "Manager"}) as root:
+        with tracer.span("tool.execute") as child:
+            assert tracer.current_span() is child
+        assert tracer.current_span() is root
+    assert tracer.current_span() is None
+
+    child_span, root_span = exporter.spans
+    assert child_span.trace_id == root_span.trace_id
+    assert child_span.parent_id == root_span.span_id
+    assert root_span.parent_id is None
+    assert root_span.attributes == {"agent.name": "Manager"}
+    assert root_span.status == STATUS_OK
+    assert root_span.duration >= 0
+
+
+def test_span_records_exception(tracer, exporter):
+    with pytest.raises(RuntimeError):
+        with tracer.span("llm.attempt"):
+            raise RuntimeError("429 quota")
+
+    assert exporter.spans[0].status == STATUS_ERROR
+    assert exporter.spans[0].error == "429 quota"
+
+
+def test_separate_requests_get_separate_traces(tracer, exporter):
+    with tracer.span("a"):
+        pass
+    with tracer.span("b"):
+        pass
+    assert exporter.spans[0].trace_id != exporter.spans[1].trace_id
+
+
+def test_span_add_accumulates(tracer):
+    with tracer.span("agent.send_message") as span:
+        span.add("llm.total_tokens", 10)
+        span.add("llm.total_tokens", 5)
+    assert span.attributes["llm.total_tokens"] == 15
+
+
+def test_context_follows_asyncio_tasks(tracer, exporter):
+    async def child(name):
+        with tracer.span(name):
+            await asyncio.sleep(0)
+
+    async def main():
+        with tracer.span("root"):
+            await asyncio.gather(child("c1"), child("c2"))
+
+    asyncio.run(main())
+    root = exporter.spans[-1]
+    assert {s.parent_id for s in exporter.spans[:-1]} == {root.span_id}
+
+
+def test_from_env_configures_exporters(tmp_path):
+    env = {"AGENT_TRACE_FILE": str(tmp_path / "t.jsonl"), "AGENT_TRACE_OTLP_FILE": str(tmp_path / "t.otlp.jsonl")}
+    with patch.dict(os.environ, env):
+        tracer = Tracer.from_env()
+    assert [type(e) for e in tracer.exporters] == [JsonlSpanExporter, OtlpJsonSpanExporter]
+    tracer.shutdown()
+
+
+def test_from_env_without_files():
+    with patch.dict(os.environ, {}, clear=True):
+        assert Tracer.from_env().exporters == []
+
+
+def test_get_tracer_is_shared():
+    assert get_tracer() is get_tracer()
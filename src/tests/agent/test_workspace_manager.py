@@ -0,0 +1,126 @@
+import os
+
+import pytest
+
+from agent.workspace_manager import (
+    COPY_COPY, COPY_HARDLINK, WorkspaceManager, create_template, workspace_env,
+)
+
+
+@pytest.fixture
+def template(tmp_path):
+    template = tmp_path / "template"
+    (template / "lib").mkdir(parents=True)
+    (template / "lib" / "common.py").write_text("VALUE = 1\n")
+    bin_dir = template / ".venv" / "bin"
+    bin_dir.mkdir(parents=True)
+    (bin_dir / "pip").write_text(f"#!{bin_dir / 'python'}\nimport pip\n")
+    (bin_dir / "pip").chmod(0o755)
+    os.symlink("/usr/bin/env", bin_dir / "python")
+    return template
+
+
+def test_workspaces_are_created_per_key_and_reused(tmp_path):
+    manager = WorkspaceManager(str(tmp_path / "root"))
+
+    first = manager.path("session-a")
+    (first / "app.py").write_text("print(1)")
+
+    second = manager.path("session-b")
+
+    assert manager.path("session-a") == first
+    assert second != first
+    assert not (second / "app.py").exists()
+    assert manager.stats()["created"] == 2
+    assert manager.stats()["reused"] == 1
+
+
+def test_workspace_is_copied_from_template(tmp_path, template):
+    manager = WorkspaceManager(str(tmp_path / "root"), template=str(template), copy_mode=COPY_COPY)
+
+    workspace = manager.path("s1")
+    (workspace / "lib" / "common.py").write_text("VALUE = 2\n")
+
+    assert (template / "lib" / "common.py").read_text() == "VALUE = 1\n"
+    assert os.readlink(workspace / ".venv" / "bin" / "python") == "/usr/bin/env"
+
+
+def test_hardlink_mode_shares_files_with_template(tmp_path, template):
+    manager = WorkspaceManager(str(tmp_path / "root"), template=str(template), copy_mode=COPY_HARDLINK)
+
+    workspace = manager.path("s1")
+
+    assert (workspace / "lib" / "common.py").stat().st_ino == (template / "lib" / "common.py").stat().st_ino
+
+
+def test_virtualenv_scripts_point_to_workspace(tmp_path, template):
+    manager = WorkspaceManager(str(tmp_path / "root"), template=str(template), copy_mode=COPY_HARDLINK)
+
+    workspace = manager.path("s1")
+
+    pip = workspace / ".venv" / "bin" / "pip"
+    assert pip.read_text().startswith(f"#!{(workspace / '.venv' / 'bin').resolve() / 'python'}")
+    assert os.access(pip, os.X_OK)
+    # テンプレートのスクリプトは書き換えない
+    assert str(template) in (template / ".venv" / "bin" / "pip").read_text()
+
+
+def test_prune_removes_least_recently_used_idle_workspaces(tmp_path, clock):
+    manager = WorkspaceManager(str(tmp_path / "root"), retention=2, min_idle_seconds=60, clock=clock)
+    for key in ("a", "b"):
+        manager.path(key)
+        clock.now += 100
+    manager.path("a")
+    clock.now += 100
+
+    manager.path("c")
+
+    assert manager.workspaces() == ["a", "c"]
+
+
+def test_prune_keeps_recent_and_leased_workspaces(tmp_path, clock):
+    manager = WorkspaceManager(str(tmp_path / "root"), retention=1, min_idle_seconds=60, clock=clock)
+
+    with manager.lease("busy"):
+        clock.now += 100
+        manager.path("recent")
+        clock.now += 10
+        manager.path("new")
+        # busy は使用中、recent は直近に使われたため残る
+        assert manager.workspaces() == ["busy", "recent", "new"]
+
+    clock.now += 100
+    assert manager.prune() == ["recent", "new"]
+    assert manager.workspaces() == ["busy"]
+
+
+def test_unsafe_keys_are_hashed(tmp_path):
+    manager = WorkspaceManager(str(tmp_path / "root"))
+
+    workspace = manager.path("../escape")
+
+    assert workspace.parent == tmp_path / "root"
+    assert workspace.name.startswith("ws-")
+
+
+def test_from_env(monkeypatch, tmp_path):
+    monkeypatch.delenv("AGENT_WORKSPACE_ROOT", raising=False)
+    assert WorkspaceManager.from_env() is None
+
+    monkeypatch.setenv("AGENT_WORKSPACE_ROOT", str(tmp_path))
+    monkeypatch.setenv("AGENT_WORKSPACE_RETENTION", "5")
+    monkeypatch.setenv("AGENT_WORKSPACE_COPY", "hardlink")
+    manager = WorkspaceManager.from_env()
+
+    assert manager.retention == 5
+    assert manager.copy_mode == COPY_HARDLINK
+
+
+def test_create_template_builds_virtualenv(tmp_path):
+    template = create_template(str(tmp_path / "template"), with_pip=False)
+
+    assert (template / ".venv" / "bin" / "python").exists()
+    env = workspace_env(template)
+    assert env["VIRTUAL_ENV"] == str((template / ".venv").resolve())
+    assert env["PATH"].startswith(str((template / ".venv" / "bin").resolve()))
+    assert workspace_env(tmp_path) == {}